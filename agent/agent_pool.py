@@ -0,0 +1,190 @@
+"""warm コンテナ内で Strands Agent を使い回すプール.
+
+Agent の生成には BedrockModel (boto3 の bedrock-runtime クライアント) と
+ツールレジストリの構築が含まれ、リクエストごとに作ると数十〜数百 ms かかる。
+生成済みの Agent をプールしておき、リクエストごとに会話履歴を消して
+システムプロンプト (現在日時の行) とコールバックだけを差し替えて使う。
+返却時にそのリクエストのトークン使用量 (プロンプトキャッシュの読み込み / 書き込みを含む) を記録する。
+
+session_manager (AgentCore Memory) は Agent の生成時に結び付くため使い回せない。
+その場合は Agent を新しく作るが、BedrockModel はプールと共有する。
+memory_sessions.MemorySession を渡すと、そのセッション (ユーザー・日付) の Agent を
+会話履歴ごと使い回す (最初のリクエストで作り、セッションに持たせる)。
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+import prompt_cache
+
+logger = logging.getLogger(__name__)
+
+# コンテナ内で待機させておく Agent の最大数
+AGENT_POOL_SIZE = int(os.environ.get("AGENT_POOL_SIZE", "2"))
+
+
+@dataclass
+class AgentLease:
+    """プールから借りた Agent と準備にかかった時間."""
+
+    agent: Any
+    setup_ms: float
+    reused: bool
+    usage: dict = field(default_factory=dict)
+
+    def metrics(self) -> dict:
+        return {"agent_setup_ms": round(self.setup_ms, 1), "agent_reused": self.reused, **self.usage}
+
+
+class AgentPool:
+    """Agent のプール.
+
+    factory は create_agent(session_manager=None, model=None) 形式で Agent を作る関数。
+    """
+
+    def __init__(self, factory: Callable[..., Any], max_idle: int = AGENT_POOL_SIZE, name: str = "agent"):
+        self._factory = factory
+        self.max_idle = max(0, max_idle)
+        self.name = name
+        self._idle: list[tuple[Any, Any]] = []  # (agent, 生成時の callback_handler)
+        self._model = None
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "created_ms": 0.0, "reused_ms": 0.0}
+
+    def _create(self, **kwargs) -> Any:
+        agent = self._factory(model=self._model, **kwargs)
+        if self._model is None:
+            self._model = getattr(agent, "model", None)
+        return agent
+
+    def _record(self, reused: bool, setup_ms: float) -> None:
+        key = "reused" if reused else "created"
+        with self._lock:
+            self._stats[key] += 1
+            self._stats[f"{key}_ms"] += setup_ms
+        logger.info("%s setup %.1fms (%s)", self.name, setup_ms, key)
+
+    def _record_usage(self, lease: AgentLease, before: dict[str, int]) -> None:
+        # 返却前に測る (返却後は別のリクエストが同じ Agent を使い始める)
+        lease.usage = prompt_cache.usage_metrics(before, prompt_cache.usage_snapshot(lease.agent))
+        if lease.usage:
+            logger.info(
+                "%s tokens: input=%d cache_read=%d cache_write=%d output=%d",
+                self.name,
+                lease.usage["input_tokens"],
+                lease.usage["cache_read_input_tokens"],
+                lease.usage["cache_write_input_tokens"],
+                lease.usage["output_tokens"],
+            )
+
+    @contextmanager
+    def acquire(
+        self, system_prompt: str | list[dict], callback_handler=None, session_manager=None, session=None
+    ) -> Iterator[AgentLease]:
+        """Agent を借りる. スコープを抜けると会話履歴を消してプールに戻す."""
+        started = time.perf_counter()
+        if session is not None:
+            with self._acquire_session(session, system_prompt, callback_handler, started) as lease:
+                yield lease
+            return
+        if session_manager is not None:
+            agent = self._create(session_manager=session_manager)
+            if callback_handler is not None:
+                agent.callback_handler = callback_handler
+            lease = AgentLease(agent, (time.perf_counter() - started) * 1000, reused=False)
+            self._record(False, lease.setup_ms)
+            before = prompt_cache.usage_snapshot(agent)
+            try:
+                yield lease
+            finally:
+                self._record_usage(lease, before)
+            return
+
+        with self._lock:
+            entry = self._idle.pop() if self._idle else None
+        reused = entry is not None
+        if entry is None:
+            agent = self._create()
+            entry = (agent, agent.callback_handler)
+        agent, default_handler = entry
+        # 日時の行だけが変わるので毎回差し替える
+        agent.system_prompt = system_prompt
+        if callback_handler is not None:
+            agent.callback_handler = callback_handler
+        lease = AgentLease(agent, (time.perf_counter() - started) * 1000, reused=reused)
+        self._record(reused, lease.setup_ms)
+        before = prompt_cache.usage_snapshot(agent)
+        try:
+            yield lease
+        finally:
+            self._record_usage(lease, before)
+            self._release(agent, default_handler)
+
+    @contextmanager
+    def _acquire_session(self, session, system_prompt, callback_handler, started: float) -> Iterator[AgentLease]:
+        """Memory セッションの Agent を借りる. 会話履歴は消さずにセッションに残す."""
+        reused = session.agent is not None
+        if not reused:
+            session.agent = self._create(session_manager=session.session_manager)
+            session.default_handler = session.agent.callback_handler
+        agent = session.agent
+        agent.system_prompt = system_prompt
+        if callback_handler is not None:
+            agent.callback_handler = callback_handler
+        lease = AgentLease(agent, (time.perf_counter() - started) * 1000, reused=reused)
+        if not reused:
+            # 初回の履歴の読み込みは、次のリクエストでヒットしたときに省ける時間
+            session.load_ms += lease.setup_ms
+        self._record(reused, lease.setup_ms)
+        before = prompt_cache.usage_snapshot(agent)
+        settled = False
+        try:
+            yield lease
+            settled = _ends_with_reply(agent.messages)
+        finally:
+            self._record_usage(lease, before)
+            agent.callback_handler = session.default_handler
+            if not settled:
+                # 途中で止まった履歴 (ツール結果待ちなど) は次のリクエストに持ち越さない
+                session.discard()
+
+    def _release(self, agent, default_handler) -> None:
+        agent.messages.clear()
+        agent.callback_handler = default_handler
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((agent, default_handler))
+
+    def stats(self) -> dict:
+        """生成 / 再利用の回数と平均準備時間 (ms)."""
+        with self._lock:
+            s = dict(self._stats)
+            idle = len(self._idle)
+        return {
+            "created": s["created"],
+            "reused": s["reused"],
+            "idle": idle,
+            "avg_created_ms": s["created_ms"] / s["created"] if s["created"] else 0.0,
+            "avg_reused_ms": s["reused_ms"] / s["reused"] if s["reused"] else 0.0,
+        }
+
+    def clear(self) -> None:
+        """待機中の Agent と共有モデルを破棄する (テスト・設定変更用)."""
+        with self._lock:
+            self._idle.clear()
+            self._model = None
+
+
+def _ends_with_reply(messages) -> bool:
+    """会話履歴がアシスタントの応答 (ツール呼び出しなし) で終わっているか."""
+    if not isinstance(messages, list) or not messages:
+        return False
+    last = messages[-1]
+    if not isinstance(last, dict) or last.get("role") != "assistant":
+        return False
+    return not any("toolUse" in block for block in last.get("content") or [] if isinstance(block, dict))
@@ -1,6 +1,5 @@
 """Google Calendar Agent on Bedrock AgentCore Runtime."""
 
-import json
 import logging
 import os
 
@@ -13,11 +12,23 @@ try:
 except ImportError:
     pass
 
+import deadline
+import envelope
+import operations
+import prompt_cache
+import request_context
+import tracing
+from agent_pool import AgentPool
 from bedrock_agentcore import BedrockAgentCoreApp
+from envelope import Envelope
 from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials
+from operations import Operation, OperationError
+from request_context import RequestContext
 from strands import Agent
 from strands.models import BedrockModel
+from streaming import EnvelopeScanner, StreamBridge, single_result, wants_stream
+from trace_hooks import TraceHooks
 
 from tools.google_calendar import (
     create_event,
@@ -83,49 +94,6 @@ MODEL_ID = os.environ.get(
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 
 
-def _sanitize_response(text: str) -> str:
-    """LLM レスポンスから JSON 部分を抽出.
-
-    Strands Agent の str(result) にはマークダウンコードブロックや
-    前後の説明テキストが含まれることがある。複数の手法で JSON を抽出する。
-    """
-    stripped = text.strip()
-
-    # 1. そのまま JSON として解析できるならそのまま返す
-    try:
-        json.loads(stripped)
-        return stripped
-    except (json.JSONDecodeError, TypeError):
-        pass
-
-    # 2. Markdown コードブロック除去
-    if stripped.startswith("```"):
-        first_newline = stripped.find("\n")
-        if first_newline != -1:
-            candidate = stripped[first_newline + 1:]
-        else:
-            candidate = stripped[3:]
-        if candidate.endswith("```"):
-            candidate = candidate[:-3].strip()
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    # 3. テキスト中の最外 JSON オブジェクトを抽出 ({ ... })
-    first_brace = stripped.find("{")
-    last_brace = stripped.rfind("}")
-    if first_brace != -1 and last_brace > first_brace:
-        candidate = stripped[first_brace:last_brace + 1]
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    return stripped
-
 app = BedrockAgentCoreApp()
 
 
@@ -151,23 +119,22 @@ def _setup_credentials(payload: dict) -> bool:
     return True
 
 
-def _build_system_prompt() -> str:
-    """現在日時を埋め込んだシステムプロンプトを生成."""
-    from datetime import datetime, timedelta, timezone
+def _build_system_prompt() -> list[dict] | str:
+    """システムプロンプトを生成 (固定部分をキャッシュし、現在日時は末尾)."""
+    return prompt_cache.build_system_prompt(SYSTEM_PROMPT)
 
-    jst = timezone(timedelta(hours=9))
-    now = datetime.now(jst)
-    weekday = ["月", "火", "水", "木", "金", "土", "日"][now.weekday()]
-    date_line = f"現在の日時: {now.strftime('%Y年%m月%d日')}({weekday}) {now.strftime('%H:%M')}"
-    return f"{date_line}\n\n{SYSTEM_PROMPT}"
 
-
-def create_agent() -> Agent:
-    """Calendar Agent を作成."""
-    model = BedrockModel(
-        model_id=MODEL_ID,
-        streaming=True,
-    )
+def create_agent(callback_handler=None, model=None) -> Agent:
+    """Calendar Agent を作成. callback_handler を渡すとテキスト差分を受け取れる."""
+    if model is None:
+        model = BedrockModel(
+            model_id=MODEL_ID,
+            streaming=True,
+            **prompt_cache.model_kwargs(),
+        )
+    kwargs = {}
+    if callback_handler is not None:
+        kwargs["callback_handler"] = callback_handler
     return Agent(
         model=model,
         system_prompt=_build_system_prompt(),
@@ -180,39 +147,156 @@ def create_agent() -> Agent:
             invite_attendees,
             get_free_busy,
         ],
+        hooks=[TraceHooks()],
+        **kwargs,
     )
 
 
+_agent_pool = AgentPool(lambda **kwargs: create_agent(**kwargs), name="Calendar agent")
+
+
+# ---------- 構造化オペレーション (LLM を通さずにツールを実行) ----------
+
+
+def _events_envelope(events: list, args: dict) -> dict:
+    message = f"予定は{len(events)}件です。" if events else "予定はありません。"
+    return {"type": "calendar_events", "message": message, "events": events}
+
+
+def _event_detail_envelope(event: dict, args: dict) -> dict:
+    return {"type": "calendar_events", "message": f"「{event.get('summary', '')}」の詳細です。", "events": [event]}
+
+
+def _created_envelope(event: dict, args: dict) -> dict:
+    return {"type": "event_created", "message": f"予定「{event.get('summary', '')}」を作成しました。", "event": event}
+
+
+def _updated_envelope(event: dict, args: dict) -> dict:
+    return {"type": "event_updated", "message": f"予定「{event.get('summary', '')}」を更新しました。", "event": event}
+
+
+def _invited_envelope(event: dict, args: dict) -> dict:
+    return {"type": "event_updated", "message": "参加者を招待しました。", "event": event}
+
+
+def _deleted_envelope(result: dict, args: dict) -> dict:
+    return {"type": "event_deleted", "message": "予定を削除しました。"}
+
+
+def _date_selection_envelope(busy_slots: list, args: dict) -> dict:
+    return {
+        "type": "date_selection",
+        "message": "日付を選択してください。",
+        "busy_slots": busy_slots,
+        "suggested_title": args.get("suggested_title") or "新しい予定",
+    }
+
+
+OPERATIONS = {
+    "list_events": Operation(list_events, _events_envelope),
+    "get_event": Operation(get_event, _event_detail_envelope),
+    "create_event": Operation(create_event, _created_envelope),
+    "update_event": Operation(update_event, _updated_envelope),
+    "delete_event": Operation(delete_event, _deleted_envelope),
+    "invite_attendees": Operation(invite_attendees, _invited_envelope),
+    "get_free_busy": Operation(get_free_busy, _date_selection_envelope, envelope_args=("suggested_title",)),
+}
+
+
+def _run_operation(payload: dict, ctx: RequestContext) -> Envelope | None:
+    """payload の op を直接実行. op がない・実行できない場合は None (LLM で処理する)."""
+    try:
+        parsed = operations.parse(payload)
+        if parsed is None:
+            return None
+        ctx.deadline.check()
+        with request_context.use(ctx):
+            return operations.run(OPERATIONS, *parsed)
+    except OperationError as e:
+        logger.info("Falling back to LLM: %s", e)
+        return None
+    except deadline.DeadlineExceeded:
+        logger.warning("No time left to run the operation")
+        return deadline.timeout_envelope()
+    except Exception:
+        # 作成・削除などを LLM でやり直すと二重実行になるため、フォールバックしない
+        logger.error("Calendar operation failed", exc_info=True)
+        return envelope.text("カレンダーの操作に失敗しました。")
+
+
 @app.entrypoint
+@tracing.entrypoint("calendar_agent.invoke", service="calendar-agent")
 def invoke(payload: dict) -> dict:
     """Calendar Agent を呼び出し."""
     prompt = payload.get("prompt", "")
     if not prompt:
-        return {"result": '{"type": "text", "message": "メッセージが空です。"}', "status": "error"}
+        return {"result": envelope.text("メッセージが空です。").to_dict(), "status": "error"}
 
-    # Google 認証情報セットアップ
-    if not _setup_credentials(payload):
-        return {
-            "result": '{"type": "oauth_required", "message": "Google 認証が必要です。"}',
-            "status": "error",
-        }
+    # Google 認証情報セットアップ (リクエストごとのコンテキストに保持する)
+    ctx = RequestContext(deadline=deadline.from_payload(payload))
+    with request_context.use(ctx), tracing.span("credentials.setup"):
+        has_credentials = _setup_credentials(payload)
+    if not has_credentials:
+        return {"result": envelope.make("oauth_required", "Google 認証が必要です。").to_dict(), "status": "error"}
 
-    logger.info("Invoking calendar agent with prompt length: %d", len(prompt))
+    response = _run_operation(payload, ctx)
+    if response is not None:
+        if wants_stream(payload):
+            return single_result(response)
+        return {"result": response.to_dict(), "status": "success", "metrics": {"operation": payload["op"]}}
 
-    agent = create_agent()
-    result = agent(prompt)
+    logger.info("Invoking calendar agent with prompt length: %d", len(prompt))
 
-    response_text = _sanitize_response(str(result))
-    logger.info("Calendar agent response length: %d", len(response_text))
+    if wants_stream(payload):
+        return _invoke_stream(prompt, ctx)
 
-    # JSON レスポンスの検証
-    try:
-        parsed = json.loads(response_text)
-        return {"result": response_text, "status": "success"}
-    except json.JSONDecodeError:
-        # JSON でない場合はテキストとしてラップ
-        fallback = json.dumps({"type": "text", "message": response_text}, ensure_ascii=False)
-        return {"result": fallback, "status": "success"}
+    with request_context.use(ctx), _agent_pool.acquire(
+        _build_system_prompt(), callback_handler=ctx.deadline.callback_handler()
+    ) as lease:
+        try:
+            result = lease.agent(prompt)
+        except deadline.DeadlineExceeded:
+            logger.warning("Calendar agent stopped at the deadline")
+            return {"result": deadline.timeout_envelope().to_dict(), "status": "timeout", "metrics": lease.metrics()}
+
+    response = _finalize_response(str(result))
+    logger.info("Calendar agent response type: %s", response.type)
+    return {"result": response.to_dict(), "status": "success", "metrics": lease.metrics()}
+
+
+def _finalize_response(text: str) -> Envelope:
+    """LLM 出力から JSON エンベロープを取り出す. JSON でなければテキストとしてラップ."""
+    return envelope.coerce(text)
+
+
+def _invoke_stream(prompt: str, ctx: RequestContext):
+    """ストリーミング版. エンベロープの JSON が閉じた時点で result を流す."""
+    bridge = StreamBridge()
+    scanner = EnvelopeScanner()
+
+    def callback_handler(**kwargs) -> None:
+        bridge.callback_handler(**kwargs)
+        text = kwargs.get("data")
+        if text:
+            found = scanner.feed(text)
+            if found is not None and bridge.publish_result(found):
+                logger.info("Calendar agent envelope completed early")
+        if kwargs.get("message") is not None:
+            scanner.reset()
+
+    def _run() -> None:
+        with request_context.use(ctx), _agent_pool.acquire(
+            _build_system_prompt(), callback_handler=ctx.deadline.callback_handler(callback_handler)
+        ) as lease:
+            try:
+                result = lease.agent(prompt)
+            except deadline.DeadlineExceeded:
+                logger.warning("Calendar agent stopped at the deadline")
+                bridge.publish_result(deadline.timeout_envelope(), status="timeout")
+                return
+        bridge.publish_result(_finalize_response(str(result)))
+
+    return bridge.run(_run, deadline=ctx.deadline)
 
 
 if __name__ == "__main__":
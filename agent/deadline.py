@@ -0,0 +1,96 @@
+"""リクエストの締め切り (Lambda → Router → サブエージェント → ツール).
+
+Lambda は reply token と Lambda の残り時間から使える秒数を決め、payload の
+deadline_ms で Router に渡す。各ホップは受け取った時点からの締め切りに変換し、
+下流 (サブエージェント) には残り時間から返送の余裕を引いた予算を渡す。
+HTTP 呼び出しのタイムアウトは残り時間で打ち切り、締め切りを過ぎたら Agent の
+ループを止めて、途中までの結果かフォールバックのエンベロープを返す。
+
+時計のずれの影響を受けないよう、絶対時刻ではなく残りのミリ秒を渡す。
+"""
+
+import math
+import os
+import time
+from typing import Callable
+
+import envelope
+import request_context
+
+# payload に締め切りがないとき (直接呼び出し・ローカル) の予算
+DEADLINE_DEFAULT_SECONDS = float(os.environ.get("DEADLINE_DEFAULT_SECONDS", "55"))
+# 下流に渡す予算から引く余裕 (応答の返送とフォールバックの組み立て)
+DEADLINE_HOP_MARGIN_SECONDS = float(os.environ.get("DEADLINE_HOP_MARGIN_SECONDS", "1.5"))
+
+PAYLOAD_KEY = "deadline_ms"
+
+TIMEOUT_MESSAGE = "時間内に処理を終えられませんでした。もう一度お試しください。"
+
+
+class DeadlineExceeded(TimeoutError):
+    """締め切りを過ぎた."""
+
+
+class Deadline:
+    """1 リクエストの締め切り (モノトニック時計)."""
+
+    def __init__(self, budget_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.budget = budget_seconds
+        self.expires_at = clock() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"deadline of {self.budget:.1f}s exceeded")
+
+    def timeout(self, cap: float) -> float:
+        """HTTP 呼び出しなどのタイムアウト (残り時間と cap の小さい方). 過ぎていれば DeadlineExceeded."""
+        self.check()
+        return min(cap, self.remaining())
+
+    def child_budget_ms(self) -> int:
+        """下流に渡す予算 (ms). 返送の余裕を引く."""
+        return max(0, int((self.remaining() - DEADLINE_HOP_MARGIN_SECONDS) * 1000))
+
+    def callback_handler(self, inner: Callable[..., None] | None = None) -> Callable[..., None]:
+        """Strands Agent の callback_handler. 締め切りを過ぎたら次のイベントで例外を投げてループを止める."""
+
+        def handler(**kwargs) -> None:
+            self.check()
+            if inner is not None:
+                inner(**kwargs)
+
+        return handler
+
+
+def from_payload(payload: dict, clock: Callable[[], float] = time.monotonic) -> Deadline:
+    """payload の deadline_ms から締め切りを作る. なければ既定の予算."""
+    budget_ms = payload.get(PAYLOAD_KEY)
+    if isinstance(budget_ms, (int, float)) and not isinstance(budget_ms, bool) and math.isfinite(budget_ms):
+        return Deadline(max(0.0, budget_ms / 1000), clock)
+    return Deadline(DEADLINE_DEFAULT_SECONDS, clock)
+
+
+def current() -> Deadline | None:
+    """実行中のリクエストの締め切り (リクエスト外なら None)."""
+    ctx = request_context.current()
+    return ctx.deadline if ctx is not None else None
+
+
+def timeout(cap: float) -> float:
+    """実行中のリクエストの残り時間で cap を切り詰めたタイムアウト."""
+    deadline = current()
+    if deadline is None:
+        return cap
+    return deadline.timeout(cap)
+
+
+def timeout_envelope(message: str = TIMEOUT_MESSAGE) -> envelope.Envelope:
+    """締め切りまでに結果が出なかったときに返すエンベロープ."""
+    return envelope.text(message)
@@ -1,6 +1,5 @@
 """Google Gmail Agent on Bedrock AgentCore Runtime."""
 
-import json
 import logging
 import os
 
@@ -13,11 +12,23 @@ try:
 except ImportError:
     pass
 
+import deadline
+import envelope
+import operations
+import prompt_cache
+import request_context
+import tracing
+from agent_pool import AgentPool
 from bedrock_agentcore import BedrockAgentCoreApp
+from envelope import Envelope
 from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials
+from operations import Operation, OperationError
+from request_context import RequestContext
 from strands import Agent
 from strands.models import BedrockModel
+from streaming import EnvelopeScanner, StreamBridge, single_result, wants_stream
+from trace_hooks import TraceHooks
 
 from tools.google_gmail import (
     delete_email,
@@ -96,49 +107,6 @@ MODEL_ID = os.environ.get(
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 
 
-def _sanitize_response(text: str) -> str:
-    """LLM レスポンスから JSON 部分を抽出.
-
-    Strands Agent の str(result) にはマークダウンコードブロックや
-    前後の説明テキストが含まれることがある。複数の手法で JSON を抽出する。
-    """
-    stripped = text.strip()
-
-    # 1. そのまま JSON として解析できるならそのまま返す
-    try:
-        json.loads(stripped)
-        return stripped
-    except (json.JSONDecodeError, TypeError):
-        pass
-
-    # 2. Markdown コードブロック除去
-    if stripped.startswith("```"):
-        first_newline = stripped.find("\n")
-        if first_newline != -1:
-            candidate = stripped[first_newline + 1:]
-        else:
-            candidate = stripped[3:]
-        if candidate.endswith("```"):
-            candidate = candidate[:-3].strip()
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    # 3. テキスト中の最外 JSON オブジェクトを抽出 ({ ... })
-    first_brace = stripped.find("{")
-    last_brace = stripped.rfind("}")
-    if first_brace != -1 and last_brace > first_brace:
-        candidate = stripped[first_brace:last_brace + 1]
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    return stripped
-
 app = BedrockAgentCoreApp()
 
 
@@ -164,23 +132,22 @@ def _setup_credentials(payload: dict) -> bool:
     return True
 
 
-def _build_system_prompt() -> str:
-    """現在日時を埋め込んだシステムプロンプトを生成."""
-    from datetime import datetime, timedelta, timezone
+def _build_system_prompt() -> list[dict] | str:
+    """システムプロンプトを生成 (固定部分をキャッシュし、現在日時は末尾)."""
+    return prompt_cache.build_system_prompt(SYSTEM_PROMPT)
 
-    jst = timezone(timedelta(hours=9))
-    now = datetime.now(jst)
-    weekday = ["月", "火", "水", "木", "金", "土", "日"][now.weekday()]
-    date_line = f"現在の日時: {now.strftime('%Y年%m月%d日')}({weekday}) {now.strftime('%H:%M')}"
-    return f"{date_line}\n\n{SYSTEM_PROMPT}"
 
-
-def create_agent() -> Agent:
-    """Gmail Agent を作成."""
-    model = BedrockModel(
-        model_id=MODEL_ID,
-        streaming=True,
-    )
+def create_agent(callback_handler=None, model=None) -> Agent:
+    """Gmail Agent を作成. callback_handler を渡すとテキスト差分を受け取れる."""
+    if model is None:
+        model = BedrockModel(
+            model_id=MODEL_ID,
+            streaming=True,
+            **prompt_cache.model_kwargs(),
+        )
+    kwargs = {}
+    if callback_handler is not None:
+        kwargs["callback_handler"] = callback_handler
     return Agent(
         model=model,
         system_prompt=_build_system_prompt(),
@@ -193,39 +160,162 @@ def create_agent() -> Agent:
             manage_labels,
             save_draft,
         ],
+        hooks=[TraceHooks()],
+        **kwargs,
     )
 
 
+_agent_pool = AgentPool(lambda **kwargs: create_agent(**kwargs), name="Gmail agent")
+
+
+# ---------- 構造化オペレーション (LLM を通さずにツールを実行) ----------
+
+
+def _inbox_envelope(emails: list, args: dict) -> dict:
+    message = f"受信トレイのメール{len(emails)}件です。" if emails else "メールはありません。"
+    return {"type": "email_list", "message": message, "emails": emails}
+
+
+def _search_envelope(emails: list, args: dict) -> dict:
+    message = f"検索結果は{len(emails)}件です。" if emails else "該当するメールはありません。"
+    return {"type": "email_list", "message": message, "emails": emails}
+
+
+def _confirm_send_envelope(_: None, args: dict) -> dict:
+    missing = [k for k in ("to", "subject", "body") if not args.get(k)]
+    if missing:
+        raise OperationError(f"confirm_send requires {', '.join(missing)}")
+    return {
+        "type": "email_confirm_send",
+        "message": "以下の内容でメールを送信しますか？",
+        "to": args["to"],
+        "subject": args["subject"],
+        "body": args["body"],
+    }
+
+
+def _sent_envelope(result: dict, args: dict) -> dict:
+    return {"type": "email_sent", "message": "メールを送信しました。"}
+
+
+def _deleted_envelope(result: dict, args: dict) -> dict:
+    return {"type": "email_deleted", "message": "メールを削除しました。"}
+
+
+def _labels_envelope(result: dict, args: dict) -> dict:
+    return {"type": "email_labels_updated", "message": "ラベルを更新しました。"}
+
+
+def _draft_envelope(result: dict, args: dict) -> dict:
+    return {"type": "draft_saved", "message": "下書きを保存しました。"}
+
+
+# get_email は本文の要約に LLM が必要なため対象外
+OPERATIONS = {
+    "list_emails": Operation(list_emails, _inbox_envelope),
+    "search_emails": Operation(search_emails, _search_envelope),
+    "confirm_send": Operation(None, _confirm_send_envelope),
+    "send_email": Operation(send_email, _sent_envelope),
+    "delete_email": Operation(delete_email, _deleted_envelope),
+    "manage_labels": Operation(manage_labels, _labels_envelope),
+    "save_draft": Operation(save_draft, _draft_envelope),
+}
+
+
+def _run_operation(payload: dict, ctx: RequestContext) -> Envelope | None:
+    """payload の op を直接実行. op がない・実行できない場合は None (LLM で処理する)."""
+    try:
+        parsed = operations.parse(payload)
+        if parsed is None:
+            return None
+        ctx.deadline.check()
+        with request_context.use(ctx):
+            return operations.run(OPERATIONS, *parsed)
+    except OperationError as e:
+        logger.info("Falling back to LLM: %s", e)
+        return None
+    except deadline.DeadlineExceeded:
+        logger.warning("No time left to run the operation")
+        return deadline.timeout_envelope()
+    except Exception:
+        # 送信・削除などを LLM でやり直すと二重実行になるため、フォールバックしない
+        logger.error("Gmail operation failed", exc_info=True)
+        return envelope.text("メールの操作に失敗しました。")
+
+
 @app.entrypoint
+@tracing.entrypoint("gmail_agent.invoke", service="gmail-agent")
 def invoke(payload: dict) -> dict:
     """Gmail Agent を呼び出し."""
     prompt = payload.get("prompt", "")
     if not prompt:
-        return {"result": '{"type": "text", "message": "メッセージが空です。"}', "status": "error"}
+        return {"result": envelope.text("メッセージが空です。").to_dict(), "status": "error"}
 
-    # Google 認証情報セットアップ
-    if not _setup_credentials(payload):
-        return {
-            "result": '{"type": "oauth_required", "message": "Google 認証が必要です。"}',
-            "status": "error",
-        }
+    # Google 認証情報セットアップ (リクエストごとのコンテキストに保持する)
+    ctx = RequestContext(deadline=deadline.from_payload(payload))
+    with request_context.use(ctx), tracing.span("credentials.setup"):
+        has_credentials = _setup_credentials(payload)
+    if not has_credentials:
+        return {"result": envelope.make("oauth_required", "Google 認証が必要です。").to_dict(), "status": "error"}
 
-    logger.info("Invoking gmail agent with prompt length: %d", len(prompt))
+    response = _run_operation(payload, ctx)
+    if response is not None:
+        if wants_stream(payload):
+            return single_result(response)
+        return {"result": response.to_dict(), "status": "success", "metrics": {"operation": payload["op"]}}
 
-    agent = create_agent()
-    result = agent(prompt)
+    logger.info("Invoking gmail agent with prompt length: %d", len(prompt))
 
-    response_text = _sanitize_response(str(result))
-    logger.info("Gmail agent response length: %d", len(response_text))
+    if wants_stream(payload):
+        return _invoke_stream(prompt, ctx)
 
-    # JSON レスポンスの検証
-    try:
-        parsed = json.loads(response_text)
-        return {"result": response_text, "status": "success"}
-    except json.JSONDecodeError:
-        # JSON でない場合はテキストとしてラップ
-        fallback = json.dumps({"type": "text", "message": response_text}, ensure_ascii=False)
-        return {"result": fallback, "status": "success"}
+    with request_context.use(ctx), _agent_pool.acquire(
+        _build_system_prompt(), callback_handler=ctx.deadline.callback_handler()
+    ) as lease:
+        try:
+            result = lease.agent(prompt)
+        except deadline.DeadlineExceeded:
+            logger.warning("Gmail agent stopped at the deadline")
+            return {"result": deadline.timeout_envelope().to_dict(), "status": "timeout", "metrics": lease.metrics()}
+
+    response = _finalize_response(str(result))
+    logger.info("Gmail agent response type: %s", response.type)
+    return {"result": response.to_dict(), "status": "success", "metrics": lease.metrics()}
+
+
+def _finalize_response(text: str) -> Envelope:
+    """LLM 出力から JSON エンベロープを取り出す. JSON でなければテキストとしてラップ."""
+    return envelope.coerce(text)
+
+
+def _invoke_stream(prompt: str, ctx: RequestContext):
+    """ストリーミング版. エンベロープの JSON が閉じた時点で result を流す."""
+    bridge = StreamBridge()
+    scanner = EnvelopeScanner()
+
+    def callback_handler(**kwargs) -> None:
+        bridge.callback_handler(**kwargs)
+        text = kwargs.get("data")
+        if text:
+            found = scanner.feed(text)
+            if found is not None and bridge.publish_result(found):
+                logger.info("Gmail agent envelope completed early")
+        if kwargs.get("message") is not None:
+            scanner.reset()
+
+    def _run() -> None:
+        with request_context.use(ctx), _agent_pool.acquire(
+            _build_system_prompt(), callback_handler=ctx.deadline.callback_handler(callback_handler)
+        ) as lease:
+            try:
+                result = lease.agent(prompt)
+            except deadline.DeadlineExceeded:
+                logger.warning("Gmail agent stopped at the deadline")
+                bridge.publish_result(deadline.timeout_envelope(), status="timeout")
+                return
+        bridge.publish_result(_finalize_response(str(result)))
+
+    return bridge.run(_run, deadline=ctx.deadline)
 
 
 if __name__ == "__main__":
@@ -12,8 +12,6 @@ Agents as Tools パターン:
 import json
 import logging
 import os
-import urllib.request
-from datetime import datetime, timedelta, timezone
 
 # ローカル開発時は .env.local を読み込む
 try:
@@ -24,12 +22,24 @@ try:
 except ImportError:
     pass
 
+import deadline
+import envelope
+import http_pool
+import memory_sessions
+import prompt_cache
+import request_context
+import tracing
+from agent_pool import AgentPool
 from bedrock_agentcore import BedrockAgentCoreApp
+from envelope import Envelope
+from memory_sessions import MemorySessionCache
 from strands import Agent, tool
 from strands.models import BedrockModel
+from strands.tools.executors import ConcurrentToolExecutor
+from streaming import StreamBridge, read_agent_response, wants_stream
+from request_context import RequestContext
+from trace_hooks import TraceHooks
 from tools.google_maps import (
-    clear_maps_result,
-    get_maps_result,
     recommend_place,
     request_location,
     search_place,
@@ -39,8 +49,6 @@ from tools.tavily_search import extract_content, web_search
 logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
-jst = timezone(timedelta(hours=9))
-
 # --- Bedrock AgentCore Memory (条件付き) ---
 BEDROCK_MEMORY_ID = os.environ.get("BEDROCK_MEMORY_ID", "")
 _memory_available = False
@@ -59,10 +67,9 @@ def _build_session_manager(line_user_id: str):
     """Memory が利用可能なら AgentCoreMemorySessionManager を構築."""
     if not _memory_available or not BEDROCK_MEMORY_ID:
         return None
-    today = datetime.now(jst).strftime("%Y-%m-%d")
     config = AgentCoreMemoryConfig(
         memory_id=BEDROCK_MEMORY_ID,
-        session_id=f"{line_user_id}-{today}",
+        session_id=f"{line_user_id}-{memory_sessions.session_day()}",
         actor_id=line_user_id,
     )
     return AgentCoreMemorySessionManager(
@@ -141,6 +148,8 @@ extract_content を呼ぶべきケース:
 ・「前に話した○○」のような参照があれば記憶から思い出してください
 ・ただし記憶を無理に言及する必要はありません。自然な会話を優先してください
 
+calendar_agent / gmail_agent は、操作と引数がすべて確定しているときは op と args も指定してください（曖昧なら query のみ）。
+「今日の予定とメールを見せて」のように互いに独立した操作を頼まれた場合は、1 回の応答で必要なツールをすべて同時に呼んでください（結果を待って順番に呼ばないでください）。
 calendar_agent ツールを呼んだ場合は、その戻り値をそのまま返してください。加工しないでください。
 gmail_agent ツールを呼んだ場合は、その戻り値をそのまま返してください。加工しないでください。
 search_place / recommend_place ツールを呼んだ場合も、その戻り値をそのまま返してください。加工しないでください。
@@ -152,202 +161,323 @@ MODEL_ID = os.environ.get(
     "us.anthropic.claude-sonnet-4-5-20250929-v1:0",
 )
 
-def _sanitize_response(text: str) -> str:
-    """LLM レスポンスから JSON 部分を抽出.
-
-    Strands Agent の str(result) にはマークダウンコードブロックや
-    前後の説明テキストが含まれることがある。複数の手法で JSON を抽出する。
-    """
-    stripped = text.strip()
-
-    # 1. そのまま JSON として解析できるならそのまま返す
-    try:
-        json.loads(stripped)
-        return stripped
-    except (json.JSONDecodeError, TypeError):
-        pass
-
-    # 2. Markdown コードブロック除去
-    if stripped.startswith("```"):
-        first_newline = stripped.find("\n")
-        if first_newline != -1:
-            candidate = stripped[first_newline + 1:]
-        else:
-            candidate = stripped[3:]
-        if candidate.endswith("```"):
-            candidate = candidate[:-3].strip()
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    # 3. テキスト中の最外 JSON オブジェクトを抽出 ({ ... })
-    first_brace = stripped.find("{")
-    last_brace = stripped.rfind("}")
-    if first_brace != -1 and last_brace > first_brace:
-        candidate = stripped[first_brace:last_brace + 1]
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    return stripped
-
-
 CALENDAR_AGENT_ENDPOINT = os.environ.get("CALENDAR_AGENT_ENDPOINT", "http://localhost:8081")
 GMAIL_AGENT_ENDPOINT = os.environ.get("GMAIL_AGENT_ENDPOINT", "http://localhost:8082")
 
 app = BedrockAgentCoreApp()
 
-# Google 認証情報をリクエストスコープで保持
-_google_credentials: dict | None = None
-# calendar_agent / gmail_agent ツールの生レスポンスを保持（LLM の加工をバイパスするため）
-_calendar_agent_result: str | None = None
-_gmail_agent_result: str | None = None
-
 
-@tool
-def calendar_agent(query: str) -> str:
-    """Google Calendar の予定確認・作成・変更・削除・空き時間確認を行うエージェント。
-    カレンダーに関する操作はすべてこのツールに委譲してください。"""
-    global _calendar_agent_result
+def _invoke_sub_agent(endpoint: str, query: str, op: str = "", args: dict | None = None) -> Envelope:
+    """サブエージェントを呼び出して result のエンベロープを返す. ストリーミング中は差分を転送.
 
+    op を渡すとサブエージェントは LLM を使わずにツールを直接実行する (実行できなければ query で処理)。
+    Router の残り時間で打ち切り、締め切りを過ぎたら DeadlineExceeded を投げる。
+    """
+    ctx = request_context.current() or RequestContext()
+    dl = ctx.deadline or deadline.Deadline(deadline.DEADLINE_DEFAULT_SECONDS)
     payload = {"prompt": query}
-    if _google_credentials:
-        payload["google_credentials"] = _google_credentials
+    if op:
+        payload["op"] = op
+        payload["args"] = args or {}
+    if ctx.google_credentials:
+        payload["google_credentials"] = ctx.google_credentials
+    bridge = ctx.stream_bridge
+    if bridge is not None:
+        payload["stream"] = True
+    # サブエージェントは返送の余裕を残してフォールバックを返す
+    payload[deadline.PAYLOAD_KEY] = dl.child_budget_ms()
+
+    url = f"{endpoint.rstrip('/')}/invocations"
+    try:
+        with (
+            tracing.span("subagent.http", attributes={"http.url": url, "subagent.op": op}),
+            http_pool.pool.stream(
+                "POST",
+                url,
+                # サブエージェントのスパンをこの呼び出しの子にする
+                body=json.dumps(tracing.inject(payload)).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                timeout=dl.timeout(55),
+            ) as resp,
+        ):
+            for event in read_agent_response(resp):
+                if event.get("event") == "result":
+                    return envelope.coerce(event["result"])
+                if event.get("event") == "delta":
+                    if bridge is not None:
+                        bridge.publish_delta(event["text"])
+                elif "error" in event:
+                    raise RuntimeError(event["error"])
+                # delta が流れ続けていても締め切りで打ち切る (途中の接続は release で閉じる)
+                dl.check()
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as e:
+        if dl.expired():
+            raise deadline.DeadlineExceeded(f"sub agent timed out: {e}") from e
+        raise
+    raise RuntimeError("Sub agent stream ended without result")
 
-    url = f"{CALENDAR_AGENT_ENDPOINT.rstrip('/')}/invocations"
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url, data=data, headers={"Content-Type": "application/json"}
-    )
 
+@tool
+def calendar_agent(query: str, op: str = "", args: dict | None = None) -> dict:
+    """Google Calendar の予定確認・作成・変更・削除・空き時間確認を行うエージェント。
+    カレンダーに関する操作はすべてこのツールに委譲してください。
+
+    操作と引数がすべて確定している場合は op と args も指定してください (LLM を使わずに直接実行されます)。
+    曖昧な場合は op を空にして query だけを渡してください。
+    ・list_events: date_from, date_to (YYYY-MM-DD)
+    ・get_event: event_id
+    ・create_event: summary, start, end (YYYY-MM-DDTHH:MM:SS+09:00 または終日なら YYYY-MM-DD), description, location
+    ・update_event: event_id, summary, start, end, description, location (変更する項目のみ)
+    ・delete_event: event_id
+    ・invite_attendees: event_id, attendee_emails (カンマ区切り)
+    ・get_free_busy: date_from, date_to, suggested_title (日付未指定の予定作成・空き確認)
+
+    Args:
+        query: ユーザーの依頼内容 (自然文)。
+        op: 直接実行する操作名 (任意)。
+        args: op の引数 (任意)。
+    """
     try:
-        with urllib.request.urlopen(req, timeout=55) as resp:
-            result = json.loads(resp.read().decode("utf-8"))
-            raw_result = result.get("result", str(result))
+        raw_result = _invoke_sub_agent(CALENDAR_AGENT_ENDPOINT, query, op=op, args=args)
+    except deadline.DeadlineExceeded as e:
+        logger.warning("Calendar agent call timed out: %s", e)
+        raw_result = deadline.timeout_envelope()
     except Exception as e:
         logger.error("Calendar agent call failed: %s", e)
-        raw_result = json.dumps(
-            {"type": "text", "message": "カレンダーエージェントへの接続に失敗しました。"},
-            ensure_ascii=False,
-        )
+        raw_result = envelope.text("カレンダーエージェントへの接続に失敗しました。")
 
     # LLM が JSON を加工するのを防ぐため、生レスポンスを保持
-    _calendar_agent_result = raw_result
-    return raw_result
+    ctx = request_context.current()
+    if ctx is not None:
+        ctx.calendar_result = raw_result
+        _publish_bypass_result(ctx)
+    return raw_result.to_tool_result()
 
 
 @tool
-def gmail_agent(query: str) -> str:
+def gmail_agent(query: str, op: str = "", args: dict | None = None) -> dict:
     """Gmail のメール確認・検索・送信・削除・ラベル管理・下書き保存を行うエージェント。
-    メールに関する操作はすべてこのツールに委譲してください。"""
-    global _gmail_agent_result
-
-    payload = {"prompt": query}
-    if _google_credentials:
-        payload["google_credentials"] = _google_credentials
-
-    url = f"{GMAIL_AGENT_ENDPOINT.rstrip('/')}/invocations"
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url, data=data, headers={"Content-Type": "application/json"}
-    )
-
+    メールに関する操作はすべてこのツールに委譲してください。
+
+    操作と引数がすべて確定している場合は op と args も指定してください (LLM を使わずに直接実行されます)。
+    曖昧な場合やメールの詳細・要約は op を空にして query だけを渡してください。
+    ・list_emails: label (既定 INBOX), max_results
+    ・search_emails: query (Gmail の検索構文), max_results
+    ・confirm_send: to, subject, body (送信前の確認画面。送信依頼はまずこれ)
+    ・send_email: to, subject, body, cc, bcc (ユーザーが送信を承認した後のみ)
+    ・delete_email: email_id
+    ・manage_labels: email_id, add_labels, remove_labels (カンマ区切り)
+    ・save_draft: to, subject, body, cc
+
+    Args:
+        query: ユーザーの依頼内容 (自然文)。
+        op: 直接実行する操作名 (任意)。
+        args: op の引数 (任意)。
+    """
     try:
-        with urllib.request.urlopen(req, timeout=55) as resp:
-            result = json.loads(resp.read().decode("utf-8"))
-            raw_result = result.get("result", str(result))
+        raw_result = _invoke_sub_agent(GMAIL_AGENT_ENDPOINT, query, op=op, args=args)
+    except deadline.DeadlineExceeded as e:
+        logger.warning("Gmail agent call timed out: %s", e)
+        raw_result = deadline.timeout_envelope()
     except Exception as e:
         logger.error("Gmail agent call failed: %s", e)
-        raw_result = json.dumps(
-            {"type": "text", "message": "メールエージェントへの接続に失敗しました。"},
-            ensure_ascii=False,
-        )
+        raw_result = envelope.text("メールエージェントへの接続に失敗しました。")
 
     # LLM が JSON を加工するのを防ぐため、生レスポンスを保持
-    _gmail_agent_result = raw_result
-    return raw_result
+    ctx = request_context.current()
+    if ctx is not None:
+        ctx.gmail_result = raw_result
+        _publish_bypass_result(ctx)
+    return raw_result.to_tool_result()
+
+
+# LLM の加工をバイパスして生レスポンスを返すツール → RequestContext の属性
+_BYPASS_TOOLS = {
+    "calendar_agent": "calendar_result",
+    "gmail_agent": "gmail_result",
+    "search_place": "maps_result",
+    "recommend_place": "maps_result",
+    "request_location": "maps_result",
+}
+# 複数のツールが結果を返したときの並び順
+_BYPASS_RESULTS = ("calendar_result", "gmail_result", "maps_result")
+
+
+def _multi_envelope(results: list[Envelope]) -> Envelope:
+    """複数ツールの結果を 1 つのエンベロープ (type=multi) にまとめる."""
+    return envelope.make("multi", parts=[envelope.coerce(result).to_dict() for result in results])
+
+
+def _bypass_result(ctx: RequestContext) -> Envelope | None:
+    """LLM の加工をバイパスして返すツールの生レスポンス (なければ None). 複数あれば type=multi."""
+    results = [(name, getattr(ctx, name)) for name in _BYPASS_RESULTS if getattr(ctx, name) is not None]
+    if not results:
+        return None
+    logger.info(
+        "Using raw %s (bypassing LLM post-processing)", ", ".join(name for name, _ in results)
+    )
+    if len(results) == 1:
+        return results[0][1]
+    return _multi_envelope([result for _, result in results])
 
 
-def _build_system_prompt() -> str:
-    """現在日時を埋め込んだシステムプロンプトを生成."""
-    now = datetime.now(jst)
-    weekday = ["月", "火", "水", "木", "金", "土", "日"][now.weekday()]
-    date_line = f"現在の日時: {now.strftime('%Y年%m月%d日')}({weekday}) {now.strftime('%H:%M')}"
-    return f"{date_line}\n\n{SYSTEM_PROMPT}"
+def _publish_bypass_result(ctx: RequestContext) -> None:
+    """ストリーミング中ならツールの生レスポンスを Router の LLM 完了を待たずに流す.
 
+    同じターンで並行に呼ばれた他のバイパス対象ツールがまだ終わっていなければ待つ。
+    """
+    bridge = ctx.stream_bridge
+    if bridge is None or bridge.result_sent:
+        return
+    if any(getattr(ctx, name) is None for name in ctx.pending_results):
+        return
+    result = _bypass_result(ctx)
+    if result is not None:
+        bridge.publish_result(result)
 
-def create_agent(session_manager=None) -> Agent:
-    """Router Agent を作成."""
-    model = BedrockModel(
-        model_id=MODEL_ID,
-        streaming=True,
-    )
+
+def _on_router_message(ctx: RequestContext, message: dict) -> None:
+    """Router の会話にメッセージが追加されたとき.
+
+    assistant のツール呼び出しから同じターンで待つ結果を記録し、
+    ツール結果のメッセージ (ターン内の全ツールの完了) で結果を流す。
+    """
+    if message.get("role") == "assistant":
+        ctx.pending_results = {
+            _BYPASS_TOOLS[block["toolUse"].get("name")]
+            for block in message.get("content") or []
+            if isinstance(block, dict) and "toolUse" in block and block["toolUse"].get("name") in _BYPASS_TOOLS
+        }
+        return
+    ctx.pending_results = set()
+    _publish_bypass_result(ctx)
+
+
+def _build_system_prompt() -> list[dict] | str:
+    """システムプロンプトを生成 (固定部分をキャッシュし、現在日時は末尾)."""
+    return prompt_cache.build_system_prompt(SYSTEM_PROMPT)
+
+
+def create_agent(session_manager=None, callback_handler=None, model=None) -> Agent:
+    """Router Agent を作成. model を渡すと BedrockModel を使い回す."""
+    if model is None:
+        model = BedrockModel(
+            model_id=MODEL_ID,
+            streaming=True,
+            **prompt_cache.model_kwargs(),
+        )
     kwargs = {
         "model": model,
         "system_prompt": _build_system_prompt(),
         "tools": [calendar_agent, gmail_agent, search_place, recommend_place, request_location, web_search, extract_content],
+        # 同じターンの独立したツール呼び出し (予定とメールなど) をスレッドで並行に実行する
+        "tool_executor": ConcurrentToolExecutor(),
+        # モデル呼び出し・ツール呼び出しごとのスパン
+        "hooks": [TraceHooks()],
     }
     if session_manager is not None:
         kwargs["session_manager"] = session_manager
+    if callback_handler is not None:
+        kwargs["callback_handler"] = callback_handler
     return Agent(**kwargs)
 
 
+# warm コンテナ内で Agent を使い回す (リクエストごとに履歴を消して日時の行だけ差し替える)
+_agent_pool = AgentPool(lambda **kwargs: create_agent(**kwargs), name="Router agent")
+# Memory の session manager と Agent をユーザー・日付ごとに使い回す (履歴の読み込みを省く)
+_memory_sessions = MemorySessionCache(lambda line_user_id: _build_session_manager(line_user_id))
+
+
 @app.entrypoint
+@tracing.entrypoint("router.invoke", service="router-agent")
 def invoke(payload: dict) -> dict:
     """Router Agent を呼び出し."""
-    global _google_credentials, _calendar_agent_result, _gmail_agent_result
-
     prompt = payload.get("prompt", "")
     if not prompt:
-        return {"result": "メッセージが空です。", "status": "error"}
+        return {"result": envelope.text("メッセージが空です。").to_dict(), "status": "error"}
 
-    # リクエストスコープの初期化
-    _google_credentials = payload.get("google_credentials")
-    _calendar_agent_result = None
-    _gmail_agent_result = None
-    clear_maps_result()
+    # リクエストスコープの状態 (同じコンテナで並行に処理するリクエストと共有しない)
+    ctx = RequestContext(
+        google_credentials=payload.get("google_credentials"),
+        deadline=deadline.from_payload(payload),
+    )
 
     logger.info("Invoking router agent with prompt length: %d", len(prompt))
 
-    # Memory session manager の構築
-    session_manager = None
     line_user_id = payload.get("line_user_id")
-    if line_user_id:
+    if wants_stream(payload):
+        return _invoke_stream(prompt, line_user_id, ctx)
+
+    status = "success"
+    with (
+        request_context.use(ctx),
+        _memory_sessions.checkout(line_user_id) as session,
+        _agent_pool.acquire(
+            _build_system_prompt(),
+            callback_handler=ctx.deadline.callback_handler(),
+            session=session,
+        ) as lease,
+    ):
         try:
-            session_manager = _build_session_manager(line_user_id)
-        except Exception:
-            logger.warning("Failed to build session manager, continuing without memory", exc_info=True)
-
-    agent = create_agent(session_manager=session_manager)
-    result = agent(prompt)
-
-    # ツールが呼ばれた場合、LLM の加工を無視して生の JSON を返す
-    maps_result = get_maps_result()
-    if _calendar_agent_result is not None:
-        response_text = _calendar_agent_result
-        logger.info("Using raw calendar_agent result (bypassing LLM post-processing)")
-    elif _gmail_agent_result is not None:
-        response_text = _gmail_agent_result
-        logger.info("Using raw gmail_agent result (bypassing LLM post-processing)")
-    elif maps_result is not None:
-        response_text = maps_result
-        logger.info("Using raw maps_agent result (bypassing LLM post-processing)")
-    else:
-        response_text = _sanitize_response(str(result))
-
-    logger.info("Router agent response length: %d", len(response_text))
-
-    # クリア
-    _google_credentials = None
-    _calendar_agent_result = None
-    _gmail_agent_result = None
-    clear_maps_result()
-
-    return {"result": response_text, "status": "success"}
+            result = lease.agent(prompt)
+        except deadline.DeadlineExceeded:
+            logger.warning("Router agent stopped at the deadline")
+            result, status = None, "timeout"
+
+    # ツールが呼ばれた場合、LLM の加工を無視してツールのエンベロープを返す
+    response = _bypass_result(ctx)
+    if response is None:
+        response = envelope.coerce(str(result)) if result is not None else deadline.timeout_envelope()
+
+    logger.info("Router agent response type: %s", response.type)
+    metrics = {**lease.metrics(), **_memory_metrics(session)}
+    return {"result": response.to_dict(), "status": status, "metrics": metrics}
+
+
+def _memory_metrics(session) -> dict:
+    if session is None:
+        return {}
+    return {"memory_session_hit": session.hit, "memory_load_ms": round(session.load_ms, 1)}
+
+
+def _invoke_stream(prompt: str, line_user_id: str | None, ctx: RequestContext):
+    """ストリーミング版.
+
+    サブエージェント / 場所ツールの結果が出た時点で result を流し、
+    Router の LLM が結果を読み直して応答し終わるのを待たない。
+    エージェント自体は最後まで実行する (Memory への保存のため)。締め切りまでに
+    結果が出なければ途中までのツール結果かタイムアウトのエンベロープを流す。
+    """
+    bridge = StreamBridge()
+    # 場所ツールと、同じターンで並行に呼ばれたツールの結果はツール結果メッセージが追加された時点で流す
+    bridge.on_message = lambda message: _on_router_message(ctx, message)
+    ctx.stream_bridge = bridge
+
+    def _run() -> None:
+        with (
+            request_context.use(ctx),
+            _memory_sessions.checkout(line_user_id) as session,
+            _agent_pool.acquire(
+                _build_system_prompt(),
+                callback_handler=ctx.deadline.callback_handler(bridge.callback_handler),
+                session=session,
+            ) as lease,
+        ):
+            try:
+                result = lease.agent(prompt)
+            except deadline.DeadlineExceeded:
+                logger.warning("Router agent stopped at the deadline")
+                bridge.publish_result(_bypass_result(ctx) or deadline.timeout_envelope(), status="timeout")
+                return
+        response = _bypass_result(ctx)
+        if response is None:
+            response = envelope.coerce(str(result))
+        if bridge.publish_result(response):
+            logger.info("Router agent response type: %s", response.type)
+
+    return bridge.run(_run, deadline=ctx.deadline)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+"""AgentCore Memory のセッション (session manager と Agent) をユーザー・日付ごとに使い回すキャッシュ.
+
+セッション ID は `{line_user_id}-{YYYY-MM-DD}` で 1 日変わらないが、リクエストごとに
+AgentCoreMemoryConfig / AgentCoreMemorySessionManager (boto3 クライアント) を作り、
+Agent の生成時に会話履歴を Memory から読み直していた。
+
+session manager は結び付けた Agent と組でしか使えない (同じ agent_id の Agent を 2 つ
+登録できない) ため、組のまま LRU に置き、次のリクエストでは Agent の会話履歴をそのまま使う。
+
+- 日付が変わったら (JST の 0 時) 期限切れとして捨てる
+- 件数 (MEMORY_SESSION_CACHE_SIZE) とプロセスの RSS (MEMORY_SESSION_MAX_RSS_MB) で上限を設ける
+- 同じユーザーの並行リクエストが使用中なら、そのリクエストはキャッシュしないセッションを作る
+- 実行が途中で止まった (締め切りなど) セッションは捨て、次は Memory から読み直す
+
+キャッシュが効くのは同じユーザーのリクエストが同じコンテナに届くときだけで、Lambda は
+runtimeSessionId をユーザー × 日付 (JST) で固定している (AgentCore はセッション ID ごとに microVM を割り当てる)。
+microVM が回収されれば (アイドル・最大寿命) 新しいコンテナは空のキャッシュから Memory を読み直すので問題ない。
+一方、同じユーザーのターンが別のコンテナでも処理され (ローカルで複数レプリカに振り分けたときなど)、
+その後に元のコンテナへ戻ると、キャッシュ中の Agent にはその間のターンが入っておらず古い履歴で応答する。
+その日のうちは Memory から読み直さないため、セッションの割り当てが固定されない構成では
+MEMORY_SESSION_CACHE_SIZE=0 にする。
+
+ヒット時には初回の準備 (session manager の生成と履歴の読み込み) にかかった時間を
+省けた時間として stats() に積む。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# キャッシュするセッション (ユーザー × 日付) の最大数. 0 で無効
+MEMORY_SESSION_CACHE_SIZE = int(os.environ.get("MEMORY_SESSION_CACHE_SIZE", "32"))
+# プロセスの RSS がこれを超えたら古いセッションから半分捨てる (MB). 0 で無効
+MEMORY_SESSION_MAX_RSS_MB = int(os.environ.get("MEMORY_SESSION_MAX_RSS_MB", "1024"))
+
+_JST = timezone(timedelta(hours=9))
+
+# 捨てた理由
+EVICT_CAPACITY = "capacity"
+EVICT_EXPIRED = "expired"
+EVICT_PRESSURE = "pressure"
+EVICT_DISCARDED = "discarded"
+
+
+def session_day(now: float | None = None) -> str:
+    """セッション ID に使う日付 (JST)."""
+    return datetime.fromtimestamp(time.time() if now is None else now, _JST).strftime("%Y-%m-%d")
+
+
+def next_rollover(now: float) -> float:
+    """次の JST 0 時 (epoch 秒)."""
+    today = datetime.fromtimestamp(now, _JST).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today + timedelta(days=1)).timestamp()
+
+
+def rss_mb() -> float | None:
+    """プロセスの現在の RSS (MB). 取れなければ None."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+@dataclass
+class MemorySession:
+    """1 ユーザー・1 日のセッション. agent は最初のリクエストで AgentPool が作る."""
+
+    key: tuple[str, str]
+    session_manager: Any
+    expires_at: float
+    cached: bool = True
+    hit: bool = False
+    agent: Any = None
+    default_handler: Any = None
+    # session manager の生成 + Agent の生成 (履歴の読み込み) にかかった時間
+    load_ms: float = 0.0
+    discarded: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def discard(self) -> None:
+        """このセッションを使い回さない (会話履歴が途中の状態になったときなど)."""
+        self.discarded = True
+
+
+class MemorySessionCache:
+    """(line_user_id, 日付) → MemorySession の LRU.
+
+    build は line_user_id から session manager を作る関数 (Memory が使えなければ None)。
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str], Any],
+        max_entries: int = MEMORY_SESSION_CACHE_SIZE,
+        max_rss_mb: int = MEMORY_SESSION_MAX_RSS_MB,
+        clock: Callable[[], float] = time.time,
+        rss: Callable[[], float | None] = rss_mb,
+    ):
+        self._build = build
+        self.max_entries = max(0, max_entries)
+        self.max_rss_mb = max_rss_mb
+        self._clock = clock
+        self._rss = rss
+        self._entries: OrderedDict[tuple[str, str], MemorySession] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "busy": 0, "saved_ms": 0.0, "load_ms": 0.0, "loads": 0}
+        self._evictions = {EVICT_CAPACITY: 0, EVICT_EXPIRED: 0, EVICT_PRESSURE: 0, EVICT_DISCARDED: 0}
+
+    @contextmanager
+    def checkout(self, line_user_id: str | None) -> Iterator[MemorySession | None]:
+        """その日のセッションを借りる. Memory が使えない・作れなければ None."""
+        session = self._checkout(line_user_id) if line_user_id else None
+        try:
+            yield session
+        finally:
+            if session is not None:
+                self._checkin(session)
+
+    def _checkout(self, line_user_id: str) -> MemorySession | None:
+        now = self._clock()
+        key = (line_user_id, session_day(now))
+        with self._lock:
+            self._evict_expired(now)
+            session = self._entries.get(key)
+            if session is not None and session.lock.acquire(blocking=False):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["saved_ms"] += session.load_ms
+                session.hit = True
+                logger.info("Memory session hit for %s (saved %.0fms)", line_user_id, session.load_ms)
+                return session
+            busy = session is not None
+            self._stats["busy" if busy else "misses"] += 1
+
+        started = time.perf_counter()
+        try:
+            session_manager = self._build(line_user_id)
+        except Exception:
+            logger.warning("Failed to build session manager, continuing without memory", exc_info=True)
+            return None
+        if session_manager is None:
+            return None
+        cached = not busy and self.max_entries > 0
+        session = MemorySession(
+            key, session_manager, next_rollover(now), cached=cached, load_ms=(time.perf_counter() - started) * 1000
+        )
+        session.lock.acquire()
+        if cached:
+            with self._lock:
+                self._entries[key] = session
+                self._entries.move_to_end(key)
+                self._enforce_limits(key)
+        return session
+
+    def _checkin(self, session: MemorySession) -> None:
+        with self._lock:
+            if session.agent is not None and not session.hit:
+                self._stats["loads"] += 1
+                self._stats["load_ms"] += session.load_ms
+            if session.discarded and self._entries.get(session.key) is session:
+                del self._entries[session.key]
+                self._evictions[EVICT_DISCARDED] += 1
+        session.lock.release()
+
+    def _evict_expired(self, now: float) -> None:
+        for key in [key for key, s in self._entries.items() if s.expires_at <= now]:
+            del self._entries[key]
+            self._evictions[EVICT_EXPIRED] += 1
+
+    def _enforce_limits(self, keep: tuple[str, str]) -> None:
+        while len(self._entries) > self.max_entries:
+            self._evict_oldest(EVICT_CAPACITY, keep)
+        if self.max_rss_mb <= 0:
+            return
+        rss = self._rss()
+        if rss is not None and rss > self.max_rss_mb:
+            # 捨ててもすぐには RSS が下がらないため、一度に半分まで減らす
+            target = len(self._entries) // 2
+            logger.warning("RSS %.0fMB over %dMB, evicting memory sessions to %d", rss, self.max_rss_mb, target)
+            while len(self._entries) > max(target, 1):
+                if not self._evict_oldest(EVICT_PRESSURE, keep):
+                    break
+
+    def _evict_oldest(self, reason: str, keep: tuple[str, str]) -> bool:
+        for key in self._entries:
+            if key != keep:
+                del self._entries[key]
+                self._evictions[reason] += 1
+                return True
+        return False
+
+    def stats(self) -> dict:
+        """ヒット / ミス数と、ヒットで省けた準備時間 (ms)."""
+        with self._lock:
+            s = dict(self._stats)
+            evictions = dict(self._evictions)
+            entries = len(self._entries)
+        lookups = s["hits"] + s["misses"] + s["busy"]
+        return {
+            "hits": s["hits"],
+            "misses": s["misses"],
+            "busy": s["busy"],
+            "hit_rate": round(s["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "evictions": evictions,
+            "avg_load_ms": s["load_ms"] / s["loads"] if s["loads"] else 0.0,
+            "saved_ms": s["saved_ms"],
+        }
+
+    def clear(self) -> None:
+        """キャッシュと統計を消す (テスト・設定変更用)."""
+        with self._lock:
+            self._entries.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+            for key in self._evictions:
+                self._evictions[key] = 0
@@ -0,0 +1,70 @@
+"""Router → サブエージェントの構造化オペレーション.
+
+Router の LLM がパラメータまで決められる操作は、自由文の query の代わりに
+{"op": "list_events", "args": {...}} を送る。サブエージェントは LLM を呼ばずに
+ツール関数を直接実行し、LLM が返すのと同じ type のエンベロープ (envelope.Envelope) を返す。
+op が未知・引数が合わないときは OperationError を投げ、呼び出し側は query を
+使って従来どおり LLM で処理する。
+"""
+
+import inspect
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import tracing
+from envelope import Envelope
+
+logger = logging.getLogger(__name__)
+
+
+class OperationError(ValueError):
+    """オペレーションを直接実行できない (LLM にフォールバックする)."""
+
+
+@dataclass(frozen=True)
+class Operation:
+    """ツール関数と、その戻り値 (JSON を読み込んだもの) からエンベロープを作る関数.
+
+    envelope_args はツールには渡さずエンベロープの組み立てだけに使う引数。
+    tool が None なら引数だけでエンベロープを作る (送信前の確認画面など)。
+    """
+
+    tool: Callable[..., str] | None
+    envelope: Callable[[Any, dict], dict]
+    envelope_args: tuple[str, ...] = ()
+
+
+def parse(payload: dict) -> tuple[str, dict] | None:
+    """payload から (op, args) を取り出す. op がなければ None."""
+    op = payload.get("op")
+    if not op:
+        return None
+    args = payload.get("args") or {}
+    if not isinstance(op, str) or not isinstance(args, dict):
+        raise OperationError("op must be a string and args an object")
+    return op, args
+
+
+def run(registry: dict[str, Operation], op: str, args: dict) -> Envelope:
+    """op を直接実行してエンベロープを返す."""
+    operation = registry.get(op)
+    if operation is None:
+        raise OperationError(f"unknown op: {op}")
+    data = None
+    if operation.tool is not None:
+        tool_args = {k: v for k, v in args.items() if k not in operation.envelope_args}
+        try:
+            inspect.signature(operation.tool).bind(**tool_args)
+        except TypeError as e:
+            raise OperationError(f"invalid args for {op}: {e}") from e
+        with tracing.span(f"operation {op}", attributes={"operation.op": op}):
+            raw = operation.tool(**tool_args)
+        try:
+            data = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            data = raw
+    result = Envelope.from_dict(operation.envelope(data, args))
+    logger.info("Ran operation %s directly (type=%s)", op, result.type)
+    return result
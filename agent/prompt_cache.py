@@ -0,0 +1,73 @@
+"""Bedrock のプロンプトキャッシュ向けのシステムプロンプト構成とトークン使用量の集計.
+
+Bedrock のキャッシュはリクエストの先頭 (ツール定義 → システムプロンプト → 会話) から
+cachePoint までが一致したときに効く。現在日時の行をプロンプトの先頭に置くと毎分
+プレフィックスが変わってキャッシュされないため、長い固定のルールを先頭に置いて
+cachePoint を打ち、日時は cachePoint の後ろの短いブロックにする。ツール定義の後ろにも
+BedrockModel の cache_tools で cachePoint を打つ。
+
+リクエストごとのキャッシュ読み込み / 書き込み / キャッシュなしの入力トークン数は
+AgentPool が Agent のイベントループの累積使用量の差分から集計する。
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# システムプロンプトとツール定義に cachePoint を打つ
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+_JST = timezone(timedelta(hours=9))
+_WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+
+# Bedrock の usage のキーと metrics のキー
+_USAGE_KEYS = {
+    "inputTokens": "input_tokens",
+    "cacheReadInputTokens": "cache_read_input_tokens",
+    "cacheWriteInputTokens": "cache_write_input_tokens",
+    "outputTokens": "output_tokens",
+}
+
+
+def date_line(now: datetime | None = None) -> str:
+    now = now or datetime.now(_JST)
+    return f"現在の日時: {now.strftime('%Y年%m月%d日')}({_WEEKDAYS[now.weekday()]}) {now.strftime('%H:%M')}"
+
+
+def build_system_prompt(static_prompt: str, now: datetime | None = None) -> list[dict] | str:
+    """固定のプロンプト → cachePoint → 日時の行 の順に並べたシステムプロンプト.
+
+    キャッシュを無効にした場合も並び順は同じ (文字列で返す)。
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return f"{static_prompt}\n\n{date_line(now)}"
+    return [{"text": static_prompt}, CACHE_POINT, {"text": date_line(now)}]
+
+
+def model_kwargs() -> dict:
+    """BedrockModel に渡す設定 (ツール定義の後ろの cachePoint)."""
+    return {"cache_tools": "default"} if PROMPT_CACHE_ENABLED else {}
+
+
+def usage_snapshot(agent) -> dict[str, int]:
+    """Agent のイベントループの累積トークン使用量 (取れなければ空)."""
+    usage = getattr(getattr(agent, "event_loop_metrics", None), "accumulated_usage", None)
+    if not isinstance(usage, dict):
+        return {}
+    return {key: int(usage.get(key, 0) or 0) for key in _USAGE_KEYS}
+
+
+def usage_metrics(before: dict[str, int], after: dict[str, int]) -> dict:
+    """2 つのスナップショットの差分 = 1 リクエスト分の使用量と、入力のうちキャッシュから読んだ割合."""
+    if not before and not after:
+        return {}
+    metrics = {name: after.get(key, 0) - before.get(key, 0) for key, name in _USAGE_KEYS.items()}
+    total_input = (
+        metrics["input_tokens"] + metrics["cache_read_input_tokens"] + metrics["cache_write_input_tokens"]
+    )
+    metrics["cache_hit_rate"] = round(metrics["cache_read_input_tokens"] / total_input, 3) if total_input else 0.0
+    return metrics
@@ -0,0 +1,55 @@
+"""リクエストスコープの状態 (contextvars).
+
+Google 認証情報やツールの生レスポンスをモジュール変数に置くと、同じプロセスで
+並行に処理しているリクエスト同士で混ざる。リクエストごとに RequestContext を作り、
+contextvars 経由でツールから参照する。
+
+Strands はツールを別スレッドで実行するが、contextvars はコピーされて引き継がれる。
+コピー先で ContextVar を set し直しても呼び出し元には見えないため、ツールは
+RequestContext オブジェクトの属性を書き換えて結果を返す。
+"""
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+
+@dataclass
+class RequestContext:
+    """1 回の invoke の状態."""
+
+    # Router: サブエージェントに転送する認証情報 (dict)
+    google_credentials: dict | None = None
+    # Calendar / Gmail: ツールが使う google.oauth2.credentials.Credentials
+    credentials: Any = None
+    # LLM の加工をバイパスして返すツールの生レスポンス (envelope.Envelope)
+    calendar_result: Any = None
+    gmail_result: Any = None
+    maps_result: Any = None
+    # Router: 実行中のターンで呼ばれたバイパス対象ツールの結果の属性名 (揃うまで result を流さない)
+    pending_results: set[str] = field(default_factory=set)
+    # ストリーミング中の出力先 (streaming.StreamBridge)
+    stream_bridge: Any = None
+    # 締め切り (deadline.Deadline)
+    deadline: Any = None
+
+
+_current: contextvars.ContextVar[RequestContext | None] = contextvars.ContextVar(
+    "request_context", default=None
+)
+
+
+def current() -> RequestContext | None:
+    """実行中のリクエストの状態 (リクエスト外なら None)."""
+    return _current.get()
+
+
+@contextmanager
+def use(ctx: RequestContext) -> Iterator[RequestContext]:
+    """ctx をこのスコープ (とそこから起動したツール) のリクエスト状態にする."""
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
@@ -0,0 +1,254 @@
+"""Web 検索 (Tavily) の結果キャッシュ.
+
+L1: プロセス内 LRU / L2: TTL 付きの永続ストア (SQLite)。よく聞かれる検索や共有された
+URL を毎回 Tavily から取得しないようにする。
+
+キーは正規化したクエリ + search_depth + max_results、または正規化した URL の
+SHA-256。鮮度はクエリの種類ごとに分ける (ニュース・天気などは短く、一般的な
+調べ物は長く)。ヒット / ミスの件数を種類ごとに集計する。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# L2 のバックエンド (sqlite / none)
+SEARCH_CACHE_BACKEND = os.environ.get("SEARCH_CACHE_BACKEND", "sqlite")
+SEARCH_CACHE_SQLITE_PATH = os.environ.get("SEARCH_CACHE_SQLITE_PATH", "/tmp/search_cache.db")
+SEARCH_CACHE_L1_SIZE = int(os.environ.get("SEARCH_CACHE_L1_SIZE", "256"))
+# 種類ごとの有効期間 (秒)
+SEARCH_CACHE_TTL_REALTIME_SECONDS = int(os.environ.get("SEARCH_CACHE_TTL_REALTIME_SECONDS", "600"))
+SEARCH_CACHE_TTL_GENERAL_SECONDS = int(os.environ.get("SEARCH_CACHE_TTL_GENERAL_SECONDS", "86400"))
+SEARCH_CACHE_TTL_EXTRACT_SECONDS = int(os.environ.get("SEARCH_CACHE_TTL_EXTRACT_SECONDS", "21600"))
+
+# クエリの種類
+CLASS_REALTIME = "realtime"
+CLASS_GENERAL = "general"
+CLASS_EXTRACT = "extract"
+
+_REALTIME_WORDS = (
+    "最新", "ニュース", "速報", "今日", "きょう", "本日", "今週", "昨日", "明日", "現在", "いま", "今の",
+    "天気", "気温", "株価", "為替", "相場", "試合", "結果", "地震", "運行", "遅延",
+    "news", "latest", "today", "breaking", "weather", "price", "stock", "score",
+)
+# URL から落とすトラッキング用のクエリパラメータ
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|yclid|mc_cid|mc_eid|ref_src)$")
+
+
+def ttl_for(query_class: str) -> int:
+    return {
+        CLASS_REALTIME: SEARCH_CACHE_TTL_REALTIME_SECONDS,
+        CLASS_EXTRACT: SEARCH_CACHE_TTL_EXTRACT_SECONDS,
+    }.get(query_class, SEARCH_CACHE_TTL_GENERAL_SECONDS)
+
+
+def normalize_query(query: str) -> str:
+    """全角・半角と大文字小文字、空白の違いを揃える."""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def classify_query(query: str) -> str:
+    """鮮度が重要な (時事・天気など) クエリは realtime、それ以外は general."""
+    normalized = normalize_query(query)
+    return CLASS_REALTIME if any(word in normalized for word in _REALTIME_WORDS) else CLASS_GENERAL
+
+
+def canonical_url(url: str) -> str:
+    """スキーム・ホストの大文字小文字、既定ポート、フラグメント、トラッキングパラメータの違いを揃える."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not (scheme, parts.port) in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k))
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def search_key(query: str, search_depth: str, max_results: int) -> str:
+    return _digest("search", normalize_query(query), search_depth, max_results)
+
+
+def extract_key(url: str) -> str:
+    return _digest("extract", canonical_url(url))
+
+
+class SQLiteStore:
+    """TTL 付きの永続ストア (SQLite ファイル). 期限切れの行は読み込み時に無視し、書き込み時に掃除する."""
+
+    def __init__(self, path: str = SEARCH_CACHE_SQLITE_PATH):
+        import sqlite3
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, key: str, now: float) -> tuple[Any, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value: Any, expires_at: float, now: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache")
+
+
+class SearchCache:
+    """2 段のキャッシュ. store が None なら L1 のみ."""
+
+    def __init__(
+        self,
+        store: SQLiteStore | None = None,
+        l1_size: int = SEARCH_CACHE_L1_SIZE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._store = store
+        self.l1_size = l1_size
+        self._clock = clock
+        self._l1: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _count(self, query_class: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._stats.setdefault(query_class, {"l1_hits": 0, "l2_hits": 0, "misses": 0})
+            counts[outcome] += 1
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._l1[key] = (value, expires_at)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def _lookup(self, key: str, query_class: str) -> Any | None:
+        now = self._clock()
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._l1[key]
+                entry = None
+            if entry is not None:
+                self._l1.move_to_end(key)
+        if entry is not None:
+            self._count(query_class, "l1_hits")
+            return entry[0]
+        if self._store is not None:
+            try:
+                stored = self._store.get(key, now)
+            except Exception:
+                logger.warning("Search cache read failed", exc_info=True)
+                stored = None
+            if stored is not None:
+                self._remember(key, *stored)
+                self._count(query_class, "l2_hits")
+                return stored[0]
+        self._count(query_class, "misses")
+        return None
+
+    def get_or_fetch(self, key: str, query_class: str, fetch: Callable[[], Any]) -> Any:
+        """キャッシュにあればそれを、なければ fetch() の結果を保存して返す.
+
+        fetch の例外と None (結果なし) は保存しない。
+        """
+        value = self._lookup(key, query_class)
+        if value is not None:
+            return value
+        value = fetch()
+        if value is None:
+            return None
+        now = self._clock()
+        expires_at = now + ttl_for(query_class)
+        self._remember(key, value, expires_at)
+        if self._store is not None:
+            try:
+                self._store.put(key, value, expires_at, now)
+            except Exception:
+                logger.warning("Search cache write failed", exc_info=True)
+        return value
+
+    def stats(self) -> dict:
+        """種類ごとの L1 / L2 ヒット数・ミス数とヒット率."""
+        with self._lock:
+            snapshot = {name: dict(counts) for name, counts in self._stats.items()}
+            l1_entries = len(self._l1)
+        for counts in snapshot.values():
+            total = counts["l1_hits"] + counts["l2_hits"] + counts["misses"]
+            counts["hit_rate"] = (counts["l1_hits"] + counts["l2_hits"]) / total if total else 0.0
+        return {"l1_entries": l1_entries, "classes": snapshot}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._l1.clear()
+            self._stats.clear()
+        if self._store is not None:
+            self._store.clear()
+
+
+def build_search_cache(backend: str = "") -> SearchCache:
+    """環境変数からキャッシュを構築."""
+    backend = backend or SEARCH_CACHE_BACKEND
+    if backend == "sqlite":
+        try:
+            return SearchCache(SQLiteStore(SEARCH_CACHE_SQLITE_PATH))
+        except Exception:
+            logger.warning("Search cache store unavailable, using in-process cache only", exc_info=True)
+            return SearchCache()
+    if backend == "none":
+        return SearchCache()
+    raise ValueError(f"Unknown SEARCH_CACHE_BACKEND: {backend}")
+
+
+_cache: SearchCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """プロセス内で共有するキャッシュを取得 (warm コンテナでは再利用)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_search_cache()
+    return _cache
+
+
+def set_search_cache(cache: SearchCache | None) -> None:
+    """共有キャッシュを差し替え (テスト・ローカル検証用)."""
+    global _cache
+    _cache = cache
@@ -0,0 +1,54 @@
+"""Agent の SSE レスポンス (`data: {json}`) の読み取り.
+
+AgentCore (BedrockAgentCoreApp) はエントリポイントが返す generator の各要素を
+`data: {json}` の SSE イベントとして送る。Router はサブエージェントの応答を、
+Lambda は Router の応答をこのパーサーで読む (送る側と読む側で形式をそろえる)。
+
+- {"event": "delta", "text": "..."}            テキスト差分
+- {"event": "result", "result": {...}, ...}    最終エンベロープ (JSON オブジェクト)
+- {"error": "...", ...}                         ストリーミング中の例外 (AgentCore が付与)
+"""
+
+import json
+from typing import Iterable, Iterator
+
+
+class SSEParser:
+    """チャンク境界をまたぐ SSE を逐次パースする."""
+
+    def __init__(self):
+        self._buffer = b""
+        self._data_lines: list[str] = []
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        """チャンクを追加し、完成したイベントを返す."""
+        self._buffer += chunk
+        events = []
+        while b"\n" in self._buffer:
+            raw, self._buffer = self._buffer.split(b"\n", 1)
+            line = raw.rstrip(b"\r").decode("utf-8")
+            if not line:
+                if self._data_lines:
+                    events.append(json.loads("\n".join(self._data_lines)))
+                    self._data_lines = []
+            elif line.startswith("data:"):
+                self._data_lines.append(line[5:].lstrip(" "))
+        return events
+
+    def close(self) -> list[dict]:
+        """末尾の空行なしで終わったイベントを返す."""
+        if self._buffer:
+            self.feed(b"\n")
+        if self._data_lines:
+            event = json.loads("\n".join(self._data_lines))
+            self._data_lines = []
+            return [event]
+        return []
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """SSE のバイト列から `data:` イベントを 1 つずつ dict で返す (チャンクは必要な分だけ読む)."""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
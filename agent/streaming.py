@@ -0,0 +1,200 @@
+"""Agent 出力のストリーミング (AgentCore の SSE レスポンス用).
+
+エントリポイントが generator を返すと AgentCore (BedrockAgentCoreApp) は
+各要素を `data: {json}` の SSE イベントとして送出する (読む側は sse.py)。イベントは 2 種類:
+
+- {"event": "delta", "text": "..."}            LLM のテキスト差分 (参考情報)
+- {"event": "result", "result": {...}, ...}    最終エンベロープ (JSON オブジェクト, 1 回だけ)
+
+result を出した後に届く delta は捨てる (Router の LLM 後処理など不要な出力のため)。
+"""
+
+import contextvars
+import json
+import logging
+import queue
+import threading
+from typing import Callable, Iterator
+
+import envelope
+import sse
+from deadline import timeout_envelope
+from envelope import Envelope
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def delta_event(text: str) -> dict:
+    return {"event": "delta", "text": text}
+
+
+def result_event(result: Envelope, status: str = "success") -> dict:
+    return {"event": "result", "result": result.to_dict(), "status": status}
+
+
+def single_result(result: Envelope, status: str = "success") -> Iterator[dict]:
+    """LLM を通さずに確定した結果を 1 イベントのストリームとして返す."""
+    yield result_event(result, status)
+
+
+def wants_stream(payload: dict) -> bool:
+    """呼び出し元がストリーミングを要求しているか."""
+    return bool(payload.get("stream"))
+
+
+def read_agent_response(resp) -> Iterator[dict]:
+    """サブエージェントの HTTP レスポンスをイベント列として読む.
+
+    SSE なら逐次、JSON なら result イベント 1 つに変換する。
+    """
+    content_type = resp.headers.get("Content-Type", "")
+    if "text/event-stream" in content_type:
+        yield from sse.iter_sse_events(iter(lambda: resp.read1(8192), b""))
+        return
+    body = json.loads(resp.read().decode("utf-8"))
+    yield result_event(envelope.coerce(body.get("result", body)), body.get("status", "success"))
+
+
+class EnvelopeScanner:
+    """LLM のテキスト差分から、先頭の JSON オブジェクトが閉じた時点を検出する.
+
+    文字列リテラル中の括弧は無視する。先頭が JSON でないメッセージは対象外。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = -1
+        self._gave_up = False
+
+    def feed(self, text: str) -> Envelope | None:
+        """差分を追加し、エンベロープ (type を持つ JSON) が完成したら返す."""
+        if self._gave_up:
+            return None
+        offset = len(self._buffer)
+        self._buffer += text
+        for i in range(offset, len(self._buffer)):
+            ch = self._buffer[i]
+            if self._start == -1:
+                # コードフェンス以外のテキストで始まる応答は最後まで待つ
+                prefix = self._buffer[:i].strip()
+                if ch == "{" and prefix in ("", "```", "```json"):
+                    self._start = i
+                    self._depth = 1
+                elif ch == "{" or len(prefix) > len("```json"):
+                    self._gave_up = True
+                    return None
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self._buffer[self._start:i + 1]
+                    self._gave_up = True
+                    try:
+                        parsed = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        return None
+                    if not isinstance(parsed, dict) or "type" not in parsed:
+                        return None
+                    try:
+                        return Envelope.from_dict(parsed)
+                    except envelope.EnvelopeError:
+                        # 読めないものは最終結果 (coerce) に任せる
+                        return None
+        return None
+
+
+class StreamBridge:
+    """別スレッドで動くエージェントの出力を generator に橋渡しする.
+
+    callback_handler を Strands Agent に渡すと、テキスト差分が delta として流れる。
+    publish_result() は 1 回目だけ有効で、以降の delta は捨てる。
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._result_sent = False
+        self._lock = threading.Lock()
+        self.on_message: Callable[[dict], None] | None = None
+
+    @property
+    def result_sent(self) -> bool:
+        return self._result_sent
+
+    def callback_handler(self, **kwargs) -> None:
+        """Strands Agent の callback_handler."""
+        text = kwargs.get("data")
+        if text:
+            self.publish_delta(text)
+        message = kwargs.get("message")
+        if message is not None and self.on_message is not None:
+            self.on_message(message)
+
+    def publish_delta(self, text: str) -> None:
+        if not self._result_sent:
+            self._queue.put(delta_event(text))
+
+    def publish_result(self, result: Envelope, status: str = "success") -> bool:
+        """最終結果を流す. すでに流していれば False."""
+        with self._lock:
+            if self._result_sent:
+                return False
+            self._result_sent = True
+        self._queue.put(result_event(result, status))
+        return True
+
+    def run(self, fn: Callable[[], None], deadline=None) -> Iterator[dict]:
+        """fn を別スレッドで実行し、流れてきたイベントを yield する.
+
+        fn の終了 (例外含む) でストリームを閉じる。結果を出さずに例外で終わった場合は
+        エラーエンベロープを result として流す。deadline (deadline.Deadline) までに
+        結果が出なければタイムアウトのエンベロープを流す (fn はそのまま最後まで待つ)。
+        """
+        ctx = contextvars.copy_context()
+
+        def _target() -> None:
+            try:
+                ctx.run(fn)
+            except Exception:
+                logger.error("Streaming agent failed", exc_info=True)
+                self.publish_result(
+                    envelope.text("申し訳ありません。エラーが発生しました。もう一度お試しください。"), status="error"
+                )
+            finally:
+                self._queue.put(_DONE)
+
+        threading.Thread(target=_target, daemon=True).start()
+        while True:
+            try:
+                event = self._queue.get(timeout=self._wait_timeout(deadline))
+            except queue.Empty:
+                logger.warning("Deadline exceeded before the agent produced a result")
+                self.publish_result(timeout_envelope(), status="timeout")
+                continue
+            if event is _DONE:
+                return
+            yield event
+
+    def _wait_timeout(self, deadline) -> float | None:
+        if deadline is None or self._result_sent:
+            return None
+        return deadline.remaining()
@@ -0,0 +1,176 @@
+"""Tests for agent/agent_pool.py."""
+
+import threading
+from unittest.mock import MagicMock
+
+from agent_pool import AgentPool
+from memory_sessions import MemorySession
+
+
+def _factory():
+    created = []
+
+    def create_agent(session_manager=None, model=None):
+        agent = MagicMock()
+        agent.messages = []
+        agent.model = model or MagicMock(name="model")
+        agent.session_manager = session_manager
+        created.append(agent)
+        return agent
+
+    return create_agent, created
+
+
+def test_reuses_agent_and_resets_conversation():
+    """2 回目以降は同じ Agent を使い、会話履歴を消してシステムプロンプトを差し替えること."""
+    factory, created = _factory()
+    pool = AgentPool(factory)
+
+    with pool.acquire("prompt-1") as lease:
+        assert not lease.reused
+        lease.agent.messages.append({"role": "user"})
+    with pool.acquire("prompt-2") as lease:
+        assert lease.reused
+        assert lease.agent.messages == []
+        assert lease.agent.system_prompt == "prompt-2"
+
+    assert len(created) == 1
+    stats = pool.stats()
+    assert stats["created"] == 1 and stats["reused"] == 1 and stats["idle"] == 1
+    assert lease.metrics()["agent_reused"] is True
+
+
+def test_callback_handler_is_restored_on_release():
+    """リクエストのコールバックは返却時に生成時のものへ戻ること."""
+    factory, _ = _factory()
+    pool = AgentPool(factory)
+    handler = MagicMock()
+
+    with pool.acquire("p", callback_handler=handler) as lease:
+        assert lease.agent.callback_handler is handler
+    with pool.acquire("p") as lease:
+        assert lease.agent.callback_handler is not handler
+
+
+def test_session_manager_gets_fresh_agent_with_shared_model():
+    """session_manager 付きは毎回新しい Agent を作り、BedrockModel は共有すること."""
+    factory, created = _factory()
+    pool = AgentPool(factory)
+
+    with pool.acquire("p"):
+        pass
+    session_manager = MagicMock()
+    with pool.acquire("p", session_manager=session_manager) as lease:
+        assert lease.agent.session_manager is session_manager
+        assert not lease.reused
+
+    assert len(created) == 2
+    assert created[1].model is created[0].model
+    # session_manager 付きの Agent はプールに戻さない
+    assert pool.stats()["idle"] == 1
+
+
+def test_concurrent_requests_get_separate_agents():
+    """同時に借りたリクエストには別々の Agent が渡り、待機数は max_idle までに抑えること."""
+    factory, created = _factory()
+    pool = AgentPool(factory, max_idle=1)
+    barrier = threading.Barrier(2)
+    agents = []
+
+    def _worker():
+        with pool.acquire("p") as lease:
+            agents.append(lease.agent)
+            barrier.wait(timeout=5)
+
+    threads = [threading.Thread(target=_worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert agents[0] is not agents[1]
+    assert len(created) == 2
+    assert pool.stats()["idle"] == 1
+
+
+def test_agent_returned_to_pool_after_exception():
+    """Agent の実行が例外で終わっても履歴を消してプールに戻すこと."""
+    factory, created = _factory()
+    pool = AgentPool(factory)
+
+    try:
+        with pool.acquire("p") as lease:
+            lease.agent.messages.append({"role": "user"})
+            raise RuntimeError("model error")
+    except RuntimeError:
+        pass
+
+    with pool.acquire("p") as lease:
+        assert lease.reused
+        assert lease.agent.messages == []
+    assert len(created) == 1
+
+
+def test_lease_reports_token_usage_of_its_request():
+    """再利用した Agent でも、そのリクエスト分のキャッシュ読み込み / 書き込み / 入力トークン数を記録すること."""
+    factory, _ = _factory()
+    pool = AgentPool(factory)
+    usage = {"inputTokens": 0, "cacheReadInputTokens": 0, "cacheWriteInputTokens": 0, "outputTokens": 0}
+
+    def _call(input_tokens, cache_read, cache_write, output_tokens):
+        usage["inputTokens"] += input_tokens
+        usage["cacheReadInputTokens"] += cache_read
+        usage["cacheWriteInputTokens"] += cache_write
+        usage["outputTokens"] += output_tokens
+
+    with pool.acquire("p") as first:
+        first.agent.event_loop_metrics.accumulated_usage = usage
+        _call(50, 0, 3000, 40)
+    with pool.acquire("p") as second:
+        _call(60, 3000, 0, 30)
+
+    assert first.metrics()["cache_write_input_tokens"] == 3000
+    metrics = second.metrics()
+    assert metrics["agent_reused"] is True
+    assert metrics["input_tokens"] == 60
+    assert metrics["cache_read_input_tokens"] == 3000
+    assert metrics["cache_write_input_tokens"] == 0
+    assert metrics["output_tokens"] == 30
+    assert metrics["cache_hit_rate"] == round(3000 / 3060, 3)
+
+
+def test_memory_session_keeps_agent_and_history():
+    """Memory セッションの Agent は会話履歴ごと次のリクエストで使い回すこと."""
+    factory, created = _factory()
+    pool = AgentPool(factory)
+    session = MemorySession(("U1", "2026-10-17"), MagicMock(), expires_at=0.0)
+    handler = MagicMock()
+
+    with pool.acquire("prompt-1", callback_handler=handler, session=session) as lease:
+        assert not lease.reused
+        lease.agent.messages.extend([{"role": "user"}, {"role": "assistant", "content": [{"text": "ok"}]}])
+    assert lease.agent.callback_handler is not handler
+    with pool.acquire("prompt-2", session=session) as lease:
+        assert lease.reused
+        assert len(lease.agent.messages) == 2
+        assert lease.agent.system_prompt == "prompt-2"
+        lease.agent.messages.append({"role": "assistant", "content": [{"text": "ok"}]})
+
+    assert len(created) == 1
+    assert created[0].session_manager is session.session_manager
+    assert session.load_ms > 0
+    assert not session.discarded
+    # セッションの Agent はプールに戻さない
+    assert pool.stats()["idle"] == 0
+
+
+def test_memory_session_is_discarded_when_run_stops_midway():
+    """ツール呼び出しの途中で止まった履歴のセッションは使い回さないこと."""
+    factory, _ = _factory()
+    pool = AgentPool(factory)
+    session = MemorySession(("U1", "2026-10-17"), MagicMock(), expires_at=0.0)
+
+    with pool.acquire("p", session=session) as lease:
+        lease.agent.messages.append({"role": "assistant", "content": [{"toolUse": {"name": "calendar_agent"}}]})
+
+    assert session.discarded
@@ -0,0 +1,179 @@
+"""Tests for agent/deadline.py (締め切りの伝搬と打ち切り)."""
+
+import http.server
+import json
+import sys
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import calendar_agent
+import deadline
+import envelope
+import pytest
+import request_context
+from deadline import Deadline, DeadlineExceeded
+from operations import Operation
+from request_context import RequestContext
+from streaming import StreamBridge
+
+agent_main = sys.modules["agent.main"]
+
+
+class _Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def _fresh_agent_pools():
+    agent_main._agent_pool.clear()
+    calendar_agent._agent_pool.clear()
+    yield
+    agent_main._agent_pool.clear()
+    calendar_agent._agent_pool.clear()
+
+
+def test_deadline_counts_down():
+    """残り時間・タイムアウト・下流への予算を締め切りから計算すること."""
+    clock = _Clock(100.0)
+    dl = Deadline(10.0, clock)
+
+    assert dl.timeout(55) == 10.0
+    assert dl.timeout(3) == 3
+    assert dl.child_budget_ms() == int((10.0 - deadline.DEADLINE_HOP_MARGIN_SECONDS) * 1000)
+
+    clock.now = 110.0
+    assert dl.expired()
+    assert dl.child_budget_ms() == 0
+    with pytest.raises(DeadlineExceeded):
+        dl.timeout(55)
+
+
+@pytest.mark.parametrize("payload, budget", [
+    ({"deadline_ms": 12_000}, 12.0),
+    ({"deadline_ms": -5}, 0.0),
+    ({}, deadline.DEADLINE_DEFAULT_SECONDS),
+    ({"deadline_ms": "soon"}, deadline.DEADLINE_DEFAULT_SECONDS),
+])
+def test_from_payload(payload, budget):
+    """payload の deadline_ms (なければ既定値) を予算にすること."""
+    assert deadline.from_payload(payload).budget == budget
+
+
+def test_callback_handler_stops_after_deadline():
+    """締め切り前は元のハンドラに渡し、過ぎたら例外でループを止めること."""
+    clock = _Clock(0.0)
+    inner = MagicMock()
+    handler = Deadline(1.0, clock).callback_handler(inner)
+
+    handler(data="a")
+    clock.now = 2.0
+    with pytest.raises(DeadlineExceeded):
+        handler(data="b")
+
+    inner.assert_called_once_with(data="a")
+
+
+def test_stream_bridge_sends_timeout_envelope_at_deadline():
+    """締め切りまでに結果が出なければタイムアウトのエンベロープを流し、fn の終了を待つこと."""
+    bridge = StreamBridge()
+    finished = []
+
+    def _slow() -> None:
+        time.sleep(0.3)
+        bridge.publish_result(envelope.text("遅い応答"))
+        finished.append(True)
+
+    start = time.monotonic()
+    events = bridge.run(_slow, deadline=Deadline(0.05))
+    first = next(events)
+
+    assert time.monotonic() - start < 0.2
+    assert first == {"event": "result", "result": deadline.timeout_envelope().to_dict(), "status": "timeout"}
+    assert list(events) == []
+    assert finished == [True]
+
+
+class _SlowSubAgent(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    payloads: list = []
+
+    def do_POST(self):
+        _SlowSubAgent.payloads.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        time.sleep(1.0)
+        body = json.dumps({"result": '{"type": "calendar_events"}'}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_sub_agent_call_is_cut_at_deadline():
+    """サブエージェント呼び出しは Router の残り時間で打ち切り、下流には余裕を引いた予算を渡すこと."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SlowSubAgent)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    _SlowSubAgent.payloads = []
+    ctx = RequestContext(deadline=Deadline(0.4))
+
+    try:
+        with (
+            request_context.use(ctx),
+            patch.object(agent_main, "CALENDAR_AGENT_ENDPOINT", endpoint),
+            patch.object(deadline, "DEADLINE_HOP_MARGIN_SECONDS", 0.1),
+        ):
+            start = time.monotonic()
+            result = agent_main.calendar_agent("今日の予定")
+            elapsed = time.monotonic() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert elapsed < 0.8
+    assert result == deadline.timeout_envelope().to_tool_result()
+    assert ctx.calendar_result == deadline.timeout_envelope()
+    assert 0 < _SlowSubAgent.payloads[0]["deadline_ms"] <= 300
+
+
+def test_router_returns_timeout_when_loop_exceeds_deadline():
+    """Router の LLM ループが締め切りを過ぎたら止めてタイムアウトのエンベロープを返すこと."""
+
+    def fake_agent_call(prompt):
+        time.sleep(0.1)
+        mock_agent.callback_handler(data="まだ考えています")
+        return "届かない応答"
+
+    mock_agent = MagicMock(side_effect=fake_agent_call)
+    with patch.object(agent_main, "create_agent", return_value=mock_agent):
+        response = agent_main.invoke({"prompt": "こんにちは", "deadline_ms": 50})
+
+    assert response["status"] == "timeout"
+    assert response["result"] == deadline.timeout_envelope().to_dict()
+
+
+def test_sub_agent_skips_operation_without_budget():
+    """残り時間のないオペレーションはツールを実行せずタイムアウトを返すこと."""
+    mock_tool = MagicMock(return_value="[]")
+    with (
+        patch.object(calendar_agent, "_setup_credentials", return_value=True),
+        patch.dict(calendar_agent.OPERATIONS, {
+            "list_events": Operation(mock_tool, calendar_agent._events_envelope),
+        }),
+    ):
+        result = calendar_agent.invoke({
+            "prompt": "今日の予定",
+            "op": "list_events",
+            "args": {"date_from": "2026-10-17", "date_to": "2026-10-17"},
+            "deadline_ms": 0,
+        })
+
+    mock_tool.assert_not_called()
+    assert result["result"] == deadline.timeout_envelope().to_dict()
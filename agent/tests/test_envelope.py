@@ -0,0 +1,66 @@
+"""Tests for agent/envelope.py."""
+
+import json
+
+import envelope
+import pytest
+from envelope import Envelope, EnvelopeError
+
+
+def test_to_dict_and_from_dict_round_trip():
+    """to_dict は v と type / message / フィールドを平らに並べ、from_dict で元に戻ること."""
+    env = envelope.make("calendar_events", "今日の予定", events=[{"id": "e1"}])
+
+    assert env.to_dict() == {"v": 1, "type": "calendar_events", "message": "今日の予定", "events": [{"id": "e1"}]}
+    assert Envelope.from_dict(env.to_dict()) == env
+
+
+def test_from_dict_reads_legacy_envelope_without_version():
+    """v のない旧形式 (LLM が書いたもの) は現在のバージョンとして読むこと."""
+    env = Envelope.from_dict({"type": "email_sent", "message": None})
+
+    assert env.version == envelope.ENVELOPE_VERSION
+    assert env.message == ""
+
+
+@pytest.mark.parametrize("data", [
+    {"type": "unknown"},
+    {"type": "calendar_events", "events": "e1"},
+    {"type": "email_confirm_send", "to": ["a@example.com"]},
+    {"type": "text", "message": ["a"]},
+    {"v": 2, "type": "text"},
+    {"v": "1", "type": "text"},
+    {"type": ["calendar_events"]},
+    {"type": {"name": "calendar_events"}},
+    {"type": 1},
+])
+def test_from_dict_rejects_invalid_envelope(data):
+    """未知の type・文字列でない type・フィールドの型違い・未対応のバージョンは EnvelopeError になること."""
+    with pytest.raises(EnvelopeError):
+        Envelope.from_dict(data)
+
+
+def test_to_tool_result_keeps_envelope_as_json_block():
+    """LLM に渡すツール結果はエンベロープを文字列にせず json ブロックに入れること."""
+    env = envelope.make("location_request", "位置情報を送ってください")
+
+    assert env.to_tool_result() == {"status": "success", "content": [{"json": env.to_dict()}]}
+
+
+def test_coerce_accepts_envelope_dict_and_text():
+    """エンベロープ・dict・LLM の出力テキストのいずれからもエンベロープを作ること."""
+    env = envelope.make("event_deleted", "削除しました")
+    fenced = "```json\n" + json.dumps({"type": "event_deleted", "message": "削除しました"}, ensure_ascii=False) + "\n```"
+
+    assert envelope.coerce(env) is env
+    assert envelope.coerce(env.to_dict()) == env
+    assert envelope.coerce(fenced) == env
+    assert envelope.coerce("  こんにちは！ ") == envelope.text("こんにちは！")
+
+
+def test_coerce_falls_back_to_text_for_unreadable_envelope():
+    """エンベロープとして読めない JSON は message (なければ元の JSON) のテキストにすること."""
+    assert envelope.coerce({"type": "unknown", "message": "お知らせ"}) == envelope.text("お知らせ")
+    assert envelope.coerce('結果: {"type": "unknown"}') == envelope.text('{"type": "unknown"}')
+    assert envelope.coerce(None) == envelope.text("")
+    assert envelope.coerce({"type": ["calendar_events"], "message": "予定です"}) == envelope.text("予定です")
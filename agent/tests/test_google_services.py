@@ -0,0 +1,96 @@
+"""Tests for agent/google_services.py."""
+
+import sys
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import google_services
+from google_services import ServiceCache
+
+
+def _creds(refresh_token: str, token: str = "access"):
+    return SimpleNamespace(refresh_token=refresh_token, token=token)
+
+
+def _cache(**kwargs):
+    build = MagicMock(
+        side_effect=lambda api, version, credentials, build_kwargs: SimpleNamespace(
+            api=api, _http=SimpleNamespace(credentials=credentials)
+        )
+    )
+    return ServiceCache(build=build, **kwargs), build
+
+
+def test_same_user_reuses_service_and_binds_new_credentials():
+    """同じユーザーの 2 回目は Resource を作らず、認証情報だけ差し替えること."""
+    cache, build = _cache()
+    first = _creds("r1", token="old")
+    refreshed = _creds("r1", token="new")
+
+    service = cache.get("calendar", "v3", first)
+    again = cache.get("calendar", "v3", refreshed)
+
+    assert again is service
+    assert service._http.credentials is refreshed
+    assert build.call_count == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_services_are_separate_per_api_user_and_thread():
+    """API・ユーザー・スレッドが違えば別の Resource になること (httplib2 はスレッドセーフでない)."""
+    cache, build = _cache()
+    u1 = _creds("r1")
+
+    calendar = cache.get("calendar", "v3", u1)
+    gmail = cache.get("gmail", "v1", u1)
+    other_user = cache.get("calendar", "v3", _creds("r2"))
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(cache.get("calendar", "v3", u1)))
+    thread.start()
+    thread.join()
+
+    assert len({id(calendar), id(gmail), id(other_user), id(seen[0])}) == 4
+    assert cache.stats()["users"] == 2
+    assert cache.stats()["services"] == 4
+
+
+def test_evicts_least_recently_used_user():
+    """上限を超えたら最も使われていないユーザーの Resource をまとめて捨てること."""
+    cache, build = _cache(max_users=2)
+    u1, u2, u3 = _creds("r1"), _creds("r2"), _creds("r3")
+    cache.get("calendar", "v3", u1)
+    cache.get("gmail", "v1", u1)
+    cache.get("calendar", "v3", u2)
+    cache.get("calendar", "v3", u1)  # u2 が最も古くなる
+
+    cache.get("calendar", "v3", u3)
+    cache.get("calendar", "v3", u2)
+
+    assert build.call_count == 5
+    assert cache.stats()["evictions"] == 2
+    assert google_services.user_key(u1) != google_services.user_key(u2)
+    assert "r1" not in google_services.user_key(u1)
+
+
+def test_discovery_document_is_parsed_once():
+    """ディスカバリ文書の解析はプロセスで 1 回にし、ユーザーごとの Resource はその文書から作ること."""
+    discovery_cache = MagicMock()
+    discovery_cache.get_static_doc.return_value = '{"name": "calendar", "version": "v3"}'
+    discovery = MagicMock()
+    googleapiclient = MagicMock(discovery=discovery, discovery_cache=discovery_cache)
+    cache = ServiceCache()
+
+    with patch.dict(sys.modules, {
+        "googleapiclient": googleapiclient,
+        "googleapiclient.discovery": discovery,
+        "googleapiclient.discovery_cache": discovery_cache,
+    }):
+        cache.get("calendar", "v3", _creds("r1"))
+        cache.get("calendar", "v3", _creds("r2"))
+
+    discovery_cache.get_static_doc.assert_called_once_with("calendar", "v3")
+    assert discovery.build_from_document.call_count == 2
+    document = discovery.build_from_document.call_args.args[0]
+    assert document == {"name": "calendar", "version": "v3"}
+    discovery.build.assert_not_called()
@@ -0,0 +1,121 @@
+"""Tests for agent/http_pool.py (ローカルの HTTP サーバーに対する接続の再利用)."""
+
+import http.server
+import json
+import threading
+
+import pytest
+from http_pool import HTTPPool, HTTPStatusError
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/missing":
+            self._send(404, {"error": "not found"})
+        elif self.path == "/large":
+            self._send(200, {"data": "x" * 100_000})
+        else:
+            self._send(200, {"path": self.path})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self._send(200, {"echo": payload, "content_type": self.headers["Content-Type"]})
+
+    def _send(self, status: int, data: dict) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # release で途中まで読んだ接続を閉じたときの ConnectionResetError は想定どおり
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = _Server(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _base(server) -> tuple[str, str]:
+    host = f"127.0.0.1:{server.server_address[1]}"
+    return f"http://{host}", host
+
+
+def test_reuses_connection_per_host(server):
+    """同じホストへの連続したリクエストは 1 本の接続を使い回すこと."""
+    base, host = _base(server)
+    pool = HTTPPool()
+
+    for i in range(4):
+        assert pool.request_json("GET", f"{base}/api/{i}") == {"path": f"/api/{i}"}
+
+    stats = pool.stats()[host]
+    assert stats["requests"] == 4
+    assert stats["new_connections"] == 1
+    assert stats["reuse_rate"] == 0.75
+    assert stats["errors"] == 0
+    assert stats["avg_ms"] > 0
+
+
+def test_request_json_posts_payload(server):
+    """payload を JSON で送ること."""
+    base, _ = _base(server)
+
+    result = HTTPPool().request_json("POST", f"{base}/api/ai/recommend", {"prompt": "渋谷のカフェ"})
+
+    assert result == {"echo": {"prompt": "渋谷のカフェ"}, "content_type": "application/json"}
+
+
+def test_error_status_raises_and_keeps_connection(server):
+    """4xx は HTTPStatusError になり、本文を読み切った接続は再利用されること."""
+    base, host = _base(server)
+    pool = HTTPPool()
+
+    with pytest.raises(HTTPStatusError) as exc_info:
+        pool.request_json("GET", f"{base}/missing")
+    assert exc_info.value.status == 404
+    assert json.loads(exc_info.value.body) == {"error": "not found"}
+
+    pool.request_json("GET", f"{base}/api")
+    stats = pool.stats()[host]
+    assert stats["errors"] == 1
+    assert stats["new_connections"] == 1
+
+
+def test_release_closes_partially_read_response(server):
+    """本文を読み切らずに release した接続は捨て、次は張り直すこと."""
+    base, host = _base(server)
+    pool = HTTPPool()
+
+    with pool.stream("GET", f"{base}/large") as resp:
+        resp.read(10)
+    pool.request_json("GET", f"{base}/api")
+
+    assert pool.stats()[host]["new_connections"] == 2
+
+
+def test_clear_resets_stats(server):
+    """clear で統計と接続を破棄すること."""
+    base, _ = _base(server)
+    pool = HTTPPool()
+    pool.request_json("GET", f"{base}/api")
+
+    pool.clear()
+
+    assert pool.stats() == {}
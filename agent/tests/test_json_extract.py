@@ -0,0 +1,43 @@
+"""Tests for agent/json_extract.py (LLM 応答からの JSON エンベロープ抽出)."""
+
+import json
+
+import json_extract
+import pytest
+
+ENVELOPE = {"type": "calendar_events", "message": "予定です {括弧} \"引用\" \\", "events": [{"id": 1}]}
+RAW = json.dumps(ENVELOPE, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("text", [
+    RAW,
+    f"  {RAW}\n",
+    f"```json\n{RAW}\n```",
+    f"```\n{RAW}```",
+    f"予定を取得しました。\n{RAW}\nほかにありますか？",
+    f"テンプレートは {{name}} の形式です。{RAW}",
+    f"閉じていない {{ 記号のあとに {RAW}",
+])
+def test_extracts_object_and_span(text):
+    """フェンス・前後の説明文・説明文中の括弧があっても最初の JSON オブジェクトと元テキスト上の位置を返すこと."""
+    found = json_extract.extract_json(text)
+
+    assert found.value == ENVELOPE
+    assert found.text == RAW
+    assert text[found.start:found.end] == RAW
+
+
+@pytest.mark.parametrize("text", ["", "ただのテキストです。", "[1, 2, 3]", '{"type": "text", "message": "途中', None])
+def test_returns_none_without_object(text):
+    """JSON オブジェクトがなければ None、sanitize は前後の空白を除いたテキストを返すこと."""
+    assert json_extract.extract_json(text) is None
+    assert json_extract.parse_envelope(text) is None
+    if text is not None:
+        assert json_extract.sanitize(f"  {text} ") == text
+
+
+def test_parse_envelope_passes_dict_through():
+    """解析済みの dict は解析し直さずにそのまま返すこと."""
+    assert json_extract.parse_envelope(ENVELOPE) is ENVELOPE
+    assert json_extract.sanitize(f"```json\n{RAW}\n```") == RAW
+
@@ -3,11 +3,24 @@
 import sys
 from unittest.mock import MagicMock, patch
 
+import pytest
+import request_context
+
 # Module is pre-registered in sys.modules by conftest.py
 agent_main = sys.modules["agent.main"]
 google_maps = sys.modules["tools.google_maps"]
 
 
+@pytest.fixture(autouse=True)
+def _fresh_agent_pool():
+    """テストごとに create_agent の差し替えが効くようプールと Memory セッションを空にする."""
+    agent_main._agent_pool.clear()
+    agent_main._memory_sessions.clear()
+    yield
+    agent_main._agent_pool.clear()
+    agent_main._memory_sessions.clear()
+
+
 def test_create_agent():
     """create_agent() が Agent インスタンスを返すこと."""
     mock_model_instance = MagicMock()
@@ -23,8 +36,12 @@ def test_create_agent():
     mock_agent_cls.assert_called_once()
     call_kwargs = mock_agent_cls.call_args[1]
     assert call_kwargs["model"] is mock_model_instance
-    assert "現在の日時:" in call_kwargs["system_prompt"]
-    assert agent_main.SYSTEM_PROMPT in call_kwargs["system_prompt"]
+    # 固定のプロンプト → cachePoint → 日時の行 (毎分変わる部分はキャッシュの後ろ)
+    static, cache_point, date_block = call_kwargs["system_prompt"]
+    assert static == {"text": agent_main.SYSTEM_PROMPT}
+    assert cache_point == {"cachePoint": {"type": "default"}}
+    assert date_block["text"].startswith("現在の日時:")
+    assert mock_bm.call_args[1]["cache_tools"] == "default"
     assert result is mock_agent_instance
 
 
@@ -37,7 +54,7 @@ def test_invoke_success():
         result = agent_main.invoke({"prompt": "こんにちは"})
 
     assert result["status"] == "success"
-    assert result["result"] == "テスト応答です"
+    assert result["result"] == {"v": 1, "type": "text", "message": "テスト応答です"}
     mock_agent.assert_called_once_with("こんにちは")
 
 
@@ -45,28 +62,28 @@ def test_invoke_empty_prompt():
     """prompt が空のとき error ステータスが返ること."""
     result = agent_main.invoke({"prompt": ""})
     assert result["status"] == "error"
-    assert "空" in result["result"]
+    assert "空" in result["result"]["message"]
 
     result_no_key = agent_main.invoke({})
     assert result_no_key["status"] == "error"
 
 
 def test_request_location_tool():
-    """request_location ツールが正しい JSON を返し _maps_agent_result に設定されること."""
-    import json
-
-    # Reset global
-    google_maps.clear_maps_result()
+    """request_location ツールが json ブロックのツール結果を返しリクエストコンテキストに保持されること."""
+    from request_context import RequestContext
 
-    result = google_maps.request_location(message="近くのカフェをお探しするので、位置情報を送ってもらえますか？")
-    parsed = json.loads(result)
+    with request_context.use(RequestContext()) as ctx:
+        result = google_maps.request_location(message="近くのカフェをお探しするので、位置情報を送ってもらえますか？")
+        assert result["status"] == "success"
+        parsed = result["content"][0]["json"]
 
-    assert parsed["type"] == "location_request"
-    assert parsed["message"] == "近くのカフェをお探しするので、位置情報を送ってもらえますか？"
-    assert google_maps.get_maps_result() == result
+        assert parsed["type"] == "location_request"
+        assert parsed["message"] == "近くのカフェをお探しするので、位置情報を送ってもらえますか？"
+        assert google_maps.get_maps_result().to_dict() == parsed
+        assert ctx.maps_result.type == "location_request"
 
-    # cleanup
-    google_maps.clear_maps_result()
+    # リクエスト外では参照できない
+    assert google_maps.get_maps_result() is None
 
 
 def test_invoke_agent_exception():
@@ -133,10 +150,32 @@ def test_invoke_with_line_user_id():
         result = agent_main.invoke({"prompt": "こんにちは", "line_user_id": "U1234"})
 
     mock_build.assert_called_once_with("U1234")
-    mock_create.assert_called_once_with(session_manager=mock_sm)
+    mock_create.assert_called_once()
+    assert mock_create.call_args.kwargs["session_manager"] is mock_sm
     assert result["status"] == "success"
 
 
+def test_invoke_reuses_memory_session_for_same_user_and_day():
+    """同じユーザー・同じ日の 2 回目は session manager と Agent を作り直さないこと."""
+    mock_agent = MagicMock()
+    mock_agent.return_value = "応答"
+    mock_agent.messages = [{"role": "assistant", "content": [{"text": "応答"}]}]
+
+    with (
+        patch.object(agent_main, "_build_session_manager", return_value=MagicMock()) as mock_build,
+        patch.object(agent_main, "create_agent", return_value=mock_agent) as mock_create,
+    ):
+        first = agent_main.invoke({"prompt": "こんにちは", "line_user_id": "U1234"})
+        second = agent_main.invoke({"prompt": "さっきの続き", "line_user_id": "U1234"})
+
+    mock_build.assert_called_once_with("U1234")
+    mock_create.assert_called_once()
+    assert first["metrics"]["memory_session_hit"] is False
+    assert second["metrics"]["memory_session_hit"] is True
+    assert second["metrics"]["agent_reused"] is True
+    assert agent_main._memory_sessions.stats()["hits"] == 1
+
+
 def test_invoke_without_line_user_id():
     """line_user_id がなければ session_manager=None で呼ばれること."""
     mock_agent = MagicMock()
@@ -147,7 +186,8 @@ def test_invoke_without_line_user_id():
     ):
         result = agent_main.invoke({"prompt": "こんにちは"})
 
-    mock_create.assert_called_once_with(session_manager=None)
+    mock_create.assert_called_once()
+    assert mock_create.call_args.kwargs.get("session_manager") is None
     assert result["status"] == "success"
 
 
@@ -163,7 +203,8 @@ def test_invoke_memory_failure_graceful():
         result = agent_main.invoke({"prompt": "こんにちは", "line_user_id": "U1234"})
 
     # memory 失敗時は session_manager=None でフォールバック
-    mock_create.assert_called_once_with(session_manager=None)
+    mock_create.assert_called_once()
+    assert mock_create.call_args.kwargs.get("session_manager") is None
     assert result["status"] == "success"
 
 
@@ -213,3 +254,189 @@ def test_build_session_manager_with_memory_id():
     finally:
         agent_main.BEDROCK_MEMORY_ID = original_memory_id
         agent_main._memory_available = original_available
+
+
+# ---------------------------------------------------------------------------
+# ストリーミングテスト
+# ---------------------------------------------------------------------------
+
+
+def test_invoke_stream_publishes_tool_result_early():
+    """サブエージェントの結果は Router の LLM 完了を待たずに result として流れること."""
+    import time
+
+    import envelope as envelope_mod
+
+    envelope = envelope_mod.make("calendar_events", "今日の予定", events=[])
+    finished = []
+
+    def fake_agent_call(prompt):
+        handler = mock_agent.callback_handler
+        handler(data="確認します")
+        agent_main.calendar_agent("今日の予定")
+        handler(data="LLM の後処理テキスト")
+        time.sleep(0.3)
+        finished.append(True)
+        return "後処理済みの応答"
+
+    mock_agent = MagicMock(side_effect=fake_agent_call)
+    with (
+        patch.object(agent_main, "create_agent", return_value=mock_agent) as mock_create,
+        patch.object(agent_main, "_invoke_sub_agent", return_value=envelope) as mock_sub,
+    ):
+        events = agent_main.invoke({"prompt": "今日の予定", "stream": True})
+        first = next(events)
+        assert first == {"event": "delta", "text": "確認します"}
+        start = time.monotonic()
+        result = next(events)
+        assert time.monotonic() - start < 0.2
+        assert result == {"event": "result", "result": envelope.to_dict(), "status": "success"}
+        assert not finished
+        assert list(events) == []
+
+    assert finished == [True]
+    mock_sub.assert_called_once_with(agent_main.CALENDAR_AGENT_ENDPOINT, "今日の予定", op="", args=None)
+    assert request_context.current() is None
+
+
+def _run_tools_concurrently(*calls):
+    """Strands の ConcurrentToolExecutor と同じく、ツールをコンテキストのコピーで並行に実行する."""
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fn, *args) for fn, *args in calls]
+        return [f.result() for f in futures]
+
+
+def _fake_sub_agents(latency: float):
+    import time
+
+    import envelope
+
+    envelopes = {
+        agent_main.CALENDAR_AGENT_ENDPOINT: {"v": 1, "type": "calendar_events", "message": "今日の予定", "events": []},
+        agent_main.GMAIL_AGENT_ENDPOINT: {"v": 1, "type": "email_list", "message": "受信トレイ", "emails": []},
+    }
+
+    def _invoke(endpoint, query, op="", args=None):
+        time.sleep(latency)
+        return envelope.Envelope.from_dict(envelopes[endpoint])
+
+    return envelopes, _invoke
+
+
+def test_invoke_combines_parallel_tool_results():
+    """予定とメールを両方呼んだら type=multi で両方の結果を返すこと."""
+    envelopes, fake_invoke = _fake_sub_agents(latency=0)
+
+    def fake_agent_call(prompt):
+        _run_tools_concurrently((agent_main.calendar_agent, "今日の予定"), (agent_main.gmail_agent, "メール"))
+        return "まとめた応答"
+
+    with (
+        patch.object(agent_main, "create_agent", return_value=MagicMock(side_effect=fake_agent_call)),
+        patch.object(agent_main, "_invoke_sub_agent", side_effect=fake_invoke),
+    ):
+        response = agent_main.invoke({"prompt": "今日の予定とメールを見せて"})
+
+    assert response["result"] == {
+        "v": 1,
+        "type": "multi",
+        "message": "",
+        "parts": [envelopes[agent_main.CALENDAR_AGENT_ENDPOINT], envelopes[agent_main.GMAIL_AGENT_ENDPOINT]],
+    }
+
+
+def test_invoke_stream_waits_for_all_tools_in_turn():
+    """同じターンのツールが全部終わってから 1 回だけ result を流し、所要時間は直列の合計より短いこと."""
+    import time
+
+    latency = 0.2
+    envelopes, fake_invoke = _fake_sub_agents(latency)
+
+    def fake_agent_call(prompt):
+        handler = mock_agent.callback_handler
+        handler(message={"role": "assistant", "content": [
+            {"toolUse": {"toolUseId": "t1", "name": "calendar_agent", "input": {"query": "今日の予定"}}},
+            {"toolUse": {"toolUseId": "t2", "name": "gmail_agent", "input": {"query": "メール"}}},
+        ]})
+        _run_tools_concurrently((agent_main.calendar_agent, "今日の予定"), (agent_main.gmail_agent, "メール"))
+        handler(message={"role": "user", "content": [{"toolResult": {"toolUseId": "t1"}}, {"toolResult": {"toolUseId": "t2"}}]})
+        return "まとめた応答"
+
+    mock_agent = MagicMock(side_effect=fake_agent_call)
+    with (
+        patch.object(agent_main, "create_agent", return_value=mock_agent),
+        patch.object(agent_main, "_invoke_sub_agent", side_effect=fake_invoke),
+    ):
+        start = time.monotonic()
+        events = list(agent_main.invoke({"prompt": "今日の予定とメールを見せて", "stream": True}))
+        elapsed = time.monotonic() - start
+
+    results = [event for event in events if event.get("event") == "result"]
+    assert len(results) == 1
+    assert [part["type"] for part in results[0]["result"]["parts"]] == ["calendar_events", "email_list"]
+    assert elapsed < latency * 2
+
+
+def test_invoke_stream_plain_text_result():
+    """ツールを使わない応答は LLM 完了後に result として流れること."""
+    mock_agent = MagicMock(return_value="こんにちは！")
+
+    with patch.object(agent_main, "create_agent", return_value=mock_agent):
+        events = list(agent_main.invoke({"prompt": "こんにちは", "stream": True}))
+
+    assert events == [
+        {"event": "result", "result": {"v": 1, "type": "text", "message": "こんにちは！"}, "status": "success"}
+    ]
+
+
+def test_invoke_sub_agent_forwards_stream_deltas():
+    """ストリーミング中はサブエージェントに stream を要求し、差分を転送すること."""
+    import io
+    import json
+
+    from streaming import StreamBridge
+
+    sse = (
+        'data: {"event": "delta", "text": "{\\"type\\""}\n\n'
+        'data: {"event": "result", "result": "{\\"type\\": \\"text\\"}"}\n\n'
+    ).encode("utf-8")
+    mock_resp = MagicMock()
+    mock_resp.headers = {"Content-Type": "text/event-stream"}
+    body = io.BytesIO(sse)
+    mock_resp.read1.side_effect = body.read1
+
+    bridge = StreamBridge()
+    with (
+        request_context.use(request_context.RequestContext(stream_bridge=bridge)),
+        patch.object(agent_main.http_pool.pool, "open", return_value=mock_resp) as mock_open,
+    ):
+        result = agent_main._invoke_sub_agent("http://localhost:8081", "予定")
+
+    sent = json.loads(mock_open.call_args[1]["body"])
+    assert sent["stream"] is True
+    assert result.type == "text"
+    assert bridge._queue.get_nowait() == {"event": "delta", "text": '{"type"'}
+
+
+# ---------------------------------------------------------------------------
+# Agent プールテスト
+# ---------------------------------------------------------------------------
+
+
+def test_invoke_reuses_pooled_agent():
+    """2 回目の invoke は Agent を作り直さず、準備時間が metrics に入ること."""
+    mock_agent = MagicMock(return_value="応答")
+    mock_agent.messages = []
+
+    with patch.object(agent_main, "create_agent", return_value=mock_agent) as mock_create:
+        first = agent_main.invoke({"prompt": "こんにちは"})
+        second = agent_main.invoke({"prompt": "もう一度"})
+
+    mock_create.assert_called_once()
+    assert first["metrics"]["agent_reused"] is False
+    assert second["metrics"]["agent_reused"] is True
+    assert second["metrics"]["agent_setup_ms"] >= 0
+    assert mock_agent.system_prompt[-1]["text"].startswith("現在の日時:")
@@ -0,0 +1,142 @@
+"""Tests for agent/memory_sessions.py."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import memory_sessions
+from memory_sessions import MemorySessionCache
+
+_JST = timezone(timedelta(hours=9))
+
+
+class _Clock:
+    def __init__(self, when: datetime):
+        self.now = when.timestamp()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(**kwargs):
+    build = MagicMock(side_effect=lambda user: MagicMock(name=f"sm-{user}"))
+    kwargs.setdefault("clock", _Clock(datetime(2026, 10, 17, 12, 0, tzinfo=_JST)))
+    kwargs.setdefault("rss", lambda: None)
+    return MemorySessionCache(build, **kwargs), build
+
+
+def test_session_day_and_rollover_use_jst():
+    """日付と期限は JST の 0 時で切り替わること."""
+    late = datetime(2026, 10, 17, 23, 59, tzinfo=_JST).timestamp()
+
+    assert memory_sessions.session_day(late) == "2026-10-17"
+    assert memory_sessions.next_rollover(late) == datetime(2026, 10, 18, tzinfo=_JST).timestamp()
+
+
+def test_second_request_reuses_session_and_counts_saved_time():
+    """同じユーザー・同じ日の 2 回目は session manager を作らず、初回の準備時間を省けた時間に積むこと."""
+    cache, build = _cache()
+
+    with cache.checkout("U1") as first:
+        first.agent = MagicMock()
+        first.load_ms = 120.0
+    with cache.checkout("U1") as second:
+        assert second is first
+        assert second.hit
+
+    build.assert_called_once_with("U1")
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["saved_ms"] == 120.0
+    assert stats["avg_load_ms"] == 120.0
+
+
+def test_day_rollover_expires_session():
+    """日付が変わったら前日のセッションを捨てて作り直すこと."""
+    clock = _Clock(datetime(2026, 10, 17, 23, 59, tzinfo=_JST))
+    cache, build = _cache(clock=clock)
+
+    with cache.checkout("U1") as first:
+        assert first.key == ("U1", "2026-10-17")
+    clock.now += 120
+    with cache.checkout("U1") as second:
+        assert second is not first
+        assert second.key == ("U1", "2026-10-18")
+
+    assert build.call_count == 2
+    assert cache.stats()["evictions"]["expired"] == 1
+
+
+def test_capacity_evicts_least_recently_used():
+    """件数の上限を超えたら最後に使ったのが古いセッションから捨てること."""
+    cache, build = _cache(max_entries=2)
+
+    for user in ("U1", "U2", "U1", "U3"):
+        with cache.checkout(user):
+            pass
+    with cache.checkout("U2"):
+        pass
+
+    # U2 は U3 の追加で捨てられているので作り直す
+    assert [call.args[0] for call in build.call_args_list] == ["U1", "U2", "U3", "U2"]
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"]["capacity"] == 2
+
+
+def test_memory_pressure_evicts_half_of_sessions():
+    """RSS が上限を超えたら古いセッションから半分まで捨てること."""
+    rss = MagicMock(return_value=100.0)
+    cache, _ = _cache(max_entries=10, max_rss_mb=512, rss=rss)
+    for user in ("U1", "U2", "U3"):
+        with cache.checkout(user):
+            pass
+
+    rss.return_value = 600.0
+    with cache.checkout("U4") as session:
+        assert session is not None
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"]["pressure"] == 2
+
+
+def test_busy_session_gets_uncached_session():
+    """同じユーザーのセッションが使用中なら、キャッシュしない別のセッションを作ること."""
+    cache, build = _cache()
+
+    with cache.checkout("U1") as first, cache.checkout("U1") as second:
+        assert second is not first
+        assert not second.cached
+
+    with cache.checkout("U1") as third:
+        assert third is first
+    assert build.call_count == 2
+    assert cache.stats()["busy"] == 1
+
+
+def test_discarded_session_is_rebuilt():
+    """discard されたセッションは返却時に捨て、次は作り直すこと."""
+    cache, build = _cache()
+
+    with cache.checkout("U1") as session:
+        session.discard()
+    with cache.checkout("U1") as session:
+        assert not session.hit
+
+    assert build.call_count == 2
+    assert cache.stats()["evictions"]["discarded"] == 1
+
+
+def test_no_session_without_user_or_memory():
+    """line_user_id がない・Memory が使えない・作成に失敗したときは None を渡すこと."""
+    cache, build = _cache()
+    with cache.checkout(None) as session:
+        assert session is None
+    build.assert_not_called()
+
+    for result in (None, RuntimeError("memory error")):
+        failing = MemorySessionCache(MagicMock(side_effect=[result]), rss=lambda: None)
+        with failing.checkout("U1") as session:
+            assert session is None
+        assert failing.stats()["entries"] == 0
@@ -0,0 +1,159 @@
+"""Tests for agent/operations.py (Router → サブエージェントの構造化オペレーション)."""
+
+import json
+import sys
+from unittest.mock import MagicMock, patch
+
+import calendar_agent
+import envelope
+import gmail_agent
+import operations
+import pytest
+from envelope import Envelope, EnvelopeError
+from operations import Operation, OperationError
+
+agent_main = sys.modules["agent.main"]
+
+
+def _list_tool(date_from: str = "", date_to: str = "") -> str:
+    return json.dumps([{"id": "e1", "date_from": date_from, "date_to": date_to}])
+
+
+_REGISTRY = {
+    "list": Operation(_list_tool, lambda events, args: {"type": "calendar_events", "events": events}),
+}
+
+
+def test_parse():
+    """op がなければ None、あれば (op, args) を返すこと."""
+    assert operations.parse({"prompt": "今日の予定"}) is None
+    assert operations.parse({"op": "list_events"}) == ("list_events", {})
+    assert operations.parse({"op": "list_events", "args": {"date_from": "2026-10-17"}}) == (
+        "list_events", {"date_from": "2026-10-17"},
+    )
+    with pytest.raises(OperationError):
+        operations.parse({"op": "list_events", "args": "2026-10-17"})
+
+
+def test_run_builds_envelope_from_tool_result():
+    """ツールの戻り値 (JSON) からエンベロープを組み立てること."""
+    result = operations.run(_REGISTRY, "list", {"date_from": "2026-10-17"})
+
+    assert isinstance(result, Envelope)
+    assert result.type == "calendar_events"
+    assert result.get("events") == [{"id": "e1", "date_from": "2026-10-17", "date_to": ""}]
+
+
+def test_run_rejects_envelope_not_matching_schema():
+    """エンベロープがスキーマに合わなければ EnvelopeError になること."""
+    registry = {"list": Operation(_list_tool, lambda events, args: {"type": "calendar_events", "events": "e1"})}
+    with pytest.raises(EnvelopeError):
+        operations.run(registry, "list", {})
+
+
+@pytest.mark.parametrize("op, args", [("unknown", {}), ("list", {"title": "会議"})])
+def test_run_rejects_unknown_op_and_args(op, args):
+    """未知の op・ツールにない引数は OperationError になること."""
+    with pytest.raises(OperationError):
+        operations.run(_REGISTRY, op, args)
+
+
+def test_calendar_invoke_runs_operation_without_llm():
+    """Calendar Agent は op があれば LLM を使わずにツールを実行すること."""
+    created = json.dumps({"id": "e1", "summary": "会議", "start": "2026-10-17T10:00:00+09:00"})
+    with (
+        patch.object(calendar_agent, "_setup_credentials", return_value=True),
+        patch.object(calendar_agent, "create_agent") as mock_create,
+        patch.dict(calendar_agent.OPERATIONS, {
+            "create_event": Operation(MagicMock(return_value=created), calendar_agent._created_envelope),
+        }),
+    ):
+        tool = calendar_agent.OPERATIONS["create_event"].tool
+        result = calendar_agent.invoke({
+            "prompt": "明日10時に会議",
+            "op": "create_event",
+            "args": {"summary": "会議", "start": "2026-10-17T10:00:00+09:00", "end": "2026-10-17T11:00:00+09:00"},
+        })
+
+    mock_create.assert_not_called()
+    tool.assert_called_once_with(summary="会議", start="2026-10-17T10:00:00+09:00", end="2026-10-17T11:00:00+09:00")
+    envelope = result["result"]
+    assert envelope["type"] == "event_created"
+    assert envelope["event"]["id"] == "e1"
+    assert result["metrics"] == {"operation": "create_event"}
+
+
+def test_calendar_free_busy_keeps_suggested_title():
+    """get_free_busy は suggested_title をツールに渡さずエンベロープに入れること."""
+    slots = [{"start": "2026-10-17T09:00:00+09:00", "end": "2026-10-17T18:00:00+09:00"}]
+    with patch.object(calendar_agent, "get_free_busy", return_value=json.dumps(slots)) as mock_tool:
+        registry = {**calendar_agent.OPERATIONS, "get_free_busy": Operation(
+            mock_tool, calendar_agent._date_selection_envelope, envelope_args=("suggested_title",),
+        )}
+        envelope = operations.run(registry, "get_free_busy", {
+            "date_from": "2026-10-17", "date_to": "2026-10-23", "suggested_title": "ご飯",
+        }).to_dict()
+
+    mock_tool.assert_called_once_with(date_from="2026-10-17", date_to="2026-10-23")
+    assert envelope == {
+        "v": 1,
+        "type": "date_selection",
+        "message": "日付を選択してください。",
+        "busy_slots": slots,
+        "suggested_title": "ご飯",
+    }
+
+
+def test_gmail_invoke_falls_back_to_llm_on_invalid_op():
+    """実行できない op は query を使って LLM で処理すること."""
+    mock_agent = MagicMock(return_value='{"type": "text", "message": "ok"}')
+    gmail_agent._agent_pool.clear()
+    with (
+        patch.object(gmail_agent, "_setup_credentials", return_value=True),
+        patch.object(gmail_agent, "create_agent", return_value=mock_agent),
+    ):
+        result = gmail_agent.invoke({"prompt": "メールの詳細", "op": "get_email", "args": {"email_id": "m1"}})
+    gmail_agent._agent_pool.clear()
+
+    mock_agent.assert_called_once_with("メールの詳細")
+    assert result["result"] == {"v": 1, "type": "text", "message": "ok"}
+
+
+def test_gmail_confirm_send_streams_single_result():
+    """送信確認はツールを呼ばずに 1 イベントのストリームで返すこと."""
+    with patch.object(gmail_agent, "_setup_credentials", return_value=True):
+        events = list(gmail_agent.invoke({
+            "prompt": "田中さんにメール",
+            "stream": True,
+            "op": "confirm_send",
+            "args": {"to": "tanaka@example.com", "subject": "日程", "body": "明日はどうですか"},
+        }))
+
+    assert len(events) == 1
+    envelope = events[0]["result"]
+    assert envelope["type"] == "email_confirm_send"
+    assert envelope["to"] == "tanaka@example.com"
+
+
+def test_gmail_operation_failure_does_not_retry_with_llm():
+    """ツールの実行に失敗しても LLM でやり直さず (二重送信の防止) エラーを返すこと."""
+    failing = Operation(MagicMock(side_effect=RuntimeError("api error")), gmail_agent._sent_envelope)
+    with (
+        patch.object(gmail_agent, "_setup_credentials", return_value=True),
+        patch.object(gmail_agent, "create_agent") as mock_create,
+        patch.dict(gmail_agent.OPERATIONS, {"send_email": failing}),
+    ):
+        result = gmail_agent.invoke({"prompt": "送信して", "op": "send_email", "args": {}})
+
+    mock_create.assert_not_called()
+    assert result["result"]["type"] == "text"
+
+
+def test_router_forwards_operation():
+    """Router の calendar_agent ツールは op / args をサブエージェントに転送すること."""
+    with patch.object(agent_main, "_invoke_sub_agent", return_value=envelope.make("event_deleted")) as mock_sub:
+        agent_main.calendar_agent("予定を消して", op="delete_event", args={"event_id": "e1"})
+
+    mock_sub.assert_called_once_with(
+        agent_main.CALENDAR_AGENT_ENDPOINT, "予定を消して", op="delete_event", args={"event_id": "e1"}
+    )
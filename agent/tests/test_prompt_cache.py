@@ -0,0 +1,38 @@
+"""Tests for agent/prompt_cache.py (プロンプトキャッシュ向けのシステムプロンプト構成)."""
+
+from datetime import datetime, timedelta, timezone
+
+import calendar_agent
+import gmail_agent
+import prompt_cache
+import pytest
+
+JST = timezone(timedelta(hours=9))
+
+
+@pytest.mark.parametrize("module", [calendar_agent, gmail_agent])
+def test_static_prefix_does_not_change_with_time(module):
+    """時刻が変わっても cachePoint までのプレフィックスは同じで、日時の行だけが末尾で変わること."""
+    first = prompt_cache.build_system_prompt(module.SYSTEM_PROMPT, datetime(2026, 10, 17, 9, 0, tzinfo=JST))
+    later = prompt_cache.build_system_prompt(module.SYSTEM_PROMPT, datetime(2026, 10, 17, 9, 1, tzinfo=JST))
+
+    assert first[:2] == later[:2] == [{"text": module.SYSTEM_PROMPT}, prompt_cache.CACHE_POINT]
+    assert first[2] == {"text": "現在の日時: 2026年10月17日(土) 09:00"}
+    assert later[2] == {"text": "現在の日時: 2026年10月17日(土) 09:01"}
+    assert module._build_system_prompt()[:2] == first[:2]
+
+
+def test_disabled_keeps_static_prefix_first(monkeypatch):
+    """キャッシュを無効にしても固定部分を先頭にした文字列を返し、cache_tools を付けないこと."""
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_ENABLED", False)
+
+    prompt = prompt_cache.build_system_prompt("ルール", datetime(2026, 10, 17, 9, 0, tzinfo=JST))
+
+    assert prompt == "ルール\n\n現在の日時: 2026年10月17日(土) 09:00"
+    assert prompt_cache.model_kwargs() == {}
+
+
+def test_usage_metrics_without_usage():
+    """使用量が取れない Agent (モックなど) では何も記録しないこと."""
+    assert prompt_cache.usage_snapshot(object()) == {}
+    assert prompt_cache.usage_metrics({}, {}) == {}
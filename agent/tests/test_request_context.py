@@ -0,0 +1,184 @@
+"""Tests for agent/request_context.py (並行リクエストの分離)."""
+
+import contextvars
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+import request_context
+from google_services import ServiceCache
+from request_context import RequestContext
+
+agent_main = sys.modules["agent.main"]
+google_maps = sys.modules["tools.google_maps"]
+gmail_tools = sys.modules["tools.google_gmail"]
+
+# サブエージェント呼び出しの待ち時間 (I/O 待ちの間に他のリクエストを処理できるか)
+SUB_AGENT_LATENCY = 0.1
+PARALLEL = 8
+
+
+@pytest.fixture(autouse=True)
+def _fresh_agent_pool():
+    agent_main._agent_pool.clear()
+    yield
+    agent_main._agent_pool.clear()
+
+
+def _fake_open(method, url, body=None, headers=None, timeout=None):
+    """サブエージェントのスタンドイン. 転送された認証情報の token を結果に入れて返す."""
+    payload = json.loads(body)
+    time.sleep(SUB_AGENT_LATENCY)
+    envelope = {
+        "type": "calendar_events",
+        "owner": payload["google_credentials"]["token"],
+        "query": payload["prompt"],
+    }
+    resp = MagicMock()
+    resp.headers = {"Content-Type": "application/json"}
+    resp.read.return_value = json.dumps({"result": envelope}).encode("utf-8")
+    return resp
+
+
+def _agent_call(prompt: str) -> str:
+    """Strands と同じくツールを別スレッド (コンテキストのコピー) で実行する Agent."""
+    user = prompt.split(":")[0]
+
+    def _tools() -> None:
+        if int(user[1:]) % 2 == 0:
+            agent_main.calendar_agent(f"{user} の予定")
+        else:
+            google_maps.request_location(message=user)
+
+    ctx = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(ctx.run, _tools).result()
+    return "LLM の後処理テキスト"
+
+
+def _invoke(user: str) -> dict:
+    return agent_main.invoke({
+        "prompt": f"{user}: 今日の予定",
+        "google_credentials": {"token": f"token-{user}"},
+    })
+
+
+def _assert_own_result(user: str, response: dict) -> None:
+    envelope = response["result"]
+    if int(user[1:]) % 2 == 0:
+        assert envelope == {
+            "v": 1, "type": "calendar_events", "message": "", "owner": f"token-{user}", "query": f"{user} の予定",
+        }
+    else:
+        assert envelope["type"] == "location_request"
+        assert envelope["message"] == user
+
+
+def test_use_sets_and_resets():
+    """use() のスコープ内だけ current() が ctx を返すこと."""
+    assert request_context.current() is None
+    with request_context.use(RequestContext()) as outer:
+        assert request_context.current() is outer
+        with request_context.use(RequestContext()) as inner:
+            assert request_context.current() is inner
+        assert request_context.current() is outer
+    assert request_context.current() is None
+
+
+def test_tool_thread_writes_back_to_shared_context():
+    """コピーされたコンテキストで動くツールの書き込みが呼び出し元から見えること."""
+    with request_context.use(RequestContext()) as ctx:
+        copied = contextvars.copy_context()
+        thread = threading.Thread(target=copied.run, args=(google_maps.request_location, "現在地を送ってください"))
+        thread.start()
+        thread.join()
+        assert ctx.maps_result.type == "location_request"
+
+
+def test_set_credentials_requires_context():
+    """リクエストコンテキストの外では認証情報をセットできないこと."""
+    with pytest.raises(RuntimeError):
+        gmail_tools.set_credentials(MagicMock())
+    with pytest.raises(RuntimeError):
+        gmail_tools._get_service()
+
+
+def test_tool_credentials_isolated_between_threads():
+    """並行リクエストのツールがそれぞれ自分の認証情報で Google API を呼ぶこと."""
+    barrier = threading.Barrier(PARALLEL)
+
+    def _run(i: int):
+        with request_context.use(RequestContext()):
+            gmail_tools.set_credentials(f"creds-{i}")
+            barrier.wait()  # 全スレッドがセットし終えてから読む
+            return gmail_tools._get_service()
+
+    services = ServiceCache(build=lambda api, version, credentials, build_kwargs: credentials)
+    with patch.object(gmail_tools.google_services, "cache", services):
+        with ThreadPoolExecutor(max_workers=PARALLEL) as executor:
+            results = list(executor.map(_run, range(PARALLEL)))
+
+    assert results == [f"creds-{i}" for i in range(PARALLEL)]
+
+
+def test_concurrent_invocations_isolated_and_overlap():
+    """N 並列の invoke で認証情報・ツール結果が混ざらず、N 件が同時に Agent を実行していること."""
+    users = [f"U{i}" for i in range(PARALLEL)]
+    # 全員が Agent の中にそろわなければ timeout で BrokenBarrierError (直列化していれば失敗する)
+    barrier = threading.Barrier(PARALLEL, timeout=5)
+
+    def _overlapping_agent_call(prompt: str) -> str:
+        barrier.wait()
+        return _agent_call(prompt)
+
+    with (
+        patch.object(agent_main, "create_agent", side_effect=lambda **kw: MagicMock(side_effect=_agent_call)),
+        patch.object(agent_main.http_pool.pool, "open", side_effect=_fake_open),
+    ):
+        serial = [_invoke(user) for user in users]
+
+    agent_main._agent_pool.clear()
+    with (
+        patch.object(
+            agent_main, "create_agent", side_effect=lambda **kw: MagicMock(side_effect=_overlapping_agent_call)
+        ),
+        patch.object(agent_main.http_pool.pool, "open", side_effect=_fake_open),
+    ):
+        with ThreadPoolExecutor(max_workers=PARALLEL) as executor:
+            parallel = list(executor.map(_invoke, users))
+
+    for user, response in zip(users, serial):
+        _assert_own_result(user, response)
+    for user, response in zip(users, parallel):
+        assert response["status"] == "success"
+        _assert_own_result(user, response)
+    assert not barrier.broken
+    assert request_context.current() is None
+
+
+def test_concurrent_streams_isolated():
+    """ストリーミングの並行リクエストも自分の結果だけを受け取ること."""
+    users = [f"U{i}" for i in range(PARALLEL)]
+
+    def _stream(user: str) -> list[dict]:
+        return list(agent_main.invoke({
+            "prompt": f"{user}: 今日の予定",
+            "google_credentials": {"token": f"token-{user}"},
+            "stream": True,
+        }))
+
+    with (
+        patch.object(agent_main, "create_agent", side_effect=lambda **kw: MagicMock(side_effect=_agent_call)),
+        patch.object(agent_main.http_pool.pool, "open", side_effect=_fake_open),
+        ThreadPoolExecutor(max_workers=PARALLEL) as executor,
+    ):
+        streams = list(executor.map(_stream, users))
+
+    for user, events in zip(users, streams):
+        results = [event for event in events if event.get("event") == "result"]
+        assert len(results) == 1
+        _assert_own_result(user, results[0])
@@ -0,0 +1,121 @@
+"""Tests for agent/search_cache.py (Web 検索結果の 2 段キャッシュ)."""
+
+from unittest.mock import MagicMock
+
+import pytest
+import search_cache
+from search_cache import SearchCache, SQLiteStore
+
+
+class _Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_search_key_normalizes_query():
+    """全角・大文字小文字・空白の違いは同じキー、depth / max_results が違えば別のキーになること."""
+    key = search_cache.search_key("Python 最新バージョン", "basic", 5)
+
+    assert search_cache.search_key("  ｐｙｔｈｏｎ　 最新バージョン", "basic", 5) == key
+    assert search_cache.search_key("Python 最新バージョン", "advanced", 5) != key
+    assert search_cache.search_key("Python 最新バージョン", "basic", 3) != key
+
+
+@pytest.mark.parametrize("url", [
+    "https://Example.com/article?b=2&a=1",
+    "https://example.com:443/article?a=1&b=2#section",
+    "HTTPS://example.com/article?utm_source=line&a=1&fbclid=x&b=2",
+])
+def test_canonical_url(url):
+    """ホスト・既定ポート・フラグメント・トラッキングパラメータ・パラメータ順の違いを揃えること."""
+    assert search_cache.canonical_url(url) == "https://example.com/article?a=1&b=2"
+
+
+@pytest.mark.parametrize("query, query_class", [
+    ("今日の東京の天気", search_cache.CLASS_REALTIME),
+    ("最新のニュース", search_cache.CLASS_REALTIME),
+    ("Latest AI news", search_cache.CLASS_REALTIME),
+    ("富士山の高さ", search_cache.CLASS_GENERAL),
+])
+def test_classify_query(query, query_class):
+    """時事・天気などのクエリは realtime、それ以外は general に分類すること."""
+    assert search_cache.classify_query(query) == query_class
+
+
+def test_l1_hit_and_ttl_per_class():
+    """有効期間内は fetch を呼ばず、種類ごとの有効期間を過ぎたら取り直すこと."""
+    clock = _Clock(1000.0)
+    cache = SearchCache(clock=clock)
+    fetch = MagicMock(side_effect=[{"v": 1}, {"v": 2}, {"v": 3}])
+
+    assert cache.get_or_fetch("news", search_cache.CLASS_REALTIME, fetch) == {"v": 1}
+    assert cache.get_or_fetch("news", search_cache.CLASS_REALTIME, fetch) == {"v": 1}
+    assert cache.get_or_fetch("facts", search_cache.CLASS_GENERAL, fetch) == {"v": 2}
+
+    clock.now += search_cache.SEARCH_CACHE_TTL_REALTIME_SECONDS
+    assert cache.get_or_fetch("news", search_cache.CLASS_REALTIME, fetch) == {"v": 3}
+    assert cache.get_or_fetch("facts", search_cache.CLASS_GENERAL, fetch) == {"v": 2}
+    assert fetch.call_count == 3
+
+
+def test_l1_evicts_least_recently_used():
+    """L1 が上限を超えたら最も使われていないエントリから捨てること."""
+    cache = SearchCache(l1_size=2)
+    for key in ("a", "b"):
+        cache.get_or_fetch(key, search_cache.CLASS_GENERAL, lambda: {"key": key})
+    cache.get_or_fetch("a", search_cache.CLASS_GENERAL, MagicMock())
+    cache.get_or_fetch("c", search_cache.CLASS_GENERAL, lambda: {"key": "c"})
+
+    fetch = MagicMock(return_value={"key": "b2"})
+    assert cache.get_or_fetch("b", search_cache.CLASS_GENERAL, fetch) == {"key": "b2"}
+    fetch.assert_called_once()
+    assert cache.stats()["l1_entries"] == 2
+
+
+def test_l2_shared_across_processes(tmp_path):
+    """SQLite の永続ストアは別の L1 (別コンテナ・再起動後) からも読め、期限切れは読まないこと."""
+    path = str(tmp_path / "search_cache.db")
+    clock = _Clock(1000.0)
+    SearchCache(SQLiteStore(path), clock=clock).get_or_fetch(
+        "k", search_cache.CLASS_EXTRACT, lambda: {"raw_content": "本文"}
+    )
+
+    warm = SearchCache(SQLiteStore(path), clock=clock)
+    assert warm.get_or_fetch("k", search_cache.CLASS_EXTRACT, MagicMock()) == {"raw_content": "本文"}
+    assert warm.get_or_fetch("k", search_cache.CLASS_EXTRACT, MagicMock()) == {"raw_content": "本文"}
+
+    clock.now += search_cache.SEARCH_CACHE_TTL_EXTRACT_SECONDS
+    expired = SearchCache(SQLiteStore(path), clock=clock)
+    assert expired.get_or_fetch("k", search_cache.CLASS_EXTRACT, lambda: {"raw_content": "新しい本文"}) == {
+        "raw_content": "新しい本文"
+    }
+
+    stats = warm.stats()["classes"][search_cache.CLASS_EXTRACT]
+    assert stats == {"l1_hits": 1, "l2_hits": 1, "misses": 0, "hit_rate": 1.0}
+
+
+def test_errors_and_empty_results_are_not_cached():
+    """fetch の例外と None は保存せず、次の呼び出しで取り直すこと."""
+    cache = SearchCache()
+    with pytest.raises(RuntimeError):
+        cache.get_or_fetch("k", search_cache.CLASS_GENERAL, MagicMock(side_effect=RuntimeError("rate limit")))
+    assert cache.get_or_fetch("k", search_cache.CLASS_GENERAL, lambda: None) is None
+    assert cache.get_or_fetch("k", search_cache.CLASS_GENERAL, lambda: {"v": 1}) == {"v": 1}
+
+    assert cache.stats()["classes"][search_cache.CLASS_GENERAL] == {
+        "l1_hits": 0, "l2_hits": 0, "misses": 3, "hit_rate": 0.0,
+    }
+
+
+def test_build_search_cache_falls_back_without_store(monkeypatch):
+    """永続ストアを開けなければ L1 だけで動くこと."""
+    monkeypatch.setattr(search_cache, "SEARCH_CACHE_SQLITE_PATH", "/nonexistent/dir/cache.db")
+
+    cache = search_cache.build_search_cache("sqlite")
+
+    assert cache.get_or_fetch("k", search_cache.CLASS_GENERAL, lambda: {"v": 1}) == {"v": 1}
+    with pytest.raises(ValueError):
+        search_cache.build_search_cache("redis")
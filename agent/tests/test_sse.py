@@ -0,0 +1,61 @@
+"""Tests for agent/sse.py (lambda/sse.py と同じファイル)."""
+
+import json
+
+import envelope
+import pytest
+import sse
+import streaming
+
+
+def _encode(*events):
+    """AgentCore と同じく各イベントを `data: {json}` + 空行で送る."""
+    return b"".join(f"data: {json.dumps(e, ensure_ascii=False)}\n\n".encode("utf-8") for e in events)
+
+
+@pytest.mark.parametrize("size", [1, 5, 7, 4096])
+def test_iter_sse_events_handles_split_chunks(size):
+    """チャンク境界でイベントや UTF-8 文字が分割されてもパースできること."""
+    raw = _encode({"event": "delta", "text": "予定"}, {"event": "result", "result": "{}"})
+    chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+
+    assert list(sse.iter_sse_events(chunks)) == [
+        {"event": "delta", "text": "予定"},
+        {"event": "result", "result": "{}"},
+    ]
+
+
+def test_parser_crlf_multiline_and_trailing_event():
+    """CRLF 区切り・複数行の data・末尾の空行なしイベントを扱えること."""
+    raw = b'data: {"a": 1}\r\n\r\n: comment\ndata: {"b":\ndata: 2}\n\ndata: {"c": 3}'
+
+    assert list(sse.iter_sse_events([raw])) == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+    parser = sse.SSEParser()
+    events = parser.feed(raw)
+    assert events == [{"a": 1}, {"b": 2}]
+    assert parser.close() == [{"c": 3}]
+
+
+def test_iter_sse_events_reads_chunks_lazily():
+    """result が届いた時点で、後ろのチャンクを読まずにイベントを返すこと."""
+    consumed = []
+
+    def chunks():
+        for i, chunk in enumerate([_encode({"event": "result", "result": {}}), _encode({"event": "delta", "text": "x"})]):
+            consumed.append(i)
+            yield chunk
+
+    assert next(sse.iter_sse_events(chunks())) == {"event": "result", "result": {}}
+    assert consumed == [0]
+
+
+def test_router_events_round_trip():
+    """Router が出すイベント (streaming.delta_event / result_event) がそのまま読めること."""
+    result = envelope.make("calendar_events", "今日の予定", events=[{"id": "e1", "summary": "会議 {定例}"}])
+    produced = [streaming.delta_event('{"type": "cal'), streaming.result_event(result)]
+
+    parsed = list(sse.iter_sse_events([_encode(*produced)]))
+
+    assert parsed == produced
+    assert envelope.coerce(parsed[1]["result"]) == result
@@ -0,0 +1,81 @@
+"""Tests for agent/streaming.py."""
+
+import time
+
+import envelope
+import streaming
+
+
+def test_envelope_scanner_detects_complete_json():
+    """先頭の JSON オブジェクトが閉じた時点でエンベロープを返すこと."""
+    scanner = streaming.EnvelopeScanner()
+    parts = ['```json\n{"type": "calendar', '_events", "message": "a}b{", ', '"events": [{"id": 1}]', "}\n```"]
+    results = [scanner.feed(p) for p in parts]
+    assert results[:3] == [None, None, None]
+    assert results[3] == envelope.Envelope.from_dict({
+        "type": "calendar_events",
+        "message": "a}b{",
+        "events": [{"id": 1}],
+    })
+    # 一度返したら以降は何もしない
+    assert scanner.feed("{}") is None
+
+
+def test_envelope_scanner_ignores_text_and_non_envelope():
+    """テキストで始まる応答や type を持たない JSON は対象外であること."""
+    scanner = streaming.EnvelopeScanner()
+    assert scanner.feed("予定を確認します。") is None
+    assert scanner.feed('{"type": "text"}') is None
+
+    scanner.reset()
+    assert scanner.feed('{"foo": 1}') is None
+
+
+def test_envelope_scanner_leaves_invalid_envelope_to_final_result():
+    """スキーマに合わないエンベロープは途中で流さず、最終結果の解析に任せること."""
+    scanner = streaming.EnvelopeScanner()
+    assert scanner.feed('{"type": "calendar_events", "events": "none"}') is None
+
+
+def test_stream_bridge_result_once_and_drops_tail():
+    """result は 1 回だけ流れ、その後の delta は捨てられること."""
+    bridge = streaming.StreamBridge()
+
+    def run():
+        bridge.callback_handler(data="a")
+        bridge.publish_result(envelope.text("first"))
+        bridge.callback_handler(data="tail")
+        assert bridge.publish_result(envelope.text("second")) is False
+
+    assert list(bridge.run(run)) == [
+        streaming.delta_event("a"),
+        streaming.result_event(envelope.text("first")),
+    ]
+
+
+def test_stream_bridge_yields_result_before_completion():
+    """result は fn の終了を待たずに受け取れること."""
+    bridge = streaming.StreamBridge()
+
+    def run():
+        bridge.publish_result(envelope.text("early"))
+        time.sleep(0.3)
+
+    events = bridge.run(run)
+    start = time.monotonic()
+    assert next(events) == streaming.result_event(envelope.text("early"))
+    assert time.monotonic() - start < 0.2
+    assert list(events) == []
+
+
+def test_stream_bridge_error_envelope():
+    """result 前に例外が起きたらエラーエンベロープを流すこと."""
+    bridge = streaming.StreamBridge()
+
+    def run():
+        raise RuntimeError("model error")
+
+    events = list(bridge.run(run))
+    assert events[-1]["event"] == "result"
+    assert events[-1]["status"] == "error"
+    assert events[-1]["result"]["type"] == "text"
@@ -4,9 +4,19 @@ import json
 import sys
 from unittest.mock import MagicMock, patch
 
+import pytest
+import search_cache
+
 tavily_search = sys.modules["tools.tavily_search"]
 
 
+@pytest.fixture(autouse=True)
+def _fresh_search_cache():
+    search_cache.set_search_cache(search_cache.SearchCache())
+    yield
+    search_cache.set_search_cache(None)
+
+
 class TestWebSearch:
     """web_search ツールのテスト."""
 
@@ -43,6 +53,7 @@ class TestWebSearch:
             search_depth="basic",
             max_results=5,
             include_answer=True,
+            timeout=60,
         )
 
     def test_no_api_key(self):
@@ -84,6 +95,7 @@ class TestWebSearch:
             search_depth="advanced",
             max_results=3,
             include_answer=True,
+            timeout=60,
         )
 
     def test_empty_results(self):
@@ -100,6 +112,25 @@ class TestWebSearch:
         assert data["results"] == []
 
 
+    def test_cached_by_normalized_query(self):
+        """表記ゆれだけが違う同じ検索は Tavily を呼び直さず、エラーはキャッシュしないこと."""
+        mock_client = MagicMock()
+        mock_client.search.side_effect = [
+            Exception("API rate limit exceeded"),
+            {"answer": "Python 3.13 が最新です。", "results": []},
+        ]
+
+        with patch.dict("os.environ", {"TAVILY_API_KEY": "test-key"}):
+            with patch("tavily.TavilyClient", return_value=mock_client):
+                error = tavily_search.web_search("Python 最新バージョン")
+                first = tavily_search.web_search("Python 最新バージョン")
+                second = tavily_search.web_search("  ｐｙｔｈｏｎ　最新バージョン ")
+
+        assert "error" in json.loads(error)
+        assert first == second
+        assert mock_client.search.call_count == 2
+
+
 class TestExtractContent:
     """extract_content ツールのテスト."""
 
@@ -122,7 +153,7 @@ class TestExtractContent:
         data = json.loads(result)
         assert data["url"] == "https://example.com/article"
         assert "これは記事の内容です。" in data["raw_content"]
-        mock_client.extract.assert_called_once_with(urls=["https://example.com/article"])
+        mock_client.extract.assert_called_once_with(urls=["https://example.com/article"], timeout=60)
 
     def test_no_api_key(self):
         """API キー未設定でエラーが返ること."""
@@ -182,3 +213,18 @@ class TestExtractContent:
         # 3000 文字 + "..." = 3003 文字
         assert len(data["raw_content"]) == 3003
         assert data["raw_content"].endswith("...")
+
+    def test_cached_by_canonical_url(self):
+        """トラッキングパラメータやフラグメントだけが違う URL は再取得しないこと."""
+        mock_client = MagicMock()
+        mock_client.extract.return_value = {
+            "results": [{"url": "https://example.com/article", "raw_content": "本文"}]
+        }
+
+        with patch.dict("os.environ", {"TAVILY_API_KEY": "test-key"}):
+            with patch("tavily.TavilyClient", return_value=mock_client):
+                first = tavily_search.extract_content("https://example.com/article")
+                second = tavily_search.extract_content("https://Example.com/article?utm_source=line#top")
+
+        assert first == second
+        mock_client.extract.assert_called_once()
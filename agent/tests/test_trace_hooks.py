@@ -0,0 +1,62 @@
+"""Tests for agent/trace_hooks.py."""
+
+from types import SimpleNamespace
+
+import pytest
+import tracing
+from trace_hooks import TraceHooks
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.MemoryExporter()
+    tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(None)
+
+
+def test_registers_model_and_tool_callbacks():
+    """モデル呼び出しとツール呼び出しの前後にコールバックを登録すること."""
+    registry = SimpleNamespace(callbacks=[])
+    registry.add_callback = lambda event_type, callback: registry.callbacks.append(callback)
+    hooks = TraceHooks()
+
+    hooks.register_hooks(registry)
+
+    assert registry.callbacks == [
+        hooks.before_model_call, hooks.after_model_call, hooks.before_tool_call, hooks.after_tool_call,
+    ]
+
+
+def test_model_turn_and_tool_call_become_spans(exporter):
+    """モデルの 1 ターンとツール呼び出しがスパンになり、ツール内の処理はツールの子になること."""
+    hooks = TraceHooks()
+    agent = object()
+    tool_use = {"toolUseId": "t1", "name": "calendar_agent"}
+
+    with tracing.span("router.invoke") as root:
+        hooks.before_model_call(SimpleNamespace(agent=agent))
+        hooks.after_model_call(SimpleNamespace(agent=agent, stop_response=SimpleNamespace(stop_reason="tool_use")))
+        hooks.before_tool_call(SimpleNamespace(tool_use=tool_use))
+        with tracing.span("subagent.http"):
+            pass
+        hooks.after_tool_call(SimpleNamespace(tool_use=tool_use, result={"status": "success"}, exception=None))
+
+    spans = {s.name: s for s in exporter.spans}
+    assert spans["model.turn"].parent_span_id == root.span_id
+    assert spans["model.turn"].attributes == {"model.stop_reason": "tool_use"}
+    tool = spans["tool calendar_agent"]
+    assert tool.parent_span_id == root.span_id
+    assert tool.attributes == {"tool.name": "calendar_agent", "tool.status": "success"}
+    assert spans["subagent.http"].parent_span_id == tool.span_id
+
+
+def test_tool_exception_marks_span_as_error(exporter):
+    """ツールが例外で終わったらスパンを ERROR にすること."""
+    hooks = TraceHooks()
+    tool_use = {"toolUseId": "t2", "name": "web_search"}
+
+    hooks.before_tool_call(SimpleNamespace(tool_use=tool_use))
+    hooks.after_tool_call(SimpleNamespace(tool_use=tool_use, result=None, exception=TimeoutError("slow")))
+
+    assert exporter.spans[0].status == tracing.STATUS_ERROR
@@ -0,0 +1,138 @@
+"""Tests for agent/tracing.py."""
+
+import contextvars
+import json
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+import tracing
+
+agent_main = sys.modules["agent.main"]
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.MemoryExporter()
+    tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(None)
+
+
+def _by_name(exporter) -> dict:
+    return {s.name: s for s in exporter.spans}
+
+
+def test_disabled_tracing_records_nothing():
+    """出力先がなければスパンを作らず traceparent も付けないこと."""
+    with tracing.span("webhook") as s:
+        assert s is None
+        assert tracing.inject({}) == {}
+
+
+def test_nested_spans_share_trace_and_parent(exporter):
+    """スコープ内のスパンは同じトレースの子になり、service を引き継ぐこと."""
+    with tracing.span("webhook", service="line-webhook") as root:
+        with tracing.span("line.event"):
+            tracing.set_attribute("line.event_id", "e1")
+    spans = _by_name(exporter)
+
+    assert spans["line.event"].trace_id == root.trace_id
+    assert spans["line.event"].parent_span_id == root.span_id
+    assert spans["line.event"].service == "line-webhook"
+    assert spans["line.event"].attributes == {"line.event_id": "e1"}
+    assert root.parent_span_id == ""
+    assert tracing.current_span() is None
+
+
+def test_traceparent_round_trip(exporter):
+    """inject した traceparent を受け取った側は上流のスパンの子になること."""
+    with tracing.span("router.call") as caller:
+        payload = tracing.inject({"prompt": "こんにちは"})
+    with tracing.span("router.invoke", parent=tracing.extract(payload), service="router-agent") as callee:
+        pass
+
+    assert payload["traceparent"] == f"00-{caller.trace_id}-{caller.span_id}-01"
+    assert callee.trace_id == caller.trace_id
+    assert callee.parent_span_id == caller.span_id
+    assert tracing.parse_traceparent("00-xyz-01") is None
+
+
+def test_span_records_error_and_reraises(exporter):
+    """例外はスパンを ERROR にして再送出すること."""
+    with pytest.raises(RuntimeError), tracing.span("google calendar.events.list"):
+        raise RuntimeError("quota")
+
+    s = exporter.spans[0]
+    assert s.status == tracing.STATUS_ERROR
+    assert "quota" in s.status_message
+    assert s.end_ns >= s.start_ns
+
+
+def test_entrypoint_keeps_span_open_while_streaming(exporter):
+    """ストリーミングのジェネレータは読み終わるまでスパンを開き、スレッドにも引き継ぐこと."""
+    seen = []
+
+    @tracing.entrypoint("calendar_agent.invoke", service="calendar-agent")
+    def invoke(payload):
+        def _stream():
+            # StreamBridge.run と同じく読み始めた時点の contextvars をスレッドに渡す
+            ctx = contextvars.copy_context()
+            worker = threading.Thread(target=ctx.run, args=(lambda: seen.append(tracing.current_trace_id()),))
+            worker.start()
+            worker.join()
+            yield {"event": "result"}
+
+        return _stream()
+
+    parent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    events = invoke({"prompt": "予定", "traceparent": parent})
+    assert exporter.spans == []
+    assert list(events) == [{"event": "result"}]
+
+    s = exporter.spans[0]
+    assert s.name == "calendar_agent.invoke"
+    assert s.trace_id == "a" * 32 and s.parent_span_id == "b" * 16
+    assert seen == ["a" * 32]
+
+
+def test_file_exporter_writes_json_lines(tmp_path):
+    """file の出力先は 1 スパン 1 行の JSON (OTLP と同じキー名) を追記すること."""
+    path = tmp_path / "traces.jsonl"
+    tracing.set_exporter(tracing.FileExporter(str(path)))
+    try:
+        with tracing.span("webhook", attributes={"request.id": "r1"}):
+            with tracing.span("webhook.verify_signature"):
+                pass
+    finally:
+        tracing.set_exporter(None)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["webhook.verify_signature", "webhook"]
+    assert lines[0]["parentSpanId"] == lines[1]["spanId"]
+    assert lines[1]["attributes"] == {"request.id": "r1"}
+    assert {"traceId", "startTimeUnixNano", "endTimeUnixNano", "status"} <= set(lines[0])
+
+
+def test_router_propagates_trace_to_sub_agent(exporter):
+    """Router の invoke → サブエージェント呼び出しで traceparent を payload に入れること."""
+    sent = {}
+
+    def _stream(method, url, body, **kwargs):
+        sent.update(json.loads(body))
+        resp = MagicMock()
+        return MagicMock(__enter__=MagicMock(return_value=resp), __exit__=MagicMock(return_value=False))
+
+    parent = "00-" + "c" * 32 + "-" + "d" * 16 + "-01"
+    with (
+        patch.object(agent_main.http_pool.pool, "stream", side_effect=_stream),
+        patch.object(agent_main, "read_agent_response", return_value=iter([{"event": "result", "result": {"type": "event_deleted"}}])),
+    ):
+        with tracing.span("router.invoke", parent=parent, service="router-agent"):
+            agent_main._invoke_sub_agent("http://calendar:8081", "予定を消して")
+
+    spans = _by_name(exporter)
+    sub = spans["subagent.http"]
+    assert sub.trace_id == "c" * 32
+    assert sent["traceparent"] == sub.traceparent()
@@ -1,6 +1,6 @@
 """Google Calendar ツール (Strands Agent 用).
 
-各ツールは module-level の _credentials を使って Google Calendar API を呼び出す。
+各ツールはリクエストコンテキスト (request_context) の認証情報を使って Google Calendar API を呼び出す。
 Agent 呼び出し前に set_credentials() でセットすること。
 """
 
@@ -9,27 +9,29 @@ import logging
 from datetime import datetime, timedelta, timezone
 
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from strands import tool
 
+import google_services
+import request_context
+
 logger = logging.getLogger(__name__)
 
 JST = timezone(timedelta(hours=9))
 
-# リクエストスコープの Google 認証情報
-_credentials: Credentials | None = None
-
 
 def set_credentials(creds: Credentials) -> None:
-    """Google Credentials をセット（Agent 呼び出し前に実行）."""
-    global _credentials
-    _credentials = creds
+    """Google Credentials を実行中のリクエストにセット（Agent 呼び出し前に実行）."""
+    ctx = request_context.current()
+    if ctx is None:
+        raise RuntimeError("set_credentials() must be called inside a request context.")
+    ctx.credentials = creds
 
 
 def _get_service():
-    if _credentials is None:
+    ctx = request_context.current()
+    if ctx is None or ctx.credentials is None:
         raise RuntimeError("Google credentials not set. Call set_credentials() first.")
-    return build("calendar", "v3", credentials=_credentials, cache_discovery=False)
+    return google_services.get_service("calendar", "v3", ctx.credentials)
 
 
 # ---------- Tools ----------
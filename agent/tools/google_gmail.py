@@ -1,6 +1,6 @@
 """Google Gmail ツール (Strands Agent 用).
 
-各ツールは module-level の _credentials を使って Gmail API を呼び出す。
+各ツールはリクエストコンテキスト (request_context) の認証情報を使って Gmail API を呼び出す。
 Agent 呼び出し前に set_credentials() でセットすること。
 """
 
@@ -11,25 +11,27 @@ import re
 from email.mime.text import MIMEText
 
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from strands import tool
 
-logger = logging.getLogger(__name__)
+import google_services
+import request_context
 
-# リクエストスコープの Google 認証情報
-_credentials: Credentials | None = None
+logger = logging.getLogger(__name__)
 
 
 def set_credentials(creds: Credentials) -> None:
-    """Google Credentials をセット（Agent 呼び出し前に実行）."""
-    global _credentials
-    _credentials = creds
+    """Google Credentials を実行中のリクエストにセット（Agent 呼び出し前に実行）."""
+    ctx = request_context.current()
+    if ctx is None:
+        raise RuntimeError("set_credentials() must be called inside a request context.")
+    ctx.credentials = creds
 
 
 def _get_service():
-    if _credentials is None:
+    ctx = request_context.current()
+    if ctx is None or ctx.credentials is None:
         raise RuntimeError("Google credentials not set. Call set_credentials() first.")
-    return build("gmail", "v1", credentials=_credentials, cache_discovery=False)
+    return google_services.get_service("gmail", "v1", ctx.credentials)
 
 
 # ---------- ヘルパー ----------
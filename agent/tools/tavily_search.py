@@ -4,10 +4,17 @@ import json
 import logging
 import os
 
+import deadline
+import search_cache
 from strands import tool
 
 logger = logging.getLogger(__name__)
 
+# Tavily API 呼び出しのタイムアウト (tavily-python の既定値). リクエストの残り時間で切り詰める
+TAVILY_TIMEOUT_SECONDS = 60
+# 抽出したコンテンツの上限文字数
+EXTRACT_MAX_CHARS = 3000
+
 
 @tool
 def web_search(query: str, search_depth: str = "basic", max_results: int = 5) -> str:
@@ -19,33 +26,38 @@ def web_search(query: str, search_depth: str = "basic", max_results: int = 5) ->
     if not api_key:
         return json.dumps({"error": "TAVILY_API_KEY が設定されていません。"}, ensure_ascii=False)
 
-    try:
+    def _fetch() -> dict:
         client = TavilyClient(api_key=api_key)
         response = client.search(
             query=query,
             search_depth=search_depth,
             max_results=max_results,
             include_answer=True,
+            timeout=deadline.timeout(TAVILY_TIMEOUT_SECONDS),
+        )
+        results = []
+        for r in response.get("results", []):
+            results.append({
+                "title": r.get("title", ""),
+                "url": r.get("url", ""),
+                "content": r.get("content", ""),
+            })
+        return {
+            "answer": response.get("answer", ""),
+            "results": results,
+        }
+
+    try:
+        data = search_cache.get_search_cache().get_or_fetch(
+            search_cache.search_key(query, search_depth, max_results),
+            search_cache.classify_query(query),
+            _fetch,
         )
     except Exception as e:
         logger.error("web_search failed: %s", e)
         return json.dumps({"error": f"Web 検索に失敗しました: {e}"}, ensure_ascii=False)
 
-    results = []
-    for r in response.get("results", []):
-        results.append({
-            "title": r.get("title", ""),
-            "url": r.get("url", ""),
-            "content": r.get("content", ""),
-        })
-
-    return json.dumps(
-        {
-            "answer": response.get("answer", ""),
-            "results": results,
-        },
-        ensure_ascii=False,
-    )
+    return json.dumps(data, ensure_ascii=False)
 
 
 @tool
@@ -58,27 +70,31 @@ def extract_content(url: str) -> str:
     if not api_key:
         return json.dumps({"error": "TAVILY_API_KEY が設定されていません。"}, ensure_ascii=False)
 
-    try:
+    def _fetch() -> dict | None:
         client = TavilyClient(api_key=api_key)
-        response = client.extract(urls=[url])
+        response = client.extract(urls=[url], timeout=deadline.timeout(TAVILY_TIMEOUT_SECONDS))
+        extracted = response.get("results", [])
+        if not extracted:
+            return None
+        item = extracted[0]
+        raw_content = item.get("raw_content", "")
+        # 長すぎるコンテンツは先頭 3000 文字に制限 (キャッシュにも切り詰めた結果だけを保存)
+        if len(raw_content) > EXTRACT_MAX_CHARS:
+            raw_content = raw_content[:EXTRACT_MAX_CHARS] + "..."
+        return {
+            "url": item.get("url", url),
+            "raw_content": raw_content,
+        }
+
+    try:
+        data = search_cache.get_search_cache().get_or_fetch(
+            search_cache.extract_key(url), search_cache.CLASS_EXTRACT, _fetch
+        )
     except Exception as e:
         logger.error("extract_content failed: %s", e)
         return json.dumps({"error": f"コンテンツの抽出に失敗しました: {e}"}, ensure_ascii=False)
 
-    extracted = response.get("results", [])
-    if not extracted:
+    if data is None:
         return json.dumps({"error": "コンテンツを抽出できませんでした。"}, ensure_ascii=False)
 
-    item = extracted[0]
-    raw_content = item.get("raw_content", "")
-    # 長すぎるコンテンツは先頭 3000 文字に制限
-    if len(raw_content) > 3000:
-        raw_content = raw_content[:3000] + "..."
-
-    return json.dumps(
-        {
-            "url": item.get("url", url),
-            "raw_content": raw_content,
-        },
-        ensure_ascii=False,
-    )
+    return json.dumps(data, ensure_ascii=False)
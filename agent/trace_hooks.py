@@ -0,0 +1,65 @@
+"""Strands Agent のモデル呼び出し・ツール呼び出しをスパンにするフック.
+
+create_agent で Agent(hooks=[TraceHooks()]) として登録する。モデル呼び出し 1 回
+(1 ターン) とツール呼び出し 1 回ごとにスパンを作り、ツールのスパンを実行中にするので
+ツール内の HTTP・Google API 呼び出しはその子になる (ツールは contextvars を
+引き継いだスレッドで実行される)。トレースが無効なら何もしない。
+"""
+
+import threading
+
+import tracing
+
+
+class TraceHooks:
+    """Strands の HookProvider."""
+
+    def __init__(self):
+        self._spans: dict[tuple[str, str], tracing.Span] = {}
+        self._lock = threading.Lock()
+
+    def register_hooks(self, registry, **kwargs) -> None:
+        from strands.hooks import (
+            AfterModelCallEvent,
+            AfterToolCallEvent,
+            BeforeModelCallEvent,
+            BeforeToolCallEvent,
+        )
+
+        registry.add_callback(BeforeModelCallEvent, self.before_model_call)
+        registry.add_callback(AfterModelCallEvent, self.after_model_call)
+        registry.add_callback(BeforeToolCallEvent, self.before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self.after_tool_call)
+
+    def before_model_call(self, event) -> None:
+        self._start(("model", str(id(event.agent))), "model.turn", {})
+
+    def after_model_call(self, event) -> None:
+        stop = getattr(event, "stop_response", None)
+        attributes = {"model.stop_reason": str(stop.stop_reason)} if stop is not None else {}
+        self._end(("model", str(id(event.agent))), getattr(event, "exception", None), attributes)
+
+    def before_tool_call(self, event) -> None:
+        tool_use = event.tool_use or {}
+        name = tool_use.get("name", "")
+        self._start(("tool", tool_use.get("toolUseId", "")), f"tool {name}", {"tool.name": name})
+
+    def after_tool_call(self, event) -> None:
+        tool_use = event.tool_use or {}
+        result = getattr(event, "result", None)
+        attributes = {"tool.status": result.get("status")} if isinstance(result, dict) else {}
+        self._end(("tool", tool_use.get("toolUseId", "")), getattr(event, "exception", None), attributes)
+
+    def _start(self, key: tuple[str, str], name: str, attributes: dict) -> None:
+        s = tracing.start_span(name, attributes=attributes)
+        if s is not None:
+            with self._lock:
+                self._spans[key] = s
+
+    def _end(self, key: tuple[str, str], error: BaseException | None, attributes: dict) -> None:
+        with self._lock:
+            s = self._spans.pop(key, None)
+        if s is None:
+            return
+        s.attributes.update(attributes)
+        tracing.end_span(s, error)
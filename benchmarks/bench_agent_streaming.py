@@ -0,0 +1,63 @@
+"""Agent ストリーミングの返信までの時間 (time to envelope) のベンチマーク.
+
+ローカルの AgentCore スタンドインに対して、バッファ版 (JSON) と
+ストリーミング版 (SSE を逐次パースし result で即返す) を比較する。
+
+    python benchmarks/bench_agent_streaming.py [--runs 5] [--result-at 1.0] [--tail 1.5]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambda"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import agent_stream  # noqa: E402
+from standins import AgentCoreStandIn  # noqa: E402
+
+
+def _invoke(url: str, stream: bool) -> tuple[float, float]:
+    """(エンベロープ取得までの秒数, 接続クローズまでの秒数) を返す."""
+    payload = {"prompt": "今日の予定は？", "line_user_id": "Ubench", "stream": stream}
+    req = urllib.request.Request(
+        f"{url}/invocations",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    resp = urllib.request.urlopen(req, timeout=30)
+    if "text/event-stream" in resp.headers.get("Content-Type", ""):
+        stream_obj = agent_stream.AgentStream(iter(lambda: resp.read1(8192), b""), close=resp.close)
+        stream_obj.envelope()
+        envelope_at = time.perf_counter() - start
+        stream_obj.drain()
+    else:
+        with resp:
+            json.loads(resp.read())
+        envelope_at = time.perf_counter() - start
+    return envelope_at, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--result-at", type=float, default=1.0, help="エンベロープ確定までの秒数")
+    parser.add_argument("--tail", type=float, default=1.5, help="確定後の LLM 後処理の秒数")
+    args = parser.parse_args()
+
+    envelope = {"type": "calendar_events", "message": "今日の予定", "events": []}
+    with AgentCoreStandIn(envelope, result_at=args.result_at, tail=args.tail) as stand_in:
+        for label, stream in (("buffered", False), ("streaming", True)):
+            samples = [_invoke(stand_in.url, stream) for _ in range(args.runs)]
+            to_envelope = statistics.median(s[0] for s in samples) * 1000
+            to_close = statistics.median(s[1] for s in samples) * 1000
+            print(f"{label:>9}: time to envelope p50 {to_envelope:7.0f}ms  connection closed p50 {to_close:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
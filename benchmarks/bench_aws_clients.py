@@ -0,0 +1,100 @@
+"""AWS クライアント生成コストのベンチマーク (moto).
+
+1 メッセージあたりの DynamoDB / AgentCore クライアント準備 + DynamoDB 読み書きを
+「呼び出しごとに boto3.resource / boto3.client を生成」する旧実装と
+aws_clients のレジストリで比較する。
+
+    python benchmarks/bench_aws_clients.py [--messages 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambda"))
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import boto3  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import aws_clients  # noqa: E402
+
+REGION = "us-east-1"
+STATE_TABLE = "UserSessionState"
+TOKEN_TABLE = "GoogleOAuthTokens"
+
+
+def _create_tables() -> None:
+    client = boto3.client("dynamodb", region_name=REGION)
+    for name in (STATE_TABLE, TOKEN_TABLE):
+        client.create_table(
+            TableName=name,
+            KeySchema=[{"AttributeName": "line_user_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "line_user_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+
+def message_per_call_clients(user_id: str) -> None:
+    """旧実装: 呼び出しごとにリソース / クライアントを生成."""
+    boto3.resource("dynamodb", region_name=REGION).Table(STATE_TABLE).get_item(
+        Key={"line_user_id": user_id}
+    )
+    boto3.resource("dynamodb", region_name=REGION).Table(TOKEN_TABLE).get_item(
+        Key={"line_user_id": user_id}
+    )
+    boto3.client("bedrock-agentcore", region_name=REGION)
+    boto3.resource("dynamodb", region_name=REGION).Table(STATE_TABLE).put_item(
+        Item={"line_user_id": user_id, "state": "{}"}
+    )
+
+
+def message_registry(user_id: str) -> None:
+    """aws_clients のレジストリを使う実装."""
+    aws_clients.get_table(STATE_TABLE, REGION).get_item(Key={"line_user_id": user_id})
+    aws_clients.get_table(TOKEN_TABLE, REGION).get_item(Key={"line_user_id": user_id})
+    aws_clients.get_client("bedrock-agentcore", REGION)
+    aws_clients.get_table(STATE_TABLE, REGION).put_item(
+        Item={"line_user_id": user_id, "state": "{}"}
+    )
+
+
+def _measure(fn, messages: int) -> list[float]:
+    samples = []
+    for i in range(messages):
+        start = time.perf_counter()
+        fn(f"U{i % 10}")
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    with mock_aws():
+        _create_tables()
+        aws_clients.reset()
+        results = {
+            "per-call clients": _measure(message_per_call_clients, args.messages),
+            "registry": _measure(message_registry, args.messages),
+        }
+
+    print(f"messages: {args.messages}")
+    for name, samples in results.items():
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(
+            f"{name:>17}: mean {statistics.mean(samples):7.2f}ms  "
+            f"p50 {statistics.median(samples):7.2f}ms  p95 {p95:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
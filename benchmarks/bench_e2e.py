@@ -0,0 +1,375 @@
+"""Webhook から返信までの end-to-end レイテンシのベンチマーク (オフライン).
+
+署名付きの LINE Webhook body を lambda_handler に渡し、スクリプト化した会話を流す。
+外部はローカルのスタンドイン (LINE Messaging API / AgentCore /invocations /
+Google Calendar・Gmail API) と moto の DynamoDB に置き換え、それぞれの遅延を引数で変えられる。
+Postback は直前の返信 (Flex) に入っているボタンの data をそのまま押す。
+
+段ごとの時間は tracing のスパン (webhook, state.load, credentials.resolve, router.call,
+google ..., flex.build, line.reply など) から集計し、会話ごとに p50 / p95 / p99 を表示する。
+
+    python benchmarks/bench_e2e.py [--conversation create_flow] [--iterations 30] \\
+        [--line-latency 0.05] [--google-latency 0.08] [--agent-latency 0.8] [--dynamodb-latency 0.005]
+
+lambda/requirements.txt と moto (requirements-dev.txt) が必要。
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambda"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+CHANNEL_SECRET = "bench-channel-secret"
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["LINE_CHANNEL_SECRET"] = CHANNEL_SECRET
+os.environ["LINE_CHANNEL_ACCESS_TOKEN"] = "bench-access-token"
+
+import boto3  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import aws_clients  # noqa: E402
+import google_auth  # noqa: E402
+import index  # noqa: E402
+import line_messaging  # noqa: E402
+import tracing  # noqa: E402
+from standins import AgentCoreStandIn, GoogleAPIStandIn, LineAPIStandIn  # noqa: E402
+
+JST = timezone(timedelta(hours=9))
+
+# 段ごとの表で先頭に出す順 (ほかの段は名前順)
+_STAGE_ORDER = (
+    "webhook", "webhook.verify_signature", "line.event", "state.load", "credentials.resolve",
+    "line.loading", "fast_path", "router.call", "flex.build", "line.reply", "line.push", "state.commit",
+)
+
+
+@dataclass
+class Step:
+    """会話の 1 ターン. text (ユーザーの発言) か postback (直前の返信から押すボタンの action) のどちらか."""
+
+    label: str
+    text: str = ""
+    postback: str = ""
+    # Router のスタンドインが返すエンベロープ (Router を呼ばないターンは None)
+    agent: dict | None = None
+
+
+CONVERSATIONS: dict[str, list[Step]] = {
+    # 予定一覧 (高速パス. --no-fast-path なら Router)
+    "list_events": [
+        Step("today", text="今日の予定は？", agent={"type": "calendar_events", "message": "今日の予定です。", "events": []}),
+    ],
+    # 日付 → 時間 → 確認 → 作成
+    "create_flow": [
+        Step(
+            "ask",
+            text="ご飯の予定を入れたい",
+            agent={"type": "date_selection", "message": "日付を選択してください。", "busy_slots": [], "suggested_title": "ご飯"},
+        ),
+        Step("date", postback="select_date"),
+        Step("time", postback="select_time"),
+        Step("create", postback="confirm_create"),
+    ],
+    # 受信トレイ → メール詳細
+    "inbox_detail": [
+        Step(
+            "inbox",
+            text="受信トレイ見せて",
+            agent={
+                "type": "email_list",
+                "message": "受信トレイのメールです。",
+                "emails": [{"id": "m1", "subject": "週次定例", "from": "boss@example.com", "snippet": "議題の確認です。"}],
+            },
+        ),
+        Step(
+            "detail",
+            postback="email_detail",
+            agent={
+                "type": "email_detail",
+                "message": "メールの詳細です。",
+                "email": {"id": "m1", "subject": "週次定例", "from": "boss@example.com", "summary": "議題の確認です。"},
+            },
+        ),
+    ],
+}
+
+
+def _sample_events() -> list[dict]:
+    today = datetime.now(JST).date().isoformat()
+    return [
+        {
+            "id": f"ev{i}",
+            "summary": f"ミーティング {i}",
+            "start": {"dateTime": f"{today}T{9 + i:02d}:00:00+09:00"},
+            "end": {"dateTime": f"{today}T{9 + i:02d}:30:00+09:00"},
+            "location": "会議室 A",
+        }
+        for i in range(3)
+    ]
+
+
+def _sample_emails(count: int = 5) -> list[dict]:
+    return [
+        {
+            "id": f"m{i}",
+            "threadId": f"t{i}",
+            "snippet": f"本文の冒頭 {i}",
+            "labelIds": ["INBOX", "UNREAD"] if i % 2 else ["INBOX"],
+            "payload": {"headers": [
+                {"name": "Subject", "value": f"件名 {i}"},
+                {"name": "From", "value": f"sender{i}@example.com"},
+                {"name": "Date", "value": "Mon, 19 Oct 2026 09:00:00 +0900"},
+            ]},
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+# ---------- Webhook body ----------
+
+
+def _sign(body: str) -> str:
+    digest = hmac.new(CHANNEL_SECRET.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def _webhook_event(user_id: str, step: Step, postback_data: str) -> dict:
+    event = {
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper(),
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+    }
+    if step.text:
+        event["type"] = "message"
+        event["message"] = {"type": "text", "id": str(uuid.uuid4().int)[:18], "quoteToken": "q", "text": step.text}
+    else:
+        event["type"] = "postback"
+        event["postback"] = {"data": postback_data}
+    return event
+
+
+def _api_gateway_event(webhook_event: dict) -> dict:
+    body = json.dumps({"destination": "Ubot", "events": [webhook_event]}, ensure_ascii=False)
+    return {
+        "body": body,
+        "headers": {"x-line-signature": _sign(body)},
+        "requestContext": {"requestId": uuid.uuid4().hex},
+    }
+
+
+def _find_postback(messages: list[dict], action: str) -> str:
+    """返信メッセージ (Flex) の中から action のボタンの postback data を探す."""
+    prefix = f"action={action}"
+
+    def _walk(node):
+        if isinstance(node, dict):
+            if node.get("type") == "postback" and str(node.get("data", "")).startswith(prefix):
+                return node["data"]
+            nodes = node.values()
+        elif isinstance(node, list):
+            nodes = node
+        else:
+            return None
+        for child in nodes:
+            found = _walk(child)
+            if found:
+                return found
+        return None
+
+    found = _walk(messages)
+    if not found:
+        raise RuntimeError(f"no {action} button in the previous reply")
+    return found
+
+
+# ---------- ローカル環境 ----------
+
+
+class _LocalLineMessenger(line_messaging.LineMessenger):
+    """送信先を LINE のスタンドインに向けた LineMessenger."""
+
+    def __init__(self, access_token: str, host: str):
+        self.host = host
+        super().__init__(access_token)
+
+    def _build_configuration(self):
+        configuration = super()._build_configuration()
+        configuration.host = self.host
+        return configuration
+
+
+def _use_google_stand_in(stand_in: GoogleAPIStandIn) -> None:
+    """google_services が作るサービスの送信先をスタンドインに向ける."""
+    from googleapiclient import discovery
+
+    build_from_document = discovery.build_from_document
+
+    def _build_local(service, *args, **kwargs):
+        document = json.loads(service) if isinstance(service, str) else service
+        kwargs["client_options"] = {"api_endpoint": stand_in.endpoint(document["name"])}
+        return build_from_document(service, *args, **kwargs)
+
+    discovery.build_from_document = _build_local
+
+
+def _add_dynamodb_latency(seconds: float) -> None:
+    """DynamoDB の API 呼び出しごとに seconds 秒待たせる (moto は同一プロセスで即応答するため)."""
+    if seconds <= 0:
+        return
+    aws_clients._get_session().events.register(
+        "before-call.dynamodb.*", lambda **kwargs: time.sleep(seconds)
+    )
+
+
+def _create_tables(user_ids: list[str]) -> None:
+    region = index.AWS_REGION
+    client = boto3.client("dynamodb", region_name=region)
+    for name, key in (
+        (index.USER_STATE_TABLE, "line_user_id"),
+        (google_auth.DYNAMODB_TOKEN_TABLE, "line_user_id"),
+        (index.IDEMPOTENCY_TABLE, "event_id"),
+    ):
+        client.create_table(
+            TableName=name,
+            KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+    tokens = boto3.resource("dynamodb", region_name=region).Table(google_auth.DYNAMODB_TOKEN_TABLE)
+    for user_id in user_ids:
+        tokens.put_item(Item={
+            "line_user_id": user_id,
+            "access_token": f"token-{user_id}",
+            "refresh_token": "refresh",
+            "token_expiry": int(time.time()) + 86400,
+        })
+
+
+# ---------- 実行・集計 ----------
+
+
+def run_conversation(
+    steps: list[Step], user_id: str, line: LineAPIStandIn, agent: AgentCoreStandIn, exporter: tracing.MemoryExporter
+) -> dict[str, list[float]]:
+    """1 ユーザー分の会話を流し、段 (スパン名) ごとの時間 (ms) を返す. 段名の先頭に step.label を付けた合計も入れる."""
+    durations: dict[str, list[float]] = defaultdict(list)
+    previous: list[dict] = []
+    for step in steps:
+        if step.agent is not None:
+            agent.envelope = step.agent
+        postback = _find_postback(previous, step.postback) if step.postback else ""
+        sent_before = len(line.requests)
+        exporter.clear()
+        response = index.lambda_handler(_api_gateway_event(_webhook_event(user_id, step, postback)), None)
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"{step.label}: webhook returned {response}")
+        previous = line.messages_since(sent_before)
+        if not previous:
+            raise RuntimeError(f"{step.label}: no reply was sent")
+        for s in exporter.spans:
+            durations[s.name].append(s.duration_ms)
+            if s.name == "webhook":
+                durations[f"[{step.label}]"].append(s.duration_ms)
+    return durations
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """nearest-rank の百分位数."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _stage_key(name: str) -> tuple:
+    if name.startswith("["):
+        return (0, "")
+    if name in _STAGE_ORDER:
+        return (1, _STAGE_ORDER.index(name))
+    return (2, name)
+
+
+def report(name: str, durations: dict[str, list[float]]) -> str:
+    """段ごとの回数・p50 / p95 / p99 の表. [label] は会話のターンごとの webhook 全体."""
+    width = max(len(stage) for stage in durations)
+    lines = [f"{name}", f"  {'stage':<{width}}  {'n':>4}  {'p50':>8}  {'p95':>8}  {'p99':>8}"]
+    for stage in sorted(durations, key=lambda s: (_stage_key(s), s)):
+        samples = durations[stage]
+        lines.append(
+            f"  {stage:<{width}}  {len(samples):4d}  {percentile(samples, 50):6.1f}ms"
+            f"  {percentile(samples, 95):6.1f}ms  {percentile(samples, 99):6.1f}ms"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversation", choices=sorted(CONVERSATIONS), action="append", help="流す会話 (複数可. 既定は全部)")
+    parser.add_argument("--iterations", type=int, default=30, help="会話ごとの繰り返し回数 (ユーザーを変えて流す)")
+    parser.add_argument("--warmup", type=int, default=1, help="集計しない最初の回数 (コールドスタート分)")
+    parser.add_argument("--line-latency", type=float, default=0.05, help="LINE API 1 回の遅延 (秒)")
+    parser.add_argument("--google-latency", type=float, default=0.08, help="Google API 1 回の遅延 (秒)")
+    parser.add_argument("--agent-latency", type=float, default=0.8, help="Router のエンベロープ確定までの秒数")
+    parser.add_argument("--agent-tail", type=float, default=0.5, help="確定後の LLM 後処理の秒数")
+    parser.add_argument("--dynamodb-latency", type=float, default=0.005, help="DynamoDB 1 回の遅延 (秒)")
+    parser.add_argument("--no-fast-path", action="store_true", help="一覧表示も Router に任せる")
+    parser.add_argument("--no-streaming", action="store_true", help="Router の応答を SSE で受け取らない")
+    args = parser.parse_args()
+
+    names = args.conversation or list(CONVERSATIONS)
+    runs = args.warmup + args.iterations
+    user_ids = [f"Ubench{name}{i}" for name in names for i in range(runs)]
+    index.intent_classifier.INTENT_FAST_PATH = not args.no_fast_path
+    index.AGENT_STREAMING = not args.no_streaming
+
+    exporter = tracing.MemoryExporter()
+    tracing.set_exporter(exporter)
+    with (
+        mock_aws(),
+        LineAPIStandIn(latency=args.line_latency) as line,
+        GoogleAPIStandIn(_sample_events(), emails=_sample_emails(), latency=args.google_latency) as google,
+        AgentCoreStandIn({}, result_at=args.agent_latency, tail=args.agent_tail) as agent,
+    ):
+        aws_clients.reset()
+        _add_dynamodb_latency(args.dynamodb_latency)
+        _create_tables(user_ids)
+        _use_google_stand_in(google)
+        index.messenger = _LocalLineMessenger(index.CHANNEL_ACCESS_TOKEN, line.url)
+        index.AGENTCORE_RUNTIME_ENDPOINT = agent.url
+
+        print(
+            f"latency: line {args.line_latency * 1000:.0f}ms  google {args.google_latency * 1000:.0f}ms  "
+            f"agent {args.agent_latency * 1000:.0f}ms (+{args.agent_tail * 1000:.0f}ms tail)  "
+            f"dynamodb {args.dynamodb_latency * 1000:.0f}ms  iterations {args.iterations}"
+        )
+        for name in names:
+            durations: dict[str, list[float]] = defaultdict(list)
+            for i in range(runs):
+                result = run_conversation(CONVERSATIONS[name], f"Ubench{name}{i}", line, agent, exporter)
+                if i >= args.warmup:
+                    for stage, samples in result.items():
+                        durations[stage].extend(samples)
+            print()
+            print(report(name, durations))
+    tracing.set_exporter(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""サブエージェント → Router → Lambda のエンベロープ受け渡しのベンチマーク.
+
+大きなメール一覧・場所一覧のエンベロープについて、段ごと (サブエージェント / Router / Lambda) の
+応答ボディのエンコード / デコードにかかる時間と、ボディのバイト数を比較する。
+
+旧実装: エンベロープを JSON 文字列にして {"result": "..."} に入れる (文字列の中の JSON を
+エスケープして二重にエンコードし、Lambda で文字列からエンベロープを解析し直す)。
+新実装: {"result": {...}} と JSON オブジェクトのまま入れ、各段では Envelope.from_dict だけ行う。
+Router の LLM に渡すツール結果は Bedrock のリクエストに入れてエンコードするところまで含める
+(旧実装は text ブロックに文字列、新実装は json ブロックにオブジェクトのまま)。
+
+    python benchmarks/bench_envelope.py [--iterations 200] [--items 30]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agent"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import envelope  # noqa: E402
+import json_extract  # noqa: E402
+from bench_json_extract import _email_envelope, _place_envelope  # noqa: E402
+
+
+def _string_hops(llm_text: str) -> tuple:
+    """旧実装: エンベロープを文字列のまま {"result": "..."} に入れる."""
+
+    def sub_agent() -> str:
+        # LLM 出力から JSON の部分を取り出し、文字列のまま応答ボディに入れる
+        return json.dumps({"result": json_extract.sanitize(llm_text)}, ensure_ascii=False)
+
+    def router(sub_body: str) -> str:
+        # ツール結果の文字列を LLM に渡し (text ブロック)、同じ文字列を応答ボディに入れる
+        tool_result = json.loads(sub_body)["result"]
+        json.dumps({"toolResult": {"status": "success", "content": [{"text": tool_result}]}})
+        return json.dumps({"result": tool_result}, ensure_ascii=False)
+
+    def lambda_(router_body: str) -> dict:
+        # ボディを読み、文字列からエンベロープを解析する
+        return json_extract.parse_envelope(json.loads(router_body)["result"])
+
+    return sub_agent, router, lambda_
+
+
+def _object_hops(llm_text: str) -> tuple:
+    """新実装: エンベロープを JSON オブジェクトのまま {"result": {...}} に入れる."""
+
+    def sub_agent() -> str:
+        # LLM 出力を 1 回だけ解析してエンベロープにする
+        return json.dumps({"result": envelope.coerce(llm_text).to_dict()}, ensure_ascii=False)
+
+    def router(sub_body: str) -> str:
+        # ボディのオブジェクトをそのままエンベロープにし、LLM には json ブロックで渡す
+        result = envelope.coerce(json.loads(sub_body)["result"])
+        json.dumps({"toolResult": result.to_tool_result()})
+        return json.dumps({"result": result.to_dict()}, ensure_ascii=False)
+
+    def lambda_(router_body: str) -> dict:
+        return envelope.coerce(json.loads(router_body)["result"]).to_dict()
+
+    return sub_agent, router, lambda_
+
+
+def _measure(fn, arg, iterations: int, runs: int) -> float:
+    def _once() -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(arg) if arg is not None else fn()
+        return (time.perf_counter() - start) * 1000 / iterations
+
+    return statistics.median(_once() for _ in range(runs))
+
+
+def _profile(hops: tuple, iterations: int, runs: int) -> tuple[dict, list[float], int]:
+    sub_agent, router, lambda_ = hops
+    sub_body = sub_agent()
+    router_body = router(sub_body)
+    timings = [
+        _measure(sub_agent, None, iterations, runs),
+        _measure(router, sub_body, iterations, runs),
+        _measure(lambda_, router_body, iterations, runs),
+    ]
+    size = len(sub_body.encode("utf-8")) + len(router_body.encode("utf-8"))
+    return lambda_(router_body), timings, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--items", type=int, default=30, help="エンベロープに含めるメール / 場所の件数")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'':>15} {'protocol':>14} {'sub':>7} {'router':>7} {'lambda':>7} {'total':>7} {'body':>8}")
+    for name, data in (("email_list", _email_envelope(args.items)), ("place_recommend", _place_envelope(args.items))):
+        llm_text = f"```json\n{json.dumps(data, ensure_ascii=False)}\n```"
+        for protocol, hops in (("string-in-JSON", _string_hops(llm_text)), ("object", _object_hops(llm_text))):
+            result, timings, size = _profile(hops, args.iterations, args.runs)
+            assert {k: v for k, v in result.items() if k != envelope.VERSION_KEY} == data
+            cells = " ".join(f"{ms:6.2f}ms" for ms in (*timings, sum(timings)))
+            print(f"{name:>15} {protocol:>14} {cells} {size / 1024:6.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
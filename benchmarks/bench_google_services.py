@@ -0,0 +1,85 @@
+"""Google API サービス生成コストのベンチマーク.
+
+1 回の API 呼び出しの準備 (サービス取得 + リクエスト組み立て. 通信はしない) を
+「呼び出しごとに build(..., cache_discovery=False)」する旧実装と
+google_services のキャッシュ (ディスカバリ文書はプロセスで 1 回、Resource はユーザーごと) で比較する。
+
+    python benchmarks/bench_google_services.py [--calls 200] [--users 10]
+
+lambda/requirements.txt (google-api-python-client, google-auth) が必要。
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambda"))
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+
+import google_services  # noqa: E402
+
+APIS = (("calendar", "v3"), ("gmail", "v1"))
+
+
+def _request(api: str, service) -> None:
+    if api == "calendar":
+        service.events().list(calendarId="primary", maxResults=10)
+    else:
+        service.users().messages().list(userId="me", maxResults=10)
+
+
+def call_build(api: str, version: str, credentials) -> None:
+    """旧実装: 呼び出しごとにディスカバリ文書を読み込んで build する."""
+    _request(api, build(api, version, credentials=credentials, cache_discovery=False))
+
+
+def call_cached(api: str, version: str, credentials) -> None:
+    """google_services のキャッシュを使う実装."""
+    _request(api, google_services.get_service(api, version, credentials))
+
+
+def _measure(call, calls: int, users: list) -> dict[str, list[float]]:
+    samples = {api: [] for api, _ in APIS}
+    for i in range(calls):
+        credentials = users[i % len(users)]
+        for api, version in APIS:
+            start = time.perf_counter()
+            call(api, version, credentials)
+            samples[api].append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200, help="API ごとの呼び出し回数")
+    parser.add_argument("--users", type=int, default=10, help="呼び出しを振り分けるユーザー数")
+    args = parser.parse_args()
+
+    # リクエストごとに作り直される認証情報 (Lambda / サブエージェントと同じ)
+    def _users() -> list:
+        return [Credentials(token=f"token-{i}", refresh_token=f"refresh-{i}") for i in range(args.users)]
+
+    google_services.cache.clear()
+    results = {
+        "build per call": _measure(call_build, args.calls, _users()),
+        "cached": _measure(call_cached, args.calls, _users()),
+    }
+
+    print(f"calls: {args.calls} per API  users: {args.users}")
+    for name, by_api in results.items():
+        for api, samples in by_api.items():
+            samples.sort()
+            p95 = samples[int(len(samples) * 0.95) - 1]
+            print(
+                f"{name:>14} {api:<8}: mean {statistics.mean(samples):7.2f}ms  "
+                f"p50 {statistics.median(samples):7.2f}ms  p95 {p95:7.2f}ms"
+            )
+    print(f"cache: {google_services.cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
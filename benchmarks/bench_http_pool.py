@@ -0,0 +1,77 @@
+"""外部 HTTP 呼び出しの接続プールのベンチマーク.
+
+ローカルの JSON API スタンドイン (新規接続ごとにハンドシェイク分の遅延) に対して、
+呼び出しごとに接続を張る urllib.request.urlopen と http_pool (keep-alive) を比較する。
+
+    python benchmarks/bench_http_pool.py [--requests 50] [--runs 3] [--handshake 0.03]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agent"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import http_pool  # noqa: E402
+from standins import JSONAPIStandIn  # noqa: E402
+
+
+def call_urlopen(url: str) -> None:
+    """旧実装: 呼び出しごとに接続を張る."""
+    req = urllib.request.Request(url, headers={"Accept": "application/json"})
+    with urllib.request.urlopen(req, timeout=15) as resp:
+        json.loads(resp.read().decode("utf-8"))
+
+
+def call_pooled(url: str) -> None:
+    """http_pool の共有プールを使う実装."""
+    http_pool.pool.request_json("GET", url, timeout=15)
+
+
+def _measure(call, url: str, requests: int) -> list[float]:
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        call(url)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="1 回あたりのリクエスト数")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--handshake", type=float, default=0.03, help="新規接続ごとの遅延 (秒)")
+    parser.add_argument("--latency", type=float, default=0.005, help="リクエストごとの処理時間 (秒)")
+    args = parser.parse_args()
+
+    places = [{"place_id": "p1", "display_name": "渋谷カフェ", "lat": "35.66", "lon": "139.70"}]
+    with JSONAPIStandIn(places, latency=args.latency, handshake=args.handshake) as stand_in:
+        url = f"{stand_in.url}/api/search?q=cafe"
+        results = {}
+        for label, call in (("urlopen", call_urlopen), ("pooled", call_pooled)):
+            http_pool.pool.clear()
+            before = stand_in.connections
+            samples = [ms for _ in range(args.runs) for ms in _measure(call, url, args.requests)]
+            results[label] = samples
+            print(
+                f"{label:>8}: p50 {statistics.median(samples):6.1f}ms  "
+                f"p99 {statistics.quantiles(samples, n=100)[98]:6.1f}ms  "
+                f"connections {stand_in.connections - before}"
+            )
+
+        host_stats = http_pool.pool.stats()[url.split("/")[2]]
+        saved = statistics.mean(results["urlopen"]) - statistics.mean(results["pooled"])
+        print(
+            f"pooled reuse rate {host_stats['reuse_rate']:.0%}  "
+            f"saved {saved:.1f}ms/request ({saved * args.requests * args.runs:.0f}ms total)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""LLM 応答からのエンベロープ抽出のベンチマーク.
+
+大きなメール一覧・場所一覧のエンベロープ (素の JSON / コードフェンス付き / 前後に説明文) について、
+サブエージェントの応答確定から Lambda の convert_agent_response までにかかる解析時間を比較する。
+
+旧実装: サブエージェントで _sanitize_response + json.loads、Lambda で handle_text_message の json.loads と
+convert_agent_response の _sanitize_response + json.loads (同じ文字列を最大 5 回以上解析)。
+新実装: サブエージェントで extract_json 1 回、Lambda で parse_envelope 1 回 (dict をそのまま渡す)。
+
+    python benchmarks/bench_json_extract.py [--iterations 200] [--items 30]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agent"))
+
+import json_extract  # noqa: E402
+
+
+def legacy_sanitize(text: str) -> str:
+    """旧実装の _sanitize_response (4 ファイルに複製されていたもの)."""
+    stripped = text.strip()
+    try:
+        json.loads(stripped)
+        return stripped
+    except (json.JSONDecodeError, TypeError):
+        pass
+    if stripped.startswith("```"):
+        first_newline = stripped.find("\n")
+        candidate = stripped[first_newline + 1:] if first_newline != -1 else stripped[3:]
+        if candidate.endswith("```"):
+            candidate = candidate[:-3].strip()
+        try:
+            json.loads(candidate)
+            return candidate
+        except (json.JSONDecodeError, TypeError):
+            pass
+    first_brace = stripped.find("{")
+    last_brace = stripped.rfind("}")
+    if first_brace != -1 and last_brace > first_brace:
+        candidate = stripped[first_brace:last_brace + 1]
+        try:
+            json.loads(candidate)
+            return candidate
+        except (json.JSONDecodeError, TypeError):
+            pass
+    return stripped
+
+
+def legacy_pipeline(llm_text: str) -> dict:
+    # サブエージェント: _finalize_response
+    response_text = legacy_sanitize(llm_text)
+    json.loads(response_text)
+    # Router: _sanitize_response (サブエージェントの結果をそのまま返す場合も通る)
+    response_text = legacy_sanitize(response_text)
+    # Lambda: handle_text_message の location_request 判定と convert_agent_response
+    json.loads(response_text)
+    return json.loads(legacy_sanitize(response_text))
+
+
+def single_pass_pipeline(llm_text: str) -> dict:
+    # サブエージェント: _finalize_response (span の文字列を返す)
+    response_text = json_extract.extract_json(llm_text).text
+    # Router: json_extract.sanitize
+    response_text = json_extract.sanitize(response_text)
+    # Lambda: parse_envelope 1 回、convert_agent_response には dict を渡す
+    return json_extract.parse_envelope(json_extract.parse_envelope(response_text))
+
+
+def _email_envelope(items: int) -> dict:
+    body = "お世話になっております。来週の打ち合わせの件でご連絡しました。{資料} を添付します。" * 20
+    return {
+        "type": "email_list",
+        "message": "受信トレイのメールです。",
+        "emails": [
+            {
+                "id": f"m{i}",
+                "from": f"送信者{i} <sender{i}@example.com>",
+                "subject": f"【確認】打ち合わせ資料 \"第{i}版\"",
+                "date": "2026-10-17T09:00:00+09:00",
+                "snippet": body[:200],
+                "body": body,
+                "labels": ["INBOX", "UNREAD"],
+            }
+            for i in range(items)
+        ],
+    }
+
+
+def _place_envelope(items: int) -> dict:
+    review = "雰囲気がよく、コーヒーも美味しいです。Wi-Fi あり {電源} も使えます。" * 5
+    return {
+        "type": "place_recommend",
+        "message": "渋谷駅周辺のおすすめのカフェです。",
+        "places": [
+            {
+                "place_id": f"p{i}",
+                "display_name": f"カフェ {i}",
+                "address": f"東京都渋谷区道玄坂{i}丁目",
+                "lat": 35.658 + i / 1000,
+                "lon": 139.701 + i / 1000,
+                "rating": 4.2,
+                "photo_url": f"https://example.com/photos/{i}.jpg",
+                "reviews": [{"author": f"ユーザー{j}", "text": review} for j in range(5)],
+            }
+            for i in range(items)
+        ],
+    }
+
+
+def _variants(envelope: dict) -> dict[str, str]:
+    raw = json.dumps(envelope, ensure_ascii=False)
+    return {
+        "plain": raw,
+        "fenced": f"```json\n{raw}\n```",
+        "prose": f"結果をまとめました。\n{raw}\n他にご用件があればどうぞ。",
+    }
+
+
+def _measure(fn, text: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(text)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--items", type=int, default=30, help="エンベロープに含めるメール / 場所の件数")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for name, envelope in (("email_list", _email_envelope(args.items)), ("place_recommend", _place_envelope(args.items))):
+        for variant, text in _variants(envelope).items():
+            assert legacy_pipeline(text) == single_pass_pipeline(text) == envelope
+            legacy = statistics.median(_measure(legacy_pipeline, text, args.iterations) for _ in range(args.runs))
+            single = statistics.median(_measure(single_pass_pipeline, text, args.iterations) for _ in range(args.runs))
+            print(
+                f"{name:>15} {variant:>6} ({len(text) / 1024:6.1f}KB): "
+                f"legacy {legacy:6.2f}ms  single-pass {single:6.2f}ms  ({legacy / single:4.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Lambda エントリポイントの import 時間 (コールドスタート) の計測と予算チェック.
+
+`python -X importtime` で index.py / oauth_callback.py を新しいプロセスで import し、
+エントリが直接 import しているモジュールごとの累積時間と、自身の処理時間が
+大きいモジュールを表示する。合計 (中央値) が予算を超えるか、遅延 import すべき
+モジュールが import 時に読み込まれていたら終了コード 1 を返す。
+
+    python benchmarks/import_budget.py [--runs 5] [--top 15] [--budget index=1200]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent / "lambda"
+
+# エントリごとの import 予算 (ms, 中央値)
+BUDGETS_MS = {
+    "index": 1200.0,
+    "oauth_callback": 900.0,
+}
+
+# import 時に読み込んではいけない (使う関数の中で遅延 import する) モジュール
+LAZY_MODULES = {
+    "index": (
+        "googleapiclient",
+        "fastapi",
+        "uvicorn",
+        "dotenv",
+        "sqlite3",
+        "flex_messages.place_carousel",
+        "flex_messages.email_carousel",
+        "flex_messages.email_detail",
+        "flex_messages.email_confirm",
+    ),
+    "oauth_callback": (
+        "googleapiclient",
+        "fastapi",
+        "uvicorn",
+        "dotenv",
+    ),
+}
+
+# import 時に必要な環境変数 (値は何でもよい)
+_DUMMY_ENV = {
+    "LINE_CHANNEL_SECRET": "dummy",
+    "LINE_CHANNEL_ACCESS_TOKEN": "dummy",
+    "AWS_REGION": "us-east-1",
+}
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[ImportRecord]:
+    """`-X importtime` の出力をパースする. depth はネストの深さ (0 がトップレベル)."""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, raw_name = parts
+        name = raw_name.rstrip()
+        stripped = name.lstrip(" ")
+        depth = (len(name) - len(stripped) - 1) // 2
+        records.append(ImportRecord(stripped, int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def measure(entry: str) -> list[ImportRecord]:
+    """新しいインタプリタで entry を import し、import 記録を返す."""
+    env = {**os.environ, **_DUMMY_ENV, "PYTHONPATH": str(LAMBDA_DIR)}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {entry}"],
+        cwd=LAMBDA_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {entry} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def entry_total_ms(records: list[ImportRecord], entry: str) -> float:
+    for record in records:
+        if record.module == entry and record.depth == 0:
+            return record.cumulative_us / 1000
+    raise ValueError(f"{entry} not found in importtime output")
+
+
+def lazy_violations(records: list[ImportRecord], entry: str) -> list[str]:
+    """import 時に読み込まれてしまった遅延対象モジュール."""
+    loaded = {record.module for record in records}
+    violations = []
+    for module in LAZY_MODULES.get(entry, ()):
+        if any(name == module or name.startswith(module + ".") for name in loaded):
+            violations.append(module)
+    return violations
+
+
+def _report(entry: str, runs: list[list[ImportRecord]], top: int) -> float:
+    totals = [entry_total_ms(records, entry) for records in runs]
+    total = statistics.median(totals)
+    print(f"\n== {entry}: {total:.1f}ms (median of {len(totals)}, min {min(totals):.1f}ms)")
+
+    # エントリ直下の import ごとの累積時間 (どの import 文が重いか)
+    children: dict[str, list[int]] = {}
+    selfs: dict[str, list[int]] = {}
+    for records in runs:
+        # importtime は子を親より先に出力する. 直前のトップレベル以降がエントリの部分木
+        subtree: list[ImportRecord] = []
+        for record in records:
+            subtree.append(record)
+            if record.depth != 0:
+                continue
+            if record.module == entry:
+                for node in subtree:
+                    if node.depth == 1:
+                        children.setdefault(node.module, []).append(node.cumulative_us)
+                    selfs.setdefault(node.module, []).append(node.self_us)
+            subtree = []
+
+    print(f"  {'direct import':<40} {'cumulative':>12}")
+    ranked = sorted(children.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)
+    for module, values in ranked[:top]:
+        print(f"  {module:<40} {statistics.median(values) / 1000:>10.1f}ms")
+
+    print(f"  {'module (self time)':<40} {'self':>12}")
+    ranked = sorted(selfs.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)
+    for module, values in ranked[:top]:
+        print(f"  {module:<40} {statistics.median(values) / 1000:>10.1f}ms")
+    return total
+
+
+def _parse_budgets(values: list[str]) -> dict[str, float]:
+    budgets = dict(BUDGETS_MS)
+    for value in values:
+        entry, _, ms = value.partition("=")
+        budgets[entry] = float(ms)
+    return budgets
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget", action="append", default=[], metavar="ENTRY=MS")
+    ap.add_argument("entries", nargs="*", default=list(BUDGETS_MS))
+    args = ap.parse_args()
+    budgets = _parse_budgets(args.budget)
+
+    failed = False
+    for entry in args.entries:
+        # 1 回目は .pyc 生成を含むので捨てる
+        measure(entry)
+        runs = [measure(entry) for _ in range(args.runs)]
+        total = _report(entry, runs, args.top)
+
+        budget = budgets.get(entry)
+        if budget is not None and total > budget:
+            print(f"  FAIL: {total:.1f}ms exceeds budget {budget:.1f}ms")
+            failed = True
+        violations = lazy_violations(runs[0], entry)
+        if violations:
+            print(f"  FAIL: loaded at import time (should be lazy): {', '.join(violations)}")
+            failed = True
+        if budget is not None and not violations and total <= budget:
+            print(f"  OK: within budget {budget:.1f}ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
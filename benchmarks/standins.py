@@ -0,0 +1,274 @@
+"""ベンチマーク用のローカルスタンドイン (AWS / 外部 API なしで動かす)."""
+
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+
+class _StandInServer:
+    """127.0.0.1 の空きポートで動く HTTP サーバー."""
+
+    handler_class: type
+
+    def __init__(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _make_handler(self) -> type:
+        raise NotImplementedError
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AgentCoreStandIn(_StandInServer):
+    """Router Agent (/invocations) のスタンドイン.
+
+    result_at 秒後に最終エンベロープが確定し、その後 tail 秒 LLM の後処理が続く想定。
+    payload に stream=true があれば SSE、なければ全部終わってから JSON を返す。
+    """
+
+    def __init__(self, envelope: dict, result_at: float = 1.0, tail: float = 1.5, deltas: int = 10):
+        self.envelope = envelope
+        self.result_at = result_at
+        self.tail = tail
+        self.deltas = deltas
+        self.payloads: list[dict] = []
+        super().__init__()
+
+    def _make_handler(self) -> type:
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                payload = json.loads(self.rfile.read(length))
+                stand_in.payloads.append(payload)
+                result = stand_in.envelope
+                if payload.get("stream"):
+                    self._stream(result)
+                else:
+                    time.sleep(stand_in.result_at + stand_in.tail)
+                    body = json.dumps({"result": result, "status": "success"}).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def _stream(self, result: dict) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                step = stand_in.result_at / max(stand_in.deltas, 1)
+                for i in range(stand_in.deltas):
+                    time.sleep(step)
+                    self._send({"event": "delta", "text": f"chunk{i}"})
+                self._send({"event": "result", "result": result, "status": "success"})
+                time.sleep(stand_in.tail)
+                self._send({"event": "delta", "text": "post-processing"})
+                self.close_connection = True
+
+            def _send(self, event: dict) -> None:
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class JSONAPIStandIn(_StandInServer):
+    """JSON API (Maps API など) のスタンドイン. keep-alive に対応する.
+
+    新しい接続の最初のリクエストだけ handshake 秒待たせて、TLS ハンドシェイクと
+    ネットワーク往復のコストを模擬する。
+    """
+
+    def __init__(self, response, latency: float = 0.005, handshake: float = 0.03):
+        self.response = response
+        self.latency = latency
+        self.handshake = handshake
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def _make_handler(self) -> type:
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # keep-alive 中のヘッダーと本文の分割送信が Nagle + 遅延 ACK で待たされないように
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.connections += 1
+                time.sleep(stand_in.handshake)
+
+            def do_GET(self):
+                self._respond()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._respond()
+
+            def _respond(self) -> None:
+                time.sleep(stand_in.latency)
+                body = json.dumps(stand_in.response, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _send_json(handler: http.server.BaseHTTPRequestHandler, obj, status: int = 200) -> None:
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def _read_json(handler: http.server.BaseHTTPRequestHandler) -> dict:
+    length = int(handler.headers.get("Content-Length", 0))
+    return json.loads(handler.rfile.read(length)) if length else {}
+
+
+class LineAPIStandIn(_StandInServer):
+    """LINE Messaging API (reply / push / ローディング表示) のスタンドイン.
+
+    受け取ったリクエストを (path, body) で requests に記録し、latency 秒待ってから返す。
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.requests: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def messages_since(self, index: int) -> list[dict]:
+        """requests の index 番目以降に reply / push で送られたメッセージ."""
+        with self._lock:
+            sent = self.requests[index:]
+        return [
+            message
+            for path, body in sent
+            if path.endswith(("/reply", "/push"))
+            for message in body.get("messages", [])
+        ]
+
+    def _make_handler(self) -> type:
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = _read_json(self)
+                time.sleep(stand_in.latency)
+                with stand_in._lock:
+                    stand_in.requests.append((self.path, body))
+                    sent_id = str(len(stand_in.requests))
+                if self.path.endswith(("/reply", "/push")):
+                    sent = [{"id": f"{sent_id}-{i}", "quoteToken": "q"} for i, _ in enumerate(body.get("messages", []))]
+                    _send_json(self, {"sentMessages": sent})
+                else:
+                    _send_json(self, {})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class GoogleAPIStandIn(_StandInServer):
+    """Google Calendar / Gmail REST API のスタンドイン.
+
+    events (Calendar API のイベント)、busy (freeBusy の予定ありスロット)、
+    emails (Gmail API の metadata 形式のメッセージ) を返す。予定の作成は受け取った
+    本文に id を付けて返す。リクエストごとに latency 秒待つ。
+    """
+
+    def __init__(self, events: list[dict], busy: list[dict] | None = None, emails: list[dict] | None = None,
+                 latency: float = 0.08):
+        self.events = events
+        self.busy = busy or []
+        self.emails = emails or []
+        self.latency = latency
+        self.requests: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def endpoint(self, service: str) -> str:
+        """googleapiclient の client_options.api_endpoint (discovery の servicePath まで含む)."""
+        return f"{self.url}/calendar/v3/" if service == "calendar" else f"{self.url}/"
+
+    def _route(self, method: str, path: str, body: dict) -> tuple[int, dict]:
+        if match := re.fullmatch(r"/calendar/v3/calendars/[^/]+/events(?:/([^/]+))?", path):
+            event_id = match.group(1)
+            if method == "POST" and event_id is None:
+                with self._lock:
+                    return 200, {**body, "id": f"created{len(self.requests)}", "status": "confirmed"}
+            if event_id is None:
+                return 200, {"kind": "calendar#events", "items": self.events}
+            found = next((e for e in self.events if e.get("id") == event_id), None)
+            return (200, found) if found else (404, {"error": {"code": 404, "message": "Not Found"}})
+        if path == "/calendar/v3/freeBusy":
+            return 200, {"kind": "calendar#freeBusy", "calendars": {"primary": {"busy": self.busy}}}
+        if match := re.fullmatch(r"/gmail/v1/users/[^/]+/messages(?:/([^/]+))?", path):
+            message_id = match.group(1)
+            if message_id is None:
+                refs = [{"id": e["id"], "threadId": e.get("threadId", e["id"])} for e in self.emails]
+                return 200, {"messages": refs, "resultSizeEstimate": len(refs)}
+            found = next((e for e in self.emails if e.get("id") == message_id), None)
+            return (200, found) if found else (404, {"error": {"code": 404, "message": "Not Found"}})
+        return 404, {"error": {"code": 404, "message": f"No stand-in for {method} {path}"}}
+
+    def _make_handler(self) -> type:
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._respond("GET", {})
+
+            def do_POST(self):
+                self._respond("POST", _read_json(self))
+
+            def _respond(self, method: str, body: dict) -> None:
+                path = urllib.parse.urlsplit(self.path).path
+                time.sleep(stand_in.latency)
+                with stand_in._lock:
+                    stand_in.requests.append((method, path))
+                status, response = stand_in._route(method, path, body)
+                _send_json(self, response, status)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
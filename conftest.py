@@ -3,6 +3,7 @@
 import importlib
 import importlib.machinery
 import importlib.util
+import os
 import sys
 import types
 from pathlib import Path
@@ -38,6 +39,9 @@ _mock_strands = MagicMock()
 _mock_strands.tool = lambda fn: fn  # pass-through decorator
 sys.modules.setdefault("strands", _mock_strands)
 sys.modules.setdefault("strands.models", MagicMock())
+sys.modules.setdefault("strands.tools", MagicMock())
+sys.modules.setdefault("strands.tools.executors", MagicMock())
+sys.modules.setdefault("strands.hooks", MagicMock())
 
 # Google API mocks
 sys.modules.setdefault("google.oauth2.credentials", MagicMock())
@@ -78,6 +82,9 @@ if "tools.google_gmail" not in sys.modules:
     sys.modules["tools.google_gmail"] = mod
     spec.loader.exec_module(mod)
 
+# 検索キャッシュはプロセス内のみ (/tmp の SQLite をテスト実行間で共有しない)
+os.environ.setdefault("SEARCH_CACHE_BACKEND", "none")
+
 # Tavily mock — tavily モジュールを先にモックしてから tavily_search をロード
 if "tavily" not in sys.modules:
     _mock_tavily = MagicMock()
@@ -135,7 +142,14 @@ class _LocationMessageContent:
     pass
 
 
+class _Event:
+    @classmethod
+    def from_dict(cls, obj):
+        raise NotImplementedError("use a patched _deserialize_event in tests")
+
+
 _linebot_v3_webhooks = types.ModuleType("linebot.v3.webhooks")
+_linebot_v3_webhooks.Event = _Event
 _linebot_v3_webhooks.MessageEvent = _MessageEvent
 _linebot_v3_webhooks.TextMessageContent = _TextMessageContent
 _linebot_v3_webhooks.PostbackEvent = _PostbackEvent
@@ -203,8 +217,26 @@ if "lambda.flex_messages" not in sys.modules:
 
 # Register lambda modules that index.py imports
 _lambda_modules = {
+    "agent_stream": ROOT / "lambda" / "agent_stream.py",
+    "aws_clients": ROOT / "lambda" / "aws_clients.py",
+    "event_dispatcher": ROOT / "lambda" / "event_dispatcher.py",
+    "event_queue": ROOT / "lambda" / "event_queue.py",
     "google_auth": ROOT / "lambda" / "google_auth.py",
+    "google_services": ROOT / "lambda" / "google_services.py",
     "google_calendar_api": ROOT / "lambda" / "google_calendar_api.py",
+    "google_gmail_api": ROOT / "lambda" / "google_gmail_api.py",
+    "http_pool": ROOT / "lambda" / "http_pool.py",
+    "idempotency": ROOT / "lambda" / "idempotency.py",
+    "intent_classifier": ROOT / "lambda" / "intent_classifier.py",
+    "json_extract": ROOT / "lambda" / "json_extract.py",
+    "envelope": ROOT / "lambda" / "envelope.py",
+    "sse": ROOT / "lambda" / "sse.py",
+    "tracing": ROOT / "lambda" / "tracing.py",
+    "fast_path": ROOT / "lambda" / "fast_path.py",
+    "line_messaging": ROOT / "lambda" / "line_messaging.py",
+    "prefetch": ROOT / "lambda" / "prefetch.py",
+    "reply_scheduler": ROOT / "lambda" / "reply_scheduler.py",
+    "user_session": ROOT / "lambda" / "user_session.py",
     "flex_messages": None,  # package, already registered above
     "flex_messages.calendar_carousel": ROOT / "lambda" / "flex_messages" / "calendar_carousel.py",
     "flex_messages.date_picker": ROOT / "lambda" / "flex_messages" / "date_picker.py",
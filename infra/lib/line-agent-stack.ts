@@ -3,7 +3,9 @@ import * as apigateway from "aws-cdk-lib/aws-apigateway";
 import * as dynamodb from "aws-cdk-lib/aws-dynamodb";
 import * as iam from "aws-cdk-lib/aws-iam";
 import * as lambda from "aws-cdk-lib/aws-lambda";
+import * as lambdaEventSources from "aws-cdk-lib/aws-lambda-event-sources";
 import * as logs from "aws-cdk-lib/aws-logs";
+import * as sqs from "aws-cdk-lib/aws-sqs";
 import * as agentcore from "@aws-cdk/aws-bedrock-agentcore-alpha";
 import * as bedrock from "@aws-cdk/aws-bedrock-alpha";
 import * as path from "path";
@@ -33,6 +35,33 @@ export class LineAgentStack extends cdk.Stack {
       timeToLiveAttribute: "ttl",
     });
 
+    // Webhook イベント処理記録テーブル (再配信の重複排除、TTL 付き)
+    const eventLogTable = new dynamodb.Table(this, "WebhookEventLog", {
+      tableName: "WebhookEventLog",
+      partitionKey: { name: "event_id", type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      timeToLiveAttribute: "ttl",
+    });
+
+    // --- SQS (Webhook イベントキュー: ingest → worker) ---
+
+    // 処理に失敗し続けたイベントの退避先
+    const eventDlq = new sqs.Queue(this, "WebhookEventDLQ", {
+      queueName: "LineWebhookEventsDLQ.fifo",
+      fifo: true,
+      retentionPeriod: cdk.Duration.days(4),
+    });
+
+    // FIFO: MessageGroupId = LINE user_id で同一ユーザーのイベント順序を保証
+    const eventQueue = new sqs.Queue(this, "WebhookEventQueue", {
+      queueName: "LineWebhookEvents.fifo",
+      fifo: true,
+      visibilityTimeout: cdk.Duration.seconds(360), // worker timeout (60s) の 6 倍
+      retentionPeriod: cdk.Duration.hours(1), // reply token の有効期限を大きく過ぎたものは不要
+      deadLetterQueue: { queue: eventDlq, maxReceiveCount: 3 },
+    });
+
     // --- AgentCore Runtime (既存: 汎用 Agent) ---
     const agentRuntimeArtifact = agentcore.AgentRuntimeArtifact.fromAsset(
       path.join(__dirname, "../../agent"),
@@ -180,7 +209,10 @@ export class LineAgentStack extends cdk.Stack {
       OAUTH_STATE_SECRET: process.env.OAUTH_STATE_SECRET ?? "",
       DYNAMODB_TOKEN_TABLE: tokenTable.tableName,
       USER_STATE_TABLE: stateTable.tableName,
+      IDEMPOTENCY_TABLE: eventLogTable.tableName,
       AWS_REGION_NAME: this.region,
+      AGENT_STREAMING: process.env.AGENT_STREAMING ?? "true",
+      INTENT_FAST_PATH: process.env.INTENT_FAST_PATH ?? "true",
       LOG_LEVEL: "INFO",
     };
 
@@ -201,6 +233,8 @@ export class LineAgentStack extends cdk.Stack {
         CALENDAR_AGENT_RUNTIME_ARN: calendarRuntime.agentRuntimeArn,
         GMAIL_AGENT_RUNTIME_ARN: gmailRuntime.agentRuntimeArn,
         DEV_WEBHOOK_URL: process.env.DEV_WEBHOOK_URL ?? "",
+        WEBHOOK_MODE: process.env.WEBHOOK_MODE ?? "sync",
+        EVENT_QUEUE_URL: eventQueue.queueUrl,
       },
       logRetention: logs.RetentionDays.ONE_WEEK,
     });
@@ -211,6 +245,39 @@ export class LineAgentStack extends cdk.Stack {
     gmailRuntime.grantInvokeRuntime(webhookFunction);
     tokenTable.grantReadWriteData(webhookFunction);
     stateTable.grantReadWriteData(webhookFunction);
+    eventLogTable.grantReadWriteData(webhookFunction);
+    eventQueue.grantSendMessages(webhookFunction);
+
+    // --- Webhook Worker Lambda Function (async モード用) ---
+    const webhookWorkerFunction = new lambda.Function(this, "WebhookWorkerFunction", {
+      runtime: lambda.Runtime.PYTHON_3_13,
+      architecture: lambda.Architecture.ARM_64,
+      handler: "index.worker_handler",
+      code: lambda.Code.fromAsset(path.join(__dirname, "../../lambda"), {
+        exclude: ["requirements.txt", "__pycache__", "*.pyc", "tests"],
+      }),
+      layers: [depsLayer],
+      memorySize: 512,
+      timeout: cdk.Duration.seconds(60),
+      environment: {
+        ...commonEnv,
+        AGENT_RUNTIME_ARN: runtime.agentRuntimeArn,
+      },
+      logRetention: logs.RetentionDays.ONE_WEEK,
+    });
+
+    webhookWorkerFunction.addEventSource(
+      new lambdaEventSources.SqsEventSource(eventQueue, {
+        // 1 イベントで Agent の待ち時間 (TIMEOUT_SECONDS=55s) を使い切ることがあるため 1 件ずつ処理する.
+        // 同じユーザーのイベントは直列なので、まとめて受けると timeout で処理済みのイベントまで再配信される
+        batchSize: 1,
+        reportBatchItemFailures: true,
+      }),
+    );
+    runtime.grantInvokeRuntime(webhookWorkerFunction);
+    tokenTable.grantReadWriteData(webhookWorkerFunction);
+    stateTable.grantReadWriteData(webhookWorkerFunction);
+    eventLogTable.grantReadWriteData(webhookWorkerFunction);
 
     // --- OAuth Callback Lambda Function ---
     const oauthCallbackFunction = new lambda.Function(this, "OAuthCallbackFunction", {
@@ -0,0 +1,103 @@
+"""Router Agent のストリーミングレスポンス (SSE) を逐次読み取る.
+
+イベントの形式とパースは sse.py (Router がサブエージェントの応答を読むのと同じもの)。
+
+result が届いた時点で envelope() が返るので、残りを待たずに LINE へ返信できる。
+残りのストリームは返信後に drain() で読み捨てる。
+"""
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+import sse
+
+logger = logging.getLogger(__name__)
+
+_pending: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "agent_stream_pending", default=None
+)
+
+
+class AgentStreamError(Exception):
+    """ストリームがエラーで終わった、または result なしで終わった."""
+
+
+class AgentStream:
+    """AgentCore の SSE レスポンス."""
+
+    def __init__(self, chunks: Iterable[bytes], close: Callable[[], None] | None = None):
+        self._chunks = iter(chunks)
+        self._close = close
+        self._started = time.perf_counter()
+        self._closed = False
+        self.deltas = 0
+        self.time_to_result_ms: float | None = None
+
+    def _events(self) -> Iterator[dict]:
+        return sse.iter_sse_events(self._chunks)
+
+    def envelope(self) -> dict | str:
+        """result イベントまで読み、エンベロープを返す (旧形式の Agent なら文字列)."""
+        try:
+            for event in self._events():
+                if event.get("event") == "result":
+                    self.time_to_result_ms = (time.perf_counter() - self._started) * 1000
+                    logger.info(
+                        "Agent stream result in %.0fms (%d deltas)", self.time_to_result_ms, self.deltas
+                    )
+                    return event.get("result", "")
+                if event.get("event") == "delta":
+                    self.deltas += 1
+                elif "error" in event:
+                    raise AgentStreamError(event["error"])
+        except Exception:
+            self.close()
+            raise
+        self.close()
+        raise AgentStreamError("Agent stream ended without result")
+
+    def drain(self) -> None:
+        """残りのイベントを読み捨ててクローズする."""
+        if self._closed:
+            return
+        try:
+            for chunk in self._chunks:
+                pass
+        except Exception:
+            logger.warning("Failed to drain agent stream", exc_info=True)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._close is not None:
+            try:
+                self._close()
+            except Exception:
+                logger.debug("Failed to close agent stream", exc_info=True)
+
+    def defer_drain(self) -> None:
+        """drain_after() の中なら返信後まで drain を遅らせる. 外ならすぐ drain する."""
+        pending = _pending.get()
+        if pending is None:
+            self.drain()
+        else:
+            pending.append(self)
+
+
+@contextmanager
+def drain_after():
+    """このスコープで defer_drain() されたストリームを抜けるときに drain する."""
+    pending: list[AgentStream] = []
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+        for stream in pending:
+            stream.drain()
@@ -0,0 +1,102 @@
+"""プロセス全体で共有する boto3 クライアント / リソースのレジストリ.
+
+boto3.client() / boto3.resource() は呼ぶたびに設定ファイルやサービス定義を読み込み、
+新しい接続プールを作る。warm コンテナ内では 1 度だけ生成して使い回す。
+
+- クライアントはスレッドセーフなのでプロセスで共有する
+- リソース (Table など) はスレッドセーフでないためスレッドごとにキャッシュする
+"""
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "20"))
+
+_lock = threading.RLock()
+_session: boto3.session.Session | None = None
+_clients: dict[tuple, object] = {}
+_local = threading.local()
+
+
+def _build_config(**overrides) -> Config:
+    options = {
+        "max_pool_connections": AWS_MAX_POOL_CONNECTIONS,
+        "tcp_keepalive": True,
+        "connect_timeout": 5,
+        "retries": {"mode": "standard", "max_attempts": 3},
+    }
+    options.update(overrides)
+    return Config(**options)
+
+
+def _get_session() -> boto3.session.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_client(service: str, region: str | None = None, **config_overrides):
+    """サービスごとの共有クライアントを返す. config_overrides は botocore Config の引数."""
+    region = region or AWS_REGION
+    key = (service, region, tuple(sorted(config_overrides.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                # Session は client 生成がスレッドセーフでないためロック内で作る
+                client = _get_session().client(
+                    service, region_name=region, config=_build_config(**config_overrides)
+                )
+                _clients[key] = client
+    return client
+
+
+def get_resource(service: str, region: str | None = None):
+    """スレッドごとに共有するリソースを返す."""
+    region = region or AWS_REGION
+    resources = getattr(_local, "resources", None)
+    if resources is None:
+        resources = _local.resources = {}
+    key = (service, region)
+    resource = resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _get_session().resource(
+                service, region_name=region, config=_build_config()
+            )
+        resources[key] = resource
+    return resource
+
+
+def get_table(table_name: str, region: str | None = None):
+    """DynamoDB Table リソースを返す (スレッドごとにキャッシュ)."""
+    region = region or AWS_REGION
+    tables = getattr(_local, "tables", None)
+    if tables is None:
+        tables = _local.tables = {}
+    key = (table_name, region)
+    table = tables.get(key)
+    if table is None:
+        table = get_resource("dynamodb", region).Table(table_name)
+        tables[key] = table
+    return table
+
+
+def reset() -> None:
+    """キャッシュを破棄する (テストや認証情報の切り替え用).
+
+    他スレッドのリソースキャッシュは世代が変わった時点で作り直される。
+    """
+    global _session, _local
+    with _lock:
+        _session = None
+        _clients.clear()
+        _local = threading.local()
@@ -0,0 +1,130 @@
+"""応答エンベロープ (Agent → Lambda の応答の型).
+
+サブエージェント・Router・Lambda の間ではエンベロープを JSON オブジェクトのまま渡す
+({"result": {...}})。応答ボディの中に JSON 文字列を入れて二重にエンコード / デコードしない。
+Router の LLM に渡すツール結果も json ブロック (to_tool_result) にして文字列にしない。
+
+エンベロープは type ごとにフィールドの型 (SCHEMAS) を持ち、v でバージョンを表す。
+v がないものは LLM が書いた旧形式として現在のバージョンで読む。新しい type は
+SCHEMAS に追加し、Lambda 側は描画関数を登録する。
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+import json_extract
+
+logger = logging.getLogger(__name__)
+
+ENVELOPE_VERSION = 1
+VERSION_KEY = "v"
+
+# type → フィールド名と型 (message 以外). 省略されたフィールドは描画側の既定値を使う
+SCHEMAS: dict[str, dict[str, type]] = {
+    "text": {},
+    "oauth_required": {},
+    "multi": {"parts": list},
+    "location_request": {},
+    "calendar_events": {"events": list},
+    "date_selection": {"busy_slots": list, "suggested_title": str},
+    "event_created": {"event": dict},
+    "event_updated": {"event": dict},
+    "event_deleted": {},
+    "place_search": {"places": list},
+    "place_recommend": {"places": list},
+    "email_list": {"emails": list},
+    "email_detail": {"email": dict},
+    "email_confirm_send": {"to": str, "subject": str, "body": str},
+    "email_sent": {},
+    "email_deleted": {},
+    "email_labels_updated": {},
+    "draft_saved": {},
+}
+
+
+class EnvelopeError(ValueError):
+    """エンベロープとして読めない (未知の type・フィールドの型違い・未対応のバージョン)."""
+
+
+@dataclass(frozen=True)
+class Envelope:
+    """1 つの応答. fields は type ごとのフィールド (SCHEMAS)."""
+
+    type: str
+    message: str = ""
+    fields: dict = field(default_factory=dict)
+    version: int = ENVELOPE_VERSION
+
+    def __post_init__(self) -> None:
+        schema = SCHEMAS.get(self.type)
+        if schema is None:
+            raise EnvelopeError(f"unknown envelope type: {self.type!r}")
+        if not isinstance(self.message, str):
+            raise EnvelopeError(f"{self.type}.message must be a string")
+        for name, expected in schema.items():
+            value = self.fields.get(name)
+            if value is not None and not isinstance(value, expected):
+                raise EnvelopeError(f"{self.type}.{name} must be {expected.__name__}")
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.fields.get(name, default)
+
+    def to_dict(self) -> dict:
+        """応答ボディに入れる JSON オブジェクト."""
+        return {VERSION_KEY: self.version, "type": self.type, "message": self.message, **self.fields}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_tool_result(self) -> dict:
+        """Strands のツール結果 (Bedrock の toolResult に json ブロックのまま入る)."""
+        return {"status": "success", "content": [{"json": self.to_dict()}]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Envelope":
+        """JSON オブジェクトから読む. 読めなければ EnvelopeError."""
+        if not isinstance(data, dict):
+            raise EnvelopeError("envelope must be an object")
+        version = data.get(VERSION_KEY, ENVELOPE_VERSION)
+        if not isinstance(version, int) or isinstance(version, bool) or version > ENVELOPE_VERSION:
+            raise EnvelopeError(f"unsupported envelope version: {version!r}")
+        type_ = data.get("type", "text")
+        # LLM の出力では type が配列・オブジェクトになることがある (SCHEMAS を引く前に弾く)
+        if not isinstance(type_, str):
+            raise EnvelopeError(f"envelope type must be a string: {type_!r}")
+        fields = {k: v for k, v in data.items() if k not in (VERSION_KEY, "type", "message")}
+        return cls(type_, data.get("message") or "", fields, version)
+
+
+def make(type_: str, message: str = "", **fields: Any) -> Envelope:
+    return Envelope(type_, message, fields)
+
+
+def text(message: str) -> Envelope:
+    return Envelope("text", message)
+
+
+def coerce(value: "Envelope | dict | str | None") -> Envelope:
+    """受け取った応答をエンベロープにする.
+
+    JSON 文字列 (LLM の出力・旧形式の応答) は 1 回だけ解析する。エンベロープとして
+    読めない JSON は message (なければ元のテキスト) を text として扱う。
+    """
+    if isinstance(value, Envelope):
+        return value
+    source = ""
+    if isinstance(value, str):
+        found = json_extract.extract_json(value)
+        if found is None:
+            return text(value.strip())
+        value, source = found.value, found.text
+    if not isinstance(value, dict):
+        return text("" if value is None else str(value))
+    try:
+        return Envelope.from_dict(value)
+    except EnvelopeError as e:
+        logger.warning("Rendering unreadable envelope as text: %s", e)
+        message = value.get("message")
+        return text(message if isinstance(message, str) and message else source or json.dumps(value, ensure_ascii=False))
@@ -0,0 +1,105 @@
+"""Webhook イベントの並列ディスパッチャ.
+
+1 回の Webhook 配信には複数ユーザーのイベントが含まれることがある。
+ユーザーごとにグループ化し、グループ単位でスレッドプールに投入することで
+遅いユーザーが他のユーザーを待たせないようにする。同一ユーザーのイベントは
+グループ内で逐次処理するため順序が保たれる。
+"""
+
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_MAX_WORKERS = int(os.environ.get("DISPATCH_MAX_WORKERS", "4"))
+
+
+@dataclass
+class DispatchResult:
+    """ディスパッチ結果. failed / skipped には元の item が入る."""
+
+    succeeded: int = 0
+    failed: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+
+
+class EventDispatcher:
+    """キーごとに順序を保ちつつ、キー間は並列に処理するディスパッチャ.
+
+    スレッドプールは warm コンテナ内で使い回す。
+    """
+
+    def __init__(self, max_workers: int = DISPATCH_MAX_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="dispatch"
+                    )
+        return self._executor
+
+    def dispatch(
+        self,
+        items: Iterable,
+        handler: Callable,
+        key: Callable,
+        stop_group_on_error: bool = False,
+    ) -> DispatchResult:
+        """items を key ごとにまとめて handler で処理し、全件完了まで待つ.
+
+        stop_group_on_error=True の場合、失敗したイベント以降の同一キーのイベントは
+        処理せず skipped に入れる (SQS FIFO で順序を崩さず再配信させるため)。
+        """
+        groups: dict[str, list] = {}
+        for item in items:
+            groups.setdefault(key(item), []).append(item)
+
+        result = DispatchResult()
+        if not groups:
+            return result
+
+        # 1 グループならスレッドを使わずそのまま処理
+        if len(groups) == 1 or self.max_workers == 1:
+            for group in groups.values():
+                self._run_group(group, handler, stop_group_on_error, result)
+            return result
+
+        # 呼び出し元の contextvars (Lambda context など) をグループごとに引き継ぐ
+        executor = self._get_executor()
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                self._run_group, group, handler, stop_group_on_error, result,
+            )
+            for group in groups.values()
+        ]
+        for future in futures:
+            future.result()
+        return result
+
+    def _run_group(self, group: list, handler: Callable, stop_on_error: bool, result: DispatchResult) -> None:
+        """1 キー分のイベントを順番に処理. 例外は 1 イベント単位で握りつぶす."""
+        for i, item in enumerate(group):
+            try:
+                handler(item)
+            except Exception:
+                logger.error("Event handling failed", exc_info=True)
+                with self._lock:
+                    result.failed.append(item)
+                if stop_on_error:
+                    with self._lock:
+                        result.skipped.extend(group[i + 1:])
+                    return
+            else:
+                with self._lock:
+                    result.succeeded += 1
@@ -0,0 +1,244 @@
+"""Webhook イベントキュー (ingest → worker の 2 段構成用).
+
+ingest 側 (lambda_handler) は署名検証済みの生イベント dict を enqueue して即 200 を返し、
+worker 側 (worker_handler / drain_event_queue) が取り出して各ハンドラで処理する。
+
+バックエンド:
+- sqs: 本番用 (SQS FIFO, MessageGroupId = LINE user_id で同一ユーザーの順序を保証)
+- sqlite: ローカル検証・ベンチマーク用 (プロセスをまたいで共有可能)
+- memory: テスト用 (プロセス内のみ)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+EVENT_QUEUE_BACKEND = os.environ.get("EVENT_QUEUE_BACKEND", "")
+EVENT_QUEUE_URL = os.environ.get("EVENT_QUEUE_URL", "")
+EVENT_QUEUE_SQLITE_PATH = os.environ.get("EVENT_QUEUE_SQLITE_PATH", "/tmp/line_event_queue.db")
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+
+# 取り出し後に ack されなかったメッセージを再配信するまでの秒数 (SQS の visibility timeout 相当)
+VISIBILITY_TIMEOUT_SECONDS = 300
+
+
+@dataclass
+class QueuedEvent:
+    """キューから取り出したメッセージ."""
+
+    message_id: str
+    group_id: str
+    payload: dict
+    receipt: str = ""
+
+
+def build_message(raw_event: dict, destination: str = "") -> dict:
+    """LINE の生イベント dict をキューメッセージ形式に変換."""
+    return {
+        "event": raw_event,
+        "destination": destination,
+        "enqueued_at": time.time(),
+    }
+
+
+def group_id_for(raw_event: dict) -> str:
+    """順序保証の単位 (ユーザー / グループ / ルーム) を返す."""
+    source = raw_event.get("source") or {}
+    return source.get("userId") or source.get("groupId") or source.get("roomId") or "anonymous"
+
+
+# ---------- In-memory ----------
+
+
+class InMemoryEventQueue:
+    """プロセス内キュー (テスト用). ack されなかったメッセージは visibility timeout 後に再配信する."""
+
+    def __init__(self, visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS):
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        # message_id → (メッセージ, 再び取り出せるようになる時刻). enqueue 順を保つ
+        self._messages: OrderedDict[str, tuple[QueuedEvent, float]] = OrderedDict()
+
+    def enqueue(self, payload: dict, group_id: str) -> str:
+        message = QueuedEvent(message_id=str(uuid.uuid4()), group_id=group_id, payload=payload)
+        with self._lock:
+            self._messages[message.message_id] = (message, 0.0)
+        return message.message_id
+
+    def receive(self, max_messages: int = 10) -> list[QueuedEvent]:
+        now = time.time()
+        received = []
+        with self._lock:
+            for message, visible_at in self._messages.values():
+                if len(received) >= max_messages:
+                    break
+                if visible_at <= now:
+                    message.receipt = message.message_id
+                    received.append(message)
+            for message in received:
+                self._messages[message.message_id] = (message, now + self.visibility_timeout)
+        return received
+
+    def ack(self, message: QueuedEvent) -> None:
+        with self._lock:
+            self._messages.pop(message.receipt, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._messages)
+
+
+# ---------- SQLite ----------
+
+
+class SQLiteEventQueue:
+    """SQLite ファイルを使ったキュー (ローカル 2 段構成の検証・ベンチマーク用)."""
+
+    def __init__(self, path: str = EVENT_QUEUE_SQLITE_PATH, visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        # ローカル開発用のバックエンドなので Lambda では読み込まない
+        import sqlite3
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT NOT NULL UNIQUE,
+                group_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                visible_at REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+    def enqueue(self, payload: dict, group_id: str) -> str:
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO webhook_events (message_id, group_id, payload) VALUES (?, ?, ?)",
+                (message_id, group_id, json.dumps(payload, ensure_ascii=False)),
+            )
+        return message_id
+
+    def receive(self, max_messages: int = 10) -> list[QueuedEvent]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT message_id, group_id, payload FROM webhook_events "
+                    "WHERE visible_at <= ? ORDER BY seq LIMIT ?",
+                    (now, max_messages),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE webhook_events SET visible_at = ? WHERE message_id = ?",
+                    [(now + self.visibility_timeout, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            QueuedEvent(message_id=row[0], group_id=row[1], payload=json.loads(row[2]), receipt=row[0])
+            for row in rows
+        ]
+
+    def ack(self, message: QueuedEvent) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM webhook_events WHERE message_id = ?", (message.receipt,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM webhook_events").fetchone()[0]
+
+
+# ---------- SQS ----------
+
+
+class SQSEventQueue:
+    """SQS キュー. FIFO キューなら group_id ごとに順序が保証される."""
+
+    def __init__(self, queue_url: str = EVENT_QUEUE_URL, client=None):
+        import boto3
+
+        self.queue_url = queue_url
+        self.fifo = queue_url.endswith(".fifo")
+        self._client = client or boto3.client("sqs", region_name=AWS_REGION)
+
+    def enqueue(self, payload: dict, group_id: str) -> str:
+        kwargs = {
+            "QueueUrl": self.queue_url,
+            "MessageBody": json.dumps(payload, ensure_ascii=False),
+        }
+        if self.fifo:
+            kwargs["MessageGroupId"] = group_id
+            # webhookEventId があれば SQS 側でも重複排除
+            event_id = (payload.get("event") or {}).get("webhookEventId")
+            kwargs["MessageDeduplicationId"] = event_id or str(uuid.uuid4())
+        response = self._client.send_message(**kwargs)
+        return response["MessageId"]
+
+    def receive(self, max_messages: int = 10) -> list[QueuedEvent]:
+        response = self._client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            AttributeNames=["MessageGroupId"],
+        )
+        return [
+            QueuedEvent(
+                message_id=m["MessageId"],
+                group_id=m.get("Attributes", {}).get("MessageGroupId", ""),
+                payload=json.loads(m["Body"]),
+                receipt=m["ReceiptHandle"],
+            )
+            for m in response.get("Messages", [])
+        ]
+
+    def ack(self, message: QueuedEvent) -> None:
+        self._client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message.receipt)
+
+
+# ---------- Factory ----------
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def build_event_queue(backend: str = ""):
+    """環境変数からキューを構築. backend 未指定なら EVENT_QUEUE_URL の有無で sqs / memory を選ぶ."""
+    backend = backend or EVENT_QUEUE_BACKEND or ("sqs" if EVENT_QUEUE_URL else "memory")
+    if backend == "sqs":
+        return SQSEventQueue(EVENT_QUEUE_URL)
+    if backend == "sqlite":
+        return SQLiteEventQueue(EVENT_QUEUE_SQLITE_PATH)
+    if backend == "memory":
+        return InMemoryEventQueue()
+    raise ValueError(f"Unknown EVENT_QUEUE_BACKEND: {backend}")
+
+
+def get_event_queue():
+    """プロセス内で共有するキューを取得 (warm コンテナでは再利用)."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = build_event_queue()
+    return _queue
+
+
+def set_event_queue(queue) -> None:
+    """共有キューを差し替え (テスト・ローカル検証用)."""
+    global _queue
+    _queue = queue
@@ -0,0 +1,69 @@
+"""意図が確定したメッセージを Router Agent を通さずに処理する高速パス.
+
+intent_classifier で分類した一覧表示 (予定・メール) を Lambda から Google API で
+直接取得し、サブエージェントと同じ形式のエンベロープを返す。
+LINE メッセージへの変換は Agent の応答と同じく convert_agent_response で行う
+(エンベロープは envelope.Envelope のまま渡し、JSON 文字列を経由しない)。
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import envelope
+import google_calendar_api
+import google_gmail_api
+from envelope import Envelope
+from intent_classifier import (
+    CALENDAR_LIST,
+    EMAIL_LIST,
+    PERIOD_TODAY,
+    PERIOD_TOMORROW,
+    Intent,
+)
+
+JST = timezone(timedelta(hours=9))
+
+# カルーセルに並べる件数 (Calendar / Gmail Agent の list と揃える)
+FAST_PATH_MAX_RESULTS = 10
+
+_PERIOD_LABELS = {PERIOD_TODAY: "今日", PERIOD_TOMORROW: "明日"}
+
+
+def period_range(period: str, now: datetime | None = None) -> tuple[str, str]:
+    """期間名を (date_from, date_to) (YYYY-MM-DD) に変換. 今週は今日から日曜まで."""
+    today = (now or datetime.now(JST)).date()
+    if period == PERIOD_TODAY:
+        start = end = today
+    elif period == PERIOD_TOMORROW:
+        start = end = today + timedelta(days=1)
+    else:
+        start, end = today, today + timedelta(days=6 - today.weekday())
+    return start.isoformat(), end.isoformat()
+
+
+def answer(intent: Intent, credentials, now: datetime | None = None) -> Envelope:
+    """intent を Google API で処理し、エンベロープを返す."""
+    if intent.name == CALENDAR_LIST:
+        return _calendar_list(intent.params.get("period", ""), credentials, now)
+    if intent.name == EMAIL_LIST:
+        return _email_list(bool(intent.params.get("unread")), credentials)
+    raise ValueError(f"unsupported intent: {intent.name}")
+
+
+def _calendar_list(period: str, credentials, now: datetime | None) -> Envelope:
+    date_from, date_to = period_range(period, now)
+    events = google_calendar_api.list_events(
+        credentials, date_from=date_from, date_to=date_to, max_results=FAST_PATH_MAX_RESULTS
+    )
+    label = _PERIOD_LABELS.get(period, "今週")
+    message = f"{label}の予定です。" if events else f"{label}の予定はありません。"
+    return envelope.make("calendar_events", message, events=events)
+
+
+def _email_list(unread: bool, credentials) -> Envelope:
+    label_ids = ["INBOX", "UNREAD"] if unread else ["INBOX"]
+    emails = google_gmail_api.list_emails(credentials, label_ids=label_ids, max_results=FAST_PATH_MAX_RESULTS)
+    if unread:
+        message = "未読メールです。" if emails else "未読メールはありません。"
+    else:
+        message = "受信トレイのメールです。" if emails else "受信トレイにメールはありません。"
+    return envelope.make("email_list", message, emails=emails)
@@ -8,10 +8,11 @@ import os
 import time
 from urllib.parse import urlencode
 
-import boto3
 from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials
 
+import aws_clients
+
 logger = logging.getLogger(__name__)
 
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "")
@@ -30,8 +31,7 @@ GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 
 
 def _get_table():
-    dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-    return dynamodb.Table(DYNAMODB_TOKEN_TABLE)
+    return aws_clients.get_table(DYNAMODB_TOKEN_TABLE, AWS_REGION)
 
 
 # ---------- state パラメータ (HMAC署名) ----------
@@ -184,3 +184,14 @@ def get_google_credentials(line_user_id: str) -> Credentials | None:
             return None
 
     return creds
+
+
+def credentials_from_dict(data: dict) -> Credentials:
+    """Agent に渡す認証情報 dict (index._build_google_credentials) から Credentials を復元."""
+    return Credentials(
+        token=data["access_token"],
+        refresh_token=data.get("refresh_token"),
+        token_uri=GOOGLE_TOKEN_URL,
+        client_id=data.get("client_id") or GOOGLE_CLIENT_ID,
+        client_secret=data.get("client_secret") or GOOGLE_CLIENT_SECRET,
+    )
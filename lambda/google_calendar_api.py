@@ -4,7 +4,8 @@ import logging
 from datetime import datetime, timedelta, timezone
 
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+
+import google_services
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +13,7 @@ JST = timezone(timedelta(hours=9))
 
 
 def _get_service(credentials: Credentials):
-    return build("calendar", "v3", credentials=credentials, cache_discovery=False)
+    return google_services.get_service("calendar", "v3", credentials)
 
 
 def list_events(
@@ -0,0 +1,60 @@
+"""Gmail API ラッパー (Lambda 用)."""
+
+import logging
+
+from google.oauth2.credentials import Credentials
+
+import google_services
+
+logger = logging.getLogger(__name__)
+
+
+def _get_service(credentials: Credentials):
+    return google_services.get_service("gmail", "v1", credentials)
+
+
+def list_emails(
+    credentials: Credentials,
+    label_ids: list[str] | None = None,
+    max_results: int = 10,
+) -> list[dict]:
+    """メール一覧を取得 (Gmail Agent の list_emails と同じ形式)."""
+    service = _get_service(credentials)
+
+    result = (
+        service.users()
+        .messages()
+        .list(userId="me", labelIds=label_ids or ["INBOX"], maxResults=max_results)
+        .execute()
+    )
+
+    emails = []
+    for msg_ref in result.get("messages", []):
+        msg = (
+            service.users()
+            .messages()
+            .get(userId="me", id=msg_ref["id"], format="metadata", metadataHeaders=["Subject", "From", "Date"])
+            .execute()
+        )
+        emails.append(_parse_message(msg))
+    return emails
+
+
+# ---------- ヘルパー ----------
+
+
+def _parse_message(msg: dict) -> dict:
+    """Gmail API のメッセージ (metadata) をシンプルな dict に変換."""
+    headers = {
+        h.get("name", "").lower(): h.get("value", "")
+        for h in msg.get("payload", {}).get("headers", [])
+    }
+    return {
+        "id": msg.get("id", ""),
+        "thread_id": msg.get("threadId", ""),
+        "subject": headers.get("subject", "(件名なし)"),
+        "from": headers.get("from", ""),
+        "date": headers.get("date", ""),
+        "snippet": msg.get("snippet", ""),
+        "label_ids": msg.get("labelIds", []),
+    }
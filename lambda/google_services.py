@@ -0,0 +1,139 @@
+"""googleapiclient のサービス (Resource) をプロセス内で使い回すファクトリ.
+
+build(..., cache_discovery=False) は呼ぶたびにディスカバリ文書 (calendar v3 / gmail v1 の JSON) を
+読み込んで解析し、Resource と HTTP トランスポート (httplib2.Http) を作り直す。ここでは
+
+- ディスカバリ文書の解析はプロセスで 1 回 (API・バージョンごと)
+- Resource はユーザーごとに LRU で持ち (GOOGLE_SERVICE_CACHE_SIZE ユーザーまで. 超えたら
+  最も使われていないユーザーの分をまとめて捨てる)、次のリクエストでは認証情報だけ差し替える
+
+httplib2.Http はスレッドセーフでないため、同じユーザーでもスレッドごとに別の Resource にする
+(Strands はツールを並行に実行することがある)。ユーザーは refresh_token (なければ access token)
+のハッシュで区別する。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Resource を持っておくユーザー数の上限
+GOOGLE_SERVICE_CACHE_SIZE = int(os.environ.get("GOOGLE_SERVICE_CACHE_SIZE", "64"))
+
+
+def user_key(credentials) -> str:
+    """キャッシュのキー (ユーザー). トークンそのものはキーに持たない."""
+    secret = getattr(credentials, "refresh_token", None) or getattr(credentials, "token", None)
+    if not secret:
+        return f"id:{id(credentials)}"
+    return hashlib.sha256(str(secret).encode("utf-8")).hexdigest()[:32]
+
+
+def _bind(service, credentials) -> None:
+    """キャッシュ済みの Resource の認証情報を差し替える (子リソースも同じ AuthorizedHttp を使う)."""
+    http = getattr(service, "_http", None)
+    if http is not None and getattr(http, "credentials", credentials) is not credentials:
+        http.credentials = credentials
+
+
+class ServiceCache:
+    """ユーザー (× スレッド) ごとの Resource の LRU.
+
+    build(api, version, credentials, build_kwargs) -> Resource を差し替えられる (テスト用)。
+    """
+
+    def __init__(
+        self,
+        max_users: int = GOOGLE_SERVICE_CACHE_SIZE,
+        build: Callable[[str, str, Any, dict], Any] | None = None,
+    ):
+        self.max_users = max_users
+        self._build = build or self._build_from_document
+        self._users: OrderedDict[str, dict[tuple, Any]] = OrderedDict()
+        self._documents: dict[tuple[str, str], dict | None] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._build_ms = 0.0
+
+    def get(self, api: str, version: str, credentials):
+        """credentials を束ねた Resource. 同じユーザー・スレッドの 2 回目以降はキャッシュから返す."""
+        user = user_key(credentials)
+        build_kwargs = tracing.google_build_kwargs()
+        # トレースの有効 / 無効で requestBuilder が変わるため、キーに含める
+        key = (api, version, threading.get_ident(), build_kwargs.get("requestBuilder"))
+        with self._lock:
+            services = self._users.get(user)
+            service = services.get(key) if services is not None else None
+            if service is not None:
+                self._users.move_to_end(user)
+                self._hits += 1
+                _bind(service, credentials)
+                return service
+            self._misses += 1
+
+        started = time.perf_counter()
+        service = self._build(api, version, credentials, build_kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._build_ms += elapsed_ms
+            self._users.setdefault(user, {})[key] = service
+            self._users.move_to_end(user)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self._evictions += 1
+        return service
+
+    def _document(self, api: str, version: str) -> dict | None:
+        """googleapiclient に同梱のディスカバリ文書 (解析済み). 同梱されていなければ None."""
+        key = (api, version)
+        if key not in self._documents:
+            from googleapiclient.discovery_cache import get_static_doc
+
+            content = get_static_doc(api, version)
+            self._documents[key] = json.loads(content) if content else None
+        return self._documents[key]
+
+    def _build_from_document(self, api: str, version: str, credentials, build_kwargs: dict):
+        # googleapiclient は import が重いため実際に使うときだけ読み込む
+        from googleapiclient import discovery
+
+        document = self._document(api, version)
+        if document is None:
+            return discovery.build(api, version, credentials=credentials, cache_discovery=False, **build_kwargs)
+        return discovery.build_from_document(document, credentials=credentials, **build_kwargs)
+
+    def stats(self) -> dict:
+        """ヒット率・キャッシュ中のユーザー数・退避数・Resource の生成時間."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "users": len(self._users),
+                "services": sum(len(services) for services in self._users.values()),
+                "evictions": self._evictions,
+                "avg_build_ms": round(self._build_ms / self._misses, 1) if self._misses else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+
+cache = ServiceCache()
+
+
+def get_service(api: str, version: str, credentials):
+    """プロセス共有のキャッシュから Resource を返す."""
+    return cache.get(api, version, credentials)
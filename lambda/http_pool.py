@@ -0,0 +1,203 @@
+"""外部 HTTP 呼び出しの共有トランスポート (ホストごとの接続プール + keep-alive).
+
+urllib.request.urlopen は呼び出しごとに TCP (+TLS) 接続を張り直す。サブエージェント・
+Maps API などへの呼び出しを urllib3 の PoolManager に集約し、warm コンテナ内で接続を
+使い回す。ホストごとにリクエスト数・新規接続数 (再利用率)・接続確立時間・レイテンシを集計する。
+
+HTTP_POOL_HTTP2=true かつ h2 が入っていれば、このプールの HTTPS 接続だけ urllib3 の
+HTTP/2 (実験的) を使う。既定は HTTP/1.1 keep-alive。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+from urllib.parse import urlsplit
+
+import urllib3
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# プールするホスト数と、ホストごとに保持する接続数
+HTTP_POOL_NUM_POOLS = int(os.environ.get("HTTP_POOL_NUM_POOLS", "10"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+HTTP_POOL_HTTP2 = os.environ.get("HTTP_POOL_HTTP2", "false").lower() == "true"
+
+
+class HTTPStatusError(Exception):
+    """4xx / 5xx レスポンス (urllib の HTTPError に相当)."""
+
+    def __init__(self, status: int, url: str, body: bytes = b""):
+        super().__init__(f"HTTP {status} from {url}")
+        self.status = status
+        self.url = url
+        self.body = body
+
+
+class _TrackedConnectionMixin:
+    """接続の確立を記録する. リクエスト後に fresh を見て新規接続か再利用かを判定する."""
+
+    fresh = False
+    connect_ms = 0.0
+
+    def connect(self) -> None:
+        started = time.perf_counter()
+        super().connect()
+        self.connect_ms = (time.perf_counter() - started) * 1000
+        self.fresh = True
+
+
+class _TrackedHTTPConnection(_TrackedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TrackedHTTPSConnection(_TrackedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class HTTPPool:
+    """ホストごとの接続プール. スレッドセーフ."""
+
+    def __init__(self, num_pools: int = HTTP_POOL_NUM_POOLS, maxsize: int = HTTP_POOL_MAXSIZE):
+        self._manager = urllib3.PoolManager(num_pools=num_pools, maxsize=maxsize, block=False, retries=False)
+        self._manager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def _record(self, host: str, elapsed_ms: float, conn, ok: bool) -> None:
+        fresh = bool(getattr(conn, "fresh", False))
+        connect_ms = getattr(conn, "connect_ms", 0.0) if fresh else 0.0
+        if conn is not None:
+            conn.fresh = False
+        with self._lock:
+            s = self._stats.setdefault(host, {
+                "requests": 0, "new_connections": 0, "errors": 0,
+                "total_ms": 0.0, "max_ms": 0.0, "connect_ms": 0.0,
+            })
+            s["requests"] += 1
+            s["new_connections"] += fresh
+            s["errors"] += not ok
+            s["total_ms"] += elapsed_ms
+            s["max_ms"] = max(s["max_ms"], elapsed_ms)
+            s["connect_ms"] += connect_ms
+
+    def open(
+        self,
+        method: str,
+        url: str,
+        body: bytes | None = None,
+        headers: dict | None = None,
+        timeout: float = 30.0,
+    ) -> urllib3.BaseHTTPResponse:
+        """リクエストを送り、ヘッダーまで受け取ったレスポンスを返す (本文は未読).
+
+        読み終えたら release() で接続をプールに戻す。4xx / 5xx は HTTPStatusError。
+        """
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            resp = self._manager.request(
+                method, url, body=body, headers=headers, timeout=timeout, preload_content=False, redirect=False
+            )
+        except Exception:
+            self._record(host, (time.perf_counter() - started) * 1000, None, ok=False)
+            raise
+        self._record(host, (time.perf_counter() - started) * 1000, resp.connection, ok=resp.status < 400)
+        if resp.status >= 400:
+            data = resp.read()
+            resp.release_conn()
+            raise HTTPStatusError(resp.status, url, data)
+        return resp
+
+    @staticmethod
+    def release(resp: urllib3.BaseHTTPResponse) -> None:
+        """接続をプールに戻す. 本文を読み切っていなければ接続を閉じる (次回は張り直す)."""
+        if not resp.isclosed():
+            resp.close()
+        resp.release_conn()
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs) -> Iterator[urllib3.BaseHTTPResponse]:
+        """SSE などを逐次読むためのレスポンス. スコープを抜けると release する."""
+        resp = self.open(method, url, **kwargs)
+        try:
+            yield resp
+        finally:
+            self.release(resp)
+
+    def request_json(
+        self,
+        method: str,
+        url: str,
+        payload: Any = None,
+        headers: dict | None = None,
+        timeout: float = 30.0,
+    ) -> Any:
+        """JSON を送って JSON を受け取る."""
+        all_headers = {"Accept": "application/json", **(headers or {})}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            all_headers.setdefault("Content-Type", "application/json")
+        with self.stream(method, url, body=body, headers=all_headers, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def stats(self) -> dict:
+        """ホストごとのリクエスト数・接続再利用率・平均レイテンシ・平均接続確立時間 (ms)."""
+        with self._lock:
+            snapshot = {host: dict(s) for host, s in self._stats.items()}
+        return {
+            host: {
+                "requests": s["requests"],
+                "new_connections": s["new_connections"],
+                "reuse_rate": 1 - s["new_connections"] / s["requests"],
+                "errors": s["errors"],
+                "avg_ms": s["total_ms"] / s["requests"],
+                "max_ms": s["max_ms"],
+                "avg_connect_ms": s["connect_ms"] / s["new_connections"] if s["new_connections"] else 0.0,
+            }
+            for host, s in snapshot.items()
+        }
+
+    def clear(self) -> None:
+        """接続と統計を破棄する (テスト・設定変更用)."""
+        self._manager.clear()
+        with self._lock:
+            self._stats.clear()
+
+
+def _enable_http2() -> None:
+    # inject_into_urllib3() は botocore なども含めて全体に効くため、このプールの接続クラスだけ差し替える
+    try:
+        from urllib3.http2 import HTTP2Connection
+    except ImportError:
+        logger.warning("HTTP_POOL_HTTP2 is set but h2 is not installed, using HTTP/1.1")
+        return
+
+    class _TrackedHTTP2Connection(_TrackedConnectionMixin, HTTP2Connection):
+        pass
+
+    _TrackedHTTPSConnectionPool.ConnectionCls = _TrackedHTTP2Connection
+    logger.info("HTTP/2 enabled for pooled HTTPS connections")
+
+
+if HTTP_POOL_HTTP2:
+    _enable_http2()
+
+pool = HTTPPool()
@@ -0,0 +1,229 @@
+"""Webhook イベントの冪等性 (再配信の重複排除と処理状況の記録).
+
+LINE は応答がなかった Webhook を同じ webhookEventId で再配信する。
+イベント ID ごとに DynamoDB (TTL 付き) に処理状況を記録し、処理済み・処理中の
+イベントは Agent や Google API を呼ぶ前にスキップする。同じコンテナ内の重複は
+プロセス内の L1 キャッシュだけで判定する。
+
+途中で失敗したイベントは failed として残り、再配信時は記録済みのチェックポイント
+(Agent の応答、予定の作成結果など) を使って続きから処理する。
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# 処理中のまま止まった (Lambda タイムアウトなど) 記録を奪い直せるまでの秒数
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "90"))
+IDEMPOTENCY_L1_SIZE = int(os.environ.get("IDEMPOTENCY_L1_SIZE", "1024"))
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+_MISSING = object()
+
+_current: contextvars.ContextVar["EventClaim | None"] = contextvars.ContextVar(
+    "event_claim", default=None
+)
+
+
+def event_id_of(ev) -> str | None:
+    """LINE イベントの webhookEventId (なければ None)."""
+    event_id = getattr(ev, "webhook_event_id", None)
+    return event_id if isinstance(event_id, str) and event_id else None
+
+
+def is_redelivery(ev) -> bool:
+    return getattr(getattr(ev, "delivery_context", None), "is_redelivery", None) is True
+
+
+class EventClaim:
+    """処理権を得た 1 イベント. チェックポイントは前回の試行から引き継ぐ."""
+
+    def __init__(self, ledger: "EventLedger | None", event_id: str, attempt: int = 1, checkpoints: dict | None = None):
+        self._ledger = ledger
+        self.event_id = event_id
+        self.attempt = attempt
+        self.checkpoints = checkpoints or {}
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.checkpoints.get(name, default)
+
+    def record(self, name: str, value: Any) -> None:
+        """チェックポイントを記録する (DynamoDB に即時書き込む)."""
+        self.checkpoints[name] = value
+        if self._ledger is not None:
+            self._ledger.checkpoint(self, name, value)
+
+
+class EventLedger:
+    """イベント ID ごとの処理状況 (L1: プロセス内 LRU / L2: DynamoDB).
+
+    table_factory は呼び出しスレッドごとの Table を返す (aws_clients.get_table)。
+    """
+
+    def __init__(
+        self,
+        table_factory: Callable,
+        ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+        lock_seconds: int = IDEMPOTENCY_LOCK_SECONDS,
+        l1_size: int = IDEMPOTENCY_L1_SIZE,
+    ):
+        self._table_factory = table_factory
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.l1_size = l1_size
+        self._seen: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, event_id: str, status: str) -> None:
+        with self._lock:
+            self._seen[event_id] = status
+            self._seen.move_to_end(event_id)
+            while len(self._seen) > self.l1_size:
+                self._seen.popitem(last=False)
+
+    def _forget(self, event_id: str) -> None:
+        with self._lock:
+            self._seen.pop(event_id, None)
+
+    def seen(self, event_id: str) -> bool:
+        """このプロセスで処理中・処理済みなら True."""
+        with self._lock:
+            return event_id in self._seen
+
+    def claim(self, event_id: str) -> EventClaim | None:
+        """処理権を取得する. 処理済み・他で処理中なら None."""
+        if self.seen(event_id):
+            return None
+        # 先に L1 に入れて同じプロセス内の並行配信を弾く
+        self._remember(event_id, STATUS_IN_PROGRESS)
+        now = int(time.time())
+        try:
+            response = self._table_factory().update_item(
+                Key={"event_id": event_id},
+                UpdateExpression=(
+                    "SET #s = :running, claimed_at = :now, #ttl = :ttl, "
+                    "checkpoints = if_not_exists(checkpoints, :empty) ADD attempts :one"
+                ),
+                ConditionExpression=(
+                    "attribute_not_exists(event_id) OR #s = :failed "
+                    "OR (#s = :running AND claimed_at < :stale)"
+                ),
+                ExpressionAttributeNames={"#s": "status", "#ttl": "ttl"},
+                ExpressionAttributeValues={
+                    ":running": STATUS_IN_PROGRESS,
+                    ":failed": STATUS_FAILED,
+                    ":now": now,
+                    ":stale": now - self.lock_seconds,
+                    ":ttl": now + self.ttl_seconds,
+                    ":empty": {},
+                    ":one": 1,
+                },
+                ReturnValues="ALL_NEW",
+            )
+        except (ClientError, BotoCoreError) as e:
+            code = e.response.get("Error", {}).get("Code") if isinstance(e, ClientError) else None
+            if code == "ConditionalCheckFailedException":
+                return None
+            # 記録できなくても処理は止めない (重複排除は L1 のみになる)
+            logger.warning("Failed to claim event %s, processing without ledger", event_id, exc_info=True)
+            return EventClaim(None, event_id)
+        item = response.get("Attributes", {})
+        checkpoints = {
+            name: json.loads(value) for name, value in (item.get("checkpoints") or {}).items()
+        }
+        return EventClaim(self, event_id, int(item.get("attempts", 1)), checkpoints)
+
+    def checkpoint(self, claim: EventClaim, name: str, value: Any) -> None:
+        try:
+            self._table_factory().update_item(
+                Key={"event_id": claim.event_id},
+                UpdateExpression="SET checkpoints.#n = :v",
+                ExpressionAttributeNames={"#n": name},
+                ExpressionAttributeValues={":v": json.dumps(value, ensure_ascii=False)},
+            )
+        except (ClientError, BotoCoreError):
+            logger.warning("Failed to record checkpoint %s for %s", name, claim.event_id, exc_info=True)
+
+    def _set_status(self, claim: EventClaim, status: str) -> None:
+        try:
+            self._table_factory().update_item(
+                Key={"event_id": claim.event_id},
+                UpdateExpression="SET #s = :s",
+                ExpressionAttributeNames={"#s": "status"},
+                ExpressionAttributeValues={":s": status},
+            )
+        except (ClientError, BotoCoreError):
+            logger.warning("Failed to mark event %s as %s", claim.event_id, status, exc_info=True)
+
+    def complete(self, claim: EventClaim) -> None:
+        self._remember(claim.event_id, STATUS_COMPLETED)
+        if claim._ledger is not None:
+            self._set_status(claim, STATUS_COMPLETED)
+
+    def fail(self, claim: EventClaim) -> None:
+        # 再配信で再開できるよう L1 からも外す
+        self._forget(claim.event_id)
+        if claim._ledger is not None:
+            self._set_status(claim, STATUS_FAILED)
+
+
+@contextmanager
+def event_scope(event_id: str | None, ledger: EventLedger) -> Iterator[bool]:
+    """イベント処理を処理権で囲む. 処理すべきなら True、重複なら False を返す.
+
+    正常終了で completed、例外で failed を記録する。event_id がなければ常に処理する。
+    """
+    if not event_id:
+        yield True
+        return
+    claim = ledger.claim(event_id)
+    if claim is None:
+        yield False
+        return
+    if claim.checkpoints:
+        logger.info("Resuming event %s (attempt %d) from %s", event_id, claim.attempt, sorted(claim.checkpoints))
+    token = _current.set(claim)
+    try:
+        yield True
+    except BaseException:
+        ledger.fail(claim)
+        raise
+    else:
+        ledger.complete(claim)
+    finally:
+        _current.reset(token)
+
+
+def current() -> EventClaim | None:
+    return _current.get()
+
+
+def once(name: str, fn: Callable[[], Any]) -> Any:
+    """副作用のある処理をイベントごとに 1 回だけ実行する.
+
+    前回の試行で記録済みなら fn を呼ばずに記録した結果を返す。戻り値は JSON 化できること。
+    """
+    claim = _current.get()
+    if claim is None:
+        return fn()
+    cached = claim.get(name, _MISSING)
+    if cached is not _MISSING:
+        logger.info("Reusing checkpoint %s for event %s", name, claim.event_id)
+        return cached
+    value = fn()
+    claim.record(name, value)
+    return value
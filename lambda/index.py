@@ -1,48 +1,55 @@
 """LINE Webhook Handler - Lambda + ローカル FastAPI 兼用."""
 
+import hashlib
 import json
 import logging
 import os
 import time
 import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
 from urllib.parse import parse_qs, unquote
 
-import boto3
 from linebot.v3 import WebhookParser
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
-    ApiClient,
-    Configuration,
     FlexContainer,
     FlexMessage,
     LocationAction,
-    MessagingApi,
-    PushMessageRequest,
     QuickReply,
     QuickReplyItem,
-    ReplyMessageRequest,
-    ShowLoadingAnimationRequest,
     TextMessage,
 )
 from linebot.v3.webhooks import (
+    Event,
     LocationMessageContent,
     MessageEvent,
     PostbackEvent,
     TextMessageContent,
 )
 
+import agent_stream
+import aws_clients
+import envelope
+import event_dispatcher
+import event_queue
+import fast_path
 import google_auth
 import google_calendar_api
+import idempotency
+import intent_classifier
+import line_messaging
+import prefetch
+import reply_scheduler
+import tracing
+import user_session
+from envelope import Envelope
 from flex_messages.calendar_carousel import build_events_carousel
 from flex_messages.date_picker import build_date_picker
 from flex_messages.event_confirm import (
     build_delete_confirmation,
     build_event_confirmation,
 )
-from flex_messages.email_carousel import build_email_carousel
-from flex_messages.email_confirm import build_email_send_confirm
-from flex_messages.email_detail import build_email_detail
-from flex_messages.place_carousel import build_place_carousel
 from flex_messages.time_picker import build_time_picker
 
 logger = logging.getLogger()
@@ -53,7 +60,7 @@ CHANNEL_SECRET = os.environ.get("LINE_CHANNEL_SECRET", "")
 CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", "")
 
 parser = WebhookParser(CHANNEL_SECRET)
-configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
+messenger = line_messaging.LineMessenger(CHANNEL_ACCESS_TOKEN)
 
 # AgentCore (Router Agent)
 AGENT_RUNTIME_ARN = os.environ.get("AGENT_RUNTIME_ARN", "")
@@ -62,50 +69,74 @@ AGENTCORE_RUNTIME_ENDPOINT = os.environ.get("AGENTCORE_RUNTIME_ENDPOINT", "")
 
 TIMEOUT_SECONDS = 55  # Lambda 60s timeout の 5s 手前
 
+# AgentCore のセッション ID はユーザー × 日付 (JST) で固定する (Agent 側の Memory セッションと同じ区切り)
+_JST = timezone(timedelta(hours=9))
+
+# reply / push 1 回で送れるメッセージ数の上限 (LINE Messaging API)
+LINE_MAX_MESSAGES = 5
+
+# reply token が切れそうなときに先に返す中間メッセージ (最終回答は push)
+INTERIM_REPLY_MESSAGE = os.environ.get("INTERIM_REPLY_MESSAGE", "確認しています。少々お待ちください…")
+
+# Agent の出力を SSE で受け取り、最終エンベロープが届いた時点で返信する
+AGENT_STREAMING = os.environ.get("AGENT_STREAMING", "true").lower() == "true"
+
 # DynamoDB ステート管理テーブル
 USER_STATE_TABLE = os.environ.get("USER_STATE_TABLE", "UserSessionState")
+# Webhook イベントの処理記録テーブル (再配信の重複排除)
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE", "WebhookEventLog")
 
 # LIFF
 LIFF_ID = os.environ.get("LIFF_ID", "")
 
+# トレースの service 名 (Router / サブエージェントのスパンと区別する)
+TRACE_SERVICE_NAME = "line-webhook"
+
 # Dev Webhook Proxy
 DEV_WEBHOOK_URL = os.environ.get("DEV_WEBHOOK_URL", "")
 
+# Webhook 処理モード
+# sync: lambda_handler 内で全イベントを処理してから 200 を返す
+# async: 署名検証 → キュー投入 → 即 200 を返し、worker_handler が処理する
+WEBHOOK_MODE = os.environ.get("WEBHOOK_MODE", "sync")
+
+dispatcher = event_dispatcher.EventDispatcher()
+ledger = idempotency.EventLedger(lambda: aws_clients.get_table(IDEMPOTENCY_TABLE, AWS_REGION))
+
 
 # ========== LINE メッセージ送信 ==========
 
 
 def show_loading(user_id: str) -> None:
     """LINE ローディングアニメーション表示."""
-    with ApiClient(configuration) as api_client:
-        api = MessagingApi(api_client)
-        api.show_loading_animation(
-            ShowLoadingAnimationRequest(chatId=user_id, loadingSeconds=60)
-        )
+    messenger.show_loading(user_id, seconds=60)
 
 
 def reply_message(reply_token: str, messages: list) -> None:
     """LINE reply message. messages は TextMessage or FlexMessage のリスト."""
-    with ApiClient(configuration) as api_client:
-        api = MessagingApi(api_client)
-        api.reply_message(
-            ReplyMessageRequest(replyToken=reply_token, messages=messages)
-        )
+    messenger.send(messages, reply_token=reply_token)
 
 
 def push_message(user_id: str, messages: list) -> None:
     """LINE push message."""
-    with ApiClient(configuration) as api_client:
-        api = MessagingApi(api_client)
-        api.push_message(
-            PushMessageRequest(to=user_id, messages=messages)
-        )
+    messenger.send(messages, to=user_id)
 
 
 def send_response(reply_token: str, user_id: str, messages: list, elapsed: float = 0) -> None:
-    """Reply or Push でメッセージ送信 (タイムアウト対策付き)."""
+    """Reply or Push でメッセージ送信 (タイムアウト対策付き).
+
+    イベント処理中は reply token の残り時間で判断する。スコープ外 (直接呼び出し) では
+    elapsed (Agent の所要時間) で判断する。
+    """
+    deadline = reply_scheduler.current()
+    if deadline is not None:
+        use_reply = deadline.can_reply()
+    else:
+        use_reply = elapsed < TIMEOUT_SECONDS
     try:
-        if elapsed < TIMEOUT_SECONDS:
+        if use_reply:
+            if deadline is not None:
+                deadline.mark_replied()
             reply_message(reply_token, messages)
         else:
             push_message(user_id, messages)
@@ -117,12 +148,39 @@ def send_response(reply_token: str, user_id: str, messages: list, elapsed: float
             logger.error("Push message also failed", exc_info=True)
 
 
+def send_interim_reply_if_late() -> bool:
+    """Agent の予測レイテンシ後には reply できないなら、先に中間メッセージを reply する.
+
+    送った場合は True. 最終回答は send_response() で push になる。
+    """
+    deadline = reply_scheduler.current()
+    if deadline is None:
+        return False
+    predicted = reply_scheduler.predictor.predict()
+    if not deadline.should_send_interim(predicted):
+        return False
+    logger.info(
+        "Predicted agent latency %.1fs exceeds reply budget %.1fs, sending interim reply",
+        predicted,
+        deadline.token_remaining(),
+    )
+    deadline.mark_replied()
+    try:
+        reply_message(deadline.reply_token, [TextMessage(text=INTERIM_REPLY_MESSAGE)])
+    except Exception:
+        logger.warning("Interim reply failed", exc_info=True)
+    return True
+
+
 # ========== Agent 呼び出し ==========
 
 
 def _build_google_credentials(line_user_id: str) -> dict | None:
     """Google 認証情報を取得して dict に変換. 未連携なら None."""
-    creds = google_auth.get_google_credentials(line_user_id)
+    with tracing.span("credentials.resolve") as sp:
+        creds = google_auth.get_google_credentials(line_user_id)
+        if sp is not None:
+            sp.set_attribute("google.linked", bool(creds))
     if not creds:
         return None
     return {
@@ -134,29 +192,81 @@ def _build_google_credentials(line_user_id: str) -> dict | None:
     }
 
 
-def invoke_router_agent(prompt: str, line_user_id: str) -> str:
-    """Router Agent を呼び出し (Google 認証情報付き)."""
+_UNRESOLVED = object()
+
+
+def invoke_router_agent(prompt: str, line_user_id: str, google_credentials=_UNRESOLVED) -> Envelope:
+    """Router Agent を呼び出し (Google 認証情報付き).
+
+    google_credentials を渡さなければここで解決する (prefetch 済みなら渡す)。
+    """
     payload = {
         "prompt": prompt,
         "line_user_id": line_user_id,
     }
 
     # Google 認証情報があれば付与（Router → Calendar Agent に転送される）
-    google_creds = _build_google_credentials(line_user_id)
-    if google_creds:
-        payload["google_credentials"] = google_creds
+    if google_credentials is _UNRESOLVED:
+        google_credentials = _build_google_credentials(line_user_id)
+    if google_credentials:
+        payload["google_credentials"] = google_credentials
+    if AGENT_STREAMING:
+        payload["stream"] = True
+
+    def _call() -> dict | str:
+        # 締め切りは呼び出し直前の残り時間で決める (中間メッセージを送った後なら Lambda の残り)
+        payload["deadline_ms"] = _agent_deadline_ms()
+        started = time.perf_counter()
+        with tracing.span("router.call", attributes={"agent.streaming": AGENT_STREAMING}):
+            # Router のスパンをこの呼び出しの子にする
+            result = _invoke_agent(tracing.inject(payload))
+        # 次回の reply / push 判断に使う
+        reply_scheduler.predictor.observe(time.perf_counter() - started)
+        return result
+
+    # 再配信で再開した場合は前回の応答を使い、Agent (メール送信など) を再実行しない
+    return envelope.coerce(idempotency.once("agent_response", _call))
+
+
+def _agent_deadline_ms() -> int:
+    """Agent に渡す締め切り (ms). Agent はこの時間内に途中結果かフォールバックを返す."""
+    budget = TIMEOUT_SECONDS
+    deadline = reply_scheduler.current()
+    if deadline is not None:
+        budget = min(budget, deadline.agent_budget())
+    return int(budget * 1000)
+
+
+def _runtime_session_id(line_user_id: str, now: float | None = None) -> str:
+    """AgentCore の runtimeSessionId. 同じユーザー・同じ日 (JST) なら同じ値.
+
+    AgentCore はセッション ID ごとに microVM を割り当てるため、固定すると同じコンテナに届き
+    Router の Agent プール・Memory セッションのキャッシュが効く。ユーザー ID はそのまま出さず
+    ハッシュにする (AgentCore の下限 33 文字を満たす長さ)。
+    """
+    if not line_user_id:
+        return str(uuid.uuid4())
+    day = datetime.fromtimestamp(time.time() if now is None else now, _JST).strftime("%Y-%m-%d")
+    digest = hashlib.sha256(f"{line_user_id}-{day}".encode("utf-8")).hexdigest()[:32]
+    return f"line-{day}-{digest}"
+
 
+def _invoke_agent(payload: dict) -> dict | str:
+    """ペイロードを Router Agent に送り、エンベロープ (JSON オブジェクト. 旧形式の Agent なら文字列) を返す."""
     if AGENTCORE_RUNTIME_ENDPOINT:
         return _invoke_agent_local(payload, AGENTCORE_RUNTIME_ENDPOINT)
 
     # AWS 環境: AgentCore Runtime 経由
-    client = boto3.client("bedrock-agentcore", region_name=AWS_REGION)
+    client = aws_clients.get_client("bedrock-agentcore", AWS_REGION)
     response = client.invoke_agent_runtime(
         agentRuntimeArn=AGENT_RUNTIME_ARN,
-        runtimeSessionId=str(uuid.uuid4()),
+        runtimeSessionId=_runtime_session_id(payload.get("line_user_id", "")),
         payload=json.dumps(payload).encode("utf-8"),
         contentType="application/json",
     )
+    if "text/event-stream" in response.get("contentType", ""):
+        body = response["response"]
+        return _read_agent_stream(agent_stream.AgentStream(body.iter_chunks(), close=body.close))
     body = response["response"].read().decode("utf-8")
     if "application/json" in response.get("contentType", ""):
         result = json.loads(body)
@@ -164,19 +274,33 @@ def invoke_router_agent(prompt: str, line_user_id: str) -> str:
     return body
 
 
-def _invoke_agent_local(payload: dict, endpoint: str) -> str:
+def _invoke_agent_local(payload: dict, endpoint: str) -> dict | str:
     """ローカル開発用: AgentCore エンドポイントに直接アクセス."""
-    import urllib.request
+    import http_pool
 
     url = f"{endpoint.rstrip('/')}/invocations"
     data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url, data=data, headers={"Content-Type": "application/json"}
+    resp = http_pool.pool.open(
+        "POST", url, body=data, headers={"Content-Type": "application/json"}, timeout=TIMEOUT_SECONDS
     )
-
-    with urllib.request.urlopen(req, timeout=TIMEOUT_SECONDS) as resp:
+    if "text/event-stream" in resp.headers.get("Content-Type", ""):
+        return _read_agent_stream(
+            agent_stream.AgentStream(
+                iter(lambda: resp.read1(8192), b""), close=lambda: http_pool.pool.release(resp)
+            )
+        )
+    try:
         result = json.loads(resp.read().decode("utf-8"))
-        return result.get("result", str(result))
+    finally:
+        http_pool.pool.release(resp)
+    return result.get("result", str(result))
+
+
+def _read_agent_stream(stream: agent_stream.AgentStream) -> dict | str:
+    """最終エンベロープが届いた時点で返す. 残りのストリームは返信後に読み捨てる."""
+    result = stream.envelope()
+    stream.defer_drain()
+    return result
 
 
 # ========== レスポンス → LINE メッセージ変換 ==========
@@ -246,198 +370,185 @@ def _build_oauth_messages(user_id: str) -> list:
     return [_build_flex_message(flex_dict)]
 
 
-def _sanitize_response(text: str) -> str:
-    """LLM レスポンスから JSON 部分を抽出.
+# type → 描画関数 (envelope.Envelope, user_id) -> LINE メッセージのリスト. 未登録の type はテキスト
+_RENDERERS: dict[str, Callable[[Envelope, str], list]] = {}
 
-    Agent のレスポンスにマークダウンコードブロックや余分なテキストが
-    含まれることがある。複数の手法で JSON を抽出する。
-    """
-    stripped = text.strip()
 
-    # 1. そのまま JSON として解析できるならそのまま返す
-    try:
-        json.loads(stripped)
-        return stripped
-    except (json.JSONDecodeError, TypeError):
-        pass
-
-    # 2. Markdown コードブロック除去
-    if stripped.startswith("```"):
-        first_newline = stripped.find("\n")
-        if first_newline != -1:
-            candidate = stripped[first_newline + 1:]
-        else:
-            candidate = stripped[3:]
-        if candidate.endswith("```"):
-            candidate = candidate[:-3].strip()
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    # 3. テキスト中の最外 JSON オブジェクトを抽出 ({ ... })
-    first_brace = stripped.find("{")
-    last_brace = stripped.rfind("}")
-    if first_brace != -1 and last_brace > first_brace:
-        candidate = stripped[first_brace:last_brace + 1]
+def _renders(*types: str):
+    """描画関数を type に登録するデコレータ."""
+
+    def _register(fn):
+        for type_ in types:
+            _RENDERERS[type_] = fn
+        return fn
+
+    return _register
+
+
+def convert_agent_response(response: Envelope | dict | str, user_id: str) -> list:
+    """Agent レスポンスを LINE メッセージに変換. 描画は type ごとに登録した関数に任せる."""
+    env = envelope.coerce(response)
+    with tracing.span("flex.build", attributes={"envelope.type": env.type}):
+        return _RENDERERS.get(env.type, _render_text)(env, user_id)
+
+
+def _with_message(env: Envelope, flex: dict) -> list:
+    """見出しテキスト (message) + Flex Message. Flex を組めなかった場合はテキストだけ."""
+    if flex.get("type") == "text":
+        return [TextMessage(text=flex["text"])]
+    messages = []
+    if env.message:
+        messages.append(TextMessage(text=env.message))
+    messages.append(_build_flex_message(flex))
+    return messages
+
+
+def _text_renderer(default: str):
+    def _render(env: Envelope, user_id: str) -> list:
+        return [TextMessage(text=env.message or default)]
+
+    return _render
+
+
+def _render_text(env: Envelope, user_id: str) -> list:
+    return [TextMessage(text=env.message or env.to_json())]
+
+
+_renders("text")(_render_text)
+_renders("event_created", "event_updated")(_text_renderer("予定を処理しました。"))
+_renders("event_deleted")(_text_renderer("予定を削除しました。"))
+_renders("email_sent")(_text_renderer("メールを送信しました。"))
+_renders("email_deleted")(_text_renderer("メールを削除しました。"))
+_renders("email_labels_updated")(_text_renderer("ラベルを更新しました。"))
+_renders("draft_saved")(_text_renderer("下書きを保存しました。"))
+
+
+@_renders("oauth_required")
+def _render_oauth_required(env: Envelope, user_id: str) -> list:
+    return _build_oauth_messages(user_id)
+
+
+@_renders("multi")
+def _render_multi(env: Envelope, user_id: str) -> list:
+    """複数ツールの結果 (type=multi) をまとめて変換. 上限を超えるなら各結果の見出しテキストを落とす."""
+    groups = [
+        convert_agent_response(part, user_id)
+        for part in env.get("parts") or []
+        if isinstance(part, dict)
+    ]
+    if sum(len(group) for group in groups) > LINE_MAX_MESSAGES:
+        # カルーセルなど各結果の本体 (最後のメッセージ) を優先する
+        groups = [group[-1:] for group in groups]
+    messages = [message for group in groups for message in group]
+    if len(messages) > LINE_MAX_MESSAGES:
+        logger.warning("Dropping %d messages over the LINE limit", len(messages) - LINE_MAX_MESSAGES)
+    return messages[:LINE_MAX_MESSAGES]
+
+
+@_renders("calendar_events")
+def _render_calendar_events(env: Envelope, user_id: str) -> list:
+    return _with_message(env, build_events_carousel(env.get("events") or [], env.message))
+
+
+@_renders("date_selection")
+def _render_date_selection(env: Envelope, user_id: str) -> list:
+    suggested_title = env.get("suggested_title") or "新しい予定"
+    # suggested_title を session state に保存（カルーセルフローで引き継ぐ）
+    save_user_state(user_id, {"action": "date_selection", "suggested_title": suggested_title})
+
+    # busy_slots から日付ごとの busy を抽出
+    busy_dates = set()
+    for slot in env.get("busy_slots") or []:
         try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, TypeError):
-            pass
+            start = datetime.fromisoformat(slot["start"])
+            end = datetime.fromisoformat(slot["end"])
+            # 終日ブロックの日付を busy に
+            if (end - start).total_seconds() >= 8 * 3600:
+                busy_dates.add(start.strftime("%Y-%m-%d"))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return _with_message(env, build_date_picker(list(busy_dates)))
+
+
+@_renders("location_request")
+def _render_location_request(env: Envelope, user_id: str) -> list:
+    quick_reply = QuickReply(items=[
+        QuickReplyItem(action=LocationAction(label="📍 位置情報を送る")),
+    ])
+    return [TextMessage(
+        text=env.message or "お近くのお店を探すので、位置情報を送ってもらえますか？",
+        quick_reply=quick_reply,
+    )]
+
+
+@_renders("place_search", "place_recommend")
+def _render_places(env: Envelope, user_id: str) -> list:
+    from flex_messages.place_carousel import build_place_carousel
+
+    flex = build_place_carousel(
+        env.get("places") or [],
+        env.message,
+        place_type="recommend" if env.type == "place_recommend" else "search",
+    )
+    return _with_message(env, flex)
 
-    return stripped
 
+# --- Gmail レスポンス ---
 
-def convert_agent_response(response_text: str, user_id: str) -> list:
-    """Agent レスポンスを LINE メッセージに変換."""
-    cleaned = _sanitize_response(response_text)
-    try:
-        data = json.loads(cleaned)
-    except (json.JSONDecodeError, TypeError):
-        return [TextMessage(text=cleaned)]
-
-    resp_type = data.get("type", "text")
-    message_text = data.get("message", "")
-
-    if resp_type == "oauth_required":
-        return _build_oauth_messages(user_id)
-
-    if resp_type == "calendar_events":
-        events = data.get("events", [])
-        flex = build_events_carousel(events, message_text)
-        if flex.get("type") == "text":
-            return [TextMessage(text=flex["text"])]
-        messages = []
-        if message_text:
-            messages.append(TextMessage(text=message_text))
-        messages.append(_build_flex_message(flex))
-        return messages
-
-    if resp_type == "date_selection":
-        busy_slots = data.get("busy_slots", [])
-        suggested_title = data.get("suggested_title", "新しい予定")
-        # suggested_title を session state に保存（カルーセルフローで引き継ぐ）
-        save_user_state(user_id, {"action": "date_selection", "suggested_title": suggested_title})
-
-        # busy_slots から日付ごとの busy を抽出
-        from datetime import datetime
-
-        busy_dates = set()
-        for slot in busy_slots:
-            try:
-                start = datetime.fromisoformat(slot["start"])
-                end = datetime.fromisoformat(slot["end"])
-                # 終日ブロックの日付を busy に
-                if (end - start).total_seconds() >= 8 * 3600:
-                    busy_dates.add(start.strftime("%Y-%m-%d"))
-            except (ValueError, KeyError):
-                continue
-        flex = build_date_picker(list(busy_dates))
-        messages = []
-        if message_text:
-            messages.append(TextMessage(text=message_text))
-        messages.append(_build_flex_message(flex))
-        return messages
-
-    if resp_type == "location_request":
-        quick_reply = QuickReply(items=[
-            QuickReplyItem(action=LocationAction(label="📍 位置情報を送る")),
-        ])
-        return [TextMessage(
-            text=message_text or "お近くのお店を探すので、位置情報を送ってもらえますか？",
-            quick_reply=quick_reply,
-        )]
-
-    if resp_type in ("place_search", "place_recommend"):
-        places = data.get("places", [])
-        flex = build_place_carousel(
-            places,
-            message_text,
-            place_type="recommend" if resp_type == "place_recommend" else "search",
-        )
-        if flex.get("type") == "text":
-            return [TextMessage(text=flex["text"])]
-        messages = []
-        if message_text:
-            messages.append(TextMessage(text=message_text))
-        messages.append(_build_flex_message(flex))
-        return messages
-
-    if resp_type in ("event_created", "event_updated"):
-        return [TextMessage(text=message_text or "予定を処理しました。")]
-
-    if resp_type == "event_deleted":
-        return [TextMessage(text=message_text or "予定を削除しました。")]
-
-    # --- Gmail レスポンス ---
-
-    if resp_type == "email_list":
-        emails = data.get("emails", [])
-        flex = build_email_carousel(emails, message_text)
-        if flex.get("type") == "text":
-            return [TextMessage(text=flex["text"])]
-        messages = []
-        if message_text:
-            messages.append(TextMessage(text=message_text))
-        messages.append(_build_flex_message(flex))
-        return messages
-
-    if resp_type == "email_detail":
-        email = data.get("email", {})
-        flex = build_email_detail(email)
-        messages = []
-        if message_text:
-            messages.append(TextMessage(text=message_text))
-        messages.append(_build_flex_message(flex))
-        return messages
-
-    if resp_type == "email_confirm_send":
-        flex = build_email_send_confirm(data)
-        messages = []
-        if message_text:
-            messages.append(TextMessage(text=message_text))
-        messages.append(_build_flex_message(flex))
-        return messages
-
-    if resp_type == "email_sent":
-        return [TextMessage(text=message_text or "メールを送信しました。")]
-
-    if resp_type == "email_deleted":
-        return [TextMessage(text=message_text or "メールを削除しました。")]
-
-    if resp_type == "email_labels_updated":
-        return [TextMessage(text=message_text or "ラベルを更新しました。")]
-
-    if resp_type == "draft_saved":
-        return [TextMessage(text=message_text or "下書きを保存しました。")]
-
-    # デフォルト: テキスト
-    return [TextMessage(text=message_text or response_text)]
+
+@_renders("email_list")
+def _render_email_list(env: Envelope, user_id: str) -> list:
+    from flex_messages.email_carousel import build_email_carousel
+
+    return _with_message(env, build_email_carousel(env.get("emails") or [], env.message))
+
+
+@_renders("email_detail")
+def _render_email_detail(env: Envelope, user_id: str) -> list:
+    from flex_messages.email_detail import build_email_detail
+
+    return _with_message(env, build_email_detail(env.get("email") or {}))
+
+
+@_renders("email_confirm_send")
+def _render_email_confirm_send(env: Envelope, user_id: str) -> list:
+    from flex_messages.email_confirm import build_email_send_confirm
+
+    return _with_message(env, build_email_send_confirm(env.to_dict()))
 
 
 # ========== ユーザーステート管理 ==========
 
 
+def _state_table():
+    return aws_clients.get_table(USER_STATE_TABLE, AWS_REGION)
+
+
 def save_user_state(user_id: str, state: dict) -> None:
-    """ユーザーの操作ステートを DynamoDB に保存."""
-    dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-    table = dynamodb.Table(USER_STATE_TABLE)
-    table.put_item(
-        Item={
-            "line_user_id": user_id,
-            "state": json.dumps(state, ensure_ascii=False),
-            "ttl": int(time.time()) + 600,  # 10分で期限切れ
-        }
+    """ユーザーの操作ステートを保存. イベント処理中はセッションに溜めて最後にコミット."""
+    session = user_session.current(user_id)
+    if session is not None:
+        session.set(state)
+        return
+    # セッション外では version を進めて、セッション側の楽観ロックに検知させる
+    _state_table().update_item(
+        Key={"line_user_id": user_id},
+        UpdateExpression="SET #s = :s, #ttl = :ttl ADD #v :one",
+        ExpressionAttributeNames={"#s": "state", "#ttl": "ttl", "#v": "version"},
+        ExpressionAttributeValues={
+            ":s": json.dumps(state, ensure_ascii=False),
+            ":ttl": int(time.time()) + user_session.STATE_TTL_SECONDS,
+            ":one": 1,
+        },
     )
 
 
 def get_user_state(user_id: str) -> dict | None:
-    """ユーザーの操作ステートを取得."""
-    dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-    table = dynamodb.Table(USER_STATE_TABLE)
-    response = table.get_item(Key={"line_user_id": user_id})
+    """ユーザーの操作ステートを取得. イベント処理中は 1 度だけ読み込む."""
+    session = user_session.current(user_id)
+    if session is not None:
+        return session.get()
+    response = _state_table().get_item(Key={"line_user_id": user_id})
     item = response.get("Item")
     if item:
         return json.loads(item.get("state", "{}"))
@@ -446,14 +557,56 @@ def get_user_state(user_id: str) -> dict | None:
 
 def clear_user_state(user_id: str) -> None:
     """ユーザーの操作ステートを削除."""
-    dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-    table = dynamodb.Table(USER_STATE_TABLE)
-    table.delete_item(Key={"line_user_id": user_id})
+    session = user_session.current(user_id)
+    if session is not None:
+        session.clear()
+        return
+    _state_table().delete_item(Key={"line_user_id": user_id})
 
 
 # ========== メッセージハンドラ ==========
 
 
+def _prefetch_turn(user_id: str) -> prefetch.PrefetchResult:
+    """ステート読み込み・Google 認証情報の解決・ローディング表示を並列に実行."""
+    return prefetch.run_parallel({
+        "user_state": lambda: get_user_state(user_id),
+        "google_credentials": lambda: _build_google_credentials(user_id),
+        "loading": lambda: show_loading(user_id),
+    })
+
+
+def _agent_kwargs(pre: prefetch.PrefetchResult) -> dict:
+    """prefetch で解決できた認証情報だけ invoke_router_agent に渡す."""
+    if pre.ok("google_credentials"):
+        return {"google_credentials": pre.get("google_credentials")}
+    return {}
+
+
+def _answer_fast_path(intent: intent_classifier.Intent, user_id: str, pre: prefetch.PrefetchResult) -> list | None:
+    """意図が確定した一覧表示を Google API で直接処理. 処理できなければ None (Router に任せる)."""
+    creds_data = pre.get("google_credentials")
+    if not creds_data:
+        # 未連携なら Router が OAuth 案内を返す
+        return None
+    started = time.perf_counter()
+    try:
+        with tracing.span("fast_path", attributes={"intent": intent.name}):
+            messages = convert_agent_response(
+                fast_path.answer(intent, google_auth.credentials_from_dict(creds_data)), user_id
+            )
+    except Exception:
+        logger.warning("Fast path %s failed, falling back to router", intent.name, exc_info=True)
+        intent_classifier.stats.record(
+            intent_classifier.OUTCOME_FALLBACK, intent, (time.perf_counter() - started) * 1000
+        )
+        return None
+    intent_classifier.stats.record(
+        intent_classifier.OUTCOME_FAST_PATH, intent, (time.perf_counter() - started) * 1000
+    )
+    return messages
+
+
 def handle_text_message(event: MessageEvent) -> None:
     """テキストメッセージを処理."""
     user_id = event.source.user_id
@@ -462,8 +615,11 @@ def handle_text_message(event: MessageEvent) -> None:
 
     logger.info("Received message from %s: %s", user_id, user_text[:50])
 
+    # 1. ステート・認証情報・ローディング表示を並列に開始
+    pre = _prefetch_turn(user_id)
+
     # ユーザーステート確認 (タイトル編集中など)
-    user_state = get_user_state(user_id)
+    user_state = pre.get("user_state")
     if user_state and user_state.get("action") == "waiting_location":
         # 位置情報待ちの状態でテキストが来た場合はステートをクリアして通常処理へ
         clear_user_state(user_id)
@@ -480,37 +636,35 @@ def handle_text_message(event: MessageEvent) -> None:
         send_response(reply_token, user_id, [_build_flex_message(flex)])
         return
 
-    # 1. ローディングアニメーション表示
-    try:
-        show_loading(user_id)
-    except Exception:
-        logger.warning("Failed to show loading animation", exc_info=True)
+    # 2. 「今日の予定」など意図が確定した一覧表示は Router Agent を通さない
+    intent = intent_classifier.classify(user_text) if intent_classifier.INTENT_FAST_PATH else None
+    if intent is not None and intent.confident:
+        messages = _answer_fast_path(intent, user_id, pre)
+        if messages is not None:
+            send_response(reply_token, user_id, messages)
+            return
 
-    # 2. Router Agent 呼び出し（Google 認証情報付き）
+    # 3. Router Agent 呼び出し（Google 認証情報付き）
+    send_interim_reply_if_late()
     start_time = time.time()
     try:
-        ai_response = invoke_router_agent(user_text, user_id)
+        ai_response = invoke_router_agent(user_text, user_id, **_agent_kwargs(pre))
     except Exception:
         logger.error("Agent invocation failed", exc_info=True)
-        ai_response = json.dumps(
-            {"type": "text", "message": "申し訳ありません。エラーが発生しました。もう一度お試しください。"}
-        )
+        ai_response = envelope.text("申し訳ありません。エラーが発生しました。もう一度お試しください。")
 
     elapsed = time.time() - start_time
-    logger.info("Agent response in %.1fs", elapsed)
+    logger.info("Agent response in %.1fs (trace %s)", elapsed, tracing.current_trace_id() or "-")
+    intent_classifier.stats.record(intent_classifier.OUTCOME_ROUTER, intent, elapsed * 1000)
 
-    # 3. location_request の場合は元クエリをステートに保存
-    try:
-        resp_data = json.loads(ai_response)
-        if resp_data.get("type") == "location_request":
-            save_user_state(user_id, {
-                "action": "waiting_location",
-                "original_query": user_text,
-            })
-    except (json.JSONDecodeError, TypeError):
-        pass
-
-    # 4. レスポンス変換 & 送信
+    # 4. location_request の場合は元クエリをステートに保存
+    if ai_response.type == "location_request":
+        save_user_state(user_id, {
+            "action": "waiting_location",
+            "original_query": user_text,
+        })
+
+    # 5. レスポンス変換 & 送信
     messages = convert_agent_response(ai_response, user_id)
     send_response(reply_token, user_id, messages, elapsed)
 
@@ -524,8 +678,11 @@ def handle_location_message(event: MessageEvent) -> None:
 
     logger.info("Location from %s: lat=%s, lon=%s", user_id, latitude, longitude)
 
+    # ステート・認証情報・ローディング表示を並列に開始
+    pre = _prefetch_turn(user_id)
+
     # ステート確認: waiting_location なら元クエリを復元
-    user_state = get_user_state(user_id)
+    user_state = pre.get("user_state")
     if user_state and user_state.get("action") == "waiting_location":
         original_query = user_state.get("original_query", "この場所の周辺でおすすめを教えて")
         clear_user_state(user_id)
@@ -534,24 +691,17 @@ def handle_location_message(event: MessageEvent) -> None:
         # 自発的な位置情報送信
         prompt = f"[ユーザーの現在地: 緯度{latitude}, 経度{longitude}] この場所の周辺でおすすめを教えて"
 
-    # ローディングアニメーション
-    try:
-        show_loading(user_id)
-    except Exception:
-        logger.warning("Failed to show loading animation", exc_info=True)
-
     # Agent 呼び出し
+    send_interim_reply_if_late()
     start_time = time.time()
     try:
-        ai_response = invoke_router_agent(prompt, user_id)
+        ai_response = invoke_router_agent(prompt, user_id, **_agent_kwargs(pre))
     except Exception:
         logger.error("Agent invocation failed", exc_info=True)
-        ai_response = json.dumps(
-            {"type": "text", "message": "申し訳ありません。エラーが発生しました。もう一度お試しください。"}
-        )
+        ai_response = envelope.text("申し訳ありません。エラーが発生しました。もう一度お試しください。")
 
     elapsed = time.time() - start_time
-    logger.info("Agent response in %.1fs", elapsed)
+    logger.info("Agent response in %.1fs (trace %s)", elapsed, tracing.current_trace_id() or "-")
 
     messages = convert_agent_response(ai_response, user_id)
     send_response(reply_token, user_id, messages, elapsed)
@@ -662,11 +812,14 @@ def _handle_confirm_create(reply_token: str, user_id: str, params: dict) -> None
     start_dt = f"{date}T{start}:00+09:00"
     end_dt = f"{date}T{end}:00+09:00"
 
-    event = google_calendar_api.create_event(
-        credentials=creds,
-        summary=summary,
-        start=start_dt,
-        end=end_dt,
+    event = idempotency.once(
+        "calendar_create",
+        lambda: google_calendar_api.create_event(
+            credentials=creds,
+            summary=summary,
+            start=start_dt,
+            end=end_dt,
+        ),
     )
     clear_user_state(user_id)
     send_response(
@@ -754,7 +907,7 @@ def _handle_confirm_delete(reply_token: str, user_id: str, params: dict) -> None
     if not creds:
         return
 
-    google_calendar_api.delete_event(creds, event_id)
+    idempotency.once("calendar_delete", lambda: google_calendar_api.delete_event(creds, event_id))
     send_response(
         reply_token,
         user_id,
@@ -766,13 +919,14 @@ def _handle_email_detail(reply_token: str, user_id: str, params: dict) -> None:
     """メール詳細表示 → Agent に委譲."""
     email_id = params.get("email_id", [""])[0]
 
+    send_interim_reply_if_late()
     start_time = time.time()
     try:
         prompt = f"メール ID {email_id} の詳細を表示してください。"
         ai_response = invoke_router_agent(prompt, user_id)
     except Exception:
         logger.error("Email detail agent call failed", exc_info=True)
-        ai_response = json.dumps({"type": "text", "message": "メール詳細の取得に失敗しました。"})
+        ai_response = envelope.text("メール詳細の取得に失敗しました。")
 
     elapsed = time.time() - start_time
     messages = convert_agent_response(ai_response, user_id)
@@ -783,13 +937,14 @@ def _handle_email_delete(reply_token: str, user_id: str, params: dict) -> None:
     """メール削除 → Agent に委譲."""
     email_id = params.get("email_id", [""])[0]
 
+    send_interim_reply_if_late()
     start_time = time.time()
     try:
         prompt = f"メール ID {email_id} を削除してください。"
         ai_response = invoke_router_agent(prompt, user_id)
     except Exception:
         logger.error("Email delete agent call failed", exc_info=True)
-        ai_response = json.dumps({"type": "text", "message": "メール削除に失敗しました。"})
+        ai_response = envelope.text("メール削除に失敗しました。")
 
     elapsed = time.time() - start_time
     messages = convert_agent_response(ai_response, user_id)
@@ -802,13 +957,14 @@ def _handle_email_send(reply_token: str, user_id: str, params: dict) -> None:
     subject = unquote(params.get("subject", [""])[0])
     body = unquote(params.get("body", [""])[0])
 
+    send_interim_reply_if_late()
     start_time = time.time()
     try:
         prompt = f"以下の内容でメールを送信してください。送信確認は不要です。\n宛先: {to}\n件名: {subject}\n本文: {body}"
         ai_response = invoke_router_agent(prompt, user_id)
     except Exception:
         logger.error("Email send agent call failed", exc_info=True)
-        ai_response = json.dumps({"type": "text", "message": "メール送信に失敗しました。"})
+        ai_response = envelope.text("メール送信に失敗しました。")
 
     elapsed = time.time() - start_time
     messages = convert_agent_response(ai_response, user_id)
@@ -838,6 +994,98 @@ def _forward_to_dev(body: str, signature: str) -> dict:
         return {"statusCode": 502, "body": "Dev forwarding failed"}
 
 
+# ---------- イベントディスパッチ ----------
+
+
+def _dispatch_event(ev) -> None:
+    """イベント種別に応じてハンドラを呼び出し. ステートはイベント単位でまとめてコミット."""
+    event_id = idempotency.event_id_of(ev)
+    with idempotency.event_scope(event_id, ledger) as should_process:
+        if not should_process:
+            logger.info(
+                "Skipping duplicate event %s (redelivery=%s)", event_id, idempotency.is_redelivery(ev)
+            )
+            return
+        _process_event(ev)
+
+
+def _process_event(ev) -> None:
+    """1 イベントを reply の締め切り・ストリーム・ステートのスコープ内で処理."""
+    user_id = getattr(getattr(ev, "source", None), "user_id", None)
+    # ストリームの読み捨ては返信・ステートのコミットが済んでから行う
+    with (
+        tracing.span(
+            "line.event",
+            service=TRACE_SERVICE_NAME,
+            attributes={"line.event_id": idempotency.event_id_of(ev), "line.event_type": type(ev).__name__},
+        ),
+        reply_scheduler.event_scope(ev),
+        agent_stream.drain_after(),
+        user_session.session_scope(user_id, _state_table),
+    ):
+        _route_event(ev)
+
+
+def _route_event(ev) -> None:
+    """イベント種別に応じてハンドラを呼び出し."""
+    if isinstance(ev, MessageEvent) and isinstance(
+        ev.message, TextMessageContent
+    ):
+        handle_text_message(ev)
+    elif isinstance(ev, MessageEvent) and isinstance(
+        ev.message, LocationMessageContent
+    ):
+        handle_location_message(ev)
+    elif isinstance(ev, PostbackEvent):
+        handle_postback(ev)
+
+
+def _event_key(ev) -> str:
+    """順序保証キー. 同一ユーザー (なければグループ / ルーム) のイベントは逐次処理する."""
+    source = getattr(ev, "source", None)
+    for attr in ("user_id", "group_id", "room_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return f"anonymous-{id(ev)}"
+
+
+def _dispatch_events(events: list) -> event_dispatcher.DispatchResult:
+    """イベント群をユーザー単位の順序を保って並列処理."""
+    result = dispatcher.dispatch(events, _dispatch_event, key=_event_key)
+    if result.failed:
+        logger.warning("%d of %d events failed", len(result.failed), len(events))
+    return result
+
+
+def _deserialize_event(raw_event: dict):
+    """キューに積んだ生イベント dict を LINE SDK のイベントに復元."""
+    return Event.from_dict(raw_event)
+
+
+def _enqueue_events(body: str) -> int:
+    """署名検証済みの Webhook body からイベントを取り出してキューに投入."""
+    webhook = json.loads(body)
+    destination = webhook.get("destination", "")
+    queue = event_queue.get_event_queue()
+    count = 0
+    for raw_event in webhook.get("events", []):
+        queue.enqueue(
+            # worker のスパンを Webhook のトレースに繋げる
+            tracing.inject(event_queue.build_message(raw_event, destination)),
+            event_queue.group_id_for(raw_event),
+        )
+        count += 1
+    return count
+
+
+def _process_queued_message(payload: dict) -> None:
+    """キューから取り出した 1 メッセージを処理."""
+    ev = _deserialize_event(payload["event"])
+    with tracing.span("queue.message", parent=tracing.extract(payload), service=TRACE_SERVICE_NAME):
+        _dispatch_event(ev)
+
+
 # ---------- Lambda Handler ----------
 
 
@@ -854,27 +1102,77 @@ def lambda_handler(event, context):
     if not signature:
         return {"statusCode": 400, "body": "Missing signature"}
 
-    try:
-        events = parser.parse(body, signature)
-    except InvalidSignatureError:
-        logger.error("Invalid signature")
-        return {"statusCode": 403, "body": "Invalid signature"}
-
-    for ev in events:
-        if isinstance(ev, MessageEvent) and isinstance(
-            ev.message, TextMessageContent
-        ):
-            handle_text_message(ev)
-        elif isinstance(ev, MessageEvent) and isinstance(
-            ev.message, LocationMessageContent
-        ):
-            handle_location_message(ev)
-        elif isinstance(ev, PostbackEvent):
-            handle_postback(ev)
+    with tracing.span("webhook", service=TRACE_SERVICE_NAME, attributes={"request.id": _request_id(event, context)}):
+        try:
+            with tracing.span("webhook.verify_signature"):
+                events = parser.parse(body, signature)
+        except InvalidSignatureError:
+            logger.error("Invalid signature")
+            return {"statusCode": 403, "body": "Invalid signature"}
+
+        if WEBHOOK_MODE == "async":
+            with tracing.span("queue.enqueue"):
+                count = _enqueue_events(body)
+            logger.info("Enqueued %d events", count)
+            return {"statusCode": 200, "body": "OK"}
+
+        with reply_scheduler.invocation(context):
+            _dispatch_events(events)
 
     return {"statusCode": 200, "body": "OK"}
 
 
+def _request_id(event: dict, context) -> str:
+    """トレースを探すための ID (API Gateway のリクエスト ID. なければ Lambda のリクエスト ID)."""
+    request_id = (event.get("requestContext") or {}).get("requestId")
+    return str(request_id or getattr(context, "aws_request_id", "") or "")
+
+
+def worker_handler(event, context):
+    """SQS イベントソースから呼ばれる worker. 失敗したメッセージだけを再配信させる."""
+    items = [(record, json.loads(record["body"])) for record in event.get("Records", [])]
+
+    # 同一 MessageGroupId 内で失敗した以降のメッセージも失敗扱いにして順序を守る
+    with reply_scheduler.invocation(context):
+        result = dispatcher.dispatch(
+            items,
+            lambda item: _process_queued_message(item[1]),
+            key=lambda item: event_queue.group_id_for(item[1]["event"]),
+            stop_group_on_error=True,
+        )
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": record.get("messageId", "")}
+            for record, _ in result.failed + result.skipped
+        ]
+    }
+
+
+def drain_event_queue(queue=None, max_messages: int = 10) -> int:
+    """取り出せるメッセージがなくなるまで処理 (ローカル worker / ベンチマーク用). 処理できた件数を返す.
+
+    worker_handler と同じく、失敗したメッセージと同じグループでその後に続くメッセージは
+    ack せず、visibility timeout 後に再配信させる。
+    """
+    queue = queue or event_queue.get_event_queue()
+    processed = 0
+    while True:
+        messages = queue.receive(max_messages)
+        if not messages:
+            return processed
+        result = dispatcher.dispatch(
+            messages,
+            lambda message: _process_queued_message(message.payload),
+            key=lambda message: message.group_id,
+            stop_group_on_error=True,
+        )
+        retry = {id(message) for message in result.failed + result.skipped}
+        for message in messages:
+            if id(message) not in retry:
+                queue.ack(message)
+                processed += 1
+
+
 # ---------- ローカル開発 (FastAPI) ----------
 
 if __name__ == "__main__":
@@ -896,7 +1194,7 @@ if __name__ == "__main__":
     AWS_REGION = os.environ.get("AWS_REGION", "ap-northeast-1")
 
     parser = WebhookParser(CHANNEL_SECRET)
-    configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
+    messenger = line_messaging.LineMessenger(CHANNEL_ACCESS_TOKEN)
 
     # google_auth モジュールのグローバル変数も再設定
     google_auth.GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "")
@@ -907,11 +1205,34 @@ if __name__ == "__main__":
     google_auth.AWS_REGION = os.environ.get("AWS_REGION", "ap-northeast-1")
     LIFF_ID = os.environ.get("LIFF_ID", "")
 
+    # event_queue モジュールのグローバル変数も再設定
+    WEBHOOK_MODE = os.environ.get("WEBHOOK_MODE", "sync")
+    event_queue.EVENT_QUEUE_BACKEND = os.environ.get("EVENT_QUEUE_BACKEND", "")
+    event_queue.EVENT_QUEUE_URL = os.environ.get("EVENT_QUEUE_URL", "")
+    event_queue.EVENT_QUEUE_SQLITE_PATH = os.environ.get(
+        "EVENT_QUEUE_SQLITE_PATH", event_queue.EVENT_QUEUE_SQLITE_PATH
+    )
+    event_queue.AWS_REGION = os.environ.get("AWS_REGION", "ap-northeast-1")
+    dispatcher = event_dispatcher.EventDispatcher(
+        int(os.environ.get("DISPATCH_MAX_WORKERS", "4"))
+    )
+
     from fastapi import FastAPI, Header, Request
     from fastapi.responses import HTMLResponse, JSONResponse
 
     app = FastAPI(title="LINE Webhook (Local)")
 
+    if WEBHOOK_MODE == "async":
+        # ローカルでは別スレッドの worker がキューをポーリングして処理する
+        import threading
+
+        def _local_worker() -> None:
+            while True:
+                if not drain_event_queue():
+                    time.sleep(0.2)
+
+        threading.Thread(target=_local_worker, daemon=True).start()
+
     @app.post("/callback")
     async def callback(
         request: Request, x_line_signature: str = Header(default="")
@@ -923,17 +1244,11 @@ if __name__ == "__main__":
         except InvalidSignatureError:
             return {"status": "error", "message": "Invalid signature"}
 
-        for ev in events:
-            if isinstance(ev, MessageEvent) and isinstance(
-                ev.message, TextMessageContent
-            ):
-                handle_text_message(ev)
-            elif isinstance(ev, MessageEvent) and isinstance(
-                ev.message, LocationMessageContent
-            ):
-                handle_location_message(ev)
-            elif isinstance(ev, PostbackEvent):
-                handle_postback(ev)
+        if WEBHOOK_MODE == "async":
+            _enqueue_events(body)
+            return {"status": "ok"}
+
+        _dispatch_events(events)
 
         return {"status": "ok"}
 
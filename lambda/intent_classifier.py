@@ -0,0 +1,211 @@
+"""ルールと語彙による意図分類 (Router LLM を通さない高速パス用).
+
+「今日の予定」「受信トレイ見せて」のように意図が一意に決まる一覧表示だけを対象にする。
+メッセージのうち語彙で説明できない残りの文字が多いほど確信度を下げ、
+作成・変更・削除・送信・検索など一覧表示以外の語を含む場合は分類しない。
+確信度がしきい値未満なら Router Agent に任せる。
+
+しきい値の調整用に、結果 (高速パス / Router) ごとの件数とレイテンシ、
+分類できたメッセージの確信度の分布を集計する。
+"""
+
+import logging
+import os
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# この確信度以上の意図だけ高速パスで処理する
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+# 高速パスを無効にする (Router に全部任せる) ときは false
+INTENT_FAST_PATH = os.environ.get("INTENT_FAST_PATH", "true").lower() == "true"
+
+CALENDAR_LIST = "calendar_list"
+EMAIL_LIST = "email_list"
+
+# 対象期間 (予定一覧)
+PERIOD_TODAY = "today"
+PERIOD_TOMORROW = "tomorrow"
+PERIOD_THIS_WEEK = "this_week"
+
+_PERIOD_WORDS = {
+    "今日": PERIOD_TODAY,
+    "本日": PERIOD_TODAY,
+    "きょう": PERIOD_TODAY,
+    "明日": PERIOD_TOMORROW,
+    "あした": PERIOD_TOMORROW,
+    "あす": PERIOD_TOMORROW,
+    "今週": PERIOD_THIS_WEEK,
+    "今週中": PERIOD_THIS_WEEK,
+}
+_CALENDAR_WORDS = ("予定", "スケジュール", "カレンダー", "よてい")
+_EMAIL_WORDS = ("受信トレイ", "受信箱", "メール", "gmail", "めーる")
+# メールの対象を一覧に限定する語
+_INBOX_WORDS = ("受信トレイ", "受信箱", "新着", "届いてる", "届いた", "来てる", "きてる", "一覧")
+_UNREAD_WORDS = ("未読",)
+# 表示・確認の依頼
+_VIEW_WORDS = (
+    "見せて", "みせて", "教えて", "おしえて", "確認", "一覧", "表示", "見たい", "知りたい",
+    "チェック", "ある", "あります", "どう", "なに", "何",
+)
+# 語彙で説明できる付属語 (残りの文字数には数えない)
+_FILLER_WORDS = (
+    "の", "は", "を", "って", "が", "に", "ください", "下さい", "して", "お願い", "おねがい",
+    "ですか", "です", "ますか", "かな", "ある", "か", "私", "わたし", "僕", "俺", "全部", "すべて",
+)
+# 一覧表示以外の操作 (含まれていたら Router に任せる)
+_ACTION_WORDS = (
+    "追加", "入れ", "いれ", "作成", "作って", "登録", "予約", "変更", "変え", "ずらし", "移動",
+    "削除", "消し", "消去", "キャンセル", "取り消", "送", "返信", "転送", "書い", "下書き",
+    "検索", "探し", "さがし", "調べ", "から", "宛", "について", "件名", "空い", "空き",
+    "既読", "スター", "ラベル", "招待", "要約", "詳細", "何時", "いつ", "来週", "先週", "昨日",
+)
+_PUNCTUATION = re.compile(r"[\s、。,.!?！？「」『』・…〜~]+")
+
+# 長い語から順に取り除く (「今週中」を「今週」より先に)
+_LEXICON = sorted(
+    set(_PERIOD_WORDS) | set(_CALENDAR_WORDS) | set(_EMAIL_WORDS) | set(_INBOX_WORDS)
+    | set(_UNREAD_WORDS) | set(_VIEW_WORDS) | set(_FILLER_WORDS),
+    key=len,
+    reverse=True,
+)
+
+
+@dataclass(frozen=True)
+class Intent:
+    """分類結果. confidence は 0〜1."""
+
+    name: str
+    confidence: float
+    params: dict = field(default_factory=dict)
+
+    @property
+    def confident(self) -> bool:
+        return self.confidence >= INTENT_CONFIDENCE_THRESHOLD
+
+
+def _normalize(text: str) -> str:
+    # 全角英数・半角カナを揃え、記号と空白を落とす
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def _contains(text: str, words) -> bool:
+    return any(word in text for word in words)
+
+
+def _residue(text: str) -> str:
+    """語彙で説明できない残りの文字."""
+    for word in _LEXICON:
+        text = text.replace(word, "")
+    return text
+
+
+def classify(text: str) -> Intent | None:
+    """メッセージを分類する. 対象外なら None."""
+    normalized = _normalize(text)
+    if not normalized or len(normalized) > 30:
+        return None
+    if _contains(normalized, _ACTION_WORDS):
+        return None
+
+    is_calendar = _contains(normalized, _CALENDAR_WORDS)
+    is_email = _contains(normalized, _EMAIL_WORDS) or _contains(normalized, _UNREAD_WORDS)
+    if is_calendar == is_email:
+        # どちらでもない・両方含む
+        return None
+
+    # 語彙で説明できない文字 1 つにつき確信度を下げる
+    confidence = max(0.0, 1.0 - 0.15 * len(_residue(normalized)))
+
+    if is_calendar:
+        periods = {period for word, period in _PERIOD_WORDS.items() if word in normalized}
+        if len(periods) > 1:
+            return None
+        if not periods:
+            # 期間の指定がなければ Router の解釈 (既定は 1 週間) と一致する保証がない
+            confidence *= 0.7
+        period = periods.pop() if periods else PERIOD_THIS_WEEK
+        return Intent(CALENDAR_LIST, round(confidence, 2), {"period": period})
+
+    unread = _contains(normalized, _UNREAD_WORDS)
+    if _contains(normalized, _PERIOD_WORDS):
+        # 「今日のメール」は期間での絞り込みが必要
+        return None
+    if not (unread or _contains(normalized, _INBOX_WORDS) or _contains(normalized, _VIEW_WORDS)):
+        # 「メール」だけでは送信の意図と区別できない
+        confidence *= 0.5
+    return Intent(EMAIL_LIST, round(confidence, 2), {"unread": unread})
+
+
+# ---------- 集計 ----------
+
+OUTCOME_FAST_PATH = "fast_path"
+# 高速パスを試したが失敗し Router に回した
+OUTCOME_FALLBACK = "fallback"
+OUTCOME_ROUTER = "router"
+
+
+class IntentStats:
+    """高速パスのヒット率とレイテンシ (コンテナ内の累計)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._outcomes: dict[str, dict] = {}
+        # 分類できたメッセージの確信度 (0.1 刻み) → 件数
+        self._confidence: dict[str, dict[str, int]] = {}
+
+    def record(self, outcome: str, intent: Intent | None, latency_ms: float) -> None:
+        key = f"{outcome}:{intent.name if intent else 'none'}"
+        with self._lock:
+            entry = self._outcomes.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += latency_ms
+            entry["max_ms"] = max(entry["max_ms"], latency_ms)
+            if intent is not None:
+                bucket = f"{min(int(intent.confidence * 10), 9) / 10:.1f}"
+                histogram = self._confidence.setdefault(intent.name, {})
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+        logger.info(
+            "Intent outcome=%s intent=%s confidence=%s latency=%.0fms",
+            outcome,
+            intent.name if intent else "none",
+            f"{intent.confidence:.2f}" if intent else "-",
+            latency_ms,
+        )
+
+    def snapshot(self) -> dict:
+        """ヒット率・結果ごとの件数 / 平均・最大レイテンシ・確信度の分布."""
+        with self._lock:
+            outcomes = {
+                key: {
+                    "count": e["count"],
+                    "avg_ms": e["total_ms"] / e["count"],
+                    "max_ms": e["max_ms"],
+                }
+                for key, e in self._outcomes.items()
+            }
+            confidence = {name: dict(sorted(h.items())) for name, h in self._confidence.items()}
+        hits = sum(e["count"] for key, e in outcomes.items() if key.startswith(OUTCOME_FAST_PATH + ":"))
+        routed = sum(e["count"] for key, e in outcomes.items() if key.startswith(OUTCOME_ROUTER + ":"))
+        # fallback は Router 側でも数えるのでメッセージ数には足さない
+        total = hits + routed
+        return {
+            "total": total,
+            "hit_rate": hits / total if total else 0.0,
+            "threshold": INTENT_CONFIDENCE_THRESHOLD,
+            "outcomes": outcomes,
+            "confidence": confidence,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+
+stats = IntentStats()
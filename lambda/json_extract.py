@@ -0,0 +1,91 @@
+"""LLM の応答テキストから JSON エンベロープを取り出す.
+
+応答にはコードフェンス (```json ... ```) や前後の説明文が付くことがある。先頭から
+1 回だけ走査し、最初に JSON として読める {...} を解析済みのオブジェクトと元テキスト上の
+位置 (span) で返す。呼び出し側は解析済みのオブジェクトをそのまま渡し、同じ文字列を
+json.loads し直さない。
+
+候補の {...} は json の raw_decode でその場で解析する (C 実装で 1 回読むだけ)。
+読めなかった候補 (説明文中の {name} など) は文字列リテラルを考慮した括弧の
+状態機械で閉じ括弧まで読み飛ばし、その内側を候補として試し直さない。
+"""
+
+import json
+import re
+from dataclasses import dataclass
+
+_DECODER = json.JSONDecoder()
+# 括弧の対応を追うときに見る文字
+_STRUCTURAL = re.compile(r'[{}"\\]')
+
+
+@dataclass(frozen=True)
+class Extracted:
+    """取り出した JSON オブジェクトと、元テキスト上の位置 [start, end)."""
+
+    value: dict
+    start: int
+    end: int
+    source: str
+
+    @property
+    def text(self) -> str:
+        """元テキストのうち JSON の部分."""
+        return self.source[self.start:self.end]
+
+
+def _skip_balanced(text: str, start: int) -> int:
+    """text[start] の "{" に対応する "}" の次の位置. 閉じていなければ -1."""
+    depth = 0
+    in_string = False
+    escaped_until = -1
+    for match in _STRUCTURAL.finditer(text, start):
+        i = match.start()
+        if i < escaped_until:
+            continue
+        ch = match.group()
+        if in_string:
+            if ch == "\\":
+                escaped_until = i + 2
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return -1
+
+
+def extract_json(text: str) -> Extracted | None:
+    """最初の JSON オブジェクトを取り出す. なければ None."""
+    if not isinstance(text, str):
+        return None
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            value, end = _DECODER.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            end = _skip_balanced(text, pos)
+            # 閉じていない "{" (説明文中の記号など) は 1 文字だけ進める
+            pos = text.find("{", end if end != -1 else pos + 1)
+            continue
+        return Extracted(value, pos, end, text)
+    return None
+
+
+def parse_envelope(response: str | dict) -> dict | None:
+    """エンベロープを dict で返す (解析済みならそのまま). JSON でなければ None."""
+    if isinstance(response, dict):
+        return response
+    found = extract_json(response)
+    return found.value if found is not None else None
+
+
+def sanitize(text: str) -> str:
+    """JSON の部分だけの文字列 (なければ前後の空白を除いたテキスト)."""
+    found = extract_json(text)
+    return found.text if found is not None else text.strip()
@@ -0,0 +1,131 @@
+"""LINE Messaging API 送信ファサード.
+
+ApiClient を warm コンテナ内で 1 つだけ生成して使い回し、
+接続プール (keep-alive) で TLS ハンドシェイクを省く。
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+from linebot.v3.messaging import (
+    ApiClient,
+    Configuration,
+    MessagingApi,
+    PushMessageRequest,
+    ReplyMessageRequest,
+    ShowLoadingAnimationRequest,
+)
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# 同時に張る api.line.me への接続数 (DISPATCH_MAX_WORKERS 以上にしておく)
+LINE_CONNECTION_POOL_SIZE = int(os.environ.get("LINE_CONNECTION_POOL_SIZE", "10"))
+
+
+class LineMessenger:
+    """reply / push / ローディング表示を 1 つの ApiClient で送るファサード.
+
+    呼び出しごとのレイテンシを API 種別ごとに集計する (stats())。
+    """
+
+    def __init__(self, access_token: str, pool_size: int = LINE_CONNECTION_POOL_SIZE):
+        self.access_token = access_token
+        self.pool_size = pool_size
+        self._api_client: ApiClient | None = None
+        self._api: MessagingApi | None = None
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    @property
+    def api(self) -> MessagingApi:
+        """MessagingApi を遅延生成して返す (スレッドセーフ)."""
+        if self._api is None:
+            with self._lock:
+                if self._api is None:
+                    self._api_client = ApiClient(self._build_configuration())
+                    self._api = MessagingApi(self._api_client)
+        return self._api
+
+    def _build_configuration(self) -> Configuration:
+        configuration = Configuration(access_token=self.access_token)
+        configuration.connection_pool_maxsize = self.pool_size
+        # アイドル中に NAT / LB に切られないよう TCP keepalive を有効化
+        from urllib3.connection import HTTPConnection
+
+        configuration.socket_options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        return configuration
+
+    def send(self, messages: list, reply_token: str | None = None, to: str | None = None) -> None:
+        """reply_token があれば reply、なければ to へ push で送信."""
+        if reply_token:
+            self._call(
+                "reply",
+                self.api.reply_message,
+                ReplyMessageRequest(replyToken=reply_token, messages=messages),
+            )
+        elif to:
+            self._call(
+                "push",
+                self.api.push_message,
+                PushMessageRequest(to=to, messages=messages),
+            )
+        else:
+            raise ValueError("reply_token or to is required")
+
+    def show_loading(self, chat_id: str, seconds: int = 60) -> None:
+        """ローディングアニメーション表示."""
+        self._call(
+            "loading",
+            self.api.show_loading_animation,
+            ShowLoadingAnimationRequest(chatId=chat_id, loadingSeconds=seconds),
+        )
+
+    def _call(self, name: str, fn, request) -> None:
+        start = time.perf_counter()
+        ok = False
+        try:
+            with tracing.span(f"line.{name}"):
+                fn(request)
+            ok = True
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._record(name, elapsed_ms, ok)
+            logger.debug("LINE %s %.0fms (ok=%s)", name, elapsed_ms, ok)
+
+    def _record(self, name: str, elapsed_ms: float, ok: bool) -> None:
+        with self._lock:
+            stat = self._stats.setdefault(
+                name, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stat["count"] += 1
+            stat["errors"] += 0 if ok else 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+
+    def stats(self) -> dict:
+        """API 種別ごとの呼び出し回数 / エラー数 / 平均・最大レイテンシ (ms)."""
+        with self._lock:
+            return {
+                name: {
+                    "count": s["count"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 1),
+                    "max_ms": round(s["max_ms"], 1),
+                }
+                for name, s in self._stats.items()
+            }
+
+    def close(self) -> None:
+        """接続プールを閉じる (ローカル開発で再設定するとき用)."""
+        with self._lock:
+            if self._api_client is not None:
+                self._api_client.close()
+            self._api_client = None
+            self._api = None
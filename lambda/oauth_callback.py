@@ -5,20 +5,16 @@ import logging
 import os
 from urllib.parse import parse_qs
 
-from linebot.v3.messaging import (
-    ApiClient,
-    Configuration,
-    PushMessageRequest,
-    TextMessage,
-)
+from linebot.v3.messaging import TextMessage
 
 import google_auth
+import line_messaging
 
 logger = logging.getLogger()
 logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", "")
-configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
+messenger = line_messaging.LineMessenger(CHANNEL_ACCESS_TOKEN)
 
 
 def lambda_handler(event, context):
@@ -64,21 +60,15 @@ def lambda_handler(event, context):
 
 def _push_completion_message(line_user_id: str) -> None:
     """連携完了メッセージを LINE Push で送信."""
-    with ApiClient(configuration) as api_client:
-        from linebot.v3.messaging import MessagingApi
-
-        api = MessagingApi(api_client)
-        api.push_message(
-            PushMessageRequest(
-                to=line_user_id,
-                messages=[
-                    TextMessage(
-                        text="Google 連携（カレンダー & メール）が完了しました！\n\n"
-                        "「今日の予定は？」「受信トレイ見せて」などと話しかけてみてください。"
-                    )
-                ],
+    messenger.send(
+        [
+            TextMessage(
+                text="Google 連携（カレンダー & メール）が完了しました！\n\n"
+                "「今日の予定は？」「受信トレイ見せて」などと話しかけてみてください。"
             )
-        )
+        ],
+        to=line_user_id,
+    )
 
 
 def _html_response(message: str, status: int = 200) -> dict:
@@ -0,0 +1,93 @@
+"""リクエスト開始時の独立した I/O を並列に実行するヘルパー.
+
+ステート読み込み・Google 認証情報の解決・ローディング表示のように
+互いに依存しない処理をまとめて投げ、タイムアウト付きで待ち合わせる。
+各ブランチの所要時間を記録し、逐次実行と比べて短縮できた時間をログに出す。
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_TIMEOUT_SECONDS = float(os.environ.get("PREFETCH_TIMEOUT_SECONDS", "5"))
+
+# EventDispatcher のワーカーから呼ばれるため、別プールにしてデッドロックを避ける
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="prefetch")
+
+
+@dataclass
+class PrefetchResult:
+    """並列実行の結果. 失敗・タイムアウトしたブランチは errors に入る."""
+
+    values: dict[str, Any] = field(default_factory=dict)
+    errors: dict[str, BaseException] = field(default_factory=dict)
+    timings_ms: dict[str, float] = field(default_factory=dict)
+    wall_ms: float = 0.0
+
+    def ok(self, name: str) -> bool:
+        return name in self.values
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.values.get(name, default)
+
+    @property
+    def saved_ms(self) -> float:
+        """逐次実行した場合との差 (ms)."""
+        return max(0.0, sum(self.timings_ms.values()) - self.wall_ms)
+
+
+def run_parallel(
+    branches: dict[str, Callable[[], Any]],
+    timeout: float = PREFETCH_TIMEOUT_SECONDS,
+) -> PrefetchResult:
+    """branches を並列に実行し、timeout 秒まで待ち合わせて結果を返す.
+
+    各ブランチは呼び出し元の contextvars を引き継いで実行される。
+    """
+    result = PrefetchResult()
+    lock = threading.Lock()
+
+    def _timed(name: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            with lock:
+                result.timings_ms[name] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    futures = {
+        name: _executor.submit(contextvars.copy_context().run, _timed, name, fn)
+        for name, fn in branches.items()
+    }
+    wait(futures.values(), timeout=timeout)
+    result.wall_ms = (time.perf_counter() - start) * 1000
+
+    for name, future in futures.items():
+        if not future.done():
+            logger.warning("Prefetch %s timed out after %.1fs", name, timeout)
+            result.errors[name] = TimeoutError(f"prefetch {name} timed out")
+            continue
+        error = future.exception()
+        if error is not None:
+            logger.warning("Prefetch %s failed", name, exc_info=error)
+            result.errors[name] = error
+        else:
+            result.values[name] = future.result()
+
+    with lock:
+        result.timings_ms = dict(result.timings_ms)
+    logger.info(
+        "Prefetch done in %.0fms (saved %.0fms): %s",
+        result.wall_ms,
+        result.saved_ms,
+        ", ".join(f"{k}={v:.0f}ms" for k, v in result.timings_ms.items()),
+    )
+    return result
@@ -0,0 +1,145 @@
+"""reply / push の切り替えを締め切りベースで判断するスケジューラ.
+
+reply token の有効期限はイベントの発生時刻 (webhook の timestamp) から数える。
+Lambda の残り時間 (context.get_remaining_time_in_millis) も締め切りとして扱い、
+Agent の予測レイテンシが締め切りを超えそうなら先に中間メッセージを reply し、
+最終回答は push で送る。締め切りまでの残り時間は Agent にも予算として渡す。
+"""
+
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# reply token は webhook 受信から 1 分以内に使う
+REPLY_TOKEN_TTL_SECONDS = float(os.environ.get("REPLY_TOKEN_TTL_SECONDS", "60"))
+# reply API 呼び出し自体にかかる時間 + 時計のずれの余裕
+REPLY_SAFETY_MARGIN_SECONDS = float(os.environ.get("REPLY_SAFETY_MARGIN_SECONDS", "3"))
+# Lambda がタイムアウトする前に push を送り切るための余裕
+LAMBDA_SAFETY_MARGIN_SECONDS = float(os.environ.get("LAMBDA_SAFETY_MARGIN_SECONDS", "2"))
+# 実測がないときの Agent レイテンシの見積もり
+AGENT_LATENCY_ESTIMATE_SECONDS = float(os.environ.get("AGENT_LATENCY_ESTIMATE_SECONDS", "10"))
+
+_invocation: contextvars.ContextVar[Callable[[], int] | None] = contextvars.ContextVar(
+    "lambda_remaining_ms", default=None
+)
+_current: contextvars.ContextVar["ReplyDeadline | None"] = contextvars.ContextVar(
+    "reply_deadline", default=None
+)
+
+
+class LatencyPredictor:
+    """Agent レイテンシの指数移動平均 (平均 + 偏差) で次回を予測する."""
+
+    def __init__(self, initial: float = AGENT_LATENCY_ESTIMATE_SECONDS, alpha: float = 0.2):
+        self.alpha = alpha
+        self._mean = initial
+        self._dev = initial / 4
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            if self._samples == 0:
+                self._mean = seconds
+                self._dev = seconds / 4
+            else:
+                self._dev = (1 - self.alpha) * self._dev + self.alpha * abs(seconds - self._mean)
+                self._mean = (1 - self.alpha) * self._mean + self.alpha * seconds
+            self._samples += 1
+
+    def predict(self) -> float:
+        """悲観寄りの予測値 (平均 + 2 偏差)."""
+        with self._lock:
+            return self._mean + 2 * self._dev
+
+
+predictor = LatencyPredictor()
+
+
+class ReplyDeadline:
+    """1 イベント分の reply token と Lambda 残り時間の締め切り."""
+
+    def __init__(
+        self,
+        reply_token: str | None,
+        event_timestamp_ms: int | float | None = None,
+        remaining_ms: Callable[[], int] | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.reply_token = reply_token
+        self._clock = clock
+        # timestamp がなければ (テスト・ローカル) 受信時刻から数える
+        if isinstance(event_timestamp_ms, (int, float)) and not isinstance(event_timestamp_ms, bool):
+            self.issued_at = event_timestamp_ms / 1000
+        else:
+            self.issued_at = clock()
+        self._remaining_ms = remaining_ms
+        self.replied = False
+
+    def token_age(self) -> float:
+        return self._clock() - self.issued_at
+
+    def token_remaining(self) -> float:
+        """reply token を安全に使える残り秒数 (使用済みなら 0)."""
+        if not self.reply_token or self.replied:
+            return 0.0
+        return max(0.0, REPLY_TOKEN_TTL_SECONDS - REPLY_SAFETY_MARGIN_SECONDS - self.token_age())
+
+    def lambda_remaining(self) -> float:
+        """Lambda がタイムアウトするまでの残り秒数 (Lambda 外なら無限)."""
+        if self._remaining_ms is None:
+            return math.inf
+        return max(0.0, self._remaining_ms() / 1000 - LAMBDA_SAFETY_MARGIN_SECONDS)
+
+    def can_reply(self) -> bool:
+        return self.token_remaining() > 0
+
+    def should_send_interim(self, predicted_seconds: float) -> bool:
+        """予測レイテンシ後には reply できない (または Lambda が持たない) なら True."""
+        if not self.can_reply():
+            return False
+        return predicted_seconds > min(self.token_remaining(), self.lambda_remaining())
+
+    def agent_budget(self) -> float:
+        """Agent に使わせてよい秒数. reply できるなら token の残り、中間メッセージ送信後は Lambda の残り."""
+        if self.can_reply():
+            return min(self.token_remaining(), self.lambda_remaining())
+        return self.lambda_remaining()
+
+    def mark_replied(self) -> None:
+        self.replied = True
+
+
+@contextmanager
+def invocation(context) -> Iterator[None]:
+    """Lambda 呼び出し全体のスコープ. context の残り時間を各イベントから参照できるようにする."""
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    token = _invocation.set(remaining if callable(remaining) else None)
+    try:
+        yield
+    finally:
+        _invocation.reset(token)
+
+
+@contextmanager
+def event_scope(ev) -> Iterator[ReplyDeadline]:
+    """1 イベント分の締め切りを開く."""
+    reply_token = getattr(ev, "reply_token", None)
+    deadline = ReplyDeadline(
+        reply_token if isinstance(reply_token, str) else None,
+        getattr(ev, "timestamp", None),
+        _invocation.get(),
+    )
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current() -> ReplyDeadline | None:
+    return _current.get()
@@ -0,0 +1,70 @@
+"""Tests for lambda/agent_stream.py."""
+
+import json
+import sys
+
+import pytest
+
+agent_stream = sys.modules["agent_stream"]
+
+
+def _sse(*events):
+    return [f"data: {json.dumps(e, ensure_ascii=False)}\n\n".encode("utf-8") for e in events]
+
+
+def test_envelope_returns_before_stream_ends():
+    """result イベントが届いた時点で残りを読まずに返ること."""
+    consumed = []
+
+    def chunks():
+        for i, chunk in enumerate(_sse(
+            {"event": "delta", "text": "a"},
+            {"event": "result", "result": '{"type": "text", "message": "ok"}'},
+            {"event": "delta", "text": "tail"},
+        )):
+            consumed.append(i)
+            yield chunk
+
+    closed = []
+    stream = agent_stream.AgentStream(chunks(), close=lambda: closed.append(True))
+    assert json.loads(stream.envelope()) == {"type": "text", "message": "ok"}
+    assert consumed == [0, 1]
+    assert stream.deltas == 1
+    assert stream.time_to_result_ms is not None
+
+    stream.drain()
+    assert consumed == [0, 1, 2]
+    assert closed == [True]
+
+
+def test_envelope_error_event():
+    """AgentCore のエラーイベントで AgentStreamError になること."""
+    closed = []
+    stream = agent_stream.AgentStream(
+        _sse({"error": "boom", "error_type": "RuntimeError"}), close=lambda: closed.append(True)
+    )
+    with pytest.raises(agent_stream.AgentStreamError):
+        stream.envelope()
+    assert closed == [True]
+
+
+def test_envelope_without_result():
+    """result なしで終わったら AgentStreamError になること."""
+    stream = agent_stream.AgentStream(_sse({"event": "delta", "text": "a"}))
+    with pytest.raises(agent_stream.AgentStreamError):
+        stream.envelope()
+
+
+def test_drain_after_defers_until_scope_exit():
+    """drain_after の中では defer_drain がスコープ終了まで遅延されること."""
+    stream = agent_stream.AgentStream(_sse({"event": "result", "result": "{}"}, {"event": "delta", "text": "x"}))
+    with agent_stream.drain_after():
+        stream.envelope()
+        stream.defer_drain()
+        assert not stream._closed
+    assert stream._closed
+
+    outside = agent_stream.AgentStream(_sse({"event": "result", "result": "{}"}))
+    outside.envelope()
+    outside.defer_drain()
+    assert outside._closed
@@ -0,0 +1,73 @@
+"""Tests for lambda/aws_clients.py."""
+
+import sys
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+aws_clients = sys.modules["aws_clients"]
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """moto 環境とレジストリの初期化."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    aws_clients.reset()
+    with mock_aws():
+        boto3.client("dynamodb", region_name="us-east-1").create_table(
+            TableName="UserSessionState",
+            KeySchema=[{"AttributeName": "line_user_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "line_user_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield
+    aws_clients.reset()
+
+
+def test_get_client_is_cached(aws):
+    """同じサービス・リージョンのクライアントは使い回されること."""
+    first = aws_clients.get_client("dynamodb", "us-east-1")
+    assert aws_clients.get_client("dynamodb", "us-east-1") is first
+    assert aws_clients.get_client("dynamodb", "us-west-2") is not first
+    assert aws_clients.get_client("dynamodb", "us-east-1", read_timeout=10) is not first
+    assert first.meta.config.max_pool_connections == aws_clients.AWS_MAX_POOL_CONNECTIONS
+    assert first.meta.config.tcp_keepalive is True
+
+
+def test_get_client_shared_across_threads(aws):
+    """クライアントはスレッド間で共有されること."""
+    main = aws_clients.get_client("sqs", "us-east-1")
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(aws_clients.get_client("sqs", "us-east-1")))
+    thread.start()
+    thread.join()
+    assert seen == [main]
+
+
+def test_get_table_cached_per_thread(aws):
+    """Table リソースは同一スレッド内で使い回され、スレッドごとに分かれること."""
+    table = aws_clients.get_table("UserSessionState", "us-east-1")
+    assert aws_clients.get_table("UserSessionState", "us-east-1") is table
+
+    other = []
+    thread = threading.Thread(
+        target=lambda: other.append(aws_clients.get_table("UserSessionState", "us-east-1"))
+    )
+    thread.start()
+    thread.join()
+    assert other[0] is not table
+
+    table.put_item(Item={"line_user_id": "U1", "state": "{}"})
+    assert other[0].get_item(Key={"line_user_id": "U1"})["Item"]["state"] == "{}"
+
+
+def test_reset_recreates_clients(aws):
+    """reset 後は新しいクライアントが生成されること."""
+    first = aws_clients.get_client("dynamodb", "us-east-1")
+    table = aws_clients.get_table("UserSessionState", "us-east-1")
+    aws_clients.reset()
+    assert aws_clients.get_client("dynamodb", "us-east-1") is not first
+    assert aws_clients.get_table("UserSessionState", "us-east-1") is not table
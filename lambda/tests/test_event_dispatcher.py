@@ -0,0 +1,99 @@
+"""Tests for lambda/event_dispatcher.py."""
+
+import sys
+import threading
+import time
+
+event_dispatcher = sys.modules["event_dispatcher"]
+
+
+def _events(*pairs):
+    return [{"user": user, "seq": seq} for user, seq in pairs]
+
+
+def test_dispatch_keeps_per_key_order():
+    """同一キーのイベントは投入順に処理されること."""
+    dispatcher = event_dispatcher.EventDispatcher(max_workers=4)
+    seen: dict[str, list[int]] = {}
+    lock = threading.Lock()
+
+    def handler(ev):
+        # 先頭イベントほど遅くして、順序が崩れれば検出できるようにする
+        time.sleep(0.01 * (3 - ev["seq"]))
+        with lock:
+            seen.setdefault(ev["user"], []).append(ev["seq"])
+
+    events = _events(("U1", 0), ("U2", 0), ("U1", 1), ("U2", 1), ("U1", 2))
+    result = dispatcher.dispatch(events, handler, key=lambda ev: ev["user"])
+
+    assert result.succeeded == 5
+    assert seen == {"U1": [0, 1, 2], "U2": [0, 1]}
+
+
+def test_dispatch_runs_keys_concurrently_within_limit():
+    """異なるキーは並列に処理され、同時実行数は max_workers を超えないこと."""
+    dispatcher = event_dispatcher.EventDispatcher(max_workers=2)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def handler(ev):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+
+    events = _events(("U1", 0), ("U2", 0), ("U3", 0), ("U4", 0))
+    start = time.monotonic()
+    dispatcher.dispatch(events, handler, key=lambda ev: ev["user"])
+    elapsed = time.monotonic() - start
+
+    assert peak == 2
+    assert elapsed < 0.19  # 逐次なら 0.2 秒以上かかる
+
+
+def test_dispatch_isolates_errors():
+    """1 イベントの例外は他イベントの処理を止めないこと."""
+    dispatcher = event_dispatcher.EventDispatcher(max_workers=2)
+    handled = []
+
+    def handler(ev):
+        if ev["seq"] == 0 and ev["user"] == "U1":
+            raise RuntimeError("boom")
+        handled.append((ev["user"], ev["seq"]))
+
+    events = _events(("U1", 0), ("U1", 1), ("U2", 0))
+    result = dispatcher.dispatch(events, handler, key=lambda ev: ev["user"])
+
+    assert result.succeeded == 2
+    assert result.failed == [events[0]]
+    assert result.skipped == []
+    assert sorted(handled) == [("U1", 1), ("U2", 0)]
+
+
+def test_dispatch_stop_group_on_error_skips_rest_of_group():
+    """stop_group_on_error では失敗以降の同一キーを処理せず skipped に入れること."""
+    dispatcher = event_dispatcher.EventDispatcher(max_workers=2)
+    handled = []
+
+    def handler(ev):
+        if ev["user"] == "U1" and ev["seq"] == 0:
+            raise RuntimeError("boom")
+        handled.append((ev["user"], ev["seq"]))
+
+    events = _events(("U1", 0), ("U1", 1), ("U2", 0))
+    result = dispatcher.dispatch(events, handler, key=lambda ev: ev["user"], stop_group_on_error=True)
+
+    assert result.failed == [events[0]]
+    assert result.skipped == [events[1]]
+    assert handled == [("U2", 0)]
+
+
+def test_dispatch_empty():
+    """イベントが空なら何もしないこと."""
+    result = event_dispatcher.EventDispatcher().dispatch([], lambda ev: None, key=lambda ev: ev)
+    assert result.succeeded == 0
+    assert result.failed == []
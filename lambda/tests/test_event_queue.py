@@ -0,0 +1,120 @@
+"""Tests for lambda/event_queue.py."""
+
+import json
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+event_queue = sys.modules["event_queue"]
+
+
+def _raw_event(user_id="U1234", event_id="01HX"):
+    return {
+        "type": "message",
+        "webhookEventId": event_id,
+        "source": {"type": "user", "userId": user_id},
+        "replyToken": "tok",
+        "message": {"type": "text", "id": "1", "text": "こんにちは"},
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def local_queue(request, tmp_path):
+    if request.param == "memory":
+        return event_queue.InMemoryEventQueue()
+    return event_queue.SQLiteEventQueue(str(tmp_path / "queue.db"))
+
+
+def test_group_id_for():
+    """userId / groupId / roomId の順で順序保証キーが決まること."""
+    assert event_queue.group_id_for({"source": {"userId": "U1"}}) == "U1"
+    assert event_queue.group_id_for({"source": {"groupId": "G1"}}) == "G1"
+    assert event_queue.group_id_for({"source": {"roomId": "R1"}}) == "R1"
+    assert event_queue.group_id_for({}) == "anonymous"
+
+
+def test_local_queue_fifo_and_ack(local_queue):
+    """enqueue 順に取り出せて、ack 後は残らないこと."""
+    for i in range(3):
+        local_queue.enqueue(event_queue.build_message(_raw_event(event_id=f"e{i}")), "U1234")
+
+    messages = local_queue.receive(max_messages=10)
+    assert [m.payload["event"]["webhookEventId"] for m in messages] == ["e0", "e1", "e2"]
+    assert all(m.group_id == "U1234" for m in messages)
+
+    for m in messages:
+        local_queue.ack(m)
+    assert local_queue.receive() == []
+    assert len(local_queue) == 0
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_local_queue_redelivers_unacked(backend, tmp_path):
+    """visibility timeout を過ぎた未 ack メッセージが再配信されること."""
+    if backend == "memory":
+        queue = event_queue.InMemoryEventQueue(visibility_timeout=0)
+    else:
+        queue = event_queue.SQLiteEventQueue(str(tmp_path / "queue.db"), visibility_timeout=0)
+    queue.enqueue(event_queue.build_message(_raw_event()), "U1234")
+
+    first = queue.receive()
+    second = queue.receive()
+    assert len(first) == 1
+    assert len(second) == 1
+    assert first[0].message_id == second[0].message_id
+
+
+def test_local_queue_hides_in_flight_until_timeout(local_queue):
+    """取り出し中 (未 ack) のメッセージは visibility timeout までは再配信されないこと."""
+    local_queue.enqueue(event_queue.build_message(_raw_event()), "U1234")
+
+    assert len(local_queue.receive()) == 1
+    assert local_queue.receive() == []
+    assert len(local_queue) == 1
+
+
+def test_sqlite_queue_shared_between_instances(tmp_path):
+    """同じファイルを開いた別インスタンスから取り出せること (ingest / worker 分離)."""
+    path = str(tmp_path / "queue.db")
+    event_queue.SQLiteEventQueue(path).enqueue(event_queue.build_message(_raw_event()), "U1234")
+
+    messages = event_queue.SQLiteEventQueue(path).receive()
+    assert len(messages) == 1
+    assert messages[0].payload["event"]["source"]["userId"] == "U1234"
+
+
+@mock_aws
+def test_sqs_queue_fifo_group_and_dedup():
+    """FIFO キューでは MessageGroupId と webhookEventId による重複排除が付くこと."""
+    client = boto3.client("sqs", region_name="us-east-1")
+    url = client.create_queue(
+        QueueName="line-events.fifo",
+        Attributes={"FifoQueue": "true"},
+    )["QueueUrl"]
+    queue = event_queue.SQSEventQueue(url, client=client)
+
+    payload = event_queue.build_message(_raw_event(event_id="dup-1"))
+    queue.enqueue(payload, "U1234")
+    queue.enqueue(payload, "U1234")  # 同じ webhookEventId は SQS 側で排除される
+
+    messages = queue.receive()
+    assert len(messages) == 1
+    assert messages[0].group_id == "U1234"
+    assert json.dumps(messages[0].payload["event"]) == json.dumps(payload["event"])
+
+    queue.ack(messages[0])
+    assert queue.receive() == []
+
+
+def test_build_event_queue_backends(tmp_path, monkeypatch):
+    """backend 指定に応じた実装が返ること."""
+    monkeypatch.setattr(event_queue, "EVENT_QUEUE_SQLITE_PATH", str(tmp_path / "q.db"))
+    monkeypatch.setattr(event_queue, "EVENT_QUEUE_URL", "")
+    monkeypatch.setattr(event_queue, "EVENT_QUEUE_BACKEND", "")
+
+    assert isinstance(event_queue.build_event_queue(), event_queue.InMemoryEventQueue)
+    assert isinstance(event_queue.build_event_queue("sqlite"), event_queue.SQLiteEventQueue)
+    with pytest.raises(ValueError):
+        event_queue.build_event_queue("kafka")
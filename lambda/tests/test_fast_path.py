@@ -0,0 +1,80 @@
+"""Tests for lambda/fast_path.py and lambda/google_gmail_api.py."""
+
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+fast_path = sys.modules["fast_path"]
+google_gmail_api = sys.modules["google_gmail_api"]
+intent_classifier = sys.modules["intent_classifier"]
+
+JST = timezone(timedelta(hours=9))
+# 2026-10-14 は水曜日
+WEDNESDAY = datetime(2026, 10, 14, 9, 0, tzinfo=JST)
+
+
+@pytest.mark.parametrize(
+    "period, expected",
+    [
+        ("today", ("2026-10-14", "2026-10-14")),
+        ("tomorrow", ("2026-10-15", "2026-10-15")),
+        ("this_week", ("2026-10-14", "2026-10-18")),
+    ],
+)
+def test_period_range(period, expected):
+    """期間名を日付の範囲に変換すること (今週は日曜まで)."""
+    assert fast_path.period_range(period, WEDNESDAY) == expected
+
+
+def test_answer_calendar_list():
+    """予定一覧をサブエージェントと同じエンベロープで返すこと."""
+    intent = intent_classifier.classify("明日の予定")
+    with patch.object(fast_path.google_calendar_api, "list_events", return_value=[]) as mock_list:
+        envelope = fast_path.answer(intent, "creds", WEDNESDAY)
+
+    mock_list.assert_called_once_with("creds", date_from="2026-10-15", date_to="2026-10-15", max_results=10)
+    assert envelope.to_dict() == {"v": 1, "type": "calendar_events", "message": "明日の予定はありません。", "events": []}
+
+
+def test_answer_unread_email_list():
+    """未読メールは INBOX と UNREAD で絞り込むこと."""
+    intent = intent_classifier.classify("未読メール見せて")
+    emails = [{"id": "m1", "subject": "件名"}]
+    with patch.object(fast_path.google_gmail_api, "list_emails", return_value=emails) as mock_list:
+        envelope = fast_path.answer(intent, "creds")
+
+    mock_list.assert_called_once_with("creds", label_ids=["INBOX", "UNREAD"], max_results=10)
+    assert envelope.to_dict() == {"v": 1, "type": "email_list", "message": "未読メールです。", "emails": emails}
+
+
+def test_gmail_list_emails_parses_metadata():
+    """メッセージのメタデータを Gmail Agent と同じ形式に変換すること."""
+    svc = MagicMock()
+    messages = svc.users.return_value.messages.return_value
+    messages.list.return_value.execute.return_value = {"messages": [{"id": "m1"}]}
+    messages.get.return_value.execute.return_value = {
+        "id": "m1",
+        "threadId": "t1",
+        "snippet": "こんにちは",
+        "labelIds": ["INBOX", "UNREAD"],
+        "payload": {"headers": [
+            {"name": "Subject", "value": "お知らせ"},
+            {"name": "From", "value": "Taro <taro@example.com>"},
+            {"name": "Date", "value": "Wed, 14 Oct 2026 09:00:00 +0900"},
+        ]},
+    }
+    with patch.object(google_gmail_api, "_get_service", return_value=svc):
+        emails = google_gmail_api.list_emails("creds", label_ids=["INBOX"], max_results=5)
+
+    messages.list.assert_called_once_with(userId="me", labelIds=["INBOX"], maxResults=5)
+    assert emails == [{
+        "id": "m1",
+        "thread_id": "t1",
+        "subject": "お知らせ",
+        "from": "Taro <taro@example.com>",
+        "date": "Wed, 14 Oct 2026 09:00:00 +0900",
+        "snippet": "こんにちは",
+        "label_ids": ["INBOX", "UNREAD"],
+    }]
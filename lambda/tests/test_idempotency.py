@@ -0,0 +1,144 @@
+"""Tests for lambda/idempotency.py."""
+
+import sys
+import types
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from moto import mock_aws
+
+idempotency = sys.modules["idempotency"]
+idx = sys.modules["lambda.index"]
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        yield dynamodb.create_table(
+            TableName="WebhookEventLog",
+            KeySchema=[{"AttributeName": "event_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "event_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+
+def _ledger(table, **kwargs):
+    return idempotency.EventLedger(lambda: table, **kwargs)
+
+
+def test_duplicate_is_skipped_after_completion(table):
+    """完了したイベントは別プロセス (L1 なし) からも重複として扱われること."""
+    with idempotency.event_scope("E1", _ledger(table)) as process:
+        assert process
+
+    item = table.get_item(Key={"event_id": "E1"})["Item"]
+    assert item["status"] == idempotency.STATUS_COMPLETED
+    assert int(item["ttl"]) > int(item["claimed_at"])
+
+    with idempotency.event_scope("E1", _ledger(table)) as process:
+        assert not process
+
+
+def test_l1_short_circuits_without_dynamodb(table):
+    """同じプロセスで処理済みなら DynamoDB を呼ばずに重複と判定すること."""
+    ledger = _ledger(table)
+    with idempotency.event_scope("E1", ledger):
+        pass
+
+    broken = MagicMock(side_effect=AssertionError("should not hit DynamoDB"))
+    ledger._table_factory = broken
+    with idempotency.event_scope("E1", ledger) as process:
+        assert not process
+    broken.assert_not_called()
+
+
+def test_in_progress_event_is_skipped_until_lock_expires(table):
+    """処理中のイベントはロック期限内は重複、期限切れなら奪い直せること."""
+    first = _ledger(table).claim("E1")
+    assert first is not None
+
+    assert _ledger(table).claim("E1") is None
+    assert _ledger(table, lock_seconds=-1).claim("E1") is not None
+
+
+def test_failed_event_resumes_from_checkpoints(table):
+    """失敗したイベントは再配信で再開し、記録済みのステップは再実行しないこと."""
+    create = MagicMock(return_value={"id": "cal-1"})
+    send = MagicMock(side_effect=RuntimeError("LINE down"))
+
+    with pytest.raises(RuntimeError):
+        with idempotency.event_scope("E1", _ledger(table)):
+            assert idempotency.once("calendar_create", create) == {"id": "cal-1"}
+            send()
+
+    assert table.get_item(Key={"event_id": "E1"})["Item"]["status"] == idempotency.STATUS_FAILED
+
+    with idempotency.event_scope("E1", _ledger(table)) as process:
+        assert process
+        assert idempotency.current().attempt == 2
+        assert idempotency.once("calendar_create", create) == {"id": "cal-1"}
+
+    create.assert_called_once()
+
+
+def test_once_runs_directly_outside_scope():
+    """スコープ外では毎回そのまま実行すること."""
+    fn = MagicMock(return_value="ok")
+    assert idempotency.once("step", fn) == "ok"
+    assert idempotency.once("step", fn) == "ok"
+    assert fn.call_count == 2
+
+
+def test_event_without_id_is_always_processed():
+    """webhookEventId がなければ記録せずに処理すること."""
+    ledger = idempotency.EventLedger(MagicMock(side_effect=AssertionError("no table")))
+    with idempotency.event_scope(None, ledger) as process:
+        assert process
+
+
+def test_ledger_failure_does_not_block_processing():
+    """DynamoDB に書けなくても処理は続け、L1 で重複を弾くこと."""
+    from botocore.exceptions import ClientError
+
+    broken = MagicMock()
+    broken.update_item.side_effect = ClientError(
+        {"Error": {"Code": "ResourceNotFoundException", "Message": "missing"}}, "UpdateItem"
+    )
+    ledger = idempotency.EventLedger(lambda: broken)
+
+    with idempotency.event_scope("E1", ledger) as process:
+        assert process
+        assert idempotency.once("step", lambda: 1) == 1
+    with idempotency.event_scope("E1", ledger) as process:
+        assert not process
+
+
+def test_dispatch_event_skips_redelivered_event(table):
+    """再配信されたイベントは Agent を呼ばずにスキップすること."""
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    ev = MessageEvent()
+    ev.source = MagicMock(user_id="U1")
+    ev.message = TextMessageContent()
+    ev.message.text = "こんにちは"
+    ev.reply_token = "token"
+    ev.webhook_event_id = "01HXYZ"
+    ev.delivery_context = types.SimpleNamespace(is_redelivery=False)
+
+    with (
+        patch.object(idx, "ledger", _ledger(table)),
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "_invoke_agent", return_value="応答") as mock_agent,
+        patch.object(idx, "send_response"),
+    ):
+        idx._dispatch_event(ev)
+        ev.delivery_context = types.SimpleNamespace(is_redelivery=True)
+        idx._dispatch_event(ev)
+
+    mock_agent.assert_called_once()
@@ -10,6 +10,8 @@ import pytest
 # "lambda" is a Python keyword, so we cannot use normal import syntax.
 # The module is pre-registered in sys.modules by conftest.py as "lambda.index".
 idx = sys.modules["lambda.index"]
+http_pool = sys.modules["http_pool"]
+envelope = sys.modules["envelope"]
 
 
 # ---------------------------------------------------------------------------
@@ -73,20 +75,16 @@ def test_invoke_router_agent_local():
         response_body = json.dumps({"result": "ローカル応答"}).encode("utf-8")
         mock_resp = MagicMock()
         mock_resp.read.return_value = response_body
-        mock_resp.__enter__ = MagicMock(return_value=mock_resp)
-        mock_resp.__exit__ = MagicMock(return_value=False)
 
         with (
-            patch("urllib.request.Request") as mock_request_cls,
-            patch("urllib.request.urlopen", return_value=mock_resp),
+            patch.object(http_pool.pool, "open", return_value=mock_resp) as mock_open,
             patch.object(idx, "_build_google_credentials", return_value=None),
         ):
             result = idx.invoke_router_agent("テスト", "U1234")
 
-        mock_request_cls.assert_called_once()
-        call_args = mock_request_cls.call_args
-        assert call_args[0][0] == "http://localhost:8080/invocations"
-        assert result == "ローカル応答"
+        mock_open.assert_called_once()
+        assert mock_open.call_args[0][:2] == ("POST", "http://localhost:8080/invocations")
+        assert result == envelope.text("ローカル応答")
     finally:
         idx.AGENTCORE_RUNTIME_ENDPOINT = original
 
@@ -108,21 +106,15 @@ def test_invoke_router_agent_with_credentials():
         response_body = json.dumps({"result": "応答"}).encode("utf-8")
         mock_resp = MagicMock()
         mock_resp.read.return_value = response_body
-        mock_resp.__enter__ = MagicMock(return_value=mock_resp)
-        mock_resp.__exit__ = MagicMock(return_value=False)
 
         with (
-            patch("urllib.request.Request") as mock_request_cls,
-            patch("urllib.request.urlopen", return_value=mock_resp),
+            patch.object(http_pool.pool, "open", return_value=mock_resp) as mock_open,
             patch.object(idx, "_build_google_credentials", return_value=fake_creds),
         ):
             result = idx.invoke_router_agent("予定を見せて", "U1234")
 
         # payload に google_credentials が含まれているか確認
-        call_args = mock_request_cls.call_args
-        # Request(url, data=..., headers=...) の data を取得
-        sent_bytes = call_args[0][1] if len(call_args[0]) > 1 else call_args[1].get("data")
-        sent_data = json.loads(sent_bytes.decode("utf-8"))
+        sent_data = json.loads(mock_open.call_args[1]["body"].decode("utf-8"))
         assert sent_data["prompt"] == "予定を見せて"
         assert sent_data["google_credentials"]["access_token"] == "tok"
     finally:
@@ -143,20 +135,57 @@ def test_invoke_router_agent_boto3():
         }
 
         with (
-            patch.object(idx, "boto3") as mock_boto3,
+            patch.object(idx.aws_clients, "get_client", return_value=mock_client) as mock_get_client,
             patch.object(idx, "_build_google_credentials", return_value=None),
         ):
-            mock_boto3.client.return_value = mock_client
             result = idx.invoke_router_agent("テストプロンプト", "U1234")
 
+        mock_get_client.assert_called_once_with("bedrock-agentcore", idx.AWS_REGION)
         call_kwargs = mock_client.invoke_agent_runtime.call_args.kwargs
         payload = json.loads(call_kwargs["payload"].decode("utf-8"))
         assert payload["prompt"] == "テストプロンプト"
         assert "google_credentials" not in payload
-        assert result == "AI応答"
+        assert result == envelope.text("AI応答")
+    finally:
+        idx.AGENTCORE_RUNTIME_ENDPOINT = original
+
+
+def test_invoke_router_agent_session_id_stable_per_user_and_day():
+    """同じユーザー・同じ日の呼び出しは同じ runtimeSessionId を送り、ユーザーや日付が違えば変わること."""
+    original = idx.AGENTCORE_RUNTIME_ENDPOINT
+    idx.AGENTCORE_RUNTIME_ENDPOINT = ""  # AWS ルート
+
+    try:
+        mock_client = MagicMock()
+        mock_client.invoke_agent_runtime.side_effect = lambda **kwargs: {
+            "contentType": "application/json",
+            "response": io.BytesIO(json.dumps({"result": "AI応答"}).encode("utf-8")),
+        }
+
+        with (
+            patch.object(idx.aws_clients, "get_client", return_value=mock_client),
+            patch.object(idx, "_build_google_credentials", return_value=None),
+        ):
+            idx.invoke_router_agent("1 回目", "U1234")
+            idx.invoke_router_agent("2 回目", "U1234")
+            idx.invoke_router_agent("別ユーザー", "U5678")
+
+        first, second, other = (
+            call.kwargs["runtimeSessionId"] for call in mock_client.invoke_agent_runtime.call_args_list
+        )
+        assert first == second
+        assert other != first
+        assert len(first) >= 33
+        assert "U1234" not in first
     finally:
         idx.AGENTCORE_RUNTIME_ENDPOINT = original
 
+    # JST の 0 時をまたぐと別のセッションになる (2024-01-01 23:59 JST と 2024-01-02 00:00 JST)
+    before = idx._runtime_session_id("U1234", now=1704121140)
+    after = idx._runtime_session_id("U1234", now=1704121200)
+    assert before != after
+    assert idx._runtime_session_id("U1234", now=1704121140 - 3600) == before
+
 
 # ---------------------------------------------------------------------------
 # handle_text_message tests
@@ -177,14 +206,15 @@ def test_handle_text_message_reply():
     with (
         patch.object(idx, "get_user_state", return_value=None),
         patch.object(idx, "show_loading") as mock_loading,
-        patch.object(idx, "invoke_router_agent", return_value="AI応答テスト") as mock_invoke,
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("AI応答テスト")) as mock_invoke,
         patch.object(idx, "send_response") as mock_send,
     ):
         event = _make_message_event()
         idx.handle_text_message(event)
 
         mock_loading.assert_called_once_with("U1234")
-        mock_invoke.assert_called_once_with("こんにちは", "U1234")
+        mock_invoke.assert_called_once_with("こんにちは", "U1234", google_credentials=None)
         mock_send.assert_called_once()
 
 
@@ -193,7 +223,8 @@ def test_handle_text_message_push_fallback():
     with (
         patch.object(idx, "get_user_state", return_value=None),
         patch.object(idx, "show_loading"),
-        patch.object(idx, "invoke_router_agent", return_value="遅延応答"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("遅延応答")),
         patch.object(idx, "reply_message", side_effect=Exception("expired")),
         patch.object(idx, "push_message") as mock_push,
         patch.object(idx, "time") as mock_time,
@@ -215,19 +246,12 @@ def test_handle_text_message_push_fallback():
 
 def test_show_loading():
     """show_loading_animation が正しい引数で呼ばれること."""
-    mock_api_client = MagicMock()
-    mock_api_client.__enter__ = MagicMock(return_value=mock_api_client)
-    mock_api_client.__exit__ = MagicMock(return_value=False)
-
     mock_api = MagicMock()
 
-    with (
-        patch.object(idx, "ApiClient", return_value=mock_api_client),
-        patch.object(idx, "MessagingApi", return_value=mock_api) as mock_api_cls,
-    ):
+    with patch.object(idx, "messenger", idx.line_messaging.LineMessenger("token")) as messenger:
+        messenger._api = mock_api
         idx.show_loading("U9999")
 
-    mock_api_cls.assert_called_once_with(mock_api_client)
     mock_api.show_loading_animation.assert_called_once()
     call_arg = mock_api.show_loading_animation.call_args[0][0]
     assert call_arg.chat_id == "U9999"
@@ -284,6 +308,41 @@ def test_convert_agent_response_place_empty():
     assert len(messages) == 1
 
 
+def _labelled_messages():
+    return (
+        patch.object(idx, "TextMessage", side_effect=lambda text, **kwargs: ("text", text)),
+        patch.object(idx, "_build_flex_message", side_effect=lambda flex: ("flex", flex.get("altText"))),
+    )
+
+
+def test_convert_agent_response_multi():
+    """type=multi は各結果のメッセージを順に並べること."""
+    response = json.dumps({
+        "type": "multi",
+        "parts": [
+            {"type": "place_search", "message": "検索結果です。", "places": [{"name": "Cafe A", "lat": "35.6", "lon": "139.7"}]},
+            {"type": "event_created", "message": "予定を作成しました。"},
+        ],
+    })
+    text_patch, flex_patch = _labelled_messages()
+    with text_patch, flex_patch:
+        messages = idx.convert_agent_response(response, "U1234")
+
+    assert [kind for kind, _ in messages] == ["text", "flex", "text"]
+    assert messages[2] == ("text", "予定を作成しました。")
+
+
+def test_convert_agent_response_multi_fits_reply_limit():
+    """メッセージ数が上限を超えるなら見出しを落として各結果の本体を残すこと."""
+    part = {"type": "place_search", "message": "検索結果です。", "places": [{"name": "Cafe", "lat": "35.6", "lon": "139.7"}]}
+    response = json.dumps({"type": "multi", "parts": [part, part, part]})
+    text_patch, flex_patch = _labelled_messages()
+    with text_patch, flex_patch:
+        messages = idx.convert_agent_response(response, "U1234")
+
+    assert [kind for kind, _ in messages] == ["flex", "flex", "flex"]
+
+
 # ---------------------------------------------------------------------------
 # location_request tests
 # ---------------------------------------------------------------------------
@@ -328,7 +387,8 @@ def test_handle_location_message_with_state():
         patch.object(idx, "get_user_state", return_value=waiting_state),
         patch.object(idx, "clear_user_state") as mock_clear,
         patch.object(idx, "show_loading"),
-        patch.object(idx, "invoke_router_agent", return_value="AI応答") as mock_invoke,
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("AI応答")) as mock_invoke,
         patch.object(idx, "send_response") as mock_send,
     ):
         idx.handle_location_message(event)
@@ -354,7 +414,8 @@ def test_handle_location_message_without_state():
     with (
         patch.object(idx, "get_user_state", return_value=None),
         patch.object(idx, "show_loading"),
-        patch.object(idx, "invoke_router_agent", return_value="AI応答") as mock_invoke,
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("AI応答")) as mock_invoke,
         patch.object(idx, "send_response"),
     ):
         idx.handle_location_message(event)
@@ -374,7 +435,8 @@ def test_handle_text_message_clears_waiting_location():
         patch.object(idx, "get_user_state", return_value=waiting_state),
         patch.object(idx, "clear_user_state") as mock_clear,
         patch.object(idx, "show_loading"),
-        patch.object(idx, "invoke_router_agent", return_value="テスト応答") as mock_invoke,
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("テスト応答")) as mock_invoke,
         patch.object(idx, "send_response"),
     ):
         event = _make_message_event(text="渋谷のカフェ教えて")
@@ -382,7 +444,58 @@ def test_handle_text_message_clears_waiting_location():
 
         # ステートがクリアされ、通常テキスト処理が行われること
         mock_clear.assert_called_once_with("U1234")
-        mock_invoke.assert_called_once_with("渋谷のカフェ教えて", "U1234")
+        mock_invoke.assert_called_once_with("渋谷のカフェ教えて", "U1234", google_credentials=None)
+
+
+def test_handle_text_message_parses_envelope_once():
+    """Router の応答 (エンベロープ) を解析し直さず、ステート保存と変換に同じオブジェクトを使うこと."""
+    ai_response = envelope.make("location_request", "位置情報を送ってもらえますか？")
+
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "save_user_state") as mock_save,
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=ai_response),
+        patch.object(idx, "convert_agent_response", return_value=["quick_reply"]) as mock_convert,
+        patch.object(idx, "send_response"),
+        patch.object(idx.json, "loads", side_effect=AssertionError("re-parsed")),
+    ):
+        idx.handle_text_message(_make_message_event(text="近くのカフェ"))
+
+    mock_save.assert_called_once_with("U1234", {"action": "waiting_location", "original_query": "近くのカフェ"})
+    assert mock_convert.call_args.args[0] is ai_response
+
+
+def test_convert_agent_response_extracts_from_surrounding_text():
+    """前後の説明文や説明文中の括弧があっても JSON の部分だけを変換し、JSON でなければテキストで返すこと."""
+    idx.TextMessage.reset_mock()
+    response = '結果です {name} は置換されません。\n{"type": "event_deleted", "message": "削除しました"}\n以上です。'
+
+    idx.convert_agent_response(response, "U1234")
+    assert idx.TextMessage.call_args[1]["text"] == "削除しました"
+
+    idx.convert_agent_response("  ただのテキスト  ", "U1234")
+    assert idx.TextMessage.call_args[1]["text"] == "ただのテキスト"
+
+
+def test_every_envelope_type_has_a_renderer():
+    """エンベロープのすべての type に描画関数が登録されていること."""
+    assert set(idx._RENDERERS) == set(envelope.SCHEMAS)
+
+
+def test_convert_agent_response_uses_registered_renderer():
+    """type に登録した描画関数で変換し、スキーマに合わないエンベロープはテキストで返すこと."""
+    idx.TextMessage.reset_mock()
+    renderer = MagicMock(return_value=["rendered"])
+    with patch.dict(idx._RENDERERS, {"event_deleted": renderer}):
+        messages = idx.convert_agent_response({"type": "event_deleted", "message": "削除しました"}, "U1234")
+
+    assert messages == ["rendered"]
+    assert renderer.call_args.args == (envelope.make("event_deleted", "削除しました"), "U1234")
+
+    idx.convert_agent_response({"type": "calendar_events", "message": "予定です", "events": "e1"}, "U1234")
+    assert idx.TextMessage.call_args[1]["text"] == "予定です"
 
 
 # ---------------------------------------------------------------------------
@@ -493,22 +606,47 @@ def test_invoke_router_agent_passes_line_user_id():
         response_body = json.dumps({"result": "応答"}).encode("utf-8")
         mock_resp = MagicMock()
         mock_resp.read.return_value = response_body
-        mock_resp.__enter__ = MagicMock(return_value=mock_resp)
-        mock_resp.__exit__ = MagicMock(return_value=False)
 
         with (
-            patch("urllib.request.Request") as mock_request_cls,
-            patch("urllib.request.urlopen", return_value=mock_resp),
+            patch.object(http_pool.pool, "open", return_value=mock_resp) as mock_open,
             patch.object(idx, "_build_google_credentials", return_value=None),
         ):
             result = idx.invoke_router_agent("テスト", "U5678")
 
-        call_args = mock_request_cls.call_args
-        sent_bytes = call_args[0][1] if len(call_args[0]) > 1 else call_args[1].get("data")
-        sent_data = json.loads(sent_bytes.decode("utf-8"))
+        sent_data = json.loads(mock_open.call_args[1]["body"].decode("utf-8"))
         assert sent_data["prompt"] == "テスト"
         assert sent_data["line_user_id"] == "U5678"
-        assert result == "応答"
+        assert result == envelope.text("応答")
+    finally:
+        idx.AGENTCORE_RUNTIME_ENDPOINT = original
+
+
+def test_invoke_router_agent_passes_reply_deadline():
+    """payload の deadline_ms は reply token の残り時間 (イベント外なら TIMEOUT_SECONDS) になること."""
+    import time
+    import types
+
+    reply_scheduler = sys.modules["reply_scheduler"]
+    original = idx.AGENTCORE_RUNTIME_ENDPOINT
+    idx.AGENTCORE_RUNTIME_ENDPOINT = "http://localhost:8080"
+
+    try:
+        mock_resp = MagicMock()
+        mock_resp.read.return_value = json.dumps({"result": "応答"}).encode("utf-8")
+        ev = types.SimpleNamespace(reply_token="tok", timestamp=(time.time() - 40) * 1000)
+
+        with (
+            patch.object(http_pool.pool, "open", return_value=mock_resp) as mock_open,
+            patch.object(idx, "_build_google_credentials", return_value=None),
+        ):
+            idx.invoke_router_agent("テスト", "U1")
+            with reply_scheduler.event_scope(ev):
+                idx.invoke_router_agent("テスト", "U1")
+
+        budgets = [json.loads(c[1]["body"])["deadline_ms"] for c in mock_open.call_args_list]
+        assert budgets[0] == idx.TIMEOUT_SECONDS * 1000
+        expected = (reply_scheduler.REPLY_TOKEN_TTL_SECONDS - reply_scheduler.REPLY_SAFETY_MARGIN_SECONDS - 40) * 1000
+        assert expected - 1000 < budgets[1] <= expected
     finally:
         idx.AGENTCORE_RUNTIME_ENDPOINT = original
 
@@ -595,3 +733,620 @@ def test_lambda_handler_location_message():
         result = idx.lambda_handler(event, None)
         assert result["statusCode"] == 200
         mock_handle.assert_called_once_with(mock_event)
+
+
+# ---------------------------------------------------------------------------
+# Ingest → Worker (async mode) tests
+# ---------------------------------------------------------------------------
+
+event_queue = sys.modules["event_queue"]
+
+
+def _webhook_body(*user_ids):
+    return json.dumps({
+        "destination": "Udest",
+        "events": [
+            {
+                "type": "message",
+                "webhookEventId": f"ev-{i}",
+                "source": {"type": "user", "userId": uid},
+                "replyToken": f"tok-{i}",
+                "message": {"type": "text", "id": str(i), "text": "こんにちは"},
+            }
+            for i, uid in enumerate(user_ids)
+        ],
+    })
+
+
+def test_lambda_handler_async_mode_enqueues_without_processing():
+    """async モードでは署名検証後にキュー投入だけ行い、ハンドラを呼ばずに 200 を返すこと."""
+    queue = event_queue.InMemoryEventQueue()
+    original_mode = idx.WEBHOOK_MODE
+    idx.WEBHOOK_MODE = "async"
+
+    try:
+        with (
+            patch.object(idx, "parser") as mock_parser,
+            patch.object(idx, "handle_text_message") as mock_handle,
+            patch.object(event_queue, "get_event_queue", return_value=queue),
+        ):
+            mock_parser.parse.return_value = [MagicMock(), MagicMock()]
+            event = {"body": _webhook_body("U1", "U2"), "headers": {"x-line-signature": "valid"}}
+            result = idx.lambda_handler(event, None)
+
+        assert result["statusCode"] == 200
+        mock_handle.assert_not_called()
+        assert len(queue) == 2
+        messages = queue.receive()
+        assert [m.group_id for m in messages] == ["U1", "U2"]
+        assert messages[0].payload["destination"] == "Udest"
+    finally:
+        idx.WEBHOOK_MODE = original_mode
+
+
+def test_lambda_handler_async_mode_rejects_invalid_signature():
+    """async モードでも署名不正なら enqueue しないこと."""
+    from linebot.v3.exceptions import InvalidSignatureError
+
+    queue = event_queue.InMemoryEventQueue()
+    original_mode = idx.WEBHOOK_MODE
+    idx.WEBHOOK_MODE = "async"
+
+    try:
+        with (
+            patch.object(idx, "parser") as mock_parser,
+            patch.object(event_queue, "get_event_queue", return_value=queue),
+        ):
+            mock_parser.parse.side_effect = InvalidSignatureError("bad sig")
+            event = {"body": _webhook_body("U1"), "headers": {"x-line-signature": "bad"}}
+            result = idx.lambda_handler(event, None)
+
+        assert result["statusCode"] == 403
+        assert len(queue) == 0
+    finally:
+        idx.WEBHOOK_MODE = original_mode
+
+
+def test_drain_event_queue_dispatches_events():
+    """drain_event_queue がキュー内のイベントを復元してディスパッチすること."""
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    queue = event_queue.InMemoryEventQueue()
+    for raw in json.loads(_webhook_body("U1", "U2"))["events"]:
+        queue.enqueue(event_queue.build_message(raw), event_queue.group_id_for(raw))
+
+    def fake_deserialize(raw):
+        ev = MessageEvent()
+        ev.message = TextMessageContent()
+        ev.webhook_event_id = raw["webhookEventId"]
+        return ev
+
+    with (
+        patch.object(idx, "_deserialize_event", side_effect=fake_deserialize),
+        patch.object(idx, "handle_text_message") as mock_handle,
+    ):
+        processed = idx.drain_event_queue(queue)
+
+    assert processed == 2
+    # 別ユーザーのイベントは並列に処理されるため順不同
+    assert sorted(c.args[0].webhook_event_id for c in mock_handle.call_args_list) == ["ev-0", "ev-1"]
+    assert len(queue) == 0
+
+
+def test_drain_event_queue_redelivers_failed_and_skipped():
+    """ハンドラが失敗したメッセージと同じユーザーの後続は ack されず、再配信されて処理されること."""
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    queue = event_queue.InMemoryEventQueue(visibility_timeout=0)
+    for raw in json.loads(_webhook_body("U1", "U1"))["events"]:
+        raw["webhookEventId"] = f"retry-{raw['webhookEventId']}"  # 他のテストの処理記録と重ならない ID
+        queue.enqueue(event_queue.build_message(raw), event_queue.group_id_for(raw))
+
+    def fake_deserialize(raw):
+        ev = MessageEvent()
+        ev.message = TextMessageContent()
+        ev.webhook_event_id = raw["webhookEventId"]
+        return ev
+
+    handled = []
+
+    def flaky_handle(ev):
+        handled.append(ev.webhook_event_id)
+        if len(handled) == 1:
+            raise RuntimeError("一時的な失敗")
+
+    with (
+        patch.object(idx, "_deserialize_event", side_effect=fake_deserialize),
+        patch.object(idx, "handle_text_message", side_effect=flaky_handle),
+    ):
+        processed = idx.drain_event_queue(queue)
+
+    # 1 回目: ev-0 が失敗し ev-1 は処理しない. 再配信で ev-0 → ev-1 の順に処理される
+    assert handled == ["retry-ev-0", "retry-ev-0", "retry-ev-1"]
+    assert processed == 2
+    assert len(queue) == 0
+
+
+def test_worker_handler_reports_partial_failures():
+    """worker_handler は失敗したレコードだけを batchItemFailures で返すこと."""
+    raw_events = json.loads(_webhook_body("U1", "U2"))["events"]
+    records = [
+        {"messageId": f"m{i}", "body": json.dumps(event_queue.build_message(raw))}
+        for i, raw in enumerate(raw_events)
+    ]
+
+    def process(payload):
+        if payload["event"]["webhookEventId"] == "ev-1":
+            raise RuntimeError("boom")
+
+    with patch.object(idx, "_process_queued_message", side_effect=process):
+        result = idx.worker_handler({"Records": records}, None)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+
+
+def test_worker_handler_fails_rest_of_group_after_error():
+    """同一ユーザーのメッセージが失敗したら、後続も再配信対象にして順序を守ること."""
+    raw_events = json.loads(_webhook_body("U1", "U1", "U2"))["events"]
+    records = [
+        {"messageId": f"m{i}", "body": json.dumps(event_queue.build_message(raw))}
+        for i, raw in enumerate(raw_events)
+    ]
+    processed = []
+
+    def process(payload):
+        if payload["event"]["webhookEventId"] == "ev-0":
+            raise RuntimeError("boom")
+        processed.append(payload["event"]["webhookEventId"])
+
+    with patch.object(idx, "_process_queued_message", side_effect=process):
+        result = idx.worker_handler({"Records": records}, None)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m0"}, {"itemIdentifier": "m1"}]}
+    assert processed == ["ev-2"]
+
+
+# ---------------------------------------------------------------------------
+# Concurrent dispatch tests
+# ---------------------------------------------------------------------------
+
+
+def _text_event(user_id, text):
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    ev = MessageEvent()
+    ev.source = MagicMock(user_id=user_id)
+    ev.message = TextMessageContent()
+    ev.message.text = text
+    return ev
+
+
+def test_lambda_handler_isolates_event_errors():
+    """1 イベントの例外が他ユーザーのイベント処理を妨げないこと."""
+    events = [_text_event("U1", "a"), _text_event("U2", "b"), _text_event("U3", "c")]
+    handled = []
+
+    def handle(ev):
+        if ev.source.user_id == "U2":
+            raise RuntimeError("boom")
+        handled.append(ev.source.user_id)
+
+    with (
+        patch.object(idx, "parser") as mock_parser,
+        patch.object(idx, "handle_text_message", side_effect=handle),
+    ):
+        mock_parser.parse.return_value = events
+        result = idx.lambda_handler({"body": "{}", "headers": {"x-line-signature": "valid"}}, None)
+
+    assert result["statusCode"] == 200
+    assert sorted(handled) == ["U1", "U3"]
+
+
+def test_event_key_prefers_user_id():
+    """順序保証キーは user_id → group_id → room_id の順で決まること."""
+    ev = MagicMock()
+    ev.source = MagicMock(user_id=None, group_id="G1", room_id=None)
+    assert idx._event_key(ev) == "G1"
+    ev.source = MagicMock(user_id="U1", group_id="G1", room_id=None)
+    assert idx._event_key(ev) == "U1"
+
+
+# ---------------------------------------------------------------------------
+# Prefetch tests
+# ---------------------------------------------------------------------------
+
+
+def test_handle_text_message_prefetches_in_parallel():
+    """ステート読み込み・認証情報・ローディング表示が並列に実行され、認証情報が Agent に渡ること."""
+    import time as _time
+
+    fake_creds = {"access_token": "ya29"}
+
+    def slow(value):
+        def _fn(*args):
+            _time.sleep(0.05)
+            return value
+        return _fn
+
+    with (
+        patch.object(idx, "get_user_state", side_effect=slow(None)),
+        patch.object(idx, "_build_google_credentials", side_effect=slow(fake_creds)),
+        patch.object(idx, "show_loading", side_effect=slow(None)),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("応答")) as mock_invoke,
+        patch.object(idx, "send_response"),
+    ):
+        start = _time.monotonic()
+        idx.handle_text_message(_make_message_event())
+        elapsed = _time.monotonic() - start
+
+    assert elapsed < 0.14  # 逐次なら 0.15 秒以上
+    mock_invoke.assert_called_once_with("こんにちは", "U1234", google_credentials=fake_creds)
+
+
+def test_handle_text_message_resolves_credentials_when_prefetch_fails():
+    """認証情報の prefetch に失敗した場合は invoke_router_agent 側で解決させること."""
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "_build_google_credentials", side_effect=RuntimeError("ddb")),
+        patch.object(idx, "show_loading", side_effect=RuntimeError("429")),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("応答")) as mock_invoke,
+        patch.object(idx, "send_response") as mock_send,
+    ):
+        idx.handle_text_message(_make_message_event())
+
+    mock_invoke.assert_called_once_with("こんにちは", "U1234")
+    mock_send.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# User state (DynamoDB via aws_clients) tests
+# ---------------------------------------------------------------------------
+
+
+def test_user_state_roundtrip_with_shared_table(monkeypatch):
+    """save / get / clear が共有 Table リソース経由で DynamoDB を操作すること."""
+    import boto3
+    from moto import mock_aws
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    idx.aws_clients.reset()
+    try:
+        with mock_aws():
+            boto3.client("dynamodb", region_name=idx.AWS_REGION).create_table(
+                TableName=idx.USER_STATE_TABLE,
+                KeySchema=[{"AttributeName": "line_user_id", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "line_user_id", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST",
+            )
+            idx.save_user_state("U1", {"action": "edit_title", "date": "2026-01-01"})
+            assert idx.get_user_state("U1") == {"action": "edit_title", "date": "2026-01-01"}
+            idx.clear_user_state("U1")
+            assert idx.get_user_state("U1") is None
+    finally:
+        idx.aws_clients.reset()
+
+
+# ---------------------------------------------------------------------------
+# Streaming (local AgentCore stand-in) tests
+# ---------------------------------------------------------------------------
+
+
+class _StreamingAgentStandIn:
+    """SSE を返す AgentCore のローカルスタンドイン.
+
+    result を送った後、tail_delay 秒待ってから残りの delta を送る。
+    """
+
+    def __init__(self, envelope: dict, tail_delay: float = 0.5):
+        import http.server
+        import threading
+
+        stand_in = self
+        self.payloads = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                import time as _time
+
+                length = int(self.headers["Content-Length"])
+                stand_in.payloads.append(json.loads(self.rfile.read(length)))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for event in (
+                    {"event": "delta", "text": "{\"type\""},
+                    {"event": "result", "result": envelope, "status": "success"},
+                ):
+                    self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                _time.sleep(tail_delay)
+                self.wfile.write(b'data: {"event": "delta", "text": "tail"}\n\n')
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_invoke_router_agent_streams_and_returns_early():
+    """result イベントが届いた時点で返り、残りは drain_after の終了時に読み捨てること."""
+    import time as _time
+
+    expected = {"v": 1, "type": "text", "message": "ストリーミング応答"}
+    original = (idx.AGENTCORE_RUNTIME_ENDPOINT, idx.AGENT_STREAMING)
+
+    with _StreamingAgentStandIn(expected, tail_delay=0.5) as stand_in:
+        idx.AGENTCORE_RUNTIME_ENDPOINT = stand_in.url
+        idx.AGENT_STREAMING = True
+        try:
+            with patch.object(idx, "_build_google_credentials", return_value=None):
+                with idx.agent_stream.drain_after():
+                    start = _time.monotonic()
+                    result = idx.invoke_router_agent("こんにちは", "U1234")
+                    time_to_envelope = _time.monotonic() - start
+                total = _time.monotonic() - start
+        finally:
+            idx.AGENTCORE_RUNTIME_ENDPOINT, idx.AGENT_STREAMING = original
+
+    assert result.to_dict() == expected
+    assert stand_in.payloads[0]["stream"] is True
+    assert time_to_envelope < 0.4
+    assert total >= 0.5
+
+
+def test_invoke_router_agent_streaming_boto3():
+    """AgentCore が text/event-stream を返した場合も逐次パースし、旧形式 (JSON 文字列の result) も読めること."""
+    body = MagicMock()
+    body.iter_chunks.return_value = iter([
+        b'data: {"event": "delta", "text": "x"}\n\n',
+        b'data: {"event": "result", "result": "{\\"type\\": \\"text\\", \\"message\\": \\"ok\\"}"}\n\n',
+    ])
+    mock_client = MagicMock()
+    mock_client.invoke_agent_runtime.return_value = {"contentType": "text/event-stream", "response": body}
+
+    original = (idx.AGENTCORE_RUNTIME_ENDPOINT, idx.AGENT_STREAMING)
+    idx.AGENTCORE_RUNTIME_ENDPOINT = ""
+    idx.AGENT_STREAMING = True
+    try:
+        with (
+            patch.object(idx.aws_clients, "get_client", return_value=mock_client),
+            patch.object(idx, "_build_google_credentials", return_value=None),
+        ):
+            result = idx.invoke_router_agent("テスト", "U1234")
+    finally:
+        idx.AGENTCORE_RUNTIME_ENDPOINT, idx.AGENT_STREAMING = original
+
+    payload = json.loads(mock_client.invoke_agent_runtime.call_args.kwargs["payload"])
+    assert payload["stream"] is True
+    assert result == envelope.text("ok")
+    body.close.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# Reply scheduler tests
+# ---------------------------------------------------------------------------
+
+
+def _timed_text_event(user_id, text, age_seconds):
+    import time as _time
+
+    ev = _text_event(user_id, text)
+    ev.reply_token = f"token-{user_id}"
+    ev.timestamp = int((_time.time() - age_seconds) * 1000)
+    return ev
+
+
+def test_dispatch_event_pushes_when_reply_token_expired():
+    """イベント発生から reply token の期限を過ぎていれば reply を試さず push すること."""
+    ev = _timed_text_event("U1", "こんにちは", age_seconds=70)
+
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("応答")),
+        patch.object(idx, "reply_message") as mock_reply,
+        patch.object(idx, "push_message") as mock_push,
+    ):
+        idx._dispatch_event(ev)
+
+    mock_reply.assert_not_called()
+    mock_push.assert_called_once()
+
+
+def test_dispatch_event_replies_within_token_budget():
+    """reply token の期限内で予測レイテンシも収まるなら reply だけで返すこと."""
+    ev = _timed_text_event("U1", "こんにちは", age_seconds=1)
+
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx.reply_scheduler, "predictor", idx.reply_scheduler.LatencyPredictor(initial=2.0)),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("応答")),
+        patch.object(idx, "reply_message") as mock_reply,
+        patch.object(idx, "push_message") as mock_push,
+    ):
+        idx._dispatch_event(ev)
+
+    mock_reply.assert_called_once()
+    assert mock_reply.call_args[0][0] == "token-U1"
+    mock_push.assert_not_called()
+
+
+def test_dispatch_event_sends_interim_reply_when_agent_is_predicted_late():
+    """予測レイテンシが reply token の残り時間を超えるなら中間メッセージを reply し、回答は push すること."""
+    ev = _timed_text_event("U1", "こんにちは", age_seconds=40)
+
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx.reply_scheduler, "predictor", idx.reply_scheduler.LatencyPredictor(initial=30.0)),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("応答")) as mock_invoke,
+        patch.object(idx, "TextMessage") as mock_text,
+        patch.object(idx, "reply_message") as mock_reply,
+        patch.object(idx, "push_message") as mock_push,
+    ):
+        idx._dispatch_event(ev)
+
+    mock_reply.assert_called_once()
+    assert mock_reply.call_args[0][0] == "token-U1"
+    assert mock_text.call_args_list[0].kwargs == {"text": idx.INTERIM_REPLY_MESSAGE}
+    mock_invoke.assert_called_once()
+    mock_push.assert_called_once()
+
+
+def test_lambda_handler_passes_remaining_time_to_event_threads():
+    """Lambda context の残り時間が並列処理中の各イベントから参照できること."""
+    events = [_timed_text_event("U1", "a", 1), _timed_text_event("U2", "b", 1)]
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 20_000
+    seen = {}
+
+    def handle(ev):
+        seen[ev.source.user_id] = idx.reply_scheduler.current().lambda_remaining()
+
+    with (
+        patch.object(idx, "parser") as mock_parser,
+        patch.object(idx, "handle_text_message", side_effect=handle),
+    ):
+        mock_parser.parse.return_value = events
+        idx.lambda_handler({"body": "{}", "headers": {"x-line-signature": "valid"}}, context)
+
+    expected = 20 - idx.reply_scheduler.LAMBDA_SAFETY_MARGIN_SECONDS
+    assert seen == {"U1": expected, "U2": expected}
+
+
+def test_invoke_router_agent_records_latency():
+    """Agent 呼び出しの所要時間が予測器に記録されること."""
+    predictor = MagicMock()
+    with (
+        patch.object(idx.reply_scheduler, "predictor", predictor),
+        patch.object(idx, "_invoke_agent", return_value="ok"),
+    ):
+        assert idx.invoke_router_agent("hi", "U1", google_credentials=None) == envelope.text("ok")
+
+    predictor.observe.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# 意図の高速パス
+# ---------------------------------------------------------------------------
+
+_FAKE_CREDS = {"access_token": "at", "refresh_token": "rt", "client_id": "cid", "client_secret": "cs"}
+
+
+def test_handle_text_message_fast_path_skips_router():
+    """「今日の予定」は Router Agent を呼ばず Calendar API の結果をカルーセルで返すこと."""
+    events = [{"id": "e1", "summary": "会議", "start": "2026-10-17T10:00:00+09:00", "end": "2026-10-17T11:00:00+09:00"}]
+    idx.intent_classifier.stats.clear()
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=_FAKE_CREDS),
+        patch.object(idx.fast_path.google_calendar_api, "list_events", return_value=events) as mock_list,
+        patch.object(idx, "invoke_router_agent") as mock_invoke,
+        patch.object(idx, "convert_agent_response", return_value=["carousel"]) as mock_convert,
+        patch.object(idx, "send_response") as mock_send,
+    ):
+        idx.handle_text_message(_make_message_event(text="今日の予定は？"))
+
+    mock_invoke.assert_not_called()
+    date_from, date_to = mock_list.call_args.kwargs["date_from"], mock_list.call_args.kwargs["date_to"]
+    assert date_from == date_to
+    assert mock_convert.call_args.args[0] == envelope.make("calendar_events", "今日の予定です。", events=events)
+    mock_send.assert_called_once_with("token123", "U1234", ["carousel"])
+    snapshot = idx.intent_classifier.stats.snapshot()
+    assert snapshot["hit_rate"] == 1.0
+    assert snapshot["outcomes"]["fast_path:calendar_list"]["count"] == 1
+
+
+def test_handle_text_message_fast_path_falls_back_on_error():
+    """Google API が失敗したら Router Agent に任せること."""
+    idx.intent_classifier.stats.clear()
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=_FAKE_CREDS),
+        patch.object(idx.fast_path.google_gmail_api, "list_emails", side_effect=RuntimeError("api down")),
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("AI応答")) as mock_invoke,
+        patch.object(idx, "send_response"),
+    ):
+        idx.handle_text_message(_make_message_event(text="受信トレイ見せて"))
+
+    mock_invoke.assert_called_once_with("受信トレイ見せて", "U1234", google_credentials=_FAKE_CREDS)
+    snapshot = idx.intent_classifier.stats.snapshot()
+    assert snapshot["total"] == 1
+    assert snapshot["hit_rate"] == 0.0
+    assert set(snapshot["outcomes"]) == {"fallback:email_list", "router:email_list"}
+
+
+def test_handle_text_message_fast_path_requires_credentials():
+    """Google 未連携なら Router Agent (OAuth 案内) に任せること."""
+    with (
+        patch.object(idx, "get_user_state", return_value=None),
+        patch.object(idx, "show_loading"),
+        patch.object(idx, "_build_google_credentials", return_value=None),
+        patch.object(idx.fast_path, "answer") as mock_answer,
+        patch.object(idx, "invoke_router_agent", return_value=envelope.text("AI応答")) as mock_invoke,
+        patch.object(idx, "send_response"),
+    ):
+        idx.handle_text_message(_make_message_event(text="今日の予定"))
+
+    mock_answer.assert_not_called()
+    mock_invoke.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# トレース
+# ---------------------------------------------------------------------------
+
+tracing = sys.modules["tracing"]
+
+
+def test_lambda_handler_traces_event_and_propagates_to_router():
+    """Webhook → イベント → Router 呼び出しのスパンを作り、Router の payload に traceparent を入れること."""
+    exporter = tracing.MemoryExporter()
+    mock_resp = MagicMock()
+    mock_resp.headers = {"Content-Type": "application/json"}
+    mock_resp.read.return_value = json.dumps({"result": {"type": "text", "message": "応答"}}).encode("utf-8")
+    original = idx.AGENTCORE_RUNTIME_ENDPOINT
+    idx.AGENTCORE_RUNTIME_ENDPOINT = "http://localhost:8080"
+    tracing.set_exporter(exporter)
+    try:
+        with (
+            patch.object(idx, "parser") as mock_parser,
+            patch.object(http_pool.pool, "open", return_value=mock_resp) as mock_open,
+            patch.object(idx, "handle_text_message", side_effect=lambda ev: idx.invoke_router_agent("hi", "U1", None)),
+        ):
+            mock_parser.parse.return_value = [_text_event("U1", "hi")]
+            idx.lambda_handler(
+                {"body": "{}", "headers": {"x-line-signature": "valid"}, "requestContext": {"requestId": "req-1"}}, None
+            )
+    finally:
+        tracing.set_exporter(None)
+        idx.AGENTCORE_RUNTIME_ENDPOINT = original
+
+    spans = {s.name: s for s in exporter.spans}
+    webhook = spans["webhook"]
+    assert webhook.attributes["request.id"] == "req-1"
+    assert webhook.service == "line-webhook"
+    assert spans["webhook.verify_signature"].parent_span_id == webhook.span_id
+    assert spans["line.event"].parent_span_id == webhook.span_id
+    router_call = spans["router.call"]
+    assert router_call.parent_span_id == spans["line.event"].span_id
+    sent = json.loads(mock_open.call_args[1]["body"].decode("utf-8"))
+    assert sent["traceparent"] == router_call.traceparent()
@@ -0,0 +1,94 @@
+"""Tests for lambda/intent_classifier.py."""
+
+import sys
+from unittest.mock import patch
+
+import pytest
+
+intent_classifier = sys.modules["intent_classifier"]
+
+
+@pytest.mark.parametrize(
+    "text, name, params",
+    [
+        ("今日の予定", "calendar_list", {"period": "today"}),
+        ("今日の予定は？", "calendar_list", {"period": "today"}),
+        ("明日のスケジュール教えて", "calendar_list", {"period": "tomorrow"}),
+        ("今週の予定を見せてください", "calendar_list", {"period": "this_week"}),
+        ("受信トレイ見せて", "email_list", {"unread": False}),
+        ("新着メールある？", "email_list", {"unread": False}),
+        ("未読メールを確認", "email_list", {"unread": True}),
+    ],
+)
+def test_classify_confident(text, name, params):
+    """一覧表示の定型文は高い確信度で分類されること."""
+    intent = intent_classifier.classify(text)
+
+    assert intent.name == name
+    assert intent.params == params
+    assert intent.confident
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "明日14時に会議の予定を入れて",
+        "今日の予定を削除して",
+        "田中さんからのメールを探して",
+        "メール送って",
+        "来週の予定",
+        "今日の予定と受信トレイ",
+        "今日のメール",
+        "こんにちは",
+        "",
+    ],
+)
+def test_classify_leaves_other_requests_to_router(text):
+    """操作・検索・複合・無関係なメッセージは分類しないこと."""
+    assert intent_classifier.classify(text) is None
+
+
+@pytest.mark.parametrize("text", ["予定", "メール", "今日の会議の予定"])
+def test_classify_low_confidence(text):
+    """期間や対象が曖昧なもの・語彙外の語を含むものは確信度がしきい値未満になること."""
+    intent = intent_classifier.classify(text)
+
+    assert intent is not None
+    assert not intent.confident
+
+
+def test_classify_normalizes_width_and_punctuation():
+    """全角・半角や記号の違いを吸収すること."""
+    assert intent_classifier.classify("ＧＭＡＩＬの受信トレイ！！").name == "email_list"
+    assert intent_classifier.classify(" 今日 の 予定 ? ").confidence == 1.0
+
+
+def test_confident_uses_threshold():
+    """しきい値を上げると高速パスの対象から外れること."""
+    intent = intent_classifier.classify("今日の会議の予定")
+    with patch.object(intent_classifier, "INTENT_CONFIDENCE_THRESHOLD", intent.confidence):
+        assert intent.confident
+    with patch.object(intent_classifier, "INTENT_CONFIDENCE_THRESHOLD", 1.0):
+        assert not intent.confident
+
+
+def test_stats_hit_rate_and_latency():
+    """ヒット率・結果ごとのレイテンシ・確信度の分布を集計すること."""
+    stats = intent_classifier.IntentStats()
+    today = intent_classifier.classify("今日の予定")
+    vague = intent_classifier.classify("予定")
+
+    stats.record(intent_classifier.OUTCOME_FAST_PATH, today, 200)
+    stats.record(intent_classifier.OUTCOME_FAST_PATH, today, 400)
+    stats.record(intent_classifier.OUTCOME_ROUTER, vague, 6000)
+    stats.record(intent_classifier.OUTCOME_ROUTER, None, 5000)
+    snapshot = stats.snapshot()
+
+    assert snapshot["total"] == 4
+    assert snapshot["hit_rate"] == 0.5
+    assert snapshot["outcomes"]["fast_path:calendar_list"] == {"count": 2, "avg_ms": 300.0, "max_ms": 400}
+    assert snapshot["outcomes"]["router:none"]["count"] == 1
+    assert snapshot["confidence"]["calendar_list"] == {"0.7": 1, "0.9": 2}
+
+    stats.clear()
+    assert stats.snapshot()["total"] == 0
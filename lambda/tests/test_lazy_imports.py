@@ -0,0 +1,95 @@
+"""import 時に重いモジュールを読み込まないことの静的チェック.
+
+実際の import 時間は benchmarks/import_budget.py で計測する。ここでは
+エントリから import 時に辿れる lambda/ 内のモジュールのトップレベル import に
+遅延対象 (LAZY_MODULES) が含まれないことを AST で確認する。
+"""
+
+import ast
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent
+BUDGET_SCRIPT = LAMBDA_DIR.parent / "benchmarks" / "import_budget.py"
+
+_spec = importlib.util.spec_from_file_location("import_budget", BUDGET_SCRIPT)
+import_budget = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(import_budget)
+
+
+def _is_main_guard(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, ast.If)
+        and isinstance(node.test, ast.Compare)
+        and isinstance(node.test.left, ast.Name)
+        and node.test.left.id == "__name__"
+    )
+
+
+def _top_level_imports(path: Path) -> set[str]:
+    """関数・クラス・__main__ ブロックの外で import されるモジュール名."""
+    names: set[str] = set()
+    stack = list(ast.parse(path.read_text(encoding="utf-8")).body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module)
+        elif isinstance(node, (ast.If, ast.Try, ast.With)) and not _is_main_guard(node):
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                for child in getattr(node, field, []):
+                    stack.extend(child.body if isinstance(child, ast.ExceptHandler) else [child])
+    return names
+
+
+def _local_path(module: str) -> Path | None:
+    path = LAMBDA_DIR.joinpath(*module.split(".")).with_suffix(".py")
+    return path if path.exists() else None
+
+
+def _import_closure(entry: str) -> set[str]:
+    """entry から import 時に読み込まれるモジュール名 (lambda/ 内は再帰的に辿る)."""
+    seen: set[str] = set()
+    pending = [entry]
+    while pending:
+        module = pending.pop()
+        if module in seen:
+            continue
+        seen.add(module)
+        path = _local_path(module)
+        if path is not None:
+            pending.extend(_top_level_imports(path))
+    return seen
+
+
+@pytest.mark.parametrize("entry", sorted(import_budget.LAZY_MODULES))
+def test_entry_does_not_import_lazy_modules(entry):
+    """エントリの import 時に遅延対象モジュールを読み込まないこと."""
+    loaded = _import_closure(entry)
+    violations = [
+        module
+        for module in import_budget.LAZY_MODULES[entry]
+        if any(name == module or name.startswith(module + ".") for name in loaded)
+    ]
+    assert violations == []
+
+
+def test_parse_importtime():
+    """-X importtime の出力からモジュール・時間・深さを取り出せること."""
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       296 |        296 |       _json\n"
+        "import time:       642 |        937 |     json.scanner\n"
+        "import time:       637 |       1573 |   json.decoder\n"
+        "import time:       336 |       2591 | json\n"
+    )
+    records = import_budget.parse_importtime(stderr)
+
+    assert [(r.module, r.depth) for r in records] == [
+        ("_json", 3), ("json.scanner", 2), ("json.decoder", 1), ("json", 0),
+    ]
+    assert import_budget.entry_total_ms(records, "json") == 2.591
+    assert import_budget.lazy_violations(records, "index") == []
@@ -0,0 +1,85 @@
+"""Tests for lambda/line_messaging.py."""
+
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+line_messaging = sys.modules["line_messaging"]
+
+
+def test_api_client_is_created_once():
+    """ApiClient は初回アクセス時に 1 度だけ生成され、以降は使い回されること."""
+    messenger = line_messaging.LineMessenger("token", pool_size=8)
+
+    with (
+        patch.object(line_messaging, "ApiClient") as mock_client_cls,
+        patch.object(line_messaging, "MessagingApi") as mock_api_cls,
+        patch.object(line_messaging, "Configuration") as mock_config_cls,
+    ):
+        messenger.send(["a"], reply_token="tok")
+        messenger.send(["b"], to="U1")
+        messenger.show_loading("U1")
+
+    mock_config_cls.assert_called_once_with(access_token="token")
+    assert mock_config_cls.return_value.connection_pool_maxsize == 8
+    mock_client_cls.assert_called_once_with(mock_config_cls.return_value)
+    mock_api_cls.assert_called_once_with(mock_client_cls.return_value)
+    api = mock_api_cls.return_value
+    api.reply_message.assert_called_once()
+    api.push_message.assert_called_once()
+    api.show_loading_animation.assert_called_once()
+
+
+def test_send_reply_and_push():
+    """reply_token があれば reply、なければ push で送ること."""
+    messenger = line_messaging.LineMessenger("token")
+    messenger._api = MagicMock()
+
+    with (
+        patch.object(line_messaging, "ReplyMessageRequest") as mock_reply_req,
+        patch.object(line_messaging, "PushMessageRequest") as mock_push_req,
+    ):
+        messenger.send(["m"], reply_token="tok")
+        messenger.send(["m"], to="U1")
+
+    mock_reply_req.assert_called_once_with(replyToken="tok", messages=["m"])
+    mock_push_req.assert_called_once_with(to="U1", messages=["m"])
+
+    with pytest.raises(ValueError):
+        messenger.send(["m"])
+
+
+def test_stats_record_latency_and_errors():
+    """API 種別ごとに回数・エラー数・レイテンシが集計されること."""
+    messenger = line_messaging.LineMessenger("token")
+    messenger._api = MagicMock()
+    messenger._api.push_message.side_effect = RuntimeError("429")
+
+    messenger.send(["m"], reply_token="tok")
+    with pytest.raises(RuntimeError):
+        messenger.send(["m"], to="U1")
+
+    stats = messenger.stats()
+    assert stats["reply"]["count"] == 1
+    assert stats["reply"]["errors"] == 0
+    assert stats["push"] == {
+        "count": 1,
+        "errors": 1,
+        "avg_ms": stats["push"]["avg_ms"],
+        "max_ms": stats["push"]["max_ms"],
+    }
+    assert stats["reply"]["avg_ms"] >= 0
+
+
+def test_close_resets_client():
+    """close 後は次回アクセス時に ApiClient を作り直すこと."""
+    messenger = line_messaging.LineMessenger("token")
+    client = MagicMock()
+    messenger._api_client = client
+    messenger._api = MagicMock()
+
+    messenger.close()
+
+    client.close.assert_called_once()
+    assert messenger._api is None
@@ -0,0 +1,62 @@
+"""Tests for lambda/prefetch.py."""
+
+import contextvars
+import sys
+import time
+
+prefetch = sys.modules["prefetch"]
+
+
+def test_run_parallel_runs_branches_concurrently():
+    """各ブランチが並列に実行され、所要時間と短縮時間が記録されること."""
+
+    def slow(value):
+        def _fn():
+            time.sleep(0.05)
+            return value
+        return _fn
+
+    result = prefetch.run_parallel({"a": slow(1), "b": slow(2), "c": slow(3)})
+
+    assert result.values == {"a": 1, "b": 2, "c": 3}
+    assert result.errors == {}
+    assert set(result.timings_ms) == {"a", "b", "c"}
+    assert result.wall_ms < 140  # 逐次なら 150ms 以上
+    assert result.saved_ms > 0
+
+
+def test_run_parallel_isolates_errors():
+    """1 ブランチの例外は errors に入り、他のブランチの結果は得られること."""
+
+    def boom():
+        raise RuntimeError("boom")
+
+    result = prefetch.run_parallel({"ok": lambda: "v", "ng": boom})
+
+    assert result.ok("ok")
+    assert result.get("ok") == "v"
+    assert not result.ok("ng")
+    assert isinstance(result.errors["ng"], RuntimeError)
+    assert result.get("ng", "default") == "default"
+
+
+def test_run_parallel_timeout():
+    """timeout を超えたブランチは待たずに TimeoutError 扱いになること."""
+    result = prefetch.run_parallel(
+        {"fast": lambda: 1, "slow": lambda: time.sleep(0.3)},
+        timeout=0.05,
+    )
+
+    assert result.get("fast") == 1
+    assert isinstance(result.errors["slow"], TimeoutError)
+    assert result.wall_ms < 250
+
+
+def test_run_parallel_propagates_contextvars():
+    """呼び出し元の contextvars がブランチに引き継がれること."""
+    var = contextvars.ContextVar("var", default="unset")
+    var.set("request-1")
+
+    result = prefetch.run_parallel({"value": var.get})
+
+    assert result.get("value") == "request-1"
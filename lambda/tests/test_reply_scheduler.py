@@ -0,0 +1,107 @@
+"""Tests for lambda/reply_scheduler.py."""
+
+import sys
+import types
+
+reply_scheduler = sys.modules["reply_scheduler"]
+
+
+class _Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_remaining_counts_from_event_timestamp():
+    """reply token の残り時間はイベントの timestamp から数えること."""
+    clock = _Clock(1000.0)
+    deadline = reply_scheduler.ReplyDeadline("tok", event_timestamp_ms=990_000, clock=clock)
+
+    assert deadline.token_age() == 10.0
+    expected = reply_scheduler.REPLY_TOKEN_TTL_SECONDS - reply_scheduler.REPLY_SAFETY_MARGIN_SECONDS - 10
+    assert deadline.token_remaining() == expected
+    assert deadline.can_reply()
+
+    clock.now = 990.0 + reply_scheduler.REPLY_TOKEN_TTL_SECONDS
+    assert deadline.token_remaining() == 0
+    assert not deadline.can_reply()
+
+
+def test_token_without_timestamp_starts_now():
+    """timestamp がなければ生成時刻から数えること."""
+    clock = _Clock(50.0)
+    deadline = reply_scheduler.ReplyDeadline("tok", event_timestamp_ms=None, clock=clock)
+
+    assert deadline.token_age() == 0
+    assert deadline.can_reply()
+
+
+def test_replied_or_missing_token_cannot_reply():
+    """使用済み・token なしなら reply できないこと."""
+    deadline = reply_scheduler.ReplyDeadline("tok")
+    deadline.mark_replied()
+    assert not deadline.can_reply()
+    assert not reply_scheduler.ReplyDeadline(None).can_reply()
+
+
+def test_should_send_interim_when_prediction_exceeds_budget():
+    """予測レイテンシが reply token または Lambda の残り時間を超えるなら中間メッセージを送ること."""
+    clock = _Clock(100.0)
+    deadline = reply_scheduler.ReplyDeadline("tok", event_timestamp_ms=100_000, clock=clock)
+    budget = deadline.token_remaining()
+
+    assert not deadline.should_send_interim(budget - 1)
+    assert deadline.should_send_interim(budget + 1)
+
+    short_lambda = reply_scheduler.ReplyDeadline(
+        "tok", event_timestamp_ms=100_000, remaining_ms=lambda: 10_000, clock=clock
+    )
+    assert short_lambda.lambda_remaining() == 10 - reply_scheduler.LAMBDA_SAFETY_MARGIN_SECONDS
+    assert short_lambda.should_send_interim(9)
+
+    # すでに reply 済みなら中間メッセージは送れない
+    deadline.mark_replied()
+    assert not deadline.should_send_interim(budget + 1)
+
+
+def test_agent_budget_uses_lambda_remaining_after_interim_reply():
+    """Agent の予算は reply token の残り、reply 済みなら Lambda の残り時間になること."""
+    clock = _Clock(100.0)
+    deadline = reply_scheduler.ReplyDeadline(
+        "tok", event_timestamp_ms=100_000, remaining_ms=lambda: 300_000, clock=clock
+    )
+
+    assert deadline.agent_budget() == deadline.token_remaining()
+    deadline.mark_replied()
+    assert deadline.agent_budget() == 300 - reply_scheduler.LAMBDA_SAFETY_MARGIN_SECONDS
+
+
+def test_latency_predictor_tracks_observations():
+    """観測値の移動平均に追従し、ばらつきがあれば悲観寄りに予測すること."""
+    predictor = reply_scheduler.LatencyPredictor(initial=10.0)
+    assert predictor.predict() == 15.0
+
+    predictor.observe(4.0)
+    assert predictor.predict() == 6.0
+
+    for _ in range(30):
+        predictor.observe(4.0)
+    stable = predictor.predict()
+    predictor.observe(40.0)
+    assert predictor.predict() > stable
+
+
+def test_event_scope_uses_invocation_context():
+    """event_scope は invocation の Lambda 残り時間と イベントの reply token を使うこと."""
+    context = types.SimpleNamespace(get_remaining_time_in_millis=lambda: 30_000)
+    ev = types.SimpleNamespace(reply_token="tok", timestamp=None)
+
+    assert reply_scheduler.current() is None
+    with reply_scheduler.invocation(context):
+        with reply_scheduler.event_scope(ev) as deadline:
+            assert reply_scheduler.current() is deadline
+            assert deadline.reply_token == "tok"
+            assert deadline.lambda_remaining() == 30 - reply_scheduler.LAMBDA_SAFETY_MARGIN_SECONDS
+    assert reply_scheduler.current() is None
@@ -0,0 +1,31 @@
+"""agent/ と lambda/ に同じものを置いているモジュールのテスト.
+
+Lambda の zip と AgentCore のコンテナイメージはそれぞれ lambda/・agent/ だけを
+パッケージするため、両方で使うモジュールは同じファイルを 2 か所に置いている。
+片方だけを直すと Router と Lambda の間でエンベロープやトレースの形式がずれるので、
+ここで内容が一致していることを確かめる。
+"""
+
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+
+SHARED_MODULES = [
+    "envelope.py",
+    "google_services.py",
+    "http_pool.py",
+    "json_extract.py",
+    "sse.py",
+    "tracing.py",
+]
+
+
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_agent_and_lambda_copies_are_identical(name):
+    """agent/ と lambda/ のファイルが 1 バイトも違わないこと (直すときは両方をそろえる)."""
+    agent_copy = (ROOT / "agent" / name).read_bytes()
+    lambda_copy = (ROOT / "lambda" / name).read_bytes()
+
+    assert agent_copy == lambda_copy, f"agent/{name} と lambda/{name} が食い違っている"
@@ -0,0 +1,207 @@
+"""Tests for lambda/user_session.py."""
+
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+user_session = sys.modules["user_session"]
+idx = sys.modules["lambda.index"]
+
+
+class _CountingTable:
+    """moto の Table を包んで呼び出し回数を数える."""
+
+    def __init__(self, table):
+        self._table = table
+        self.calls: list[str] = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        if name in ("get_item", "put_item", "delete_item", "update_item"):
+            def _wrapped(**kwargs):
+                self.calls.append(name)
+                return attr(**kwargs)
+            return _wrapped
+        return attr
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        raw = dynamodb.create_table(
+            TableName="UserSessionState",
+            KeySchema=[{"AttributeName": "line_user_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "line_user_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield _CountingTable(raw)
+
+
+def _session(table, user_id="U1"):
+    return user_session.UserSession(user_id, lambda: table)
+
+
+def test_loads_once_and_commits_once(table):
+    """何度読み書きしても get 1 回 + put 1 回になること."""
+    session = _session(table)
+    assert session.get() is None
+    session.set({"action": "select_date"})
+    session.clear()
+    session.set({"action": "edit_title", "date": "2026-01-01"})
+    assert session.get() == {"action": "edit_title", "date": "2026-01-01"}
+    session.commit()
+
+    assert table.calls == ["get_item", "put_item"]
+    item = table.get_item(Key={"line_user_id": "U1"})["Item"]
+    assert item["version"] == 1
+    assert "edit_title" in item["state"]
+
+
+def test_no_write_without_changes(table):
+    """変更がなければ書き込まないこと."""
+    session = _session(table)
+    session.get()
+    session.commit()
+    assert table.calls == ["get_item"]
+
+
+def test_clear_missing_item_skips_delete(table):
+    """もともとアイテムがなければ clear しても delete しないこと."""
+    session = _session(table)
+    session.clear()
+    session.commit()
+    assert table.calls == ["get_item"]
+
+
+def test_version_increments_and_delete(table):
+    """コミットごとに version が進み、clear で削除されること."""
+    first = _session(table)
+    first.set({"action": "a"})
+    first.commit()
+
+    second = _session(table)
+    assert second.get() == {"action": "a"}
+    second.set({"action": "b"})
+    second.commit()
+    assert table.get_item(Key={"line_user_id": "U1"})["Item"]["version"] == 2
+
+    third = _session(table)
+    third.clear()
+    third.commit()
+    assert "Item" not in table.get_item(Key={"line_user_id": "U1"})
+
+
+def test_concurrent_update_conflicts(table):
+    """同じ version を読んだ 2 つのセッションは後からコミットした方が失敗すること."""
+    seed = _session(table)
+    seed.set({"action": "a"})
+    seed.commit()
+
+    lambda_a = _session(table)
+    lambda_b = _session(table)
+    lambda_a.get()
+    lambda_b.get()
+
+    lambda_a.set({"action": "from_a"})
+    lambda_a.commit()
+    lambda_b.set({"action": "from_b"})
+    with pytest.raises(user_session.StateConflictError):
+        lambda_b.commit()
+
+    assert "from_a" in table.get_item(Key={"line_user_id": "U1"})["Item"]["state"]
+
+
+def test_concurrent_create_conflicts(table):
+    """両方ともアイテムなしと読んだ場合も後勝ちで上書きしないこと."""
+    lambda_a = _session(table)
+    lambda_b = _session(table)
+    lambda_a.set({"action": "from_a"})
+    lambda_b.set({"action": "from_b"})
+    lambda_a.commit()
+    with pytest.raises(user_session.StateConflictError):
+        lambda_b.commit()
+
+
+def test_legacy_item_without_version(table):
+    """version 属性のない既存アイテムも更新できること."""
+    table.put_item(Item={"line_user_id": "U1", "state": '{"action": "old"}'})
+    session = _session(table)
+    assert session.get() == {"action": "old"}
+    session.set({"action": "new"})
+    session.commit()
+    assert table.get_item(Key={"line_user_id": "U1"})["Item"]["version"] == 1
+
+
+def test_session_scope_commits_and_discards(table):
+    """正常終了でコミットし、例外時は破棄すること."""
+    with user_session.session_scope("U1", lambda: table) as session:
+        assert user_session.current("U1") is session
+        assert user_session.current("U2") is None
+        session.set({"action": "a"})
+    assert user_session.current("U1") is None
+    assert table.get_item(Key={"line_user_id": "U1"})["Item"]["version"] == 1
+
+    with pytest.raises(RuntimeError):
+        with user_session.session_scope("U1", lambda: table) as session:
+            session.set({"action": "b"})
+            raise RuntimeError("boom")
+    assert "\"a\"" in table.get_item(Key={"line_user_id": "U1"})["Item"]["state"]
+
+
+def test_session_scope_swallows_conflict(table):
+    """コミット時の競合はログだけ出して先行の書き込みを残すこと."""
+    with user_session.session_scope("U1", lambda: table) as session:
+        session.get()
+        other = _session(table)
+        other.set({"action": "other"})
+        other.commit()
+        session.set({"action": "mine"})
+
+    assert "other" in table.get_item(Key={"line_user_id": "U1"})["Item"]["state"]
+
+
+def test_index_state_helpers_use_session(table, monkeypatch):
+    """_dispatch_event 内の get / clear / save は 1 回の読み込みと 1 回の書き込みになること."""
+    from unittest.mock import MagicMock, patch
+
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    monkeypatch.setattr(idx, "_state_table", lambda: table)
+    table.put_item(Item={"line_user_id": "U1", "state": '{"action": "waiting_location"}', "version": 3})
+    table.calls.clear()
+
+    def handler(ev):
+        assert idx.get_user_state("U1") == {"action": "waiting_location"}
+        idx.clear_user_state("U1")
+        assert idx.get_user_state("U1") is None
+        idx.save_user_state("U1", {"action": "date_selection"})
+
+    ev = MessageEvent()
+    ev.source = MagicMock(user_id="U1")
+    ev.message = TextMessageContent()
+    with patch.object(idx, "handle_text_message", side_effect=handler):
+        idx._dispatch_event(ev)
+
+    assert table.calls == ["get_item", "put_item"]
+    item = table.get_item(Key={"line_user_id": "U1"})["Item"]
+    assert item["version"] == 4
+    assert "date_selection" in item["state"]
+
+
+def test_index_save_outside_session_bumps_version(table, monkeypatch):
+    """セッション外の save でも version が進み、セッション側で競合を検知できること."""
+    monkeypatch.setattr(idx, "_state_table", lambda: table)
+    session = _session(table)
+    session.get()
+
+    idx.save_user_state("U1", {"action": "direct"})
+    assert table.get_item(Key={"line_user_id": "U1"})["Item"]["version"] == 1
+
+    session.set({"action": "stale"})
+    with pytest.raises(user_session.StateConflictError):
+        session.commit()
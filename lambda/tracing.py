@@ -0,0 +1,333 @@
+"""分散トレース (Webhook → Router → サブエージェント → Google / LINE).
+
+1 つの LINE イベントの処理をスパンの木として記録する。スパンは OpenTelemetry
+(OTLP/JSON) と同じ traceId / spanId / parentSpanId / startTimeUnixNano / endTimeUnixNano を持ち、
+トレースコンテキストは W3C traceparent 形式で payload の traceparent に入れて
+Router・サブエージェントへ伝搬する。
+
+Lambda のコールドスタートと Agent コンテナのイメージを増やさないよう
+OpenTelemetry SDK には依存しない。出力先は TRACE_EXPORTER で選ぶ。
+
+- none: 記録しない (既定. スパンを作らず traceparent も付けない)
+- console: 1 スパン 1 行の JSON をログに出す (CloudWatch Logs から集める)
+- file: TRACE_FILE_PATH に JSON Lines で追記する (ローカル開発)
+
+scripts/trace_waterfall.py で 1 リクエスト分のスパンをウォーターフォールで表示する。
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# スパンの出力先 (none / console / file)
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none").lower()
+# TRACE_EXPORTER=file の出力先
+TRACE_FILE_PATH = os.environ.get("TRACE_FILE_PATH", "/tmp/traces.jsonl")
+
+PAYLOAD_KEY = "traceparent"
+# console 出力の行頭 (ログからスパンの行を見分ける)
+LOG_PREFIX = "TRACE_SPAN "
+
+STATUS_UNSET = "UNSET"
+STATUS_ERROR = "ERROR"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+
+
+@dataclass
+class Span:
+    """1 つの処理区間. service はプロセス (line-webhook / router-agent など)."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str = ""
+    service: str = ""
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    status: str = STATUS_UNSET
+    status_message: str = ""
+    _previous: "Span | None" = field(default=None, repr=False)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> float:
+        return max(0, self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        """OTLP/JSON のスパンと同じキー名の dict."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "service": self.service,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+class ConsoleExporter:
+    """1 スパン 1 行の JSON をログに出す."""
+
+    def export(self, span: Span) -> None:
+        logger.info("%s%s", LOG_PREFIX, json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+
+
+class FileExporter:
+    """JSON Lines でファイルに追記する."""
+
+    def __init__(self, path: str = TRACE_FILE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class MemoryExporter:
+    """メモリに溜める (テスト・ベンチマーク用)."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return [s.name for s in self.spans]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+def _build_exporter(name: str):
+    if name == "console":
+        return ConsoleExporter()
+    if name == "file":
+        return FileExporter()
+    return None
+
+
+_exporter = _build_exporter(TRACE_EXPORTER)
+
+
+def get_exporter():
+    return _exporter
+
+
+def set_exporter(exporter) -> None:
+    """出力先を差し替える (None で無効. テスト用)."""
+    global _exporter
+    _exporter = exporter
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+def parse_traceparent(value: Any) -> tuple[str, str] | None:
+    """traceparent から (trace_id, 親の span_id). 読めなければ None."""
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    return (match.group(1), match.group(2)) if match else None
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def start_span(
+    name: str, parent: str | None = None, service: str | None = None, attributes: dict | None = None
+) -> Span | None:
+    """スパンを開始して実行中のスパンにする. 無効なら None.
+
+    parent (traceparent) を渡すと上流のトレースを継ぐ。なければ実行中のスパンの子、
+    それもなければ新しいトレースを始める。
+    """
+    if _exporter is None:
+        return None
+    current = _current.get()
+    remote = parse_traceparent(parent)
+    if remote is not None:
+        trace_id, parent_span_id = remote
+    elif current is not None:
+        trace_id, parent_span_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_span_id = _new_id(128), ""
+    s = Span(
+        name,
+        trace_id,
+        _new_id(64),
+        parent_span_id,
+        service or (current.service if current is not None else ""),
+        attributes=dict(attributes or {}),
+        _previous=current,
+    )
+    _current.set(s)
+    return s
+
+
+def end_span(s: Span | None, error: BaseException | None = None) -> None:
+    """スパンを終えて出力し、実行中のスパンを開始前に戻す."""
+    if s is None:
+        return
+    s.end_ns = time.time_ns()
+    if error is not None:
+        s.status = STATUS_ERROR
+        s.status_message = f"{type(error).__name__}: {error}"[:200]
+    if _current.get() is s:
+        _current.set(s._previous)
+    exporter = _exporter
+    if exporter is None:
+        return
+    try:
+        exporter.export(s)
+    except Exception:
+        logger.warning("Failed to export span %s", s.name, exc_info=True)
+
+
+@contextmanager
+def span(
+    name: str, parent: str | None = None, service: str | None = None, attributes: dict | None = None
+) -> Iterator[Span | None]:
+    """スコープ内の処理を 1 スパンとして記録する. 例外はスパンを ERROR にして再送出."""
+    s = start_span(name, parent, service, attributes)
+    try:
+        yield s
+    except BaseException as e:
+        end_span(s, e)
+        raise
+    end_span(s)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def current_trace_id() -> str:
+    s = _current.get()
+    return s.trace_id if s is not None else ""
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """実行中のスパンに属性を付ける (スパンがなければ何もしない)."""
+    s = _current.get()
+    if s is not None:
+        s.set_attribute(key, value)
+
+
+def inject(payload: dict) -> dict:
+    """下流に送る payload に実行中のスパンの traceparent を入れる."""
+    s = _current.get()
+    if s is not None:
+        payload[PAYLOAD_KEY] = s.traceparent()
+    return payload
+
+
+def extract(payload: Any) -> str | None:
+    """受け取った payload の traceparent."""
+    if isinstance(payload, dict):
+        value = payload.get(PAYLOAD_KEY)
+        return value if isinstance(value, str) else None
+    return None
+
+
+def entrypoint(name: str, service: str) -> Callable:
+    """AgentCore のエントリポイント (payload を受け取る関数) を 1 スパンにするデコレータ.
+
+    payload の traceparent を継ぐ。ストリーミングでジェネレータを返す場合は
+    読み終わるまでをスパンにし、読んでいる間はそのスパンを実行中にする
+    (ジェネレータ内で起動するスレッドがスパンを引き継ぐ)。
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(payload, *args, **kwargs):
+            s = start_span(name, extract(payload), service)
+            try:
+                result = fn(payload, *args, **kwargs)
+            except BaseException as e:
+                end_span(s, e)
+                raise
+            if s is None or not inspect.isgenerator(result):
+                if isinstance(result, dict) and isinstance(result.get("status"), str):
+                    set_attribute("response.status", result["status"])
+                end_span(s)
+                return result
+            _current.set(s._previous)
+            return _stream_in_span(result, s)
+
+        return wrapper
+
+    return decorator
+
+
+def _stream_in_span(gen: Iterator, s: Span) -> Iterator:
+    error = None
+    try:
+        while True:
+            previous = _current.get()
+            _current.set(s)
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                _current.set(previous)
+            yield item
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(s, error)
+
+
+_traced_request_class = None
+
+
+def google_build_kwargs() -> dict:
+    """googleapiclient.discovery.build に渡す引数. トレース有効時は API 呼び出しごとにスパンを作る."""
+    global _traced_request_class
+    if _exporter is None:
+        return {}
+    if _traced_request_class is None:
+        # googleapiclient は import が重いため実際に使うときだけ読み込む
+        from googleapiclient.http import HttpRequest
+
+        class TracedHttpRequest(HttpRequest):
+            def execute(self, *args, **kwargs):
+                with span(f"google {self.methodId}", attributes={"http.method": self.method}):
+                    return super().execute(*args, **kwargs)
+
+        _traced_request_class = TracedHttpRequest
+    return {"requestBuilder": _traced_request_class}
@@ -0,0 +1,162 @@
+"""UserSessionState のリクエスト単位 Unit of Work.
+
+1 イベントの処理中はユーザーのステートを 1 度だけ読み込み、変更はメモリ上に溜めて
+処理の最後に 1 回の条件付き書き込みでコミットする。
+アイテムの version 属性で楽観ロックを行い、同じユーザーの別 Lambda が
+先に書き込んでいた場合はコミットせず StateConflictError とする。
+"""
+
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from botocore.exceptions import ClientError
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+STATE_TTL_SECONDS = 600  # 10分で期限切れ
+
+_current: contextvars.ContextVar["UserSession | None"] = contextvars.ContextVar(
+    "user_session", default=None
+)
+
+
+class StateConflictError(Exception):
+    """他のリクエストが先にステートを更新していた."""
+
+
+class UserSession:
+    """1 ユーザー・1 イベント分のステート.
+
+    table_factory は呼び出しスレッドごとの Table を返す (aws_clients.get_table)。
+    """
+
+    def __init__(self, user_id: str, table_factory: Callable):
+        self.user_id = user_id
+        self._table_factory = table_factory
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._state: dict | None = None
+        # None: アイテムなし / 0: version 属性のない旧アイテム / n: 読み込んだ version
+        self._version: int | None = None
+        self._dirty = False
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            with tracing.span("state.load"):
+                response = self._table_factory().get_item(
+                    Key={"line_user_id": self.user_id}, ConsistentRead=True
+                )
+            item = response.get("Item")
+            if item:
+                self._state = json.loads(item.get("state", "{}"))
+                self._version = int(item.get("version", 0))
+            self._loaded = True
+
+    def get(self) -> dict | None:
+        """ステートを返す (初回のみ DynamoDB から読み込む)."""
+        self._load()
+        return self._state
+
+    def set(self, state: dict) -> None:
+        """ステートを置き換える (コミットまで書き込まない)."""
+        self._load()
+        self._state = state
+        self._dirty = True
+
+    def clear(self) -> None:
+        """ステートを削除する (コミットまで書き込まない)."""
+        self._load()
+        self._state = None
+        self._dirty = True
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def _condition(self) -> dict:
+        if self._version is None:
+            return {"ConditionExpression": "attribute_not_exists(line_user_id)"}
+        if self._version == 0:
+            return {
+                "ConditionExpression": "attribute_not_exists(#v)",
+                "ExpressionAttributeNames": {"#v": "version"},
+            }
+        return {
+            "ConditionExpression": "#v = :v",
+            "ExpressionAttributeNames": {"#v": "version"},
+            "ExpressionAttributeValues": {":v": self._version},
+        }
+
+    def commit(self) -> None:
+        """変更があれば 1 回の条件付き put / delete で書き込む."""
+        if not self._dirty:
+            return
+        with tracing.span("state.commit"):
+            self._write()
+        self._dirty = False
+
+    def _write(self) -> None:
+        table = self._table_factory()
+        try:
+            if self._state is None:
+                if self._version is None:
+                    # もともとアイテムがないので削除不要
+                    return
+                table.delete_item(Key={"line_user_id": self.user_id}, **self._condition())
+                self._version = None
+            else:
+                next_version = (self._version or 0) + 1
+                table.put_item(
+                    Item={
+                        "line_user_id": self.user_id,
+                        "state": json.dumps(self._state, ensure_ascii=False),
+                        "version": next_version,
+                        "ttl": int(time.time()) + STATE_TTL_SECONDS,
+                    },
+                    **self._condition(),
+                )
+                self._version = next_version
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                raise StateConflictError(
+                    f"user state for {self.user_id} was modified concurrently"
+                ) from e
+            raise
+
+
+def current(user_id: str) -> UserSession | None:
+    """このイベントで開いている user_id のセッションを返す (なければ None)."""
+    session = _current.get()
+    if session is not None and session.user_id == user_id:
+        return session
+    return None
+
+
+@contextmanager
+def session_scope(user_id: str | None, table_factory: Callable) -> Iterator[UserSession | None]:
+    """イベント処理をセッションで囲み、正常終了時にコミットする.
+
+    例外で抜けた場合は変更を破棄する。user_id がなければ何もしない。
+    """
+    if not user_id:
+        yield None
+        return
+    session = UserSession(user_id, table_factory)
+    token = _current.set(session)
+    try:
+        yield session
+        try:
+            session.commit()
+        except StateConflictError:
+            logger.warning("User state conflict for %s, changes discarded", user_id)
+    finally:
+        _current.reset(token)
@@ -0,0 +1,139 @@
+"""1 リクエスト分のスパンをウォーターフォールで表示する.
+
+TRACE_EXPORTER=file の JSON Lines (既定: TRACE_FILE_PATH)、または TRACE_EXPORTER=console の
+ログ (CloudWatch Logs からダウンロードしたものなど. TRACE_SPAN の行だけ読む) を読み、
+ID に一致するトレースを親子関係の順に並べて、開始位置と所要時間を棒で表示する。
+
+ID はトレース ID (先頭 8 文字以上)、API Gateway / Lambda のリクエスト ID (request.id)、
+LINE の Webhook イベント ID (line.event_id) のいずれか。
+
+    python scripts/trace_waterfall.py <id> [--file /tmp/traces.jsonl ...] [--width 50]
+    python scripts/trace_waterfall.py --list
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agent"))
+
+import tracing  # noqa: E402
+
+# ID として照合するスパンの属性
+_ID_ATTRIBUTES = ("request.id", "line.event_id")
+
+
+def load_spans(paths: list[str]) -> list[dict]:
+    """JSON Lines / ログからスパンを読む. "-" は標準入力."""
+    spans = []
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        with f:
+            for line in f:
+                text = line.strip()
+                if tracing.LOG_PREFIX in text:
+                    text = text.split(tracing.LOG_PREFIX, 1)[1]
+                if not text.startswith("{"):
+                    continue
+                try:
+                    span = json.loads(text)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(span, dict) and "traceId" in span and "spanId" in span:
+                    spans.append(span)
+    return spans
+
+
+def find_traces(spans: list[dict], request_id: str) -> list[str]:
+    """ID に一致するトレース ID (最初に開始した順)."""
+    found: dict[str, int] = {}
+    for span in spans:
+        attributes = span.get("attributes") or {}
+        matched = (len(request_id) >= 8 and span["traceId"].startswith(request_id)) or any(
+            str(attributes.get(key)) == request_id for key in _ID_ATTRIBUTES
+        )
+        if matched:
+            start = span.get("startTimeUnixNano", 0)
+            found[span["traceId"]] = min(found.get(span["traceId"], start), start)
+    return sorted(found, key=found.get)
+
+
+def _ordered(spans: list[dict]) -> list[tuple[int, dict]]:
+    """親 → 子 (開始順) に並べた (深さ, スパン)."""
+    ids = {span["spanId"] for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        parent = span.get("parentSpanId")
+        (children[parent] if parent in ids else roots).append(span)
+
+    def _start(span: dict) -> int:
+        return span.get("startTimeUnixNano", 0)
+
+    ordered = []
+
+    def _walk(span: dict, depth: int) -> None:
+        ordered.append((depth, span))
+        for child in sorted(children[span["spanId"]], key=_start):
+            _walk(child, depth + 1)
+
+    for root in sorted(roots, key=_start):
+        _walk(root, 0)
+    return ordered
+
+
+def render(spans: list[dict], width: int = 50) -> str:
+    """1 トレースのウォーターフォール."""
+    ordered = _ordered(spans)
+    start = min(span["startTimeUnixNano"] for span in spans)
+    end = max(span.get("endTimeUnixNano") or span["startTimeUnixNano"] for span in spans)
+    total = max(1, end - start)
+    name_width = max(len("  " * depth + span["name"]) for depth, span in ordered)
+    lines = [f"trace {spans[0]['traceId']}  {total / 1e6:.1f}ms  {len(spans)} spans"]
+    for depth, span in ordered:
+        offset = span["startTimeUnixNano"] - start
+        duration = max(0, (span.get("endTimeUnixNano") or span["startTimeUnixNano"]) - span["startTimeUnixNano"])
+        left = int(offset / total * width)
+        bar = " " * left + "█" * max(1, round(duration / total * width))
+        error = " !" if (span.get("status") or {}).get("code") == tracing.STATUS_ERROR else ""
+        name = ("  " * depth + span["name"]).ljust(name_width)
+        lines.append(
+            f"{name}  {offset / 1e6:8.1f}ms {duration / 1e6:8.1f}ms  |{bar[:width].ljust(width)}|"
+            f"  {span.get('service', '')}{error}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("id", nargs="?", help="トレース ID / リクエスト ID / Webhook イベント ID")
+    parser.add_argument("--file", action="append", help="スパンのファイル (複数可. - は標準入力)")
+    parser.add_argument("--width", type=int, default=50, help="棒の幅 (文字数)")
+    parser.add_argument("--list", action="store_true", help="トレースの一覧を表示する")
+    args = parser.parse_args()
+
+    spans = load_spans(args.file or [os.environ.get("TRACE_FILE_PATH", tracing.TRACE_FILE_PATH)])
+    by_trace = defaultdict(list)
+    for span in spans:
+        by_trace[span["traceId"]].append(span)
+
+    if args.list or not args.id:
+        for trace_id, trace_spans in sorted(by_trace.items(), key=lambda item: min(s["startTimeUnixNano"] for s in item[1])):
+            root = _ordered(trace_spans)[0][1]
+            request_id = (root.get("attributes") or {}).get("request.id", "")
+            print(f"{trace_id}  {root['name']:<20} {len(trace_spans):3d} spans  {request_id}")
+        return
+
+    trace_ids = find_traces(spans, args.id)
+    if not trace_ids:
+        sys.exit(f"no trace found for {args.id}")
+    for trace_id in trace_ids:
+        print(render(by_trace[trace_id], args.width))
+        print()
+
+
+if __name__ == "__main__":
+    main()